@@ -0,0 +1,123 @@
+"""
+Benchmark: condições dos atendimentos SOAP via LATERAL json_agg vs consulta por chave.
+
+Compara o plano antigo (um LATERAL json_agg por atendimento, JSON montado no
+Postgres) com a estratégia atual de listar_ultimos_atendimentos_soap (página
+de atendimentos + uma consulta de condições por ANY(ids), montagem em Python).
+Usa os pacientes com mais atendimentos médicos/enfermagem da base configurada.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_atendimentos_condicoes.py --pacientes 5 --repeticoes 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+from pec_mcp.db import get_connection, query_all
+from pec_mcp.tools.atendimentos import _SQL_ATENDIMENTOS_BASE, _fetch_condicoes
+
+_SQL_LATERAL = (
+    """
+SELECT
+    ap.co_seq_atend_prof AS atendimento_id,
+    es.ds_subjetivo, eo.ds_objetivo, ea.ds_avaliacao, ep.ds_plano,
+    COALESCE(cond.condicoes, '[]') AS condicoes
+"""
+    + """
+FROM tb_atend_prof ap
+JOIN tb_atend       a   ON a.co_seq_atend       = ap.co_atend
+JOIN tb_prontuario  pr  ON pr.co_seq_prontuario = a.co_prontuario
+LEFT JOIN tb_lotacao l  ON l.co_ator_papel      = ap.co_lotacao
+LEFT JOIN tb_prof    p  ON p.co_seq_prof        = l.co_prof
+LEFT JOIN tb_cbo     cb ON cb.co_cbo            = l.co_cbo
+LEFT JOIN tb_evolucao_subjetivo es ON es.co_atend_prof = ap.co_seq_atend_prof
+LEFT JOIN tb_evolucao_objetivo  eo ON eo.co_atend_prof = ap.co_seq_atend_prof
+LEFT JOIN tb_evolucao_avaliacao ea ON ea.co_atend_prof = ap.co_seq_atend_prof
+LEFT JOIN tb_evolucao_plano     ep ON ep.co_atend_prof = ap.co_seq_atend_prof
+LEFT JOIN LATERAL (
+    SELECT json_agg(
+        jsonb_build_object(
+            'condition_id', p2.co_seq_problema,
+            'cid_code', cid2.nu_cid10,
+            'cid_description', cid2.no_cid10,
+            'ciap_code', ciap2.co_ciap,
+            'ciap_description', ciap2.ds_ciap,
+            'observacao', pe2.ds_observacao,
+            'dt_inicio_condicao', pe2.dt_inicio_problema,
+            'dt_fim_condicao', pe2.dt_fim_problema,
+            'situacao_id', pe2.co_situacao_problema
+        )
+        ORDER BY pe2.dt_inicio_problema DESC NULLS LAST, p2.co_seq_problema
+    ) AS condicoes
+    FROM tb_problema_evolucao pe2
+    JOIN tb_problema p2 ON p2.co_unico_problema = pe2.co_unico_problema
+    LEFT JOIN tb_cid10 cid2 ON cid2.co_cid10 = p2.co_cid10
+    LEFT JOIN tb_ciap ciap2 ON ciap2.co_seq_ciap = p2.co_ciap
+    WHERE pe2.co_atend_prof = ap.co_seq_atend_prof
+) cond ON TRUE
+WHERE pr.co_cidadao = %s
+  AND (cb.co_cbo_2002 LIKE '225%%' OR cb.co_cbo_2002 LIKE '2235%%')
+ORDER BY a.dt_inicio DESC NULLS LAST
+"""
+)
+
+_SEM_LIMITE = 1_000_000
+
+_SQL_TOP_PACIENTES = """
+SELECT pr.co_cidadao AS paciente_id, COUNT(*) AS total
+FROM tb_atend_prof ap
+JOIN tb_atend a ON a.co_seq_atend = ap.co_atend
+JOIN tb_prontuario pr ON pr.co_seq_prontuario = a.co_prontuario
+GROUP BY pr.co_cidadao
+ORDER BY COUNT(*) DESC
+LIMIT %s
+"""
+
+
+def _lateral(conn, paciente_id: int) -> int:
+    return len(query_all(conn, _SQL_LATERAL, (paciente_id,)))
+
+
+def _set_based(conn, paciente_id: int) -> int:
+    # Página única com todo o histórico, para comparar com o plano antigo sem LIMIT.
+    sql = _SQL_ATENDIMENTOS_BASE.format(where_clause="pr.co_cidadao = %s")
+    rows = query_all(conn, sql, (paciente_id, _SEM_LIMITE))
+    _fetch_condicoes(conn, [int(row["atendimento_id"]) for row in rows])
+    return len(rows)
+
+
+def _measure(fn, conn, paciente_id: int, repeticoes: int) -> float:
+    fn(conn, paciente_id)  # aquece cache de páginas e de planos
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        fn(conn, paciente_id)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pacientes", type=int, default=5)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = get_connection()
+    try:
+        pacientes = query_all(conn, _SQL_TOP_PACIENTES, (args.pacientes,))
+        print(f"{'paciente':>10} {'atend.':>7} {'lateral ms':>11} {'chave ms':>9} {'ganho':>6}")
+        for row in pacientes:
+            paciente_id = int(row["paciente_id"])
+            lateral_ms = _measure(_lateral, conn, paciente_id, args.repeticoes)
+            set_ms = _measure(_set_based, conn, paciente_id, args.repeticoes)
+            ganho = lateral_ms / set_ms if set_ms else float("inf")
+            print(f"{paciente_id:>10} {row['total']:>7} {lateral_ms:>11.1f} {set_ms:>9.1f} {ganho:>5.1f}x")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: extração COPY -> Arrow (em lotes) vs caminho de dicts das tools.
+
+Compara pec_mcp.extracao (COPY ... TO STDOUT em CSV lido pelo pyarrow em
+lotes) com o caminho usado pelas tools (RealDictCursor, uma lista de dicts
+em memória convertida para Arrow no fim). Os dois gravam o mesmo Parquet.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_extracao.py problemas --cid E11 --repeticoes 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from pec_mcp.db import get_connection, query_all
+from pec_mcp.extracao import _pyarrow, copiar_csv, gravar_stream, montar_consulta, schema_arrow
+from pec_mcp.tools.filters import ConditionFilter, FilterSet, PatientFilter
+
+
+def _copy_arrow(conn, dataset, sql, params, caminho: str) -> int:
+    return gravar_stream(lambda saida: copiar_csv(conn, sql, params, saida), dataset, caminho)
+
+
+def _dicts(conn, dataset, sql, params, caminho: str) -> int:
+    pa = _pyarrow()
+    rows = query_all(conn, sql, params)
+    pa.parquet.write_table(pa.Table.from_pylist(rows, schema=schema_arrow(dataset)), caminho, compression="zstd")
+    return len(rows)
+
+
+def _measure(fn, conn, dataset, sql, params, caminho: str, repeticoes: int):
+    tempos = []
+    linhas = 0
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        linhas = fn(conn, dataset, sql, params, caminho)
+        tempos.append(time.perf_counter() - inicio)
+    return linhas, statistics.median(tempos)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("dataset", choices=["atendimentos", "problemas"])
+    parser.add_argument("--sex")
+    parser.add_argument("--unidade-saude-id", type=int)
+    parser.add_argument("--cid", action="append", default=[])
+    parser.add_argument("--desde")
+    parser.add_argument("--ate")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    filters = FilterSet(
+        patient=PatientFilter.build(sex=args.sex, unidade_saude_id=args.unidade_saude_id),
+        condition=ConditionFilter.build(cid_codes=args.cid or None),
+    )
+    conn = get_connection()
+    try:
+        conn.set_client_encoding("UTF8")
+        dataset, sql, params = montar_consulta(conn, args.dataset, filters, args.desde, args.ate, todos=True)
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "saida.parquet")
+            print(f"{'caminho':>12} {'linhas':>10} {'mediana s':>10} {'linhas/s':>12}")
+            for nome, fn in (("copy->arrow", _copy_arrow), ("dicts", _dicts)):
+                linhas, segundos = _measure(fn, conn, dataset, sql, params, caminho, args.repeticoes)
+                print(f"{nome:>12} {linhas:>10} {segundos:>10.2f} {linhas / max(segundos, 1e-9):>12,.0f}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Controle de admissão: protege o banco do PEC de rajadas de chamadas.
+
+Cada tool tem um peso (agregações pesadas pesam mais que listar unidades) e
+a soma dos pesos em execução não passa da capacidade do servidor. O que não
+cabe espera numa fila limitada, com prazo, organizada por cliente: a vez
+gira entre clientes (round-robin), de modo que um agente em loop não tome a
+frente dos demais. Fila cheia, cota do cliente esgotada ou prazo vencido
+geram ServidorOcupado imediatamente, com sugestão de quando tentar de novo.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import json
+import math
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import anyio
+
+from .config import (
+    PEC_ADMISSION_CAPACITY,
+    PEC_ADMISSION_QUEUE_MAX,
+    PEC_ADMISSION_QUEUE_PER_CLIENT,
+    PEC_ADMISSION_WAIT_SECONDS,
+    PEC_ADMISSION_WEIGHTS,
+    PEC_DB_POOL_SIZE,
+)
+
+# Peso admitido da chamada em andamento: teto de conexões que ela pode usar.
+_PESO_ADMITIDO: ContextVar[Optional[int]] = ContextVar("pec_peso_admitido", default=None)
+
+# Peso de cada tool em "vagas" de execução; tools ausentes pesam 1.
+PESOS_PADRAO: Dict[str, int] = {
+    "capturar_paciente": 1,
+    "obter_codigos_condicao_saude": 2,  # CID e CIAP em paralelo
+    "listar_unidades_saude": 1,
+    "listar_ultimos_atendimentos_soap": 1,
+    "listar_resumo_atendimentos_soap": 1,
+    "obter_atendimentos_soap": 1,
+    "buscar_atendimentos_soap": 1,
+    "linha_do_tempo_paciente": 2,
+    "listar_gestantes": 1,
+    "consulta_epidemiologia": 1,
+    "listar_condicoes_pacientes": 2,
+    "contar_pacientes_sem_consulta": 2,
+    "listar_pacientes_sem_consulta": 2,
+    "contar_pacientes": 3,
+    "prevalencia_condicoes": 4,
+    "serie_atendimentos": 4,
+}
+
+
+_MOTIVOS = {
+    "fila_cheia": "fila de espera cheia",
+    "cota_cliente": "muitas chamadas deste cliente na fila",
+    "prazo": "tempo de espera na fila esgotado",
+}
+
+
+class ServidorOcupado(RuntimeError):
+    """
+    Chamada recusada por sobrecarga; retry_after sugere a espera em segundos.
+    """
+
+    def __init__(self, motivo: str, retry_after: int) -> None:
+        super().__init__(f"Servidor ocupado ({motivo}); tente novamente em {retry_after}s.")
+        self.motivo = motivo
+        self.retry_after = retry_after
+
+
+class _Pedido:
+    __slots__ = ("tool", "peso", "liberado")
+
+    def __init__(self, tool: str, peso: int) -> None:
+        self.tool = tool
+        self.peso = peso
+        self.liberado: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+
+
+class ControleAdmissao:
+    """
+    Semáforo ponderado com fila justa por cliente (roda no event loop).
+    """
+
+    def __init__(
+        self,
+        capacidade: int = PEC_ADMISSION_CAPACITY,
+        max_fila: int = PEC_ADMISSION_QUEUE_MAX,
+        max_fila_por_cliente: int = PEC_ADMISSION_QUEUE_PER_CLIENT,
+        espera_max_segundos: float = PEC_ADMISSION_WAIT_SECONDS,
+        pesos: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.capacidade = max(1, int(capacidade))
+        self.max_fila = max(0, int(max_fila))
+        self.max_fila_por_cliente = max(1, int(max_fila_por_cliente))
+        self.espera_max_segundos = float(espera_max_segundos)
+        self.pesos = dict(PESOS_PADRAO if pesos is None else pesos)
+        self._em_uso = 0
+        self._filas: "OrderedDict[str, Deque[_Pedido]]" = OrderedDict()
+        self._na_fila = 0
+        # Média móvel da duração das execuções, base do retry_after.
+        self._duracao_media = 1.0
+        self._por_tool: Dict[str, Dict[str, int]] = {}
+        self._rejeicoes: Dict[str, int] = {"fila_cheia": 0, "cota_cliente": 0, "prazo": 0}
+
+    def peso(self, tool: str) -> int:
+        return max(1, min(int(self.pesos.get(tool, 1)), self.capacidade))
+
+    async def executar(self, tool: str, cliente: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Executa fn quando houver vaga para o peso da tool; ServidorOcupado se não der.
+        """
+
+        peso = self.peso(tool)
+        if self._na_fila == 0 and self._em_uso + peso <= self.capacidade:
+            self._em_uso += peso
+        else:
+            await self._aguardar(tool, cliente, peso)
+        self._contar(tool, "admitidas")
+
+        started = time.monotonic()
+        try:
+            return await fn()
+        finally:
+            self._duracao_media = 0.8 * self._duracao_media + 0.2 * (time.monotonic() - started)
+            self._em_uso -= peso
+            self._despachar()
+
+    def metricas(self) -> dict:
+        return {
+            "capacidade": self.capacidade,
+            "em_uso": self._em_uso,
+            "fila": self._na_fila,
+            "fila_por_cliente": {cliente: len(fila) for cliente, fila in self._filas.items()},
+            "rejeicoes": dict(self._rejeicoes),
+            "por_tool": {tool: dict(contadores) for tool, contadores in self._por_tool.items()},
+        }
+
+    async def _aguardar(self, tool: str, cliente: str, peso: int) -> None:
+        fila = self._filas.get(cliente)
+        if self._na_fila >= self.max_fila:
+            self._rejeitar(tool, "fila_cheia")
+        if fila is not None and len(fila) >= self.max_fila_por_cliente:
+            self._rejeitar(tool, "cota_cliente")
+
+        pedido = _Pedido(tool, peso)
+        if fila is None:
+            fila = self._filas[cliente] = deque()
+        fila.append(pedido)
+        self._na_fila += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(pedido.liberado), timeout=self.espera_max_segundos)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if pedido.liberado.done():
+                # A vaga chegou junto com o prazo/cancelamento: devolvemos.
+                self._em_uso -= peso
+                self._despachar()
+            else:
+                pedido.liberado.cancel()
+                self._remover(cliente, pedido)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            self._rejeitar(tool, "prazo")
+
+    def _despachar(self) -> None:
+        # Round-robin entre clientes. Se a cabeça da fila da vez não cabe,
+        # ninguém passa à frente dela: pedidos pesados não ficam adiados para sempre.
+        while self._filas:
+            cliente, fila = next(iter(self._filas.items()))
+            pedido = fila[0]
+            if self._em_uso + pedido.peso > self.capacidade:
+                return
+            fila.popleft()
+            self._na_fila -= 1
+            if fila:
+                self._filas.move_to_end(cliente)
+            else:
+                del self._filas[cliente]
+            self._em_uso += pedido.peso
+            pedido.liberado.set_result(None)
+
+    def _remover(self, cliente: str, pedido: _Pedido) -> None:
+        fila = self._filas.get(cliente)
+        if fila is None or pedido not in fila:
+            return
+        fila.remove(pedido)
+        self._na_fila -= 1
+        if not fila:
+            del self._filas[cliente]
+        # A saída de uma cabeça de fila pode destravar quem vem atrás.
+        self._despachar()
+
+    def _rejeitar(self, tool: str, motivo: str) -> None:
+        self._rejeicoes[motivo] += 1
+        self._contar(tool, "rejeitadas")
+        espera = self._duracao_media * (1 + self._na_fila / self.capacidade)
+        raise ServidorOcupado(_MOTIVOS[motivo], max(1, math.ceil(espera)))
+
+    def _contar(self, tool: str, campo: str) -> None:
+        contadores = self._por_tool.setdefault(tool, {"admitidas": 0, "rejeitadas": 0})
+        contadores[campo] += 1
+
+
+def identificar_cliente(ctx: Any) -> str:
+    """
+    Cliente da chamada: client_id do MCP, senão a sessão; "anonimo" fora de requisição.
+    """
+
+    try:
+        client_id = ctx.client_id
+    except Exception:  # noqa: BLE001 - fora de uma requisição MCP
+        client_id = None
+    if client_id:
+        return str(client_id)
+    try:
+        return f"sessao-{id(ctx.session)}"
+    except Exception:  # noqa: BLE001 - idem
+        return "anonimo"
+
+
+def peso_admitido() -> Optional[int]:
+    """
+    Peso com que a chamada de tool em andamento foi admitida; None fora do controle.
+    """
+
+    return _PESO_ADMITIDO.get()
+
+
+def admitir(fn: Callable[..., Any], controle: Optional[ControleAdmissao] = None) -> Callable[..., Any]:
+    """
+    Envolve uma tool síncrona: espera vaga no controle de admissão e roda em thread.
+
+    O peso admitido fica visível na thread (peso_admitido), para que a tool
+    não use mais conexões do que as vagas que ocupa.
+    """
+
+    parametros = list(inspect.signature(fn).parameters)
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        ctx = kwargs.get("ctx", args[0] if args and parametros[:1] == ["ctx"] else None)
+        ativo = controle or ADMISSAO
+
+        async def _rodar() -> Any:
+            # A thread do anyio herda uma cópia do contexto atual.
+            token = _PESO_ADMITIDO.set(ativo.peso(fn.__name__))
+            try:
+                return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs))
+            finally:
+                _PESO_ADMITIDO.reset(token)
+
+        return await ativo.executar(fn.__name__, identificar_cliente(ctx), _rodar)
+
+    return wrapper
+
+
+def _pesos_configurados() -> Dict[str, int]:
+    pesos = dict(PESOS_PADRAO)
+    if PEC_ADMISSION_WEIGHTS.strip():
+        try:
+            extras = json.loads(PEC_ADMISSION_WEIGHTS)
+        except ValueError as exc:
+            raise ValueError("PEC_ADMISSION_WEIGHTS deve ser um objeto JSON {tool: peso}.") from exc
+        if not isinstance(extras, dict):
+            raise ValueError("PEC_ADMISSION_WEIGHTS deve ser um objeto JSON {tool: peso}.")
+        pesos.update({str(tool): int(peso) for tool, peso in extras.items()})
+    return pesos
+
+
+def _capacidade_configurada(capacidade: int = PEC_ADMISSION_CAPACITY, pool: int = PEC_DB_POOL_SIZE) -> int:
+    # Cada chamada admitida empresta uma conexão por nó que usa (as duas
+    # classes de carga no mesmo nó dividem a mesma); com mais vagas que
+    # conexões, o excedente esperaria pelo pool dentro da thread, fora da fila
+    # justa (até PEC_DB_POOL_TIMEOUT_SECONDS).
+    if capacidade > max(1, pool):
+        raise ValueError(
+            f"PEC_ADMISSION_CAPACITY ({capacidade}) não pode passar de PEC_DB_POOL_SIZE ({pool}); "
+            "aumente o pool ou reduza a capacidade."
+        )
+    return capacidade
+
+
+# Controle global do processo, exposto na rota /metrics.
+ADMISSAO = ControleAdmissao(capacidade=_capacidade_configurada(), pesos=_pesos_configurados())
+
+
+__all__ = [
+    "ADMISSAO",
+    "ControleAdmissao",
+    "PESOS_PADRAO",
+    "ServidorOcupado",
+    "admitir",
+    "identificar_cliente",
+    "peso_admitido",
+]
@@ -0,0 +1,199 @@
+"""
+Cache em memória de dados derivados do banco, recarregados periodicamente.
+
+Cada cache guarda um valor por banco de dados (chave derivada da conexão),
+para que réplicas ou bases distintas não compartilhem snapshots. O carregador
+recebe o valor anterior, permitindo atualizações incrementais.
+
+Valor vencido continua sendo servido enquanto a recarga roda em segundo
+plano, numa conexão própria do banco (registrar_banco); só a primeira carga
+de cada banco faz a chamada esperar.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, ContextManager, Dict, Generic, Hashable, Optional, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# Por banco (database_key): como emprestar uma conexão para recargas em segundo plano.
+_CONECTORES: Dict[str, Callable[[], ContextManager[object]]] = {}
+
+
+def database_key(conn) -> str:
+    """
+    Identifica o banco de uma conexão (DSN sem senha) para separar snapshots.
+    """
+
+    dsn = getattr(conn, "dsn", None)
+    return str(dsn) if dsn else f"conn-{id(conn)}"
+
+
+def registrar_banco(conn, conectar: Callable[[], ContextManager[object]]) -> None:
+    """
+    Informa como obter outra conexão do banco de conn (ex.: o pool do nó).
+
+    Sem registro, a chamada que encontra o valor vencido recarrega com a
+    própria conexão; as concorrentes seguem com o valor antigo.
+    """
+
+    _CONECTORES.setdefault(database_key(conn), conectar)
+
+
+class RefreshingCache(Generic[T]):
+    """
+    Valor carregado do banco e recarregado quando passa de ttl_seconds.
+
+    A recarga de um valor vencido roda em thread de fundo, uma por banco, e
+    quem chega nesse meio tempo recebe o valor antigo. ttl_seconds <= 0
+    recarrega a cada chamada, na própria chamada. Se a recarga falhar,
+    seguimos servindo o valor antigo (e registramos o erro) para não derrubar
+    a tool por um refresh.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[object, Optional[T]], T],
+        ttl_seconds: float,
+    ) -> None:
+        self.name = name
+        self._loader = loader
+        self._ttl = float(ttl_seconds)
+        self._entries: Dict[str, Tuple[T, float]] = {}
+        self._lock = threading.Lock()
+        self._renovando: Set[str] = set()
+        self._renovando_lock = threading.Lock()
+
+    def get(self, conn) -> T:
+        """
+        Retorna o valor do banco da conexão; vencido, agenda a recarga e devolve o atual.
+        """
+
+        key = database_key(conn)
+        entry = self._entries.get(key)
+        if entry is not None and not self._expired(entry[1]):
+            return entry[0]
+        if entry is not None and self._ttl > 0:
+            return self._renovar(key, conn, entry[0])
+
+        # Primeira carga (ou ttl <= 0): a chamada espera pelo valor.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[1]):
+                return entry[0]
+            return self._carregar(key, conn, entry[0] if entry is not None else None)
+
+    def _renovar(self, key: str, conn, previous: T) -> T:
+        with self._renovando_lock:
+            if key in self._renovando:
+                return previous
+            self._renovando.add(key)
+        conectar = _CONECTORES.get(key)
+        if conectar is None:
+            # Sem conexão própria para o banco: recarrega nesta chamada.
+            try:
+                return self._carregar(key, conn, previous)
+            finally:
+                self._liberar(key)
+
+        def _em_fundo() -> None:
+            try:
+                with conectar() as propria:
+                    self._carregar(key, propria, previous)
+            except Exception:  # noqa: BLE001 - segue com o valor antigo
+                logger.exception("Falha ao recarregar cache %s em segundo plano.", self.name)
+            finally:
+                self._liberar(key)
+
+        threading.Thread(target=_em_fundo, name=f"pec-cache-{self.name}", daemon=True).start()
+        return previous
+
+    def _liberar(self, key: str) -> None:
+        with self._renovando_lock:
+            self._renovando.discard(key)
+
+    def _carregar(self, key: str, conn, previous: Optional[T]) -> T:
+        # Uma carga por banco de cada vez: self._lock na primeira, _renovando nas demais.
+        started = time.monotonic()
+        try:
+            value = self._loader(conn, previous)
+        except Exception:
+            if previous is None:
+                raise
+            logger.exception("Falha ao recarregar cache %s; mantendo valor anterior.", self.name)
+            return previous
+        self._entries[key] = (value, time.monotonic())
+        logger.info("Cache %s recarregado em %.1f ms.", self.name, (time.monotonic() - started) * 1000)
+        return value
+
+    def loaded_at(self, conn) -> Optional[float]:
+        """
+        Instante (time.time) da última carga para o banco da conexão, se houver.
+        """
+
+        entry = self._entries.get(database_key(conn))
+        if entry is None:
+            return None
+        return time.time() - (time.monotonic() - entry[1])
+
+    def invalidate(self, conn=None) -> None:
+        """
+        Descarta o valor de um banco (ou de todos) para forçar recarga completa.
+        """
+
+        with self._lock:
+            if conn is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(database_key(conn), None)
+
+    def _expired(self, loaded_at: float) -> bool:
+        return self._ttl <= 0 or (time.monotonic() - loaded_at) >= self._ttl
+
+
+class KeyedCache(Generic[T]):
+    """
+    Resultados por chave arbitrária, com validade e limite de entradas (LRU).
+
+    Útil para resultados que dependem dos argumentos da chamada (e não só do
+    banco), como blocos já fechados de uma série temporal.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float, max_entries: int = 1024) -> None:
+        self.name = name
+        self._ttl = float(ttl_seconds)
+        self._max_entries = max(1, int(max_entries))
+        self._entries: "OrderedDict[Hashable, Tuple[T, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[T]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._ttl <= 0 or (time.monotonic() - entry[1]) >= self._ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: T) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+__all__ = ["KeyedCache", "RefreshingCache", "database_key", "registrar_banco"]
@@ -47,6 +47,98 @@ PEC_DB_USER: Final[str] = _get("PEC_DB_USER", _DEFAULT_USER)
 PEC_DB_PASSWORD: Final[str] = _get("PEC_DB_PASSWORD", _DEFAULT_PASSWORD)
 
 
+# Nós de banco para roteamento (lista JSON de {"name", "dsn", "workload"}).
+# Vazio: um único nó com a DSN acima. workload: interactive ou analytic.
+PEC_DB_NODES: Final[str] = _get("PEC_DB_NODES", "")
+PEC_DB_MAX_LAG_SECONDS: Final[float] = float(_get("PEC_DB_MAX_LAG_SECONDS", "30"))
+PEC_DB_HEALTH_INTERVAL_SECONDS: Final[float] = float(_get("PEC_DB_HEALTH_INTERVAL_SECONDS", "15"))
+PEC_DB_CONNECT_TIMEOUT: Final[int] = int(_get("PEC_DB_CONNECT_TIMEOUT", "5"))
+# Conexões por nó emprestadas a cada chamada de tool e às consultas em paralelo (ex.: séries em blocos).
+PEC_DB_POOL_SIZE: Final[int] = int(_get("PEC_DB_POOL_SIZE", "8"))
+# Espera máxima (segundos) por uma conexão livre do pool antes de desistir com erro.
+PEC_DB_POOL_TIMEOUT_SECONDS: Final[float] = float(_get("PEC_DB_POOL_TIMEOUT_SECONDS", "30"))
+
+# Modo federado: bancos PEC de vários municípios (lista JSON de {"name", "dsn"}).
+# Vazio desativa as tools federadas. O timeout vale por membro.
+PEC_FEDERATION_MEMBERS: Final[str] = _get("PEC_FEDERATION_MEMBERS", "")
+PEC_FEDERATION_TIMEOUT_SECONDS: Final[float] = float(_get("PEC_FEDERATION_TIMEOUT_SECONDS", "30"))
+
+# Intervalo (segundos) de recarga do registro em memória de gestações ativas.
+PEC_GESTANTES_REFRESH_SECONDS: Final[int] = int(_get("PEC_GESTANTES_REFRESH_SECONDS", "300"))
+# Intervalo (segundos) de recarga do cubo de comorbidades (CID x sexo x idade x localidade).
+PEC_EPIDEMIOLOGIA_REFRESH_SECONDS: Final[int] = int(_get("PEC_EPIDEMIOLOGIA_REFRESH_SECONDS", "3600"))
+# Motor de consulta_epidemiologia: "cubo" (agregado em SQL) ou "colunar" (arrays NumPy).
+PEC_EPIDEMIOLOGIA_ENGINE: Final[str] = _get("PEC_EPIDEMIOLOGIA_ENGINE", "cubo").strip().lower()
+# Índice de última consulta: avanço incremental (co_seq_atend) e recarga completa.
+PEC_ULTIMA_CONSULTA_REFRESH_SECONDS: Final[int] = int(_get("PEC_ULTIMA_CONSULTA_REFRESH_SECONDS", "60"))
+PEC_ULTIMA_CONSULTA_FULL_REBUILD_SECONDS: Final[int] = int(
+    _get("PEC_ULTIMA_CONSULTA_FULL_REBUILD_SECONDS", "86400")
+)
+# Atendimentos abaixo da marca d'água relidos a cada avanço (profissional/CBO gravados depois).
+PEC_ULTIMA_CONSULTA_REVISIT: Final[int] = int(_get("PEC_ULTIMA_CONSULTA_REVISIT", "2000"))
+# Validade (segundos) dos blocos já fechados da série de atendimentos.
+PEC_SERIE_ATENDIMENTOS_CACHE_SECONDS: Final[int] = int(_get("PEC_SERIE_ATENDIMENTOS_CACHE_SECONDS", "86400"))
+# Intervalo (segundos) de recarga do catálogo CID-10/CIAP (código -> id) usado nos filtros.
+PEC_CATALOGO_CODIGOS_REFRESH_SECONDS: Final[int] = int(_get("PEC_CATALOGO_CODIGOS_REFRESH_SECONDS", "86400"))
+# Índice de nomes normalizados (prefixo de nome sem acento): avanço incremental
+# (cidadãos novos por co_seq_cidadao) e recarga completa (nomes alterados).
+PEC_NOMES_REFRESH_SECONDS: Final[int] = int(_get("PEC_NOMES_REFRESH_SECONDS", "60"))
+PEC_NOMES_FULL_REBUILD_SECONDS: Final[int] = int(_get("PEC_NOMES_FULL_REBUILD_SECONDS", "86400"))
+
+# Aquecimento em segundo plano ao subir o servidor (conexões, catálogos, planos).
+# As sondas executam de fato as formas canônicas, além do EXPLAIN.
+PEC_WARMUP_ENABLED: Final[bool] = _get("PEC_WARMUP_ENABLED", "1").strip().lower() in ("1", "true", "sim")
+PEC_WARMUP_PROBES: Final[bool] = _get("PEC_WARMUP_PROBES", "0").strip().lower() in ("1", "true", "sim")
+
+# Controle de admissão: soma dos pesos das tools em execução, fila de espera
+# (total e por cliente) e prazo máximo na fila. Pesos extras em JSON {tool: peso}.
+# A capacidade padrão é o tamanho do pool: cada vaga tem uma conexão garantida.
+PEC_ADMISSION_CAPACITY: Final[int] = int(_get("PEC_ADMISSION_CAPACITY", "") or PEC_DB_POOL_SIZE)
+PEC_ADMISSION_QUEUE_MAX: Final[int] = int(_get("PEC_ADMISSION_QUEUE_MAX", "32"))
+PEC_ADMISSION_QUEUE_PER_CLIENT: Final[int] = int(_get("PEC_ADMISSION_QUEUE_PER_CLIENT", "8"))
+PEC_ADMISSION_WAIT_SECONDS: Final[float] = float(_get("PEC_ADMISSION_WAIT_SECONDS", "10"))
+PEC_ADMISSION_WEIGHTS: Final[str] = _get("PEC_ADMISSION_WEIGHTS", "")
+
+# Guarda de custo (EXPLAIN antes de consultas amplas): acima dos limites
+# "ANALYTIC" a consulta vai para a réplica analítica; acima dos "MAX" é
+# recusada com orientação. Linhas = maior estimativa entre os nós do plano.
+# Limite <= 0 desativa a checagem correspondente.
+PEC_COST_GUARD_ENABLED: Final[bool] = _get("PEC_COST_GUARD_ENABLED", "1").strip().lower() in ("1", "true", "sim")
+PEC_COST_GUARD_ANALYTIC_COST: Final[float] = float(_get("PEC_COST_GUARD_ANALYTIC_COST", "100000"))
+PEC_COST_GUARD_ANALYTIC_ROWS: Final[float] = float(_get("PEC_COST_GUARD_ANALYTIC_ROWS", "1000000"))
+PEC_COST_GUARD_MAX_COST: Final[float] = float(_get("PEC_COST_GUARD_MAX_COST", "10000000"))
+PEC_COST_GUARD_MAX_ROWS: Final[float] = float(_get("PEC_COST_GUARD_MAX_ROWS", "0"))
+# Contagens acima do limite MAX respondem em modo aproximado em vez de recusar.
+PEC_COST_GUARD_APPROXIMATE: Final[bool] = (
+    _get("PEC_COST_GUARD_APPROXIMATE", "1").strip().lower() in ("1", "true", "sim")
+)
+# Percentual de blocos de tb_cidadao lidos no modo aproximado (TABLESAMPLE SYSTEM).
+PEC_APPROX_SAMPLE_PERCENT: Final[float] = float(_get("PEC_APPROX_SAMPLE_PERCENT", "5"))
+
+# Índice local de texto (SQLite FTS5) das evoluções SOAP. Caminho vazio desativa
+# o índice e a tool buscar_atendimentos_soap. O avanço é incremental a partir do
+# maior co_seq_atend_prof indexado; REVISIT relê os últimos ids abaixo dele para
+# pegar evoluções gravadas depois do atendimento. O servidor sincroniza em
+# segundo plano a cada REFRESH segundos.
+PEC_SOAP_INDEX_PATH: Final[str] = _get("PEC_SOAP_INDEX_PATH", "")
+PEC_SOAP_INDEX_REFRESH_SECONDS: Final[int] = int(_get("PEC_SOAP_INDEX_REFRESH_SECONDS", "60"))
+PEC_SOAP_INDEX_BATCH: Final[int] = int(_get("PEC_SOAP_INDEX_BATCH", "5000"))
+PEC_SOAP_INDEX_REVISIT: Final[int] = int(_get("PEC_SOAP_INDEX_REVISIT", "2000"))
+
+# Espelho analítico local (SQLite) das tabelas lidas pelas tools de contagem e
+# coorte. Caminho vazio desativa. TOOLS lista (separadas por vírgula) as tools
+# servidas pelo espelho; com ele mais velho que MAX_AGE elas voltam ao Postgres.
+# Tabelas sem chave sequencial (catálogos, vínculos) só podem ser relidas por
+# inteiro, e por isso em intervalo próprio (KEYLESS_REFRESH), mais longo.
+PEC_MIRROR_PATH: Final[str] = _get("PEC_MIRROR_PATH", "")
+PEC_MIRROR_TOOLS: Final[str] = _get("PEC_MIRROR_TOOLS", "")
+PEC_MIRROR_REFRESH_SECONDS: Final[int] = int(_get("PEC_MIRROR_REFRESH_SECONDS", "300"))
+PEC_MIRROR_FULL_REBUILD_SECONDS: Final[int] = int(_get("PEC_MIRROR_FULL_REBUILD_SECONDS", "86400"))
+PEC_MIRROR_KEYLESS_REFRESH_SECONDS: Final[int] = int(_get("PEC_MIRROR_KEYLESS_REFRESH_SECONDS", "3600"))
+PEC_MIRROR_MAX_AGE_SECONDS: Final[int] = int(_get("PEC_MIRROR_MAX_AGE_SECONDS", "900"))
+PEC_MIRROR_BATCH: Final[int] = int(_get("PEC_MIRROR_BATCH", "20000"))
+
+
 def get_db_dsn() -> str:
     """
     Monta a DSN no formato aceito pelo psycopg2.
@@ -70,5 +162,48 @@ __all__ = [
     "PEC_DB_NAME",
     "PEC_DB_USER",
     "PEC_DB_PASSWORD",
+    "PEC_DB_NODES",
+    "PEC_DB_MAX_LAG_SECONDS",
+    "PEC_DB_HEALTH_INTERVAL_SECONDS",
+    "PEC_DB_CONNECT_TIMEOUT",
+    "PEC_DB_POOL_SIZE",
+    "PEC_DB_POOL_TIMEOUT_SECONDS",
+    "PEC_FEDERATION_MEMBERS",
+    "PEC_FEDERATION_TIMEOUT_SECONDS",
+    "PEC_GESTANTES_REFRESH_SECONDS",
+    "PEC_EPIDEMIOLOGIA_ENGINE",
+    "PEC_EPIDEMIOLOGIA_REFRESH_SECONDS",
+    "PEC_ULTIMA_CONSULTA_REFRESH_SECONDS",
+    "PEC_ULTIMA_CONSULTA_FULL_REBUILD_SECONDS",
+    "PEC_ULTIMA_CONSULTA_REVISIT",
+    "PEC_SERIE_ATENDIMENTOS_CACHE_SECONDS",
+    "PEC_CATALOGO_CODIGOS_REFRESH_SECONDS",
+    "PEC_NOMES_REFRESH_SECONDS",
+    "PEC_NOMES_FULL_REBUILD_SECONDS",
+    "PEC_WARMUP_ENABLED",
+    "PEC_WARMUP_PROBES",
+    "PEC_ADMISSION_CAPACITY",
+    "PEC_ADMISSION_QUEUE_MAX",
+    "PEC_ADMISSION_QUEUE_PER_CLIENT",
+    "PEC_ADMISSION_WAIT_SECONDS",
+    "PEC_ADMISSION_WEIGHTS",
+    "PEC_COST_GUARD_ENABLED",
+    "PEC_COST_GUARD_ANALYTIC_COST",
+    "PEC_COST_GUARD_ANALYTIC_ROWS",
+    "PEC_COST_GUARD_MAX_COST",
+    "PEC_COST_GUARD_MAX_ROWS",
+    "PEC_COST_GUARD_APPROXIMATE",
+    "PEC_APPROX_SAMPLE_PERCENT",
+    "PEC_SOAP_INDEX_PATH",
+    "PEC_SOAP_INDEX_REFRESH_SECONDS",
+    "PEC_SOAP_INDEX_BATCH",
+    "PEC_SOAP_INDEX_REVISIT",
+    "PEC_MIRROR_PATH",
+    "PEC_MIRROR_TOOLS",
+    "PEC_MIRROR_REFRESH_SECONDS",
+    "PEC_MIRROR_FULL_REBUILD_SECONDS",
+    "PEC_MIRROR_KEYLESS_REFRESH_SECONDS",
+    "PEC_MIRROR_MAX_AGE_SECONDS",
+    "PEC_MIRROR_BATCH",
     "get_db_dsn",
 ]
@@ -7,7 +7,8 @@ e facilitar testes (princípios KISS e YAGNI).
 
 from __future__ import annotations
 
-from typing import Iterable, Optional, Sequence
+import uuid
+from typing import Iterable, Iterator, Optional, Sequence
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
@@ -15,15 +16,16 @@ from psycopg2.extras import RealDictCursor
 from .config import get_db_dsn
 
 
-def get_connection(dsn: Optional[str] = None):
+def get_connection(dsn: Optional[str] = None, **kwargs):
     """
     Abre conexão com o PostgreSQL usando RealDictCursor para devolver dicts.
 
     Quem chama gerencia o ciclo de vida (abrir/fechar), permitindo reuso
-    de conexão no lifespan do servidor MCP.
+    de conexão no lifespan do servidor MCP. kwargs extras (ex.: connect_timeout)
+    são repassados ao psycopg2.
     """
 
-    return psycopg2.connect(dsn=dsn or get_db_dsn(), cursor_factory=RealDictCursor)
+    return psycopg2.connect(dsn=dsn or get_db_dsn(), cursor_factory=RealDictCursor, **kwargs)
 
 
 def query_all(conn, sql: str, params: Optional[Sequence] = None) -> list[dict]:
@@ -50,4 +52,18 @@ def query_one(conn, sql: str, params: Optional[Sequence] = None) -> Optional[dic
     return row if row is not None else None
 
 
-__all__ = ["get_connection", "query_all", "query_one"]
+def query_iter(conn, sql: str, params: Optional[Sequence] = None, itersize: int = 2000) -> Iterator[dict]:
+    """
+    Itera as linhas de uma consulta grande sem trazer o resultado inteiro.
+
+    Usa cursor nomeado (do lado do servidor), lido em lotes de itersize
+    linhas. WITH HOLD permite o cursor nas conexões em autocommit das tools.
+    """
+
+    with conn.cursor(name=f"pec_{uuid.uuid4().hex}", withhold=True) as cur:
+        cur.itersize = itersize
+        cur.execute(sql, params or ())
+        yield from cur
+
+
+__all__ = ["get_connection", "query_all", "query_iter", "query_one"]
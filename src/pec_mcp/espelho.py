@@ -0,0 +1,514 @@
+"""
+Espelho analítico local (SQLite) das tabelas lidas pelas tools de contagem e coorte.
+
+Contagens e listas de coorte disputam o Postgres com o atendimento clínico.
+Aqui mantemos num arquivo SQLite local exatamente as tabelas e colunas que
+essas tools leem, sincronizadas em segundo plano, e as tools habilitadas em
+PEC_MIRROR_TOOLS passam a ler do arquivo, sem tocar a produção.
+
+Sincronização:
+- tabelas com chave sequencial (co_seq_*) avançam por marca d'água,
+  em lotes (chave > última lida), e são recarregadas por inteiro a cada
+  PEC_MIRROR_FULL_REBUILD_SECONDS para refletir alterações de linhas antigas;
+- tabelas de referência/vínculo, sem chave sequencial, só podem ser relidas
+  por inteiro e por isso são recarregadas a cada
+  PEC_MIRROR_KEYLESS_REFRESH_SECONDS, não a cada ciclo (cada uma numa
+  transação: leitores veem a versão anterior até o commit).
+
+A leitura do Postgres usa cursor do lado do servidor, em lotes de
+PEC_MIRROR_BATCH linhas.
+
+As tools continuam escrevendo o SQL do Postgres: ConexaoEspelho imita o
+cursor do psycopg2 e traduz o subconjunto de sintaxe que elas usam
+(%s, = ANY(%s), ILIKE, ::date). Consultas com construções sem equivalente
+(DISTINCT ON, TABLESAMPLE, INTERVAL...) são recusadas, e a resposta traz em
+"fonte" a idade das tabelas que a consulta leu, no total e por tabela.
+
+Cada tabela tem sua idade aceita: PEC_MIRROR_MAX_AGE_SECONDS para as
+incrementais e, para as sem chave, o próprio intervalo de recarga mais esse
+limite. Com alguma acima disso, as tools voltam ao Postgres.
+
+Carga inicial fora do servidor (opcional; o servidor também sincroniza):
+
+    PYTHONPATH=src python -m pec_mcp.espelho --caminho espelho.sqlite3
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing, nullcontext
+from itertools import islice
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from .config import (
+    PEC_MIRROR_BATCH,
+    PEC_MIRROR_FULL_REBUILD_SECONDS,
+    PEC_MIRROR_KEYLESS_REFRESH_SECONDS,
+    PEC_MIRROR_MAX_AGE_SECONDS,
+    PEC_MIRROR_PATH,
+    PEC_MIRROR_REFRESH_SECONDS,
+    PEC_MIRROR_TOOLS,
+)
+from .cache import registrar_banco
+from .db import get_connection, query_iter
+from .models import FonteDados
+from .routing import DbRouter, get_router
+
+logger = logging.getLogger(__name__)
+
+# Tools cujo SQL roda no espelho (as demais ignoram PEC_MIRROR_TOOLS).
+FERRAMENTAS_SUPORTADAS: FrozenSet[str] = frozenset(
+    {"contar_pacientes", "contar_pacientes_sem_consulta", "listar_pacientes_sem_consulta"}
+)
+
+
+class TabelaEspelho(NamedTuple):
+    nome: str
+    colunas: Tuple[str, ...]
+    # Chave sequencial para avanço incremental; None recarrega a tabela toda.
+    chave: Optional[str]
+    indices: Tuple[str, ...] = ()
+
+
+# Colunas lidas por contar_pacientes (filtros de paciente/condição),
+# *_sem_consulta (perfis, gestantes, última consulta) e pelo catálogo de códigos.
+TABELAS_ESPELHO: Tuple[TabelaEspelho, ...] = (
+    TabelaEspelho(
+        "tb_cidadao",
+        ("co_seq_cidadao", "no_cidadao", "dt_nascimento", "no_sexo", "co_localidade_endereco"),
+        "co_seq_cidadao",
+    ),
+    TabelaEspelho("tb_prontuario", ("co_seq_prontuario", "co_cidadao"), "co_seq_prontuario", ("co_cidadao",)),
+    TabelaEspelho(
+        "tb_problema",
+        ("co_seq_problema", "co_prontuario", "co_cid10", "co_ciap", "co_unico_problema", "ds_outro"),
+        "co_seq_problema",
+        ("co_prontuario", "co_cid10", "co_ciap"),
+    ),
+    TabelaEspelho(
+        "tb_atend",
+        ("co_seq_atend", "co_prontuario", "co_unidade_saude", "dt_inicio"),
+        "co_seq_atend",
+        ("co_prontuario",),
+    ),
+    TabelaEspelho(
+        "tb_atend_prof",
+        ("co_seq_atend_prof", "co_atend", "co_lotacao", "tp_atend_prof", "tp_atend"),
+        "co_seq_atend_prof",
+        ("co_atend",),
+    ),
+    TabelaEspelho(
+        "tb_fat_cidadao_pec", ("co_seq_fat_cidadao_pec", "co_cidadao"), "co_seq_fat_cidadao_pec", ("co_cidadao",)
+    ),
+    TabelaEspelho(
+        "tb_fat_cad_individual",
+        ("co_seq_fat_cad_individual", "co_fat_cidadao_pec", "nu_micro_area", "st_ficha_inativa", "co_dim_tempo"),
+        "co_seq_fat_cad_individual",
+        ("co_fat_cidadao_pec",),
+    ),
+    TabelaEspelho("tb_cidadao_vinculacao_equipe", ("co_cidadao", "nu_cnes", "nu_ine"), None, ("co_cidadao",)),
+    TabelaEspelho("tb_pre_natal", ("co_prontuario", "dt_desfecho", "dt_ultima_menstruacao"), None, ("co_prontuario",)),
+    TabelaEspelho("tb_lotacao", ("co_ator_papel", "co_cbo", "co_prof"), None, ("co_ator_papel",)),
+    TabelaEspelho("tb_cbo", ("co_cbo", "co_cbo_2002", "no_cbo"), None, ("co_cbo",)),
+    TabelaEspelho("tb_cid10", ("co_cid10", "nu_cid10", "no_cid10"), None, ("co_cid10",)),
+    TabelaEspelho("tb_ciap", ("co_seq_ciap", "co_ciap", "ds_ciap"), None, ("co_seq_ciap",)),
+    TabelaEspelho("tb_unidade_saude", ("co_seq_unidade_saude", "nu_cnes"), None, ("co_seq_unidade_saude",)),
+    TabelaEspelho("tb_equipe", ("co_seq_equipe", "nu_ine"), None, ("co_seq_equipe",)),
+)
+
+_NOMES_TABELAS: FrozenSet[str] = frozenset(tabela.nome for tabela in TABELAS_ESPELHO)
+
+
+def _idade_aceita(tabela: TabelaEspelho) -> float:
+    # Sem chave, a tabela só é relida a cada KEYLESS_REFRESH: a idade aceita inclui esse intervalo.
+    return PEC_MIRROR_MAX_AGE_SECONDS + (0 if tabela.chave else PEC_MIRROR_KEYLESS_REFRESH_SECONDS)
+
+_SQL_ESTADO = """
+CREATE TABLE IF NOT EXISTS _espelho_estado (
+    tabela       TEXT PRIMARY KEY,
+    watermark    INTEGER,
+    atualizado_em REAL,
+    completo_em  REAL
+);
+"""
+
+# --- Tradução do SQL das tools (Postgres) para SQLite -----------------------
+
+_NAO_SUPORTADO = re.compile(r"\b(DISTINCT\s+ON|TABLESAMPLE|LATERAL|INTERVAL|CURRENT_DATE|AGE\s*\()", re.IGNORECASE)
+_ILIKE_ANY = re.compile(r"([\w.]+)\s+ILIKE\s+ANY\s*\(%s\)", re.IGNORECASE)
+_IGUAL_ANY = re.compile(r"([\w.]+)\s*=\s*ANY\s*\(%s\)", re.IGNORECASE)
+_CAST = re.compile(r"(\w+\([^()]*\)|[\w.]+)::(date|int|integer|bigint|text)\b", re.IGNORECASE)
+_TIPOS_CAST = {"int": "INTEGER", "integer": "INTEGER", "bigint": "INTEGER", "text": "TEXT"}
+_TABELA_LIDA = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)", re.IGNORECASE)
+_DATA = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_DATA_HORA = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}")
+
+
+def _converter_parametro(valor):
+    if isinstance(valor, (list, tuple)):
+        # Arrays viram JSON lido por json_each() (ver = ANY abaixo).
+        return json.dumps([_converter_parametro(v) for v in valor])
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return valor
+
+
+def traduzir(sql: str, params: Optional[Sequence] = None) -> Tuple[str, List]:
+    """
+    Converte o SQL (sintaxe psycopg2/Postgres) das tools em SQL e parâmetros do SQLite.
+    """
+
+    encontrado = _NAO_SUPORTADO.search(sql)
+    if encontrado:
+        raise ValueError(f"Consulta não suportada no espelho ({encontrado.group(1).upper()}).")
+    sql = _ILIKE_ANY.sub(r"EXISTS (SELECT 1 FROM json_each(%s) WHERE \1 LIKE json_each.value)", sql)
+    sql = _IGUAL_ANY.sub(r"\1 IN (SELECT value FROM json_each(%s))", sql)
+    sql = re.sub(r"\bILIKE\b", "LIKE", sql, flags=re.IGNORECASE)
+
+    def _cast(m: re.Match) -> str:
+        tipo = m.group(2).lower()
+        if tipo == "date":
+            return f"date({m.group(1)})"
+        return f"CAST({m.group(1)} AS {_TIPOS_CAST[tipo]})"
+
+    sql = _CAST.sub(_cast, sql)
+    sql = re.sub(r"%(s|%)", lambda m: "?" if m.group(1) == "s" else "%", sql)
+    return sql, [_converter_parametro(v) for v in params or ()]
+
+
+def _converter_valor(valor):
+    # Datas são gravadas em ISO; devolvemos date/datetime como o psycopg2.
+    if isinstance(valor, str):
+        if _DATA.match(valor):
+            return date.fromisoformat(valor)
+        if _DATA_HORA.match(valor):
+            try:
+                return datetime.fromisoformat(valor)
+            except ValueError:
+                return valor
+    return valor
+
+
+class _CursorEspelho:
+    def __init__(self, caminho: str, lidas: Set[str]) -> None:
+        self._db = sqlite3.connect(caminho, timeout=30)
+        self._cur = self._db.cursor()
+        self._lidas = lidas
+
+    def __enter__(self) -> "_CursorEspelho":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
+
+    def close(self) -> None:
+        self._db.close()
+
+    def execute(self, sql: str, params: Optional[Sequence] = None) -> None:
+        self._cur.execute(*traduzir(sql, params))
+        self._lidas.update(nome.lower() for nome in _TABELA_LIDA.findall(sql) if nome.lower() in _NOMES_TABELAS)
+
+    def _linha(self, row) -> Dict[str, object]:
+        nomes = [coluna[0] for coluna in self._cur.description]
+        return {nome: _converter_valor(valor) for nome, valor in zip(nomes, row)}
+
+    def fetchone(self) -> Optional[Dict[str, object]]:
+        row = self._cur.fetchone()
+        return self._linha(row) if row is not None else None
+
+    def fetchmany(self, size: int) -> List[Dict[str, object]]:
+        return [self._linha(row) for row in self._cur.fetchmany(size)]
+
+    def fetchall(self) -> List[Dict[str, object]]:
+        return [self._linha(row) for row in self._cur.fetchall()]
+
+
+class ConexaoEspelho:
+    """
+    Conexão só de leitura no espelho, com a interface usada por query_all/query_one.
+
+    dsn identifica o espelho para os caches por banco (catálogo, última consulta).
+    Guarda as tabelas lidas pelas consultas, base da idade informada em fonte.
+    """
+
+    def __init__(self, espelho: "Espelho") -> None:
+        self.espelho = espelho
+        self.caminho = espelho.caminho
+        self.dsn = f"espelho:{espelho.caminho}"
+        self.tabelas_lidas: Set[str] = set()
+        registrar_banco(self, lambda: nullcontext(ConexaoEspelho(espelho)))
+
+    @property
+    def fonte(self) -> Optional[FonteDados]:
+        """
+        Idade das tabelas lidas até aqui (todas, se nenhuma consulta rodou).
+        """
+
+        return self.espelho.fonte(self.tabelas_lidas or None)
+
+    def cursor(self) -> _CursorEspelho:
+        return _CursorEspelho(self.caminho, self.tabelas_lidas)
+
+
+# --- Sincronização ------------------------------------------------------------
+
+
+def _ddl(tabela: TabelaEspelho) -> List[str]:
+    colunas = [f"{c} INTEGER PRIMARY KEY" if c == tabela.chave else c for c in tabela.colunas]
+    comandos = [f"CREATE TABLE IF NOT EXISTS {tabela.nome} ({', '.join(colunas)})"]
+    for coluna in tabela.indices:
+        comandos.append(f"CREATE INDEX IF NOT EXISTS {tabela.nome}_{coluna} ON {tabela.nome} ({coluna})")
+    return comandos
+
+
+class Espelho:
+    """
+    Arquivo SQLite do espelho, sua sincronização e a thread de atualização.
+    """
+
+    def __init__(self, caminho: str, lote: int = PEC_MIRROR_BATCH) -> None:
+        self.caminho = caminho
+        self._lote = max(1, int(lote))
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._esquema_criado = False
+
+    @property
+    def habilitado(self) -> bool:
+        return bool(self.caminho)
+
+    def _conectar(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.caminho, timeout=30)
+        if not self._esquema_criado:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(_SQL_ESTADO)
+            for tabela in TABELAS_ESPELHO:
+                for comando in _ddl(tabela):
+                    db.execute(comando)
+            db.commit()
+            self._esquema_criado = True
+        return db
+
+    def estado(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Por tabela: marca d'água, última sincronização e última recarga completa (time.time).
+        """
+
+        db = self._conectar()
+        try:
+            rows = db.execute("SELECT tabela, watermark, atualizado_em, completo_em FROM _espelho_estado").fetchall()
+        finally:
+            db.close()
+        return {
+            tabela: {"watermark": watermark, "atualizado_em": atualizado_em, "completo_em": completo_em}
+            for tabela, watermark, atualizado_em, completo_em in rows
+        }
+
+    def fonte(self, tabelas: Optional[Iterable[str]] = None) -> Optional[FonteDados]:
+        """
+        Idade das tabelas (todas por padrão), no total e por tabela; None se alguma nunca foi carregada.
+        """
+
+        estado = self.estado()
+        nomes = sorted(tabelas) if tabelas is not None else [tabela.nome for tabela in TABELAS_ESPELHO]
+        atualizadas = {nome: estado.get(nome, {}).get("atualizado_em") for nome in nomes}
+        if not atualizadas or any(valor is None for valor in atualizadas.values()):
+            return None
+        agora = time.time()
+        mais_antiga = min(atualizadas.values())
+        return FonteDados(
+            origem="espelho",
+            atualizado_em=datetime.fromtimestamp(mais_antiga, tz=timezone.utc).isoformat(),
+            defasagem_segundos=round(max(0.0, agora - mais_antiga), 1),
+            defasagem_por_tabela={nome: round(max(0.0, agora - valor), 1) for nome, valor in atualizadas.items()},
+        )
+
+    def pronto(self) -> bool:
+        """
+        Todas as tabelas carregadas e dentro da idade aceita (ver _idade_aceita).
+        """
+
+        fonte = self.fonte()
+        if fonte is None:
+            return False
+        return all(fonte["defasagem_por_tabela"][tabela.nome] <= _idade_aceita(tabela) for tabela in TABELAS_ESPELHO)
+
+    def sincronizar(self, conn, completo: bool = False) -> Dict[str, int]:
+        """
+        Sincroniza todas as tabelas a partir da conexão Postgres; retorna linhas lidas por tabela.
+        """
+
+        with self._lock:
+            started = time.monotonic()
+            estado = self.estado()
+            lidas: Dict[str, int] = {}
+            db = self._conectar()
+            try:
+                for tabela in TABELAS_ESPELHO:
+                    info = estado.get(tabela.nome)
+                    intervalo = PEC_MIRROR_FULL_REBUILD_SECONDS if tabela.chave else PEC_MIRROR_KEYLESS_REFRESH_SECONDS
+                    recarregar = (
+                        completo
+                        or info is None
+                        or info["completo_em"] is None
+                        or time.time() - info["completo_em"] >= intervalo
+                    )
+                    if tabela.chave is None and not recarregar:
+                        # Sem chave não há leitura incremental: só no próprio intervalo.
+                        lidas[tabela.nome] = 0
+                        continue
+                    lidas[tabela.nome] = self._sincronizar_tabela(
+                        conn, db, tabela, 0 if recarregar else int(info["watermark"] or 0), recarregar
+                    )
+            finally:
+                db.close()
+            logger.info(
+                "Espelho sincronizado em %.1f ms (%d linhas lidas).",
+                (time.monotonic() - started) * 1000,
+                sum(lidas.values()),
+            )
+            return lidas
+
+    def _sincronizar_tabela(self, conn, db: sqlite3.Connection, tabela: TabelaEspelho, watermark: int, recarregar: bool) -> int:
+        colunas = ", ".join(tabela.colunas)
+        insert = (
+            f"INSERT OR REPLACE INTO {tabela.nome} ({colunas}) "
+            f"VALUES ({', '.join('?' for _ in tabela.colunas)})"
+        )
+        lidas = 0
+        agora = time.time()
+        # Uma transação por tabela: recarga e marca d'água aparecem juntas.
+        with db:
+            if recarregar:
+                db.execute(f"DELETE FROM {tabela.nome}")
+            if tabela.chave is None:
+                sql, params = f"SELECT {colunas} FROM {tabela.nome}", ()
+            else:
+                sql = f"SELECT {colunas} FROM {tabela.nome} WHERE {tabela.chave} > %s ORDER BY {tabela.chave}"
+                params = (watermark,)
+            # closing: numa falha no meio da carga, o cursor do servidor fecha já.
+            with closing(query_iter(conn, sql, params, itersize=self._lote)) as linhas:
+                while True:
+                    rows = list(islice(linhas, self._lote))
+                    if not rows:
+                        break
+                    db.executemany(
+                        insert, [tuple(_converter_parametro(row[c]) for c in tabela.colunas) for row in rows]
+                    )
+                    lidas += len(rows)
+                    if tabela.chave is not None:
+                        watermark = max(watermark, int(rows[-1][tabela.chave]))
+            db.execute(
+                "INSERT OR REPLACE INTO _espelho_estado (tabela, watermark, atualizado_em, completo_em) "
+                "VALUES (?, ?, ?, COALESCE(?, (SELECT completo_em FROM _espelho_estado WHERE tabela = ?)))",
+                (tabela.nome, watermark if tabela.chave else None, agora, agora if recarregar else None, tabela.nome),
+            )
+        return lidas
+
+    def iniciar(self, router: Optional[DbRouter] = None, intervalo: float = PEC_MIRROR_REFRESH_SECONDS) -> None:
+        """
+        Sincroniza em segundo plano (thread daemon) a cada intervalo, usando o nó analítico.
+        """
+
+        if not self.habilitado or self._thread is not None:
+            return
+        router = router or get_router()
+
+        def _loop() -> None:
+            while True:
+                try:
+                    with router.pooled_connection("analytic") as conn:
+                        self.sincronizar(conn)
+                except Exception:  # noqa: BLE001 - tenta de novo no próximo ciclo
+                    logger.exception("Falha ao sincronizar o espelho analítico.")
+                if self._parar.wait(intervalo):
+                    return
+
+        self._thread = threading.Thread(target=_loop, name="pec-espelho", daemon=True)
+        self._thread.start()
+
+    def parar(self) -> None:
+        self._parar.set()
+
+
+ESPELHO = Espelho(PEC_MIRROR_PATH)
+
+_FERRAMENTAS_HABILITADAS: FrozenSet[str] = frozenset(
+    nome.strip() for nome in PEC_MIRROR_TOOLS.split(",") if nome.strip()
+)
+for _nome in sorted(_FERRAMENTAS_HABILITADAS - FERRAMENTAS_SUPORTADAS):
+    logger.warning("PEC_MIRROR_TOOLS: %s não pode ser servida pelo espelho; ignorada.", _nome)
+
+
+def conexao_espelho(
+    ctx,
+    tool: str,
+    espelho: Optional[Espelho] = None,
+    habilitadas: Optional[FrozenSet[str]] = None,
+) -> Optional[ConexaoEspelho]:
+    """
+    Conexão do espelho se a tool estiver habilitada e o espelho pronto; senão None (usar o Postgres).
+
+    Uma conexão explícita no contexto (testes, federação) sempre tem prioridade.
+    """
+
+    espelho = espelho or ESPELHO
+    habilitadas = _FERRAMENTAS_HABILITADAS if habilitadas is None else habilitadas
+    if not espelho.habilitado or tool not in habilitadas or tool not in FERRAMENTAS_SUPORTADAS:
+        return None
+    state = getattr(ctx, "state", None)
+    if isinstance(state, dict) and state.get("db_conn") is not None:
+        return None
+    if not espelho.pronto():
+        return None
+    return ConexaoEspelho(espelho)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sincroniza o espelho analítico local (SQLite).")
+    parser.add_argument("--caminho", default=PEC_MIRROR_PATH, help="arquivo SQLite (padrão: PEC_MIRROR_PATH)")
+    parser.add_argument("--dsn", help="DSN do banco (padrão: variáveis PEC_DB_*)")
+    parser.add_argument("--completo", action="store_true", help="recarrega todas as tabelas")
+    args = parser.parse_args(argv)
+    if not args.caminho:
+        parser.error("informe --caminho ou defina PEC_MIRROR_PATH.")
+
+    logging.basicConfig(level=logging.INFO)
+    conn = get_connection(args.dsn)
+    try:
+        conn.set_session(readonly=True, autocommit=True)
+        lidas = Espelho(args.caminho).sincronizar(conn, completo=args.completo)
+    finally:
+        conn.close()
+    for tabela, total in lidas.items():
+        print(f"[pec-espelho] {tabela}: {total} linhas")
+    return 0
+
+
+__all__ = [
+    "ConexaoEspelho",
+    "ESPELHO",
+    "Espelho",
+    "FERRAMENTAS_SUPORTADAS",
+    "TABELAS_ESPELHO",
+    "TabelaEspelho",
+    "conexao_espelho",
+    "main",
+    "traduzir",
+]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,348 @@
+"""
+Extração colunar (Parquet/Arrow) para pesquisa, via COPY ... TO STDOUT.
+
+As tools devolvem poucas linhas e convertem cada uma em dict; para extrações
+de milhões de linhas (problemas, atendimentos) isso é lento demais. Aqui o
+Postgres gera CSV com COPY, o stream passa por um pipe direto para o leitor
+CSV do pyarrow (em C++) e cada lote vira um record batch gravado no arquivo.
+A memória fica limitada ao tamanho do bloco, independente do total de linhas.
+
+Os filtros são os mesmos das tools (PatientFilter/ConditionFilter), com os
+códigos CID/CIAP resolvidos pelo catálogo. Requer pyarrow.
+
+Uso:
+    PYTHONPATH=src python -m pec_mcp.extracao problemas saida.parquet --cid E11 --sex F
+    PYTHONPATH=src python -m pec_mcp.extracao atendimentos saida.arrow --desde 2024-01-01 --todos
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from psycopg2.extensions import encodings
+
+from .db import get_connection
+from .tools import parse_iso_date
+from .tools.catalogo import resolver_codigos
+from .tools.filters import ConditionFilter, FilterSet, PatientFilter
+
+_BLOCO_PADRAO = 8 * 1024 * 1024
+_EXTENSOES_PARQUET = (".parquet",)
+_EXTENSOES_ARROW = (".arrow", ".feather", ".ipc")
+
+
+class Dataset(NamedTuple):
+    # SQL com {where_clause}; colunas na ordem do SELECT, com o tipo Arrow.
+    sql: str
+    colunas: Tuple[Tuple[str, str], ...]
+    # Coluna de data/hora usada por --desde/--ate (None: sem janela).
+    coluna_data: Optional[str]
+
+
+_DATASETS: Dict[str, Dataset] = {
+    "problemas": Dataset(
+        sql="""
+WITH ultima_evolucao AS (
+    SELECT DISTINCT ON (e.co_unico_problema)
+        e.co_unico_problema,
+        e.dt_inicio_problema,
+        e.dt_fim_problema,
+        e.co_situacao_problema
+    FROM tb_problema_evolucao e
+    ORDER BY e.co_unico_problema, e.co_sequencial_evolucao DESC, e.dt_inicio_problema DESC NULLS LAST
+)
+SELECT
+    p.co_seq_problema              AS problema_id,
+    pr.co_cidadao                  AS paciente_id,
+    c.dt_nascimento::date          AS data_nascimento,
+    c.no_sexo                      AS sexo,
+    cid.nu_cid10                   AS cid_code,
+    ciap.co_ciap                   AS ciap_code,
+    ue.dt_inicio_problema::date    AS dt_inicio_condicao,
+    ue.dt_fim_problema::date       AS dt_fim_condicao,
+    ue.co_situacao_problema::text  AS situacao_id
+FROM tb_problema p
+JOIN tb_prontuario pr ON pr.co_seq_prontuario = p.co_prontuario
+JOIN tb_cidadao c ON c.co_seq_cidadao = pr.co_cidadao
+LEFT JOIN ultima_evolucao ue ON ue.co_unico_problema = p.co_unico_problema
+LEFT JOIN tb_cid10 cid ON cid.co_cid10 = p.co_cid10
+LEFT JOIN tb_ciap ciap ON ciap.co_seq_ciap = p.co_ciap
+{where_clause}
+""",
+        colunas=(
+            ("problema_id", "int64"),
+            ("paciente_id", "int64"),
+            ("data_nascimento", "date32"),
+            ("sexo", "string"),
+            ("cid_code", "string"),
+            ("ciap_code", "string"),
+            ("dt_inicio_condicao", "date32"),
+            ("dt_fim_condicao", "date32"),
+            ("situacao_id", "string"),
+        ),
+        coluna_data="ue.dt_inicio_problema",
+    ),
+    "atendimentos": Dataset(
+        sql="""
+SELECT
+    ap.co_seq_atend_prof        AS atendimento_id,
+    pr.co_cidadao               AS paciente_id,
+    a.dt_inicio::timestamp      AS data_hora,
+    a.co_unidade_saude          AS unidade_id,
+    cb.co_cbo_2002              AS cbo_codigo,
+    ap.tp_atend_prof::bigint    AS tipo_profissional_id,
+    ap.tp_atend::bigint         AS tipo_atendimento_id
+FROM tb_atend_prof ap
+JOIN tb_atend       a   ON a.co_seq_atend       = ap.co_atend
+JOIN tb_prontuario  pr  ON pr.co_seq_prontuario = a.co_prontuario
+JOIN tb_cidadao     c   ON c.co_seq_cidadao     = pr.co_cidadao
+LEFT JOIN tb_lotacao l  ON l.co_ator_papel      = ap.co_lotacao
+LEFT JOIN tb_cbo     cb ON cb.co_cbo            = l.co_cbo
+{where_clause}
+""",
+        colunas=(
+            ("atendimento_id", "int64"),
+            ("paciente_id", "int64"),
+            ("data_hora", "timestamp"),
+            ("unidade_id", "int64"),
+            ("cbo_codigo", "string"),
+            ("tipo_profissional_id", "int64"),
+            ("tipo_atendimento_id", "int64"),
+        ),
+        coluna_data="a.dt_inicio",
+    ),
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as exc:  # pragma: no cover - depende do ambiente
+        raise RuntimeError("A extração colunar requer pyarrow (pip install pyarrow).") from exc
+    return pyarrow
+
+
+def schema_arrow(dataset: Dataset):
+    """
+    Schema pyarrow do dataset, na ordem das colunas do SELECT.
+    """
+
+    pa = _pyarrow()
+    tipos = {"int64": pa.int64(), "date32": pa.date32(), "string": pa.string(), "timestamp": pa.timestamp("us")}
+    return pa.schema([(nome, tipos[tipo]) for nome, tipo in dataset.colunas])
+
+
+def montar_consulta(
+    conn,
+    nome: str,
+    filters: FilterSet,
+    desde: Optional[str] = None,
+    ate: Optional[str] = None,
+    todos: bool = False,
+) -> Tuple[Dataset, str, List]:
+    """
+    SQL e parâmetros do dataset com os filtros das tools e a janela de datas.
+    """
+
+    dataset = _DATASETS.get(nome)
+    if dataset is None:
+        raise ValueError(f"dataset inválido. Use: {', '.join(_DATASETS)}.")
+    if filters.condition.condition_text:
+        raise ValueError("condition_text não é suportado na extração; use códigos CID/CIAP.")
+    if filters.has_conditions and nome != "problemas":
+        raise ValueError("Filtros de condição só se aplicam ao dataset problemas.")
+
+    if filters.has_conditions:
+        filters = filters._replace(condition=resolver_codigos(conn, filters.condition))
+    clauses, params = filters.compile("c")
+
+    data_desde = parse_iso_date(desde, "desde")
+    data_ate = parse_iso_date(ate, "ate")
+    if data_desde and data_ate and data_desde > data_ate:
+        raise ValueError("desde não pode ser posterior a ate.")
+    if data_desde is not None:
+        clauses.append(f"{dataset.coluna_data} >= %s")
+        params.append(data_desde)
+    if data_ate is not None:
+        clauses.append(f"{dataset.coluna_data} < %s")
+        params.append(data_ate + timedelta(days=1))
+
+    if not clauses and not todos:
+        raise ValueError("Informe filtros ou use --todos para extrair a base inteira.")
+    where_clause = "WHERE " + " AND ".join(clauses) if clauses else ""
+    return dataset, dataset.sql.format(where_clause=where_clause), params
+
+
+def copiar_csv(conn, sql: str, params: Sequence, destino) -> None:
+    """
+    Executa COPY (sql) TO STDOUT em CSV, escrevendo os bytes em destino.
+    """
+
+    with conn.cursor() as cur:
+        # COPY não aceita parâmetros: o psycopg2 os interpola com escape seguro.
+        consulta = cur.mogrify(sql.strip().rstrip(";"), list(params)).decode(encodings[conn.encoding])
+        cur.copy_expert(f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv)", destino)
+
+
+def gravar_stream(
+    produtor: Callable[[object], None],
+    dataset: Dataset,
+    caminho: str,
+    bloco_bytes: int = _BLOCO_PADRAO,
+) -> int:
+    """
+    Liga produtor(arquivo) -> pipe -> leitor CSV do pyarrow -> Parquet/Arrow.
+
+    O produtor roda numa thread escrevendo no pipe; o leitor consome lotes
+    de até bloco_bytes, então só um lote por vez fica em memória. Retorna o
+    total de linhas gravadas.
+    """
+
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao not in _EXTENSOES_PARQUET + _EXTENSOES_ARROW:
+        raise ValueError("Extensão de saída inválida. Use .parquet ou .arrow.")
+    pa = _pyarrow()
+    schema = schema_arrow(dataset)
+    leitura, escrita = os.pipe()
+    erros: List[BaseException] = []
+
+    def _produzir() -> None:
+        try:
+            with os.fdopen(escrita, "wb") as saida:
+                produtor(saida)
+        except BrokenPipeError:
+            pass  # o leitor desistiu; o erro dele é o que importa
+        except BaseException as exc:  # noqa: BLE001 - repassado ao chamador
+            erros.append(exc)
+
+    thread = threading.Thread(target=_produzir, name="pec-extracao-copy", daemon=True)
+    thread.start()
+    total = 0
+    try:
+        with os.fdopen(leitura, "rb") as entrada:
+            # Sem nenhum byte o leitor CSV recusa a entrada ("Empty CSV file").
+            vazio = not entrada.peek(1)
+            if not vazio:
+                leitor = pa.csv.open_csv(
+                    entrada,
+                    read_options=pa.csv.ReadOptions(column_names=schema.names, block_size=bloco_bytes),
+                    convert_options=pa.csv.ConvertOptions(
+                        column_types=schema,
+                        # COPY csv: NULL é campo vazio sem aspas; "" é texto vazio.
+                        strings_can_be_null=True,
+                        quoted_strings_can_be_null=False,
+                    ),
+                )
+                with _abrir_escritor(pa, extensao, caminho, schema) as escritor:
+                    for lote in leitor:
+                        escritor.write_batch(lote)
+                        total += lote.num_rows
+    except Exception:
+        # O erro do produtor, se houver, explica o do leitor (ex.: CSV truncado).
+        thread.join()
+        if erros:
+            raise erros[0]
+        raise
+    thread.join()
+    if erros:
+        raise erros[0]
+    if vazio:
+        # Consulta sem linhas: arquivo só com o schema.
+        with _abrir_escritor(pa, extensao, caminho, schema):
+            pass
+    return total
+
+
+def _abrir_escritor(pa, extensao: str, caminho: str, schema):
+    if extensao in _EXTENSOES_PARQUET:
+        return pa.parquet.ParquetWriter(caminho, schema, compression="zstd")
+    return pa.ipc.new_file(caminho, schema)
+
+
+def extrair(
+    conn,
+    nome: str,
+    filters: FilterSet,
+    caminho: str,
+    desde: Optional[str] = None,
+    ate: Optional[str] = None,
+    todos: bool = False,
+    bloco_bytes: int = _BLOCO_PADRAO,
+) -> int:
+    """
+    Extrai o dataset filtrado para caminho (.parquet ou .arrow); retorna o total de linhas.
+    """
+
+    dataset, sql, params = montar_consulta(conn, nome, filters, desde, ate, todos)
+    return gravar_stream(lambda saida: copiar_csv(conn, sql, params, saida), dataset, caminho, bloco_bytes)
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Extrai problemas/atendimentos do PEC para Parquet ou Arrow.")
+    parser.add_argument("dataset", choices=sorted(_DATASETS))
+    parser.add_argument("saida", help="arquivo de saída (.parquet ou .arrow)")
+    parser.add_argument("--dsn", help="DSN do banco (padrão: variáveis PEC_DB_*)")
+    parser.add_argument("--sex")
+    parser.add_argument("--age-min", type=int)
+    parser.add_argument("--age-max", type=int)
+    parser.add_argument("--unidade-saude-id", type=int)
+    parser.add_argument("--equipe-id", type=int)
+    parser.add_argument("--micro-area")
+    parser.add_argument("--cid", action="append", default=[], help="código/prefixo CID-10 (repetível)")
+    parser.add_argument("--ciap", action="append", default=[], help="código CIAP (repetível)")
+    parser.add_argument("--desde", help="data inicial (AAAA-MM-DD)")
+    parser.add_argument("--ate", help="data final inclusiva (AAAA-MM-DD)")
+    parser.add_argument("--todos", action="store_true", help="permite extrair sem nenhum filtro")
+    parser.add_argument("--bloco-mb", type=int, default=8, help="tamanho do lote lido por vez (MB)")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parser().parse_args(argv)
+    filters = FilterSet(
+        patient=PatientFilter.build(
+            sex=args.sex,
+            age_min=args.age_min,
+            age_max=args.age_max,
+            unidade_saude_id=args.unidade_saude_id,
+            equipe_id=args.equipe_id,
+            micro_area=args.micro_area,
+        ),
+        condition=ConditionFilter.build(cid_codes=args.cid or None, ciap_codes=args.ciap or None),
+    )
+
+    conn = get_connection(args.dsn)
+    try:
+        conn.set_session(readonly=True, autocommit=True)
+        conn.set_client_encoding("UTF8")
+        started = time.perf_counter()
+        total = extrair(
+            conn,
+            args.dataset,
+            filters,
+            args.saida,
+            desde=args.desde,
+            ate=args.ate,
+            todos=args.todos,
+            bloco_bytes=max(1, args.bloco_mb) * 1024 * 1024,
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+    print(f"[pec-extracao] {total} linhas em {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} linhas/s) -> {args.saida}")
+    return 0
+
+
+__all__ = ["Dataset", "copiar_csv", "extrair", "gravar_stream", "main", "montar_consulta", "schema_arrow"]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
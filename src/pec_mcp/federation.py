@@ -0,0 +1,236 @@
+"""
+Execução federada de tools em vários bancos PEC (um por município).
+
+Cada membro tem suas conexões; a mesma tool roda em paralelo em todos os
+membros, com timeout individual. Um membro lento ou fora do ar não bloqueia
+os demais: devolvemos resultados parciais com status e latência por membro.
+
+Cada chamada empresta uma conexão do membro só para si, com o
+statement_timeout daquela chamada; ao estourar o prazo, só a consulta dela é
+cancelada.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .config import (
+    PEC_DB_CONNECT_TIMEOUT,
+    PEC_DB_POOL_SIZE,
+    PEC_FEDERATION_MEMBERS,
+    PEC_FEDERATION_TIMEOUT_SECONDS,
+)
+from .db import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+class MemberContext:
+    """
+    Contexto mínimo que prende as tools à conexão de um membro.
+    """
+
+    def __init__(self, conn) -> None:
+        self.state = {"db_conn": conn}
+
+
+class _Consulta:
+    """
+    Conexão emprestada a uma chamada; cancelável só enquanto a chamada a usa.
+    """
+
+    def __init__(self, member_name: str, conn) -> None:
+        self.member_name = member_name
+        self.conn = conn
+        self._ativa = True
+        self._lock = threading.Lock()
+
+    def cancelar(self) -> None:
+        """
+        Cancela a consulta em andamento (chamado quando o membro estoura o timeout).
+        """
+
+        with self._lock:
+            if not self._ativa or getattr(self.conn, "closed", False):
+                return
+            try:
+                self.conn.cancel()
+            except Exception:  # noqa: BLE001 - melhor esforço
+                logger.exception("Falha ao cancelar consulta no membro %s.", self.member_name)
+
+    def encerrar(self) -> None:
+        # Depois daqui a conexão pode voltar ao membro e servir outra chamada.
+        with self._lock:
+            self._ativa = False
+
+
+class FederationMember:
+    """
+    Banco PEC de um município participante do consórcio.
+    """
+
+    def __init__(self, name: str, dsn: str) -> None:
+        self.name = name
+        self.dsn = dsn
+        self._livres: List[Any] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def consulta(self, timeout_seconds: float) -> Iterator[_Consulta]:
+        """
+        Conexão só de leitura exclusiva da chamada, com statement_timeout alinhado ao timeout dela.
+        """
+
+        conn = self._emprestar()
+        consulta = _Consulta(self.name, conn)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET statement_timeout = %s", (max(1, int(timeout_seconds * 1000)),))
+            yield consulta
+        finally:
+            consulta.encerrar()
+            self._devolver(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            livres, self._livres = self._livres, []
+        for conn in livres:
+            if not getattr(conn, "closed", False):
+                conn.close()
+
+    def _emprestar(self):
+        with self._lock:
+            while self._livres:
+                conn = self._livres.pop()
+                if not getattr(conn, "closed", False):
+                    return conn
+        conn = get_connection(self.dsn, connect_timeout=PEC_DB_CONNECT_TIMEOUT)
+        conn.set_session(readonly=True, autocommit=True)
+        return conn
+
+    def _devolver(self, conn) -> None:
+        if getattr(conn, "closed", False):
+            return
+        with self._lock:
+            if len(self._livres) < max(1, PEC_DB_POOL_SIZE):
+                self._livres.append(conn)
+                return
+        conn.close()
+
+
+def parse_members(raw: str) -> List[FederationMember]:
+    """
+    Lê PEC_FEDERATION_MEMBERS: lista JSON de {"name", "dsn"}.
+    """
+
+    if not raw or not raw.strip():
+        return []
+    try:
+        items = json.loads(raw)
+    except ValueError as exc:
+        raise ValueError("PEC_FEDERATION_MEMBERS deve ser uma lista JSON de membros.") from exc
+    if not isinstance(items, list):
+        raise ValueError("PEC_FEDERATION_MEMBERS deve ser uma lista JSON de membros.")
+
+    members: List[FederationMember] = []
+    names = set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("dsn"):
+            raise ValueError("Cada membro de PEC_FEDERATION_MEMBERS precisa de dsn.")
+        name = str(item.get("name") or f"membro{index}")
+        if name in names:
+            raise ValueError(f"Nome de membro duplicado em PEC_FEDERATION_MEMBERS: {name}.")
+        names.add(name)
+        members.append(FederationMember(name, str(item["dsn"])))
+    return members
+
+
+_MEMBERS: Optional[List[FederationMember]] = None
+_MEMBERS_LOCK = threading.Lock()
+
+
+def get_members() -> List[FederationMember]:
+    global _MEMBERS
+    if _MEMBERS is None:
+        with _MEMBERS_LOCK:
+            if _MEMBERS is None:
+                _MEMBERS = parse_members(PEC_FEDERATION_MEMBERS)
+    return _MEMBERS
+
+
+def federation_enabled() -> bool:
+    return bool(get_members())
+
+
+def fan_out(
+    fn: Callable[..., Any],
+    kwargs: Dict[str, Any],
+    members: Optional[List[FederationMember]] = None,
+    timeout_seconds: float = PEC_FEDERATION_TIMEOUT_SECONDS,
+) -> List[Tuple[FederationMember, str, Any, float]]:
+    """
+    Executa fn(ctx_do_membro, **kwargs) em todos os membros em paralelo.
+
+    Retorna (membro, status, resultado_ou_erro, latencia_ms) na ordem dos
+    membros; status é "ok", "erro" ou "timeout".
+    """
+
+    members = get_members() if members is None else members
+    if not members:
+        raise ValueError("Federação não configurada (PEC_FEDERATION_MEMBERS).")
+
+    consultas: Dict[int, _Consulta] = {}
+
+    def _run(indice: int, member: FederationMember):
+        started = time.perf_counter()
+        with member.consulta(timeout_seconds) as consulta:
+            consultas[indice] = consulta
+            result = fn(MemberContext(consulta.conn), **kwargs)
+        return result, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=len(members), thread_name_prefix="pec-federation")
+    try:
+        futures = [executor.submit(_run, indice, member) for indice, member in enumerate(members)]
+        wait(futures, timeout=timeout_seconds)
+    finally:
+        # Não esperamos membros lentos: a consulta deles é cancelada abaixo.
+        executor.shutdown(wait=False)
+
+    outcomes: List[Tuple[FederationMember, str, Any, float]] = []
+    for indice, (member, future) in enumerate(zip(members, futures)):
+        if not future.done():
+            # Cancela só a consulta desta chamada; as de outras chamadas ao
+            # mesmo membro usam outras conexões.
+            consulta = consultas.get(indice)
+            if consulta is not None:
+                consulta.cancelar()
+            future.cancel()
+            elapsed = (time.perf_counter() - started) * 1000
+            outcomes.append((member, "timeout", TimeoutError("tempo limite excedido"), elapsed))
+            continue
+        exc = future.exception()
+        if exc is not None:
+            elapsed = (time.perf_counter() - started) * 1000
+            logger.warning("Membro %s falhou: %s", member.name, exc)
+            outcomes.append((member, "erro", exc, elapsed))
+            continue
+        result, latency_ms = future.result()
+        outcomes.append((member, "ok", result, latency_ms))
+    return outcomes
+
+
+__all__ = [
+    "FederationMember",
+    "MemberContext",
+    "fan_out",
+    "federation_enabled",
+    "get_members",
+    "parse_members",
+]
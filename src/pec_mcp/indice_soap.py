@@ -0,0 +1,378 @@
+"""
+Índice local de texto completo (SQLite FTS5) das evoluções SOAP.
+
+Buscar termos no texto livre do SOAP com ILIKE '%...%' no Postgres varre
+todas as evoluções e disputa I/O com o atendimento clínico. Aqui copiamos
+o texto de tb_evolucao_subjetivo/objetivo/avaliacao/plano, por
+co_atend_prof, para um arquivo SQLite local com FTS5 (tokenizador unicode61
+sem acentos: "dispneia" encontra "dispnéia") e a busca roda só nele.
+
+O avanço é incremental: a cada sincronização lemos os atendimentos acima
+do maior co_seq_atend_prof já indexado (marca d'água), em lotes, e relemos
+os últimos PEC_SOAP_INDEX_REVISIT ids abaixo dela, porque a evolução pode
+ser gravada depois do atendimento. O servidor sincroniza numa thread em
+segundo plano (iniciar); a tool de busca só lê o índice e informa a idade
+dele. A carga inicial de uma base grande deve ser feita fora do servidor:
+
+    PYTHONPATH=src PEC_SOAP_INDEX_PATH=soap.sqlite3 python -m pec_mcp.indice_soap
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from .config import (
+    PEC_SOAP_INDEX_BATCH,
+    PEC_SOAP_INDEX_PATH,
+    PEC_SOAP_INDEX_REFRESH_SECONDS,
+    PEC_SOAP_INDEX_REVISIT,
+)
+from .db import get_connection, query_all
+from .routing import DbRouter, get_router
+
+logger = logging.getLogger(__name__)
+
+# Seção SOAP -> coluna FTS5 (na ordem das colunas, usada por snippet()).
+SECOES: Dict[str, str] = {"S": "subjetivo", "O": "objetivo", "A": "avaliacao", "P": "plano"}
+
+# Marcadores de destaque sem chance de aparecer no texto clínico; trocados por ** na saída.
+_ABRE, _FECHA = "\x02", "\x03"
+_TOKENS_TRECHO = 16
+
+_SQL_ATENDIMENTOS = """
+SELECT
+    ap.co_seq_atend_prof AS atendimento_id,
+    pr.co_cidadao        AS paciente_id,
+    a.dt_inicio          AS data_hora,
+    cb.co_cbo_2002       AS cbo_codigo,
+    es.ds_subjetivo      AS subjetivo,
+    eo.ds_objetivo       AS objetivo,
+    ea.ds_avaliacao      AS avaliacao,
+    ep.ds_plano          AS plano
+FROM tb_atend_prof ap
+JOIN tb_atend       a   ON a.co_seq_atend       = ap.co_atend
+JOIN tb_prontuario  pr  ON pr.co_seq_prontuario = a.co_prontuario
+LEFT JOIN tb_lotacao l  ON l.co_ator_papel      = ap.co_lotacao
+LEFT JOIN tb_cbo     cb ON cb.co_cbo            = l.co_cbo
+LEFT JOIN tb_evolucao_subjetivo es ON es.co_atend_prof = ap.co_seq_atend_prof
+LEFT JOIN tb_evolucao_objetivo  eo ON eo.co_atend_prof = ap.co_seq_atend_prof
+LEFT JOIN tb_evolucao_avaliacao ea ON ea.co_atend_prof = ap.co_seq_atend_prof
+LEFT JOIN tb_evolucao_plano     ep ON ep.co_atend_prof = ap.co_seq_atend_prof
+WHERE ap.co_seq_atend_prof > %s
+  AND ap.co_seq_atend_prof <= %s
+  AND (cb.co_cbo_2002 LIKE '225%%' OR cb.co_cbo_2002 LIKE '2235%%')  -- médicos e enfermeiros, como nas tools SOAP
+ORDER BY ap.co_seq_atend_prof
+LIMIT %s
+"""
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS atendimento (
+    atendimento_id INTEGER PRIMARY KEY,
+    paciente_id    INTEGER NOT NULL,
+    data_hora      TEXT,
+    cbo_codigo     TEXT
+);
+CREATE INDEX IF NOT EXISTS atendimento_paciente ON atendimento (paciente_id, data_hora);
+CREATE INDEX IF NOT EXISTS atendimento_data ON atendimento (data_hora);
+CREATE VIRTUAL TABLE IF NOT EXISTS soap USING fts5 (
+    subjetivo, objetivo, avaliacao, plano,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS estado (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+_MAX_ID = 2**63 - 1
+
+# Frases entre aspas ou palavras (com * final para prefixo).
+_TERMO = re.compile(r'"([^"]+)"|(\w+\*?)')
+
+
+def expressao_fts(termo: str, secoes: Optional[Sequence[str]] = None) -> str:
+    """
+    Converte o termo do usuário numa expressão FTS5 segura (todas as palavras).
+
+    Nada do texto vira sintaxe FTS5: cada palavra ou frase vai entre aspas;
+    só o * final de prefixo e o filtro de colunas das seções são gerados aqui.
+    """
+
+    partes: List[str] = []
+    for frase, palavra in _TERMO.findall(termo or ""):
+        if frase:
+            palavras = re.findall(r"\w+", frase)
+            if palavras:
+                partes.append('"' + " ".join(palavras) + '"')
+        else:
+            prefixo = palavra.endswith("*")
+            partes.append('"' + palavra.rstrip("*") + '"' + ("*" if prefixo else ""))
+    if not partes:
+        raise ValueError("termo deve conter ao menos uma palavra.")
+    expressao = " ".join(partes)
+    if secoes:
+        colunas = []
+        for secao in secoes:
+            coluna = SECOES.get(str(secao).strip().upper())
+            if coluna is None:
+                raise ValueError("secoes inválidas. Use S, O, A e/ou P.")
+            colunas.append(coluna)
+        expressao = "{" + " ".join(dict.fromkeys(colunas)) + "} : (" + expressao + ")"
+    return expressao
+
+
+class IndiceSOAP:
+    """
+    Arquivo SQLite com o texto SOAP indexado e a marca d'água da sincronização.
+
+    Cada operação abre sua própria conexão SQLite (WAL), então buscas em
+    threads diferentes não bloqueiam nem são bloqueadas pela sincronização.
+    """
+
+    def __init__(
+        self,
+        caminho: str,
+        lote: int = PEC_SOAP_INDEX_BATCH,
+        revisitar: int = PEC_SOAP_INDEX_REVISIT,
+    ) -> None:
+        self.caminho = caminho
+        self._lote = max(1, int(lote))
+        self._revisitar = max(0, int(revisitar))
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._esquema_criado = False
+
+    @property
+    def habilitado(self) -> bool:
+        return bool(self.caminho)
+
+    def _conectar(self) -> sqlite3.Connection:
+        if not self.habilitado:
+            raise RuntimeError("Índice SOAP desativado (defina PEC_SOAP_INDEX_PATH).")
+        db = sqlite3.connect(self.caminho, timeout=30)
+        db.row_factory = sqlite3.Row
+        if not self._esquema_criado:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_ESQUEMA)
+            self._esquema_criado = True
+        return db
+
+    def estado(self) -> Dict[str, object]:
+        """
+        Marca d'água, instante da última sincronização (time.time) e total indexado.
+        """
+
+        db = self._conectar()
+        try:
+            valores = {row["chave"]: row["valor"] for row in db.execute("SELECT chave, valor FROM estado")}
+            total = db.execute("SELECT COUNT(*) FROM atendimento").fetchone()[0]
+        finally:
+            db.close()
+        return {
+            "watermark": int(valores.get("watermark") or 0),
+            "atualizado_em": float(valores["atualizado_em"]) if valores.get("atualizado_em") else None,
+            "total": int(total),
+        }
+
+    def sincronizar(self, conn) -> int:
+        """
+        Relê a janela de revisita e avança a partir da marca d'água; retorna atendimentos lidos.
+        """
+
+        with self._lock:
+            started = time.monotonic()
+            watermark = int(self.estado()["watermark"])
+            lidos = 0
+            if watermark and self._revisitar:
+                lidos += self._copiar(conn, max(0, watermark - self._revisitar), watermark)
+            lidos += self._copiar(conn, watermark, _MAX_ID, avancar=True)
+            logger.info(
+                "Índice SOAP sincronizado em %.1f ms (%d atendimentos lidos).",
+                (time.monotonic() - started) * 1000,
+                lidos,
+            )
+            return lidos
+
+    def iniciar(self, router: Optional[DbRouter] = None, intervalo: float = PEC_SOAP_INDEX_REFRESH_SECONDS) -> None:
+        """
+        Sincroniza em segundo plano (thread daemon) a cada intervalo, usando o nó analítico.
+        """
+
+        if not self.habilitado or self._thread is not None:
+            return
+        router = router or get_router()
+
+        def _loop() -> None:
+            while True:
+                try:
+                    with router.pooled_connection("analytic") as conn:
+                        self.sincronizar(conn)
+                except Exception:  # noqa: BLE001 - tenta de novo no próximo ciclo
+                    logger.exception("Falha ao sincronizar o índice SOAP.")
+                if self._parar.wait(intervalo):
+                    return
+
+        self._thread = threading.Thread(target=_loop, name="pec-indice-soap", daemon=True)
+        self._thread.start()
+
+    def parar(self) -> None:
+        self._parar.set()
+
+    def _copiar(self, conn, inicio: int, fim: int, avancar: bool = False) -> int:
+        lidos = 0
+        while True:
+            rows = query_all(conn, _SQL_ATENDIMENTOS, (inicio, fim, self._lote))
+            if not rows:
+                break
+            self._gravar(rows, avancar)
+            lidos += len(rows)
+            inicio = int(rows[-1]["atendimento_id"])
+            if len(rows) < self._lote:
+                break
+        if avancar:
+            db = self._conectar()
+            try:
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO estado (chave, valor) VALUES ('atualizado_em', ?)",
+                        (repr(time.time()),),
+                    )
+            finally:
+                db.close()
+        return lidos
+
+    def _gravar(self, rows: List[dict], avancar: bool) -> None:
+        ids = [(int(row["atendimento_id"]),) for row in rows]
+        com_texto = [row for row in rows if any(row.get(coluna) for coluna in SECOES.values())]
+        db = self._conectar()
+        try:
+            # Uma transação por lote: o lote e a marca d'água avançam juntos.
+            with db:
+                db.executemany("DELETE FROM soap WHERE rowid = ?", ids)
+                db.executemany("DELETE FROM atendimento WHERE atendimento_id = ?", ids)
+                db.executemany(
+                    "INSERT INTO atendimento (atendimento_id, paciente_id, data_hora, cbo_codigo) VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            int(row["atendimento_id"]),
+                            int(row["paciente_id"]),
+                            row["data_hora"].isoformat() if row.get("data_hora") is not None else None,
+                            row.get("cbo_codigo"),
+                        )
+                        for row in com_texto
+                    ],
+                )
+                db.executemany(
+                    "INSERT INTO soap (rowid, subjetivo, objetivo, avaliacao, plano) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (int(row["atendimento_id"]),) + tuple(row.get(coluna) for coluna in SECOES.values())
+                        for row in com_texto
+                    ],
+                )
+                if avancar:
+                    db.execute(
+                        "INSERT OR REPLACE INTO estado (chave, valor) VALUES ('watermark', ?)",
+                        (str(ids[-1][0]),),
+                    )
+        finally:
+            db.close()
+
+    def buscar(
+        self,
+        expressao: str,
+        paciente_id: Optional[int] = None,
+        desde: Optional[str] = None,
+        ate_exclusivo: Optional[str] = None,
+        limite: int = 20,
+    ) -> List[dict]:
+        """
+        Atendimentos que casam com a expressão FTS5, mais recentes primeiro, com trechos por seção.
+        """
+
+        clauses = ["soap MATCH ?"]
+        params: List[object] = [expressao]
+        if paciente_id is not None:
+            clauses.append("a.paciente_id = ?")
+            params.append(paciente_id)
+        if desde is not None:
+            clauses.append("a.data_hora >= ?")
+            params.append(desde)
+        if ate_exclusivo is not None:
+            clauses.append("a.data_hora < ?")
+            params.append(ate_exclusivo)
+        trechos = ",\n".join(
+            f"snippet(soap, {i}, '{_ABRE}', '{_FECHA}', '…', {_TOKENS_TRECHO}) AS {secao}"
+            for i, secao in enumerate(SECOES)
+        )
+        sql = f"""
+SELECT a.atendimento_id, a.paciente_id, a.data_hora, a.cbo_codigo,
+{trechos}
+FROM soap
+JOIN atendimento a ON a.atendimento_id = soap.rowid
+WHERE {" AND ".join(clauses)}
+ORDER BY a.data_hora DESC, a.atendimento_id DESC
+LIMIT ?
+"""
+        params.append(limite)
+        db = self._conectar()
+        try:
+            rows = db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+        resultados = []
+        for row in rows:
+            resultados.append(
+                {
+                    "atendimento_id": int(row["atendimento_id"]),
+                    "paciente_id": int(row["paciente_id"]),
+                    "data_hora": row["data_hora"],
+                    "cbo_codigo": row["cbo_codigo"],
+                    # snippet() devolve o início da coluna mesmo sem ocorrência; só
+                    # as seções com destaque entram no resultado.
+                    "trechos": {
+                        secao: row[secao].replace(_ABRE, "**").replace(_FECHA, "**")
+                        for secao in SECOES
+                        if row[secao] and _ABRE in row[secao]
+                    },
+                }
+            )
+        return resultados
+
+
+INDICE_SOAP = IndiceSOAP(PEC_SOAP_INDEX_PATH)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sincroniza o índice local de texto SOAP (SQLite FTS5).")
+    parser.add_argument("--caminho", default=PEC_SOAP_INDEX_PATH, help="arquivo SQLite (padrão: PEC_SOAP_INDEX_PATH)")
+    parser.add_argument("--dsn", help="DSN do banco (padrão: variáveis PEC_DB_*)")
+    args = parser.parse_args(argv)
+    if not args.caminho:
+        parser.error("informe --caminho ou defina PEC_SOAP_INDEX_PATH.")
+
+    logging.basicConfig(level=logging.INFO)
+    indice = IndiceSOAP(args.caminho)
+    conn = get_connection(args.dsn)
+    try:
+        conn.set_session(readonly=True, autocommit=True)
+        lidos = indice.sincronizar(conn)
+    finally:
+        conn.close()
+    estado = indice.estado()
+    print(f"[pec-indice-soap] {lidos} atendimentos lidos; {estado['total']} indexados até {estado['watermark']}.")
+    return 0
+
+
+__all__ = ["INDICE_SOAP", "IndiceSOAP", "SECOES", "expressao_fts", "main"]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
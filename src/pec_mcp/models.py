@@ -10,9 +10,9 @@ from __future__ import annotations
 from typing import Optional
 
 try:  # Pydantic <3 exige typing_extensions.TypedDict em Python < 3.12
-    from typing_extensions import TypedDict  # type: ignore
+    from typing_extensions import NotRequired, TypedDict  # type: ignore
 except ImportError:  # pragma: no cover - fallback para ambientes que já suportam
-    from typing import TypedDict  # type: ignore
+    from typing import NotRequired, TypedDict  # type: ignore
 
 
 class PatientCaptureResult(TypedDict):
@@ -20,6 +20,8 @@ class PatientCaptureResult(TypedDict):
     birth_date: Optional[str]
     sex: Optional[str]
     gender: Optional[str]
+    # Só na busca por paciente_ids, para associar cada resultado ao id pedido.
+    paciente_id: NotRequired[int]
 
 
 class ConditionResult(TypedDict):
@@ -38,8 +40,27 @@ class ConditionResult(TypedDict):
     observacao: Optional[str]
 
 
+class FonteDados(TypedDict):
+    # Presente quando a resposta veio do espelho analítico local.
+    origem: str
+    # Tabela lida pela consulta que foi sincronizada há mais tempo.
+    atualizado_em: str
+    defasagem_segundos: float
+    defasagem_por_tabela: dict[str, float]
+
+
 class CountResult(TypedDict):
     count: int
+    fonte: NotRequired[FonteDados]
+
+
+class ApproximateCountResult(TypedDict):
+    count: int
+    ic_inferior: int
+    ic_superior: int
+    confianca: float
+    metodo: str
+    amostra_percentual: float
 
 
 class HealthConditionCode(TypedDict):
@@ -81,6 +102,70 @@ class AtendimentoSOAPResult(TypedDict):
     condicoes: Optional[list["SOAPCondition"]]
 
 
+class AtendimentoSOAPResumoResult(TypedDict):
+    atendimento_id: int
+    paciente_id: int
+    data_hora: Optional[str]
+    cbo_codigo: Optional[str]
+    cbo_descricao: Optional[str]
+    profissional: Optional[str]
+    tipo_profissional_id: Optional[str]
+    tipo_atendimento_id: Optional[str]
+    soap_s_trecho: Optional[str]
+    soap_o_trecho: Optional[str]
+    soap_a_trecho: Optional[str]
+    soap_p_trecho: Optional[str]
+    soap_s_tamanho: Optional[int]
+    soap_o_tamanho: Optional[int]
+    soap_a_tamanho: Optional[int]
+    soap_p_tamanho: Optional[int]
+    cid_codes: list[str]
+    ciap_codes: list[str]
+
+
+class AtendimentoSOAPPage(TypedDict):
+    atendimentos: list[AtendimentoSOAPResult]
+    proximo_cursor: Optional[str]
+
+
+class LinhaDoTempoEvento(TypedDict):
+    tipo: str
+    data_hora: Optional[str]
+    evento_id: int
+    atendimento_id: Optional[int]
+    codigo: Optional[str]
+    descricao: Optional[str]
+    valor: Optional[str]
+    observacao: Optional[str]
+
+
+class LinhaDoTempoPage(TypedDict):
+    eventos: list[LinhaDoTempoEvento]
+    proximo_cursor: Optional[str]
+
+
+class AtendimentoSOAPResumoPage(TypedDict):
+    atendimentos: list[AtendimentoSOAPResumoResult]
+    proximo_cursor: Optional[str]
+
+
+class AtendimentoSOAPBuscaResult(TypedDict):
+    atendimento_id: int
+    paciente_id: int
+    data_hora: Optional[str]
+    cbo_codigo: Optional[str]
+    # Seção (S/O/A/P) -> trecho com as ocorrências entre **.
+    trechos: dict[str, str]
+
+
+class AtendimentoSOAPBuscaPage(TypedDict):
+    atendimentos: list[AtendimentoSOAPBuscaResult]
+    indice_atualizado_em: Optional[str]
+    # Segundos desde a última sincronização; None se o índice nunca foi carregado.
+    indice_defasagem_segundos: Optional[float]
+    indice_total_atendimentos: int
+
+
 class SOAPCondition(TypedDict, total=False):
     condition_id: Optional[int]
     cid_code: Optional[str]
@@ -100,6 +185,7 @@ class PacienteSemConsultaResult(TypedDict):
     sex: Optional[str]
     ultima_consulta: Optional[str]
     dias_sem_consulta: Optional[int]
+    fonte: NotRequired[FonteDados]
 
 
 class GestanteResult(TypedDict):
@@ -115,15 +201,105 @@ class GestanteResult(TypedDict):
     situacao: Optional[str]
 
 
+class EpidemiologiaComorbidadeResult(TypedDict):
+    codigo_cid10: Optional[str]
+    descricao_cid10: Optional[str]
+    sexo: Optional[str]
+    faixa_etaria: Optional[str]
+    localidade_id: Optional[int]
+    total_pacientes: int
+
+
+class PessoalFiltroResult(TypedDict):
+    paciente_id: int
+    nome_paciente: Optional[str]
+    data_referencia: Optional[str]
+    detalhe: Optional[str]
+    metrica: Optional[str]
+
+
+class PrevalenciaCondicaoResult(TypedDict):
+    nome: str
+    total_pacientes: int
+    percentual: Optional[float]
+
+
+class PrevalenciaSobreposicaoResult(TypedDict):
+    condicoes: list[str]
+    total_pacientes: int
+    percentual: Optional[float]
+
+
+class PrevalenciaResult(TypedDict):
+    populacao: int
+    condicoes: list[PrevalenciaCondicaoResult]
+    sobreposicoes: list[PrevalenciaSobreposicaoResult]
+    nenhuma: int
+
+
+class SerieAtendimentosPonto(TypedDict):
+    periodo: str
+    unidade_saude_id: Optional[int]
+    total_atendimentos: int
+
+
+class SerieAtendimentosResult(TypedDict):
+    granularidade: str
+    desde: str
+    ate: str
+    pontos: list[SerieAtendimentosPonto]
+    blocos_consultados: int
+    blocos_em_cache: int
+
+
+class FederatedMemberStatus(TypedDict):
+    fonte: str
+    status: str
+    latencia_ms: float
+    total: Optional[int]
+    erro: Optional[str]
+
+
+class FederatedCountResult(TypedDict):
+    count: int
+    parcial: bool
+    membros: list[FederatedMemberStatus]
+
+
+class FederatedListResult(TypedDict):
+    itens: list[dict]
+    parcial: bool
+    membros: list[FederatedMemberStatus]
+
+
 __all__ = [
     "PatientCaptureResult",
     "ConditionResult",
+    "FonteDados",
     "CountResult",
+    "ApproximateCountResult",
     "HealthConditionCode",
     "HealthConditionCaptureResult",
     "HealthUnitResult",
     "AtendimentoSOAPResult",
+    "AtendimentoSOAPResumoResult",
+    "AtendimentoSOAPPage",
+    "AtendimentoSOAPResumoPage",
+    "AtendimentoSOAPBuscaResult",
+    "AtendimentoSOAPBuscaPage",
+    "LinhaDoTempoEvento",
+    "LinhaDoTempoPage",
     "SOAPCondition",
     "PacienteSemConsultaResult",
     "GestanteResult",
+    "EpidemiologiaComorbidadeResult",
+    "PessoalFiltroResult",
+    "PrevalenciaCondicaoResult",
+    "PrevalenciaSobreposicaoResult",
+    "PrevalenciaResult",
+    "SerieAtendimentosPonto",
+    "SerieAtendimentosResult",
+    "FederatedMemberStatus",
+    "FederatedCountResult",
+    "FederatedListResult",
 ]
@@ -0,0 +1,379 @@
+"""
+Roteamento de consultas entre o primário e réplicas do PEC.
+
+Cada nó (DSN) é marcado como interativo ou analítico. Consultas leves vão
+para o nó interativo de menor latência; consultas pesadas vão para nós
+analíticos (em rodízio). Nós com falha de conexão ou atraso de replicação
+acima do limite são drenados até a próxima checagem de saúde.
+
+A checagem usa uma conexão própria de sonda e roda fora do lock do
+roteador (as periódicas, em thread de fundo): escolher um nó só lê o último
+resultado, e uma falha marca o nó como indisponível sem fechar conexões que
+estejam emprestadas a chamadas em andamento.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Literal, Optional
+
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+from .cache import registrar_banco
+from .config import (
+    PEC_DB_CONNECT_TIMEOUT,
+    PEC_DB_HEALTH_INTERVAL_SECONDS,
+    PEC_DB_MAX_LAG_SECONDS,
+    PEC_DB_NODES,
+    PEC_DB_POOL_SIZE,
+    PEC_DB_POOL_TIMEOUT_SECONDS,
+    get_db_dsn,
+)
+from .db import get_connection, query_one
+
+Workload = Literal["interactive", "analytic"]
+
+_WORKLOADS = ("interactive", "analytic")
+
+# Em réplica sem WAL pendente o atraso é zero, mesmo que o primário esteja ocioso.
+_SQL_HEALTH = """
+SELECT
+    pg_is_in_recovery() AS is_replica,
+    CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag_seconds;
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class PoolEsgotado(RuntimeError):
+    """
+    Nenhuma conexão do pool do nó ficou livre dentro de PEC_DB_POOL_TIMEOUT_SECONDS.
+    """
+
+
+class DbNode:
+    """
+    Nó de banco com conexão própria e último resultado de checagem de saúde.
+    """
+
+    def __init__(self, name: str, dsn: str, workload: Workload) -> None:
+        if workload not in _WORKLOADS:
+            raise ValueError(f"workload inválido para o nó {name}: use interactive ou analytic.")
+        self.name = name
+        self.dsn = dsn
+        self.workload = workload
+        self.conn = None
+        self.healthy = False
+        self.is_replica: Optional[bool] = None
+        self.lag_seconds: Optional[float] = None
+        self.latency_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self._probe = None
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._pool_slots = threading.BoundedSemaphore(max(1, PEC_DB_POOL_SIZE))
+        self._pool_lock = threading.Lock()
+        self._conn_lock = threading.Lock()
+        # Quem segura este lock está checando o nó (a sonda é só dele).
+        self._check_lock = threading.Lock()
+
+    def connection(self):
+        """
+        Conexão compartilhada do nó, aberta (ou reaberta) sob demanda.
+        """
+
+        with self._conn_lock:
+            if self.conn is None or getattr(self.conn, "closed", False):
+                self.conn = _abrir_conexao(self.dsn)
+                # Caches vencidos deste banco recarregam em segundo plano pelo pool.
+                registrar_banco(self.conn, self.pooled)
+            return self.conn
+
+    @contextmanager
+    def pooled(self) -> Iterator[object]:
+        """
+        Empresta uma conexão do pool do nó; PoolEsgotado se nenhuma ficar livre a tempo.
+
+        O pool atende as chamadas de tool (uma conexão por chamada e nó) e as
+        consultas executadas em paralelo; a conexão compartilhada (self.conn)
+        fica para scripts e usos fora do servidor. A espera tem prazo: quem já
+        segura uma conexão e pede outra não trava o processo para sempre.
+        """
+
+        if not self._pool_slots.acquire(timeout=PEC_DB_POOL_TIMEOUT_SECONDS):
+            raise PoolEsgotado(
+                f"Sem conexão livre no pool do nó {self.name} após {PEC_DB_POOL_TIMEOUT_SECONDS:g}s "
+                f"(PEC_DB_POOL_SIZE={PEC_DB_POOL_SIZE}); tente novamente."
+            )
+        try:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(
+                        0,
+                        max(1, PEC_DB_POOL_SIZE),
+                        dsn=self.dsn,
+                        cursor_factory=RealDictCursor,
+                        connect_timeout=PEC_DB_CONNECT_TIMEOUT,
+                    )
+                pool = self._pool
+            conn = pool.getconn()
+            broken = False
+            try:
+                if not conn.autocommit:
+                    conn.set_session(readonly=True, autocommit=True)
+                    registrar_banco(conn, self.pooled)
+                yield conn
+            except Exception:
+                broken = bool(getattr(conn, "closed", False))
+                raise
+            finally:
+                pool.putconn(conn, close=broken or bool(getattr(conn, "closed", False)))
+        finally:
+            self._pool_slots.release()
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "workload": self.workload,
+            "healthy": self.healthy,
+            "is_replica": self.is_replica,
+            "lag_seconds": self.lag_seconds,
+            "latency_ms": self.latency_ms,
+            "error": self.error,
+        }
+
+    def close(self) -> None:
+        """
+        Fecha todas as conexões do nó; só no encerramento do roteador.
+        """
+
+        with self._conn_lock:
+            _fechar(self.conn)
+            self.conn = None
+        self.close_probe()
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+            self._pool = None
+
+    def close_probe(self) -> None:
+        _fechar(self._probe)
+        self._probe = None
+
+
+def _abrir_conexao(dsn: str):
+    conn = get_connection(dsn, connect_timeout=PEC_DB_CONNECT_TIMEOUT)
+    # Conexões só de leitura e sem transação aberta entre chamadas:
+    # evita segurar snapshot (e conflitos de replay) nas réplicas.
+    conn.set_session(readonly=True, autocommit=True)
+    return conn
+
+
+def _fechar(conn) -> None:
+    if conn is not None and not getattr(conn, "closed", False):
+        conn.close()
+
+
+class DbRouter:
+    """
+    Escolhe a conexão por classe de carga, com checagem de saúde periódica.
+    """
+
+    def __init__(
+        self,
+        nodes: List[DbNode],
+        max_lag_seconds: float = PEC_DB_MAX_LAG_SECONDS,
+        health_interval_seconds: float = PEC_DB_HEALTH_INTERVAL_SECONDS,
+    ) -> None:
+        if not nodes:
+            raise ValueError("Configure ao menos um nó de banco.")
+        self.nodes = nodes
+        self.max_lag_seconds = float(max_lag_seconds)
+        self.health_interval_seconds = float(health_interval_seconds)
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+
+    def connection(self, workload: Workload = "interactive"):
+        """
+        Retorna a conexão do nó mais adequado para a classe de carga.
+
+        Sem nó saudável da classe pedida, usa qualquer nó saudável; sem nenhum,
+        recheca todos imediatamente antes de desistir.
+        """
+
+        return self.node_for(workload).connection()
+
+    @contextmanager
+    def pooled_connection(self, workload: Workload = "interactive") -> Iterator[object]:
+        """
+        Conexão emprestada do pool do nó escolhido para a classe de carga.
+        """
+
+        with self.node_for(workload).pooled() as conn:
+            yield conn
+
+    def check_now(self) -> List[DbNode]:
+        """
+        Checa todos os nós imediatamente (abrindo conexões) e devolve os saudáveis.
+        """
+
+        for node in self.nodes:
+            with node._check_lock:
+                self._check(node)
+        return [node for node in self.nodes if node.healthy]
+
+    def status(self) -> List[dict]:
+        return [node.status() for node in self.nodes]
+
+    def close(self) -> None:
+        with self._lock:
+            for node in self.nodes:
+                node.close()
+
+    def node_for(self, workload: Workload) -> DbNode:
+        """
+        Nó que atende a classe de carga agora (mesma escolha de connection()).
+        """
+
+        self._schedule_checks()
+        node = self._choose(workload)
+        if node is None:
+            self.check_now()
+            node = self._choose(workload)
+        if node is None:
+            errors = "; ".join(f"{n.name}: {n.error}" for n in self.nodes)
+            raise RuntimeError(f"Nenhum nó de banco disponível ({errors}).")
+        return node
+
+    def _schedule_checks(self) -> None:
+        """
+        Dispara as checagens vencidas sem segurar o lock do roteador.
+
+        Nó nunca checado é checado aqui mesmo (quem chega junto espera a mesma
+        checagem); os demais são rechecados em thread de fundo, e a escolha
+        segue com o último resultado. Se outra thread já está checando o nó,
+        não há nada a fazer.
+        """
+
+        now = time.monotonic()
+        for node in self.nodes:
+            if node.checked_at is None:
+                with node._check_lock:
+                    if node.checked_at is None:
+                        self._check(node)
+            elif now - node.checked_at >= self.health_interval_seconds and node._check_lock.acquire(blocking=False):
+                threading.Thread(
+                    target=self._check_and_release,
+                    args=(node,),
+                    name=f"pec-health-{node.name}",
+                    daemon=True,
+                ).start()
+
+    def _check_and_release(self, node: DbNode) -> None:
+        try:
+            self._check(node)
+        finally:
+            node._check_lock.release()
+
+    def _choose(self, workload: Workload) -> Optional[DbNode]:
+        # Só lê o último resultado das checagens: nada de rede sob o lock.
+        with self._lock:
+            healthy = [node for node in self.nodes if node.healthy]
+            candidates = [node for node in healthy if node.workload == workload] or healthy
+            if not candidates:
+                return None
+            if workload == "analytic":
+                return candidates[next(self._round_robin) % len(candidates)]
+            return min(candidates, key=lambda node: node.latency_ms or 0.0)
+
+    def _check(self, node: DbNode) -> None:
+        # Chamado com node._check_lock: a sonda não é compartilhada.
+        try:
+            if node._probe is None or getattr(node._probe, "closed", False):
+                node._probe = _abrir_conexao(node.dsn)
+            started = time.perf_counter()
+            row = query_one(node._probe, _SQL_HEALTH)
+            node.latency_ms = (time.perf_counter() - started) * 1000
+        except Exception as exc:  # noqa: BLE001 - qualquer falha drena o nó
+            if node.healthy:
+                logger.warning("Nó %s drenado: %s", node.name, exc)
+            node.healthy = False
+            node.error = str(exc).strip() or exc.__class__.__name__
+            # Só a sonda é descartada: conexões emprestadas seguem com quem as
+            # usa (se o nó caiu, falham ali e o pool as descarta na devolução).
+            node.close_probe()
+            return
+        finally:
+            node.checked_at = time.monotonic()
+
+        node.is_replica = bool(row["is_replica"]) if row else None
+        node.lag_seconds = float(row["lag_seconds"]) if row and row["lag_seconds"] is not None else None
+        if node.lag_seconds is not None and node.lag_seconds > self.max_lag_seconds:
+            if node.healthy:
+                logger.warning("Nó %s drenado: atraso de replicação de %.1fs.", node.name, node.lag_seconds)
+            node.healthy = False
+            node.error = f"atraso de replicação de {node.lag_seconds:.1f}s"
+            return
+        node.healthy = True
+        node.error = None
+
+
+def parse_nodes(raw: str) -> List[DbNode]:
+    """
+    Lê PEC_DB_NODES: lista JSON de {"name", "dsn", "workload"}.
+
+    Sem configuração, usa um único nó com a DSN de PEC_DB_* servindo ambas as
+    classes de carga (fallback para qualquer nó saudável).
+    """
+
+    if not raw or not raw.strip():
+        return [DbNode("primary", get_db_dsn(), "interactive")]
+    try:
+        items = json.loads(raw)
+    except ValueError as exc:
+        raise ValueError("PEC_DB_NODES deve ser uma lista JSON de nós.") from exc
+    if not isinstance(items, list) or not items:
+        raise ValueError("PEC_DB_NODES deve ser uma lista JSON de nós.")
+
+    nodes: List[DbNode] = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("dsn"):
+            raise ValueError("Cada nó de PEC_DB_NODES precisa de dsn.")
+        nodes.append(
+            DbNode(
+                name=str(item.get("name") or f"node{index}"),
+                dsn=str(item["dsn"]),
+                workload=str(item.get("workload") or "interactive"),  # type: ignore[arg-type]
+            )
+        )
+    return nodes
+
+
+_ROUTER: Optional[DbRouter] = None
+_ROUTER_LOCK = threading.Lock()
+
+
+def get_router() -> DbRouter:
+    """
+    Roteador global do processo, criado a partir de PEC_DB_NODES.
+    """
+
+    global _ROUTER
+    if _ROUTER is None:
+        with _ROUTER_LOCK:
+            if _ROUTER is None:
+                _ROUTER = DbRouter(parse_nodes(PEC_DB_NODES))
+    return _ROUTER
+
+
+__all__ = ["DbNode", "DbRouter", "PoolEsgotado", "Workload", "get_router", "parse_nodes"]
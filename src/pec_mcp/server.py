@@ -9,7 +9,12 @@ from typing import Any
 
 from mcp.server.fastmcp import Context, FastMCP
 
-from .db import get_connection
+from .admission import ADMISSAO, admitir
+from .config import PEC_WARMUP_ENABLED
+from .federation import federation_enabled
+from .routing import get_router
+from .singleflight import SINGLE_FLIGHT, coalescer
+from .warmup import AQUECIMENTO
 
 # Instância global do servidor MCP.
 mcp = FastMCP("pec-mcp")
@@ -19,22 +24,22 @@ if hasattr(mcp, "lifespan"):
     @mcp.lifespan
     async def lifespan(ctx: Context):
         """
-        Abre conexão única com o banco durante o ciclo de vida do servidor.
+        Disponibiliza o roteador de banco durante o ciclo de vida do servidor.
 
-        Mantemos a conexão no estado do contexto para ser reutilizada pelas tools,
-        reduzindo overhead de abertura/fechamento (DRY/KISS).
+        O roteador mantém um pool de conexões por nó (primário/réplicas); cada
+        chamada de tool empresta as suas, evitando abrir/fechar por chamada.
         """
 
-        conn = get_connection()
-        ctx.state["db_conn"] = conn
+        router = get_router()
+        ctx.state["db_router"] = router
         try:
             yield
         finally:
             # Garante fechamento limpo ao encerrar o servidor MCP.
-            conn.close()
+            router.close()
 else:
     # Fallback para versões antigas do FastMCP sem suporte a @lifespan.
-    # As tools farão fallback para uma conexão global compartilhada.
+    # As tools farão fallback para o roteador global do processo.
     pass
 
 
@@ -44,20 +49,92 @@ from .tools.obter_codigos_condicao_saude import obter_codigos_condicao_saude
 from .tools.condicoes import listar_condicoes_pacientes
 from .tools.contar_pacientes import contar_pacientes
 from .tools.unidades import listar_unidades_saude
-from .tools.atendimentos import listar_ultimos_atendimentos_soap
+from .tools.atendimentos import (
+    listar_resumo_atendimentos_soap,
+    listar_ultimos_atendimentos_soap,
+    obter_atendimentos_soap,
+)
 from .tools.sem_consulta import contar_pacientes_sem_consulta, listar_pacientes_sem_consulta
 from .tools.gestantes import listar_gestantes
+from .tools.analytics import consulta_epidemiologia
+from .tools.prevalencia import prevalencia_condicoes
+from .tools.serie_atendimentos import serie_atendimentos
+from .tools.federacao import contar_pacientes_federado, listar_federado
+from .tools.busca_soap import buscar_atendimentos_soap
+from .tools.linha_do_tempo import linha_do_tempo_paciente
+from .tools import com_conexoes_da_chamada
+from .indice_soap import INDICE_SOAP
+from .espelho import ESPELHO
+
+
+def registrar(fn) -> None:
+    """
+    Registra a tool executando-a em thread, com chamadas idênticas simultâneas
+    coalescidas numa única execução no banco (single-flight). Só a execução
+    real passa pelo controle de admissão; quem aguarda outra não ocupa vaga.
+    Cada execução usa conexões próprias, emprestadas do pool do nó e
+    devolvidas quando a tool retorna.
+    """
+
+    mcp.tool()(coalescer(admitir(com_conexoes_da_chamada(fn))))
+
 
 # Registro das tools no MCP.
-mcp.tool()(capturar_paciente)
-mcp.tool()(obter_codigos_condicao_saude)
-mcp.tool()(listar_condicoes_pacientes)
-mcp.tool()(contar_pacientes)
-mcp.tool()(listar_unidades_saude)
-mcp.tool()(listar_ultimos_atendimentos_soap)
-mcp.tool()(contar_pacientes_sem_consulta)
-mcp.tool()(listar_pacientes_sem_consulta)
-mcp.tool()(listar_gestantes)
+registrar(capturar_paciente)
+registrar(obter_codigos_condicao_saude)
+registrar(listar_condicoes_pacientes)
+registrar(contar_pacientes)
+registrar(listar_unidades_saude)
+registrar(listar_ultimos_atendimentos_soap)
+registrar(listar_resumo_atendimentos_soap)
+registrar(obter_atendimentos_soap)
+registrar(linha_do_tempo_paciente)
+registrar(contar_pacientes_sem_consulta)
+registrar(listar_pacientes_sem_consulta)
+registrar(listar_gestantes)
+registrar(consulta_epidemiologia)
+registrar(prevalencia_condicoes)
+registrar(serie_atendimentos)
+
+# Tools federadas só aparecem quando há municípios configurados.
+if federation_enabled():
+    registrar(contar_pacientes_federado)
+    registrar(listar_federado)
+
+# Busca textual no SOAP só aparece com o índice local configurado.
+if INDICE_SOAP.habilitado:
+    registrar(buscar_atendimentos_soap)
+
+
+if hasattr(mcp, "custom_route"):
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse
+
+    @mcp.custom_route("/ready", methods=["GET"])
+    async def ready(request: Request) -> JSONResponse:
+        """
+        Prontidão para o balanceador: 503 até o aquecimento terminar.
+        """
+
+        status = AQUECIMENTO.status()
+        return JSONResponse(status, status_code=200 if status["pronto"] else 503)
+
+    @mcp.custom_route("/metrics", methods=["GET"])
+    async def metrics(request: Request) -> JSONResponse:
+        """
+        Métricas operacionais em JSON (admissão/fila, execuções coalescidas e espelho).
+        """
+
+        return JSONResponse(
+            {
+                "admissao": ADMISSAO.metricas(),
+                "single_flight": {
+                    "em_andamento": SINGLE_FLIGHT.em_andamento(),
+                    "por_tool": SINGLE_FLIGHT.metricas(),
+                },
+                "espelho": ESPELHO.fonte() if ESPELHO.habilitado else None,
+            }
+        )
 
 
 def main() -> Any:
@@ -73,6 +150,18 @@ def main() -> Any:
     mcp.settings.host = host
     mcp.settings.port = port
 
+    # Aquecimento em segundo plano: o servidor já aceita conexões, mas só
+    # responde 200 em /ready quando conexões, catálogos e planos estão quentes.
+    if PEC_WARMUP_ENABLED:
+        AQUECIMENTO.iniciar()
+    else:
+        AQUECIMENTO.dispensar()
+
+    # Espelho analítico e índice SOAP locais: sincronizam em segundo plano a
+    # partir do nó analítico; as tools só leem os arquivos.
+    ESPELHO.iniciar()
+    INDICE_SOAP.iniciar()
+
     print(f"[pec-mcp] Iniciando Streamable HTTP em http://{host}:{port}")
     return mcp.run(transport="streamable-http")
 
@@ -0,0 +1,121 @@
+"""
+Coalescência de chamadas idênticas e simultâneas de tools (single-flight).
+
+Quando um painel atualiza, várias sessões pedem a mesma contagem no mesmo
+instante. A primeira chamada executa a tool; as idênticas que chegam
+enquanto ela está em andamento aguardam a mesma execução e recebem o mesmo
+resultado (ou a mesma exceção). A chave é o nome da tool mais os argumentos
+canônicos (defaults aplicados, ordem de chaves fixa) e o banco da conexão.
+
+As tools são síncronas (psycopg2); o wrapper as executa numa thread para
+não bloquear o event loop do servidor, o que também permite que chamadas
+simultâneas de fato se sobreponham.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+import anyio
+
+from .cache import database_key
+
+
+class SingleFlight:
+    """
+    Execuções em andamento por chave, com contadores por tool.
+    """
+
+    def __init__(self) -> None:
+        self._em_andamento: Dict[str, "asyncio.Future[Any]"] = {}
+        self._contadores: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    async def executar(self, tool: str, chave: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Executa fn uma única vez por chave entre as chamadas simultâneas.
+        """
+
+        execucao = self._em_andamento.get(chave)
+        lider = execucao is None
+        if lider:
+            execucao = asyncio.ensure_future(fn())
+            self._em_andamento[chave] = execucao
+            execucao.add_done_callback(lambda _: self._em_andamento.pop(chave, None))
+        self._contar(tool, "execucoes" if lider else "economizadas")
+        # shield: se quem chamou desistir (cliente desconectou), a execução
+        # compartilhada segue para os demais que a aguardam.
+        return await asyncio.shield(execucao)
+
+    def em_andamento(self) -> int:
+        return len(self._em_andamento)
+
+    def metricas(self) -> Dict[str, Dict[str, int]]:
+        """
+        Execuções reais e economizadas (chamadas que reaproveitaram outra) por tool.
+        """
+
+        with self._lock:
+            return {tool: dict(contadores) for tool, contadores in self._contadores.items()}
+
+    def _contar(self, tool: str, campo: str) -> None:
+        with self._lock:
+            contadores = self._contadores.setdefault(tool, {"execucoes": 0, "economizadas": 0})
+            contadores[campo] += 1
+
+
+def chave_canonica(fn: Callable[..., Any], args: tuple, kwargs: dict) -> str:
+    """
+    Nome da tool + argumentos com defaults aplicados + banco da conexão.
+    """
+
+    bound = inspect.signature(fn).bind(*args, **kwargs)
+    bound.apply_defaults()
+    argumentos = dict(bound.arguments)
+    ctx = argumentos.pop("ctx", None)
+    # Conexão explícita no contexto (testes, federação) não compartilha
+    # resultado com chamadas que usam o roteador.
+    state = getattr(ctx, "state", None)
+    conn = state.get("db_conn") if isinstance(state, dict) else None
+    banco = database_key(conn) if conn is not None else ""
+    return json.dumps([fn.__name__, banco, argumentos], sort_keys=True, default=str)
+
+
+def coalescer(fn: Callable[..., Any], registro: "SingleFlight | None" = None) -> Callable[..., Any]:
+    """
+    Envolve uma tool: coalesce chamadas idênticas e roda as síncronas em thread.
+
+    A assinatura (e as anotações) da tool original é preservada para o
+    FastMCP gerar o mesmo schema.
+    """
+
+    assincrona = inspect.iscoroutinefunction(fn)
+
+    def _chamar(args: tuple, kwargs: dict) -> Awaitable[Any]:
+        if assincrona:
+            return fn(*args, **kwargs)
+        return anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs))
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        flight = registro or SINGLE_FLIGHT
+        try:
+            chave = chave_canonica(fn, args, kwargs)
+        except TypeError:
+            # Argumentos inválidos: deixa a própria tool produzir o erro.
+            return await _chamar(args, kwargs)
+        return await flight.executar(fn.__name__, chave, lambda: _chamar(args, kwargs))
+
+    return wrapper
+
+
+# Registro global do processo, exposto na rota /metrics.
+SINGLE_FLIGHT = SingleFlight()
+
+
+__all__ = ["SINGLE_FLIGHT", "SingleFlight", "chave_canonica", "coalescer"]
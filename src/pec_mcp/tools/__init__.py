@@ -4,39 +4,136 @@ Helpers compartilhados entre as tools MCP.
 
 from __future__ import annotations
 
+import base64
+import functools
+import json
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
 from datetime import date, datetime
-from typing import Optional
-
-from ..db import get_connection
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
 
 from mcp.server.fastmcp import Context
 
-_GLOBAL_CONN = None  # Fallback para versões do FastMCP sem lifecycle
+from ..cache import database_key
+from ..routing import Workload, get_router
+
+# Conexões emprestadas na chamada de tool em andamento (por thread/contexto):
+# a pilha que as devolve ao pool e as já emprestadas, por nó.
+_CHAMADA: ContextVar[Optional[Tuple[ExitStack, Dict[str, object]]]] = ContextVar(
+    "pec_conexoes_da_chamada", default=None
+)
 
 
-def get_db_conn(ctx: Context):
+@contextmanager
+def conexoes_da_chamada() -> Iterator[None]:
+    """
+    Escopo de uma chamada de tool: get_db_conn empresta conexões do pool do
+    nó, que voltam ao pool quando o escopo termina.
     """
-    Obtém conexão de banco armazenada no estado do contexto.
 
-    Se o FastMCP da runtime não suportar lifecycle (@lifespan), fazemos
-    fallback para uma conexão global compartilhada para manter
-    compatibilidade.
+    with ExitStack() as stack:
+        token = _CHAMADA.set((stack, {}))
+        try:
+            yield
+        finally:
+            _CHAMADA.reset(token)
+
+
+def com_conexoes_da_chamada(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Envolve uma tool síncrona para rodar dentro de conexoes_da_chamada().
     """
 
-    global _GLOBAL_CONN
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with conexoes_da_chamada():
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def get_db_conn(ctx: Context, workload: Workload = "interactive"):
+    """
+    Obtém conexão de banco para a tool.
+
+    Uma conexão explícita no estado do contexto (db_conn) tem prioridade,
+    o que mantém testes e chamadas federadas presos a um banco. Caso
+    contrário, o roteador (do contexto ou global) escolhe o nó conforme a
+    classe de carga: "interactive" para consultas leves e "analytic" para
+    agregações pesadas. Dentro de uma chamada registrada no servidor
+    (conexoes_da_chamada), a conexão é emprestada do pool do nó só para esta
+    chamada, uma por nó: se "interactive" e "analytic" caem no mesmo nó, a
+    segunda classe reaproveita a conexão já emprestada em vez de segurar uma
+    e esperar outra do mesmo pool. Fora dela (scripts, benchmarks), usa a
+    conexão compartilhada do nó.
+    """
 
-    conn: Optional[object] = None
     state = getattr(ctx, "state", None)
+    router = None
     if isinstance(state, dict):
-        conn = state.get("db_conn")
-
+        conn: Optional[object] = state.get("db_conn")
+        if conn is not None:
+            return conn
+        router = state.get("db_router")
+    router = router or get_router()
+
+    chamada = _CHAMADA.get()
+    if chamada is None:
+        return router.connection(workload)
+    stack, emprestadas = chamada
+    node = router.node_for(workload)
+    conn = emprestadas.get(node.name)
     if conn is None:
-        if _GLOBAL_CONN is None or getattr(_GLOBAL_CONN, "closed", False):
-            _GLOBAL_CONN = get_connection()
-        conn = _GLOBAL_CONN
+        conn = emprestadas[node.name] = stack.enter_context(node.pooled())
     return conn
 
 
+def db_key(ctx: Context, workload: Workload = "interactive") -> str:
+    """
+    Identifica o banco que atende a classe de carga (chave de cache), sem emprestar conexão.
+    """
+
+    state = getattr(ctx, "state", None)
+    router = None
+    if isinstance(state, dict):
+        conn: Optional[object] = state.get("db_conn")
+        if conn is not None:
+            return database_key(conn)
+        router = state.get("db_router")
+    return f"no:{(router or get_router()).node_for(workload).name}"
+
+
+def conexoes_emprestadas() -> int:
+    """
+    Conexões do pool já seguras pela chamada de tool em andamento.
+    """
+
+    chamada = _CHAMADA.get()
+    return len(chamada[1]) if chamada is not None else 0
+
+
+@contextmanager
+def pooled_db_conn(ctx: Context, workload: Workload = "interactive") -> Iterator[object]:
+    """
+    Conexão para consultas em paralelo (uma por thread), emprestada do pool.
+
+    Com conexão explícita no contexto (testes, federação) devolvemos a própria
+    conexão: o psycopg2 serializa os comandos e o resultado é o mesmo, só
+    sem ganho de paralelismo.
+    """
+
+    state = getattr(ctx, "state", None)
+    router = None
+    if isinstance(state, dict):
+        conn: Optional[object] = state.get("db_conn")
+        if conn is not None:
+            yield conn
+            return
+        router = state.get("db_router")
+    with (router or get_router()).pooled_connection(workload) as conn:
+        yield conn
+
+
 def to_iso_datetime(value) -> Optional[str]:
     """
     Converte date/datetime para string ISO 8601 ou retorna None.
@@ -64,4 +161,57 @@ def to_iso_date(value) -> Optional[str]:
     return str(value)
 
 
-__all__ = ["get_db_conn", "to_iso_datetime", "to_iso_date"]
+def parse_iso_date(value, field: str) -> Optional[date]:
+    """
+    Converte string ISO (AAAA-MM-DD) ou date em date; None quando vazio.
+    """
+
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip()[:10])
+    except ValueError as exc:
+        raise ValueError(f"{field} inválido. Use o formato AAAA-MM-DD.") from exc
+
+
+def encode_cursor(payload: dict) -> str:
+    """
+    Serializa a posição de paginação em um cursor opaco (base64 URL-safe).
+    """
+
+    raw = json.dumps(payload, separators=(",", ":"), sort_keys=True, default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Decodifica cursor gerado por encode_cursor; ValueError se estiver corrompido.
+    """
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError, UnicodeError) as exc:
+        raise ValueError("cursor inválido.") from exc
+    if not isinstance(payload, dict):
+        raise ValueError("cursor inválido.")
+    return payload
+
+
+__all__ = [
+    "com_conexoes_da_chamada",
+    "conexoes_da_chamada",
+    "conexoes_emprestadas",
+    "db_key",
+    "get_db_conn",
+    "pooled_db_conn",
+    "to_iso_datetime",
+    "to_iso_date",
+    "parse_iso_date",
+    "encode_cursor",
+    "decode_cursor",
+]
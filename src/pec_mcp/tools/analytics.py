@@ -8,13 +8,24 @@ somente leitura fornecido.
 
 from __future__ import annotations
 
-from typing import List, Literal, Optional
+from typing import Dict, Iterable, Iterator, List, Literal, NamedTuple, Optional, Sequence
 
 from mcp.server.fastmcp import Context
 
+from ..cache import RefreshingCache
+from ..config import PEC_EPIDEMIOLOGIA_ENGINE, PEC_EPIDEMIOLOGIA_REFRESH_SECONDS
 from ..db import query_all
 from ..models import EpidemiologiaComorbidadeResult, PessoalFiltroResult
 from . import get_db_conn, to_iso_datetime
+from .colunar import (
+    COLUNAS_COMORBIDADES,
+    Dimensao,
+    agregar,
+    faixa_etaria,
+    validar_agrupamento,
+    validar_faixas,
+)
+from .filters import ConditionFilter, PatientFilter
 
 EpidemiologiaTipo = Literal["comorbidades_por_filtro"]
 
@@ -35,6 +46,116 @@ def _age_filter_clause(alias: str = "c") -> str:
     return f"DATE_PART('year', AGE(CURRENT_DATE, {alias}.dt_nascimento))"
 
 
+class _CelulaComorbidade(NamedTuple):
+    codigo_cid10: Optional[str]
+    descricao_cid10: Optional[str]
+    sexo: Optional[str]
+    idade: Optional[int]
+    localidade_id: Optional[int]
+    total_pacientes: int
+
+
+# Cubo CID-10 x sexo x idade (anos) x localidade com pacientes distintos por
+# célula. Como cada paciente tem um único sexo, idade e localidade, somar
+# células de um mesmo CID é exato, inclusive ao agrupar idades em faixas.
+_SQL_CUBO_COMORBIDADES = f"""
+SELECT
+    cid.nu_cid10                 AS codigo_cid10,
+    cid.no_cid10                 AS descricao_cid10,
+    c.no_sexo                    AS sexo,
+    {_age_filter_clause("c")}::int AS idade,
+    c.co_localidade_endereco     AS localidade_id,
+    COUNT(DISTINCT c.co_seq_cidadao) AS total_pacientes
+FROM tb_problema p
+JOIN tb_prontuario pr ON pr.co_seq_prontuario = p.co_prontuario
+JOIN tb_cidadao c ON c.co_seq_cidadao = pr.co_cidadao
+LEFT JOIN tb_cid10 cid ON cid.co_cid10 = p.co_cid10
+GROUP BY 1, 2, 3, 4, 5;
+"""
+
+
+class _CuboComorbidades:
+    """
+    Células do cubo indexadas por código CID-10 e, dentro dele, por localidade.
+
+    O filtro de CID é avaliado uma vez por código distinto (e não por
+    célula), e localidade_id vira busca direta no dicionário; só as células
+    restantes passam pelo filtro de sexo/idade.
+    """
+
+    __slots__ = ("por_cid", "total_celulas")
+
+    def __init__(self, celulas: Iterable[_CelulaComorbidade]) -> None:
+        por_cid: Dict[Optional[str], Dict[Optional[int], List[_CelulaComorbidade]]] = {}
+        total = 0
+        for celula in celulas:
+            por_cid.setdefault(celula.codigo_cid10, {}).setdefault(celula.localidade_id, []).append(celula)
+            total += 1
+        self.por_cid = por_cid
+        self.total_celulas = total
+
+    def __len__(self) -> int:
+        return self.total_celulas
+
+    def selecionar(self, filtro_cid: ConditionFilter, localidade_id: Optional[int]) -> Iterator[_CelulaComorbidade]:
+        """
+        Células dos códigos que casam com filtro_cid, restritas à localidade se informada.
+        """
+
+        for codigo, por_localidade in self.por_cid.items():
+            if not filtro_cid.matches_cid(codigo):
+                continue
+            if localidade_id is not None:
+                yield from por_localidade.get(localidade_id, ())
+                continue
+            for celulas in por_localidade.values():
+                yield from celulas
+
+
+def _load_cubo_comorbidades(conn, _previous) -> _CuboComorbidades:
+    rows = query_all(conn, _SQL_CUBO_COMORBIDADES)
+    return _CuboComorbidades(
+        _CelulaComorbidade(
+            codigo_cid10=row.get("codigo_cid10"),
+            descricao_cid10=row.get("descricao_cid10"),
+            sexo=row.get("sexo"),
+            idade=int(row["idade"]) if row.get("idade") is not None else None,
+            localidade_id=int(row["localidade_id"]) if row.get("localidade_id") is not None else None,
+            total_pacientes=int(row.get("total_pacientes") or 0),
+        )
+        for row in rows
+    )
+
+
+CUBO_COMORBIDADES: RefreshingCache[_CuboComorbidades] = RefreshingCache(
+    "cubo_comorbidades", _load_cubo_comorbidades, PEC_EPIDEMIOLOGIA_REFRESH_SECONDS
+)
+
+
+def _agregar_cubo(
+    cubo: _CuboComorbidades,
+    filtro_paciente: PatientFilter,
+    filtro_cid: ConditionFilter,
+    localidade_id: Optional[int],
+    limites: Sequence[int],
+    dimensoes: Sequence[str],
+) -> Dict[tuple, int]:
+    com_cid = "cid" in dimensoes
+    grupos: Dict[tuple, int] = {}
+    for celula in cubo.selecionar(filtro_cid, localidade_id):
+        if not filtro_paciente.matches_demographics(celula.sexo, celula.idade):
+            continue
+        chave = (
+            celula.codigo_cid10 if com_cid else None,
+            celula.descricao_cid10 if com_cid else None,
+            celula.sexo if "sexo" in dimensoes else None,
+            faixa_etaria(celula.idade, limites) if "faixa_etaria" in dimensoes else None,
+            celula.localidade_id if "localidade" in dimensoes else None,
+        )
+        grupos[chave] = grupos.get(chave, 0) + celula.total_pacientes
+    return grupos
+
+
 def consulta_epidemiologia(
     ctx: Context,
     tipo: EpidemiologiaTipo = "comorbidades_por_filtro",
@@ -42,89 +163,74 @@ def consulta_epidemiologia(
     idade_min: Optional[int] = None,
     idade_max: Optional[int] = None,
     localidade_id: Optional[int] = None,
+    cid_code: Optional[str] = None,
+    faixas_etarias: Optional[List[int]] = None,
+    agrupar_por: Optional[List[Dimensao]] = None,
     limite: int = 50,
 ) -> List[EpidemiologiaComorbidadeResult]:
     """
     Consulta agregada para apoiar análises epidemiológicas.
 
-    - comorbidades_por_filtro: conta pacientes com problemas (CID-10)
-      aplicando filtros opcionais de sexo, faixa etária e localidade.
+    - comorbidades_por_filtro: conta pacientes com problemas (CID-10) por
+      CID, sexo, faixa etária e localidade, aplicando filtros opcionais de
+      sexo, faixa etária, localidade e prefixo de CID-10 (cid_code).
+
+    faixas_etarias troca as faixas padrão pelos limites inferiores informados
+    (ex.: [0, 20, 65] -> 0-19, 20-64, 65+); agrupar_por escolhe as dimensões
+    (cid, sexo, faixa_etaria, localidade), deixando as demais como None.
+
+    Lê de memória, recarregada periodicamente: do cubo pré-agregado ou, com
+    PEC_EPIDEMIOLOGIA_ENGINE=colunar, de arrays por paciente (necessário
+    para agrupar sem cid, contando cada paciente uma vez).
     """
 
     if tipo != "comorbidades_por_filtro":
         raise ValueError("Tipo de consulta epidemiológica não suportado")
-
-    conn = get_db_conn(ctx)
+    if idade_min is not None and idade_max is not None and idade_min > idade_max:
+        raise ValueError("idade_min não pode ser maior que idade_max.")
+    limites = validar_faixas(faixas_etarias)
+    dimensoes = validar_agrupamento(agrupar_por)
+    colunar = PEC_EPIDEMIOLOGIA_ENGINE == "colunar"
+    if not colunar and "cid" not in dimensoes:
+        # Somar células de CIDs diferentes contaria o mesmo paciente mais de uma vez.
+        raise ValueError("agrupar_por sem cid requer PEC_EPIDEMIOLOGIA_ENGINE=colunar.")
+
+    # Mesma normalização das tools SQL, aplicada às células do cubo.
+    filtro_paciente = PatientFilter.build(sex=sexo, age_min=idade_min, age_max=idade_max)
+    filtro_cid = ConditionFilter.build(cid_code=cid_code)
+
+    conn = get_db_conn(ctx, workload="analytic")
     safe_limit = max(1, min(limite, 500))
+    if colunar:
+        grupos = agregar(
+            COLUNAS_COMORBIDADES.get(conn),
+            filtro_paciente,
+            filtro_cid,
+            localidade_id,
+            limites,
+            dimensoes,
+            safe_limit,
+        )
+    else:
+        grupos = _agregar_cubo(
+            CUBO_COMORBIDADES.get(conn), filtro_paciente, filtro_cid, localidade_id, limites, dimensoes
+        )
 
-    age_expr = _age_filter_clause("c")
-    filters = [
-        ("sexo", sexo, "c.no_sexo = %s"),
-        ("idade_min", idade_min, f"{age_expr} >= %s"),
-        ("idade_max", idade_max, f"{age_expr} <= %s"),
-        ("localidade_id", localidade_id, "c.co_localidade_endereco = %s"),
-    ]
-
-    where_clauses = []
-    params: list = []
-    for _, value, clause in filters:
-        if value is not None:
-            where_clauses.append(clause)
-            params.append(value)
-
-    where_sql = ""
-    if where_clauses:
-        where_sql = "WHERE " + " AND ".join(where_clauses)
-
-    sql = f"""
-    WITH base AS (
-        SELECT
-            pr.co_cidadao,
-            cid.nu_cid10      AS codigo_cid10,
-            cid.no_cid10      AS descricao_cid10,
-            c.no_sexo         AS sexo,
-            c.co_localidade_endereco AS localidade_id,
-            {_age_filter_clause("c")} AS idade
-        FROM tb_problema p
-        JOIN tb_prontuario pr ON pr.co_seq_prontuario = p.co_prontuario
-        JOIN tb_cidadao c ON c.co_seq_cidadao = pr.co_cidadao
-        LEFT JOIN tb_cid10 cid ON cid.co_cid10 = p.co_cid10
-    ),
-    filtrado AS (
-        SELECT * FROM base
-        {where_sql}
+    ordenados = sorted(
+        grupos.items(),
+        key=lambda item: (-item[1], tuple((v is None, str(v)) for v in item[0])),
     )
-    SELECT
-        codigo_cid10,
-        descricao_cid10,
-        sexo,
-        CASE
-            WHEN idade IS NULL THEN NULL
-            WHEN idade < 12 THEN '0-11'
-            WHEN idade BETWEEN 12 AND 17 THEN '12-17'
-            WHEN idade BETWEEN 18 AND 39 THEN '18-39'
-            WHEN idade BETWEEN 40 AND 59 THEN '40-59'
-            ELSE '60+'
-        END AS faixa_etaria,
-        localidade_id,
-        COUNT(DISTINCT co_cidadao) AS total_pacientes
-    FROM filtrado
-    GROUP BY codigo_cid10, descricao_cid10, sexo, faixa_etaria, localidade_id
-    ORDER BY total_pacientes DESC NULLS LAST
-    LIMIT %s;
-    """
 
-    rows = query_all(conn, sql, params + [safe_limit])
     results: List[EpidemiologiaComorbidadeResult] = []
-    for row in rows:
+    for (codigo, descricao, sexo_val, faixa, localidade), total in ordenados[:safe_limit]:
         results.append(
             EpidemiologiaComorbidadeResult(
-                codigo_cid10=row.get("codigo_cid10"),
-                descricao_cid10=row.get("descricao_cid10"),
-                sexo=row.get("sexo"),
-                faixa_etaria=row.get("faixa_etaria"),
-                localidade_id=row.get("localidade_id"),
-                total_pacientes=int(row.get("total_pacientes", 0)),
+                codigo_cid10=codigo,
+                descricao_cid10=descricao,
+                sexo=sexo_val,
+                faixa_etaria=faixa,
+                localidade_id=localidade,
+                total_pacientes=total,
             )
         )
     return results
@@ -285,7 +391,7 @@ def consulta_pessoal(
     - pa_maior_140_90: última PA registrada > 140/90
     """
 
-    conn = get_db_conn(ctx)
+    conn = get_db_conn(ctx, workload="analytic")
     safe_limit = max(1, min(limite, 500))
 
     if tipo == "sem_atendimento_ano":
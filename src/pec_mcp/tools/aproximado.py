@@ -0,0 +1,77 @@
+"""
+Contagem aproximada por amostragem de blocos (TABLESAMPLE SYSTEM).
+
+Lemos só uma fração dos blocos de tb_cidadao e contamos, por bloco, os
+pacientes da amostra que atendem aos filtros. Cada bloco entra na amostra
+com probabilidade f, então o total estimado é soma / f (Horvitz-Thompson).
+Como pacientes de um mesmo bloco entram juntos, a variância é a de amostra
+por conglomerados, estimada por (1 - f) / f² · Σ y_b² dos blocos amostrados,
+e o intervalo é o normal de 95%.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Iterable, Literal
+
+from ..config import PEC_APPROX_SAMPLE_PERCENT
+from ..models import ApproximateCountResult
+
+ModoContagem = Literal["exact", "approximate"]
+
+METODO_TABLESAMPLE = "tablesample_system"
+
+_Z_95 = 1.96
+
+# Expressão do número do bloco (página) de uma linha de tb_cidadao.
+SQL_BLOCO_CIDADAO = "(c.ctid::text::point)[0]::bigint"
+
+
+def validar_modo(mode: str) -> str:
+    modo = str(mode or "exact").strip().lower()
+    if modo not in ("exact", "approximate"):
+        raise ValueError("mode inválido. Use exact ou approximate.")
+    return modo
+
+
+def percentual_amostra() -> float:
+    return max(0.01, min(float(PEC_APPROX_SAMPLE_PERCENT), 100.0))
+
+
+def estimar_por_blocos(
+    contagens_por_bloco: Iterable[int],
+    percentual: float,
+    metodo: str = METODO_TABLESAMPLE,
+) -> ApproximateCountResult:
+    """
+    Estimativa e intervalo de 95% a partir das contagens por bloco amostrado.
+    """
+
+    fracao = percentual / 100.0
+    soma = 0
+    soma_quadrados = 0
+    for y in contagens_por_bloco:
+        soma += y
+        soma_quadrados += y * y
+    estimativa = soma / fracao
+    # Estimador não viesado de Σ y_b² sobre todos os blocos: Σ_amostra y_b² / f.
+    variancia = (1 - fracao) / (fracao * fracao) * soma_quadrados
+    margem = _Z_95 * math.sqrt(variancia)
+    return ApproximateCountResult(
+        count=int(round(estimativa)),
+        ic_inferior=max(soma, int(math.floor(estimativa - margem))),
+        ic_superior=int(math.ceil(estimativa + margem)),
+        confianca=0.95,
+        metodo=metodo,
+        amostra_percentual=percentual,
+    )
+
+
+__all__ = [
+    "METODO_TABLESAMPLE",
+    "ModoContagem",
+    "SQL_BLOCO_CIDADAO",
+    "estimar_por_blocos",
+    "percentual_amostra",
+    "validar_modo",
+]
@@ -1,18 +1,69 @@
 """
-Tool para listar os últimos atendimentos SOAP de um paciente.
+Tools para listar atendimentos SOAP de um paciente.
+
+A listagem pode ser feita em duas fases: primeiro um resumo leve (metadados,
+CBO, códigos de condição e trechos do SOAP) e depois o texto completo apenas
+dos atendimentos escolhidos, evitando trafegar (e destoastar) texto livre
+que não será lido.
 """
 
 from __future__ import annotations
 
-from typing import List
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
 from mcp.server.fastmcp import Context
 
 from ..db import query_all
-from ..models import AtendimentoSOAPResult
-from . import get_db_conn, to_iso_datetime
+from ..models import (
+    AtendimentoSOAPPage,
+    AtendimentoSOAPResult,
+    AtendimentoSOAPResumoPage,
+    AtendimentoSOAPResumoResult,
+    SOAPCondition,
+)
+from . import decode_cursor, encode_cursor, get_db_conn, parse_iso_date, to_iso_date, to_iso_datetime
+
+# A página (chaves + ordenação) é resolvida antes de qualquer JOIN com as
+# tabelas de evolução, para que só os atendimentos retornados leiam texto SOAP.
+# O keyset (dt_inicio, co_seq_atend_prof) mantém custo constante por página.
+_SQL_PAGINA = """
+WITH pagina AS (
+    SELECT ap.co_seq_atend_prof, a.dt_inicio
+    FROM tb_atend_prof ap
+    JOIN tb_atend       a   ON a.co_seq_atend       = ap.co_atend
+    JOIN tb_prontuario  pr  ON pr.co_seq_prontuario = a.co_prontuario
+    LEFT JOIN tb_lotacao l  ON l.co_ator_papel      = ap.co_lotacao
+    LEFT JOIN tb_cbo     cb ON cb.co_cbo            = l.co_cbo
+    WHERE {where_clause}
+      AND (
+            cb.co_cbo_2002 LIKE '225%%'   -- médicos
+         OR cb.co_cbo_2002 LIKE '2235%%'  -- enfermeiros
+         -- OR cb.co_cbo_2002 LIKE '2232%%'  -- dentistas (opcional)
+          )
+    ORDER BY a.dt_inicio DESC NULLS LAST, ap.co_seq_atend_prof DESC
+    LIMIT %s
+)
+"""
+
+_SQL_ATENDIMENTOS_FROM = """
+FROM pagina pg
+JOIN tb_atend_prof  ap  ON ap.co_seq_atend_prof = pg.co_seq_atend_prof
+JOIN tb_atend       a   ON a.co_seq_atend       = ap.co_atend
+JOIN tb_prontuario  pr  ON pr.co_seq_prontuario = a.co_prontuario
+LEFT JOIN tb_lotacao l  ON l.co_ator_papel      = ap.co_lotacao
+LEFT JOIN tb_prof    p  ON p.co_seq_prof        = l.co_prof
+LEFT JOIN tb_cbo     cb ON cb.co_cbo            = l.co_cbo
+LEFT JOIN tb_evolucao_subjetivo es ON es.co_atend_prof = ap.co_seq_atend_prof
+LEFT JOIN tb_evolucao_objetivo  eo ON eo.co_atend_prof = ap.co_seq_atend_prof
+LEFT JOIN tb_evolucao_avaliacao ea ON ea.co_atend_prof = ap.co_seq_atend_prof
+LEFT JOIN tb_evolucao_plano     ep ON ep.co_atend_prof = ap.co_seq_atend_prof
+ORDER BY pg.dt_inicio DESC NULLS LAST, pg.co_seq_atend_prof DESC
+"""
 
-_SQL_ATENDIMENTOS_BASE = """
+_SQL_ATENDIMENTOS_BASE = (
+    _SQL_PAGINA
+    + """
 SELECT
     ap.co_seq_atend_prof          AS atendimento_id,
     pr.co_cidadao                 AS paciente_id,
@@ -25,100 +76,333 @@ SELECT
     es.ds_subjetivo               AS soap_s,
     eo.ds_objetivo                AS soap_o,
     ea.ds_avaliacao               AS soap_a,
-    ep.ds_plano                   AS soap_p,
-    COALESCE(cond.condicoes, '[]') AS condicoes
-FROM tb_atend_prof ap
-JOIN tb_atend       a   ON a.co_seq_atend       = ap.co_atend
-JOIN tb_prontuario  pr  ON pr.co_seq_prontuario = a.co_prontuario
-LEFT JOIN tb_lotacao l  ON l.co_ator_papel      = ap.co_lotacao
-LEFT JOIN tb_prof    p  ON p.co_seq_prof        = l.co_prof
-LEFT JOIN tb_cbo     cb ON cb.co_cbo            = l.co_cbo
-LEFT JOIN tb_evolucao_subjetivo es ON es.co_atend_prof = ap.co_seq_atend_prof
-LEFT JOIN tb_evolucao_objetivo  eo ON eo.co_atend_prof = ap.co_seq_atend_prof
-LEFT JOIN tb_evolucao_avaliacao ea ON ea.co_atend_prof = ap.co_seq_atend_prof
-LEFT JOIN tb_evolucao_plano     ep ON ep.co_atend_prof = ap.co_seq_atend_prof
-LEFT JOIN LATERAL (
-    SELECT json_agg(
-        jsonb_build_object(
-            'condition_id', p2.co_seq_problema,
-            'cid_code', cid2.nu_cid10,
-            'cid_description', cid2.no_cid10,
-            'ciap_code', ciap2.co_ciap,
-            'ciap_description', ciap2.ds_ciap,
-            'observacao', pe2.ds_observacao,
-            'dt_inicio_condicao', pe2.dt_inicio_problema,
-            'dt_fim_condicao', pe2.dt_fim_problema,
-            'situacao_id', pe2.co_situacao_problema
-        )
-        ORDER BY pe2.dt_inicio_problema DESC NULLS LAST, p2.co_seq_problema
-    ) AS condicoes
-    FROM tb_problema_evolucao pe2
-    JOIN tb_problema p2 ON p2.co_unico_problema = pe2.co_unico_problema
-    LEFT JOIN tb_cid10 cid2 ON cid2.co_cid10 = p2.co_cid10
-    LEFT JOIN tb_ciap ciap2 ON ciap2.co_seq_ciap = p2.co_ciap
-    WHERE pe2.co_atend_prof = ap.co_seq_atend_prof
-) cond ON TRUE
-WHERE pr.co_cidadao = %s
-  AND (
-        cb.co_cbo_2002 LIKE '225%%'   -- médicos
-     OR cb.co_cbo_2002 LIKE '2235%%'  -- enfermeiros
-     -- OR cb.co_cbo_2002 LIKE '2232%%'  -- dentistas (opcional)
-      )
-ORDER BY a.dt_inicio DESC NULLS LAST
+    ep.ds_plano                   AS soap_p
 """
+    + _SQL_ATENDIMENTOS_FROM
+)
 
+# Condições dos atendimentos da página em uma única consulta por chave,
+# em vez de um LATERAL json_agg por linha; a montagem é feita em Python.
+_SQL_CONDICOES_ATENDIMENTOS = """
+SELECT
+    pe.co_atend_prof          AS atendimento_id,
+    p.co_seq_problema         AS condition_id,
+    cid.nu_cid10              AS cid_code,
+    cid.no_cid10              AS cid_description,
+    ciap.co_ciap              AS ciap_code,
+    ciap.ds_ciap              AS ciap_description,
+    pe.ds_observacao          AS observacao,
+    pe.dt_inicio_problema     AS dt_inicio_condicao,
+    pe.dt_fim_problema        AS dt_fim_condicao,
+    pe.co_situacao_problema   AS situacao_id
+FROM tb_problema_evolucao pe
+JOIN tb_problema p ON p.co_unico_problema = pe.co_unico_problema
+LEFT JOIN tb_cid10 cid ON cid.co_cid10 = p.co_cid10
+LEFT JOIN tb_ciap ciap ON ciap.co_seq_ciap = p.co_ciap
+WHERE pe.co_atend_prof = ANY(%s)
+ORDER BY pe.co_atend_prof, pe.dt_inicio_problema DESC NULLS LAST, p.co_seq_problema
+"""
+
+# Resumo: substr() permite ao Postgres descomprimir apenas o início do valor
+# TOAST e octet_length() lê o tamanho do cabeçalho sem destoastar o texto.
+_SQL_ATENDIMENTOS_RESUMO = (
+    _SQL_PAGINA
+    + """
+SELECT
+    ap.co_seq_atend_prof          AS atendimento_id,
+    pr.co_cidadao                 AS paciente_id,
+    a.dt_inicio                   AS data_hora,
+    cb.co_cbo_2002                AS cbo_codigo,
+    cb.no_cbo                     AS cbo_descricao,
+    p.no_social_profissional      AS profissional,
+    ap.tp_atend_prof              AS tipo_profissional_id,
+    ap.tp_atend                   AS tipo_atendimento_id,
+    substr(es.ds_subjetivo, 1, %s) AS soap_s_trecho,
+    substr(eo.ds_objetivo, 1, %s)  AS soap_o_trecho,
+    substr(ea.ds_avaliacao, 1, %s) AS soap_a_trecho,
+    substr(ep.ds_plano, 1, %s)     AS soap_p_trecho,
+    octet_length(es.ds_subjetivo)  AS soap_s_tamanho,
+    octet_length(eo.ds_objetivo)   AS soap_o_tamanho,
+    octet_length(ea.ds_avaliacao)  AS soap_a_tamanho,
+    octet_length(ep.ds_plano)      AS soap_p_tamanho
+"""
+    + _SQL_ATENDIMENTOS_FROM
+)
+
+_MAX_IDS_DETALHE = 50
+_DEFAULT_PAGINA = 20
+_MAX_PAGINA = 100
+_DEFAULT_PAGINA_RESUMO = 50
+_MAX_PAGINA_RESUMO = 200
 
-def listar_ultimos_atendimentos_soap(
-    ctx: Context, paciente_id: int, limite: int | None = None
-) -> List[AtendimentoSOAPResult]:
-    """
-    Recupera últimos atendimentos SOAP do paciente (médicos e enfermeiros).
-    """
 
+def _page_size(limite: Optional[int], default: int, maximo: int) -> int:
+    # limite=None (clientes da versão sem paginação) usa a página padrão.
+    if limite is None:
+        return default
+    return max(1, min(int(limite), maximo))
+
+
+def _validate_paciente_id(paciente_id: int) -> int:
     if paciente_id is None:
         raise ValueError("paciente_id é obrigatório para consultar histórico de atendimento.")
 
     paciente_id_int = int(paciente_id)
     if paciente_id_int <= 0:
         raise ValueError("paciente_id deve ser um inteiro positivo.")
+    return paciente_id_int
+
+
+def _build_history_where(
+    paciente_id: int,
+    desde: Optional[str],
+    ate: Optional[str],
+    cursor: Optional[str],
+) -> Tuple[str, List]:
+    """
+    Monta filtros da página de histórico: paciente, janela de datas e keyset.
+    """
+
+    clauses: List[str] = ["pr.co_cidadao = %s"]
+    params: List = [paciente_id]
+
+    data_desde = parse_iso_date(desde, "desde")
+    data_ate = parse_iso_date(ate, "ate")
+    if data_desde and data_ate and data_desde > data_ate:
+        raise ValueError("desde não pode ser posterior a ate.")
+    if data_desde is not None:
+        clauses.append("a.dt_inicio >= %s")
+        params.append(data_desde)
+    if data_ate is not None:
+        # ate é inclusivo: comparamos com o início do dia seguinte.
+        clauses.append("a.dt_inicio < %s")
+        params.append(data_ate + timedelta(days=1))
+
+    if cursor:
+        payload = decode_cursor(cursor)
+        if payload.get("p") != paciente_id or "i" not in payload:
+            raise ValueError("cursor inválido para este paciente.")
+        last_id = int(payload["i"])
+        if payload.get("d") is None:
+            clauses.append("(a.dt_inicio IS NULL AND ap.co_seq_atend_prof < %s)")
+            params.append(last_id)
+        else:
+            clauses.append(
+                "((a.dt_inicio, ap.co_seq_atend_prof) < (%s, %s) OR a.dt_inicio IS NULL)"
+            )
+            params.extend([datetime.fromisoformat(payload["d"]), last_id])
+
+    return " AND ".join(clauses), params
+
+
+def _next_cursor(paciente_id: int, rows: List[dict], page_size: int) -> Optional[str]:
+    """
+    Gera cursor da próxima página quando há mais registros que o tamanho pedido.
+    """
+
+    if len(rows) <= page_size:
+        return None
+    last = rows[page_size - 1]
+    data_hora = last.get("data_hora")
+    return encode_cursor(
+        {
+            "p": paciente_id,
+            "d": data_hora.isoformat() if data_hora is not None else None,
+            "i": int(last["atendimento_id"]),
+        }
+    )
+
+
+def _opt_str(value) -> str | None:
+    return str(value) if value is not None else None
+
+
+def _opt_int(value) -> int | None:
+    return int(value) if value is not None else None
+
+
+def _fetch_condicoes(conn, atendimento_ids: List[int]) -> Dict[int, List[SOAPCondition]]:
+    """
+    Busca as condições avaliadas em um conjunto de atendimentos, agrupadas por atendimento.
+    """
+
+    condicoes: Dict[int, List[SOAPCondition]] = {}
+    if not atendimento_ids:
+        return condicoes
+
+    rows = query_all(conn, _SQL_CONDICOES_ATENDIMENTOS, (list(atendimento_ids),))
+    for row in rows:
+        condicoes.setdefault(int(row["atendimento_id"]), []).append(
+            SOAPCondition(
+                condition_id=_opt_int(row.get("condition_id")),
+                cid_code=_opt_str(row.get("cid_code")),
+                cid_description=_opt_str(row.get("cid_description")),
+                ciap_code=_opt_str(row.get("ciap_code")),
+                ciap_description=_opt_str(row.get("ciap_description")),
+                observacao=_opt_str(row.get("observacao")),
+                dt_inicio_condicao=to_iso_date(row.get("dt_inicio_condicao")),
+                dt_fim_condicao=to_iso_date(row.get("dt_fim_condicao")),
+                situacao_id=_opt_str(row.get("situacao_id")),
+            )
+        )
+    return condicoes
+
+
+def _sorted_codes(condicoes: List[SOAPCondition], key: str) -> List[str]:
+    return sorted({cond[key] for cond in condicoes if cond.get(key)})
+
+
+def _rows_to_soap_results(conn, rows: List[dict]) -> List[AtendimentoSOAPResult]:
+    condicoes = _fetch_condicoes(conn, [int(row["atendimento_id"]) for row in rows])
+    return [
+        _row_to_soap_result(row, condicoes.get(int(row["atendimento_id"]), []))
+        for row in rows
+    ]
+
+
+def _row_to_soap_result(row: dict, condicoes: List[SOAPCondition]) -> AtendimentoSOAPResult:
+    return AtendimentoSOAPResult(
+        atendimento_id=int(row["atendimento_id"]),
+        paciente_id=int(row["paciente_id"]),
+        data_hora=to_iso_datetime(row.get("data_hora")),
+        cbo_codigo=_opt_str(row.get("cbo_codigo")),
+        cbo_descricao=_opt_str(row.get("cbo_descricao")),
+        profissional=_opt_str(row.get("profissional")),
+        tipo_profissional_id=_opt_str(row.get("tipo_profissional_id")),
+        tipo_atendimento_id=_opt_str(row.get("tipo_atendimento_id")),
+        soap_s=_opt_str(row.get("soap_s")),
+        soap_o=_opt_str(row.get("soap_o")),
+        soap_a=_opt_str(row.get("soap_a")),
+        soap_p=_opt_str(row.get("soap_p")),
+        condicoes=condicoes,
+    )
 
-    safe_limit = None
-    if limite is not None:
-        safe_limit = max(1, min(int(limite), 1000))
+
+def listar_ultimos_atendimentos_soap(
+    ctx: Context,
+    paciente_id: int,
+    limite: Optional[int] = _DEFAULT_PAGINA,
+    cursor: Optional[str] = None,
+    desde: Optional[str] = None,
+    ate: Optional[str] = None,
+) -> AtendimentoSOAPPage:
+    """
+    Recupera últimos atendimentos SOAP do paciente (médicos e enfermeiros), paginados.
+
+    Traz o texto completo do SOAP; para uma visão geral do histórico prefira
+    listar_resumo_atendimentos_soap e depois obter_atendimentos_soap.
+    Retorna {atendimentos, proximo_cursor}; para a próxima página, repita a
+    chamada com cursor=proximo_cursor. limite ausente usa a página padrão (20).
+    Janela opcional de datas (AAAA-MM-DD, inclusivas) em desde/ate.
+    """
+
+    paciente_id_int = _validate_paciente_id(paciente_id)
+    page_size = _page_size(limite, _DEFAULT_PAGINA, _MAX_PAGINA)
+    where_clause, params = _build_history_where(paciente_id_int, desde, ate, cursor)
 
     conn = get_db_conn(ctx)
-    sql = _SQL_ATENDIMENTOS_BASE
-    params = [paciente_id_int]
-    if safe_limit is not None:
-        sql = f"{sql} LIMIT %s"
-        params.append(safe_limit)
+    sql = _SQL_ATENDIMENTOS_BASE.format(where_clause=where_clause)
+    rows = query_all(conn, sql, tuple(params + [page_size + 1]))
+
+    proximo_cursor = _next_cursor(paciente_id_int, rows, page_size)
+    return AtendimentoSOAPPage(
+        atendimentos=_rows_to_soap_results(conn, rows[:page_size]),
+        proximo_cursor=proximo_cursor,
+    )
 
-    rows = query_all(conn, sql, tuple(params))
 
-    results: List[AtendimentoSOAPResult] = []
+def listar_resumo_atendimentos_soap(
+    ctx: Context,
+    paciente_id: int,
+    limite: Optional[int] = _DEFAULT_PAGINA_RESUMO,
+    tamanho_trecho: int = 120,
+    cursor: Optional[str] = None,
+    desde: Optional[str] = None,
+    ate: Optional[str] = None,
+) -> AtendimentoSOAPResumoPage:
+    """
+    Lista atendimentos SOAP do paciente em modo resumo (médicos e enfermeiros), paginados.
+
+    Retorna metadados, CBO, códigos CID/CIAP e apenas o início de cada seção
+    SOAP com seu tamanho. Use obter_atendimentos_soap com os atendimento_id
+    de interesse para ler o texto completo.
+    Para a próxima página, repita a chamada com cursor=proximo_cursor.
+    Janela opcional de datas (AAAA-MM-DD, inclusivas) em desde/ate.
+    """
+
+    paciente_id_int = _validate_paciente_id(paciente_id)
+    page_size = _page_size(limite, _DEFAULT_PAGINA_RESUMO, _MAX_PAGINA_RESUMO)
+    trecho = max(0, min(int(tamanho_trecho), 500))
+    where_clause, params = _build_history_where(paciente_id_int, desde, ate, cursor)
+
+    conn = get_db_conn(ctx)
+    sql = _SQL_ATENDIMENTOS_RESUMO.format(where_clause=where_clause)
+    # Ordem dos placeholders: filtros/LIMIT da CTE e depois os substr() do SELECT.
+    rows = query_all(conn, sql, tuple(params + [page_size + 1] + [trecho] * 4))
+
+    proximo_cursor = _next_cursor(paciente_id_int, rows, page_size)
+    rows = rows[:page_size]
+    condicoes = _fetch_condicoes(conn, [int(row["atendimento_id"]) for row in rows])
+
+    results: List[AtendimentoSOAPResumoResult] = []
     for row in rows:
+        row_condicoes = condicoes.get(int(row["atendimento_id"]), [])
         results.append(
-            AtendimentoSOAPResult(
+            AtendimentoSOAPResumoResult(
                 atendimento_id=int(row["atendimento_id"]),
                 paciente_id=int(row["paciente_id"]),
                 data_hora=to_iso_datetime(row.get("data_hora")),
-                cbo_codigo=str(row.get("cbo_codigo")) if row.get("cbo_codigo") is not None else None,
-                cbo_descricao=str(row.get("cbo_descricao")) if row.get("cbo_descricao") is not None else None,
-                profissional=str(row.get("profissional")) if row.get("profissional") is not None else None,
-                tipo_profissional_id=str(row.get("tipo_profissional_id"))
-                if row.get("tipo_profissional_id") is not None
-                else None,
-                tipo_atendimento_id=str(row.get("tipo_atendimento_id"))
-                if row.get("tipo_atendimento_id") is not None
-                else None,
-                soap_s=str(row.get("soap_s")) if row.get("soap_s") is not None else None,
-                soap_o=str(row.get("soap_o")) if row.get("soap_o") is not None else None,
-                soap_a=str(row.get("soap_a")) if row.get("soap_a") is not None else None,
-                soap_p=str(row.get("soap_p")) if row.get("soap_p") is not None else None,
-                condicoes=row.get("condicoes") if isinstance(row.get("condicoes"), list) else [],
+                cbo_codigo=_opt_str(row.get("cbo_codigo")),
+                cbo_descricao=_opt_str(row.get("cbo_descricao")),
+                profissional=_opt_str(row.get("profissional")),
+                tipo_profissional_id=_opt_str(row.get("tipo_profissional_id")),
+                tipo_atendimento_id=_opt_str(row.get("tipo_atendimento_id")),
+                soap_s_trecho=_opt_str(row.get("soap_s_trecho")),
+                soap_o_trecho=_opt_str(row.get("soap_o_trecho")),
+                soap_a_trecho=_opt_str(row.get("soap_a_trecho")),
+                soap_p_trecho=_opt_str(row.get("soap_p_trecho")),
+                soap_s_tamanho=_opt_int(row.get("soap_s_tamanho")),
+                soap_o_tamanho=_opt_int(row.get("soap_o_tamanho")),
+                soap_a_tamanho=_opt_int(row.get("soap_a_tamanho")),
+                soap_p_tamanho=_opt_int(row.get("soap_p_tamanho")),
+                cid_codes=_sorted_codes(row_condicoes, "cid_code"),
+                ciap_codes=_sorted_codes(row_condicoes, "ciap_code"),
             )
         )
-    return results
+    return AtendimentoSOAPResumoPage(atendimentos=results, proximo_cursor=proximo_cursor)
+
+
+def obter_atendimentos_soap(
+    ctx: Context, atendimento_ids: list[int]
+) -> List[AtendimentoSOAPResult]:
+    """
+    Recupera o SOAP completo de atendimentos específicos (médicos e enfermeiros).
+
+    Recebe os atendimento_id retornados por listar_resumo_atendimentos_soap
+    (máximo 50 por chamada).
+    """
+
+    if not atendimento_ids:
+        raise ValueError("Informe ao menos um atendimento_id.")
+
+    ids: List[int] = []
+    for value in atendimento_ids:
+        atendimento_id = int(value)
+        if atendimento_id <= 0:
+            raise ValueError("atendimento_ids deve conter apenas inteiros positivos.")
+        if atendimento_id not in ids:
+            ids.append(atendimento_id)
+    if len(ids) > _MAX_IDS_DETALHE:
+        raise ValueError(f"Máximo de {_MAX_IDS_DETALHE} atendimentos por chamada.")
+
+    conn = get_db_conn(ctx)
+    sql = _SQL_ATENDIMENTOS_BASE.format(where_clause="ap.co_seq_atend_prof = ANY(%s)")
+    rows = query_all(conn, sql, (ids, len(ids)))
+    return _rows_to_soap_results(conn, rows)
 
 
-__all__ = ["listar_ultimos_atendimentos_soap"]
+__all__ = [
+    "listar_ultimos_atendimentos_soap",
+    "listar_resumo_atendimentos_soap",
+    "obter_atendimentos_soap",
+]
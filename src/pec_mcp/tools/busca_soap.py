@@ -0,0 +1,76 @@
+"""
+Tool de busca textual nas evoluções SOAP, servida pelo índice local FTS5.
+
+O índice avança em segundo plano (por co_seq_atend_prof, ver indice_soap);
+a tool só lê o arquivo local e informa a idade dele, sem tocar o Postgres.
+"""
+
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Literal, Optional
+
+from mcp.server.fastmcp import Context
+
+from ..indice_soap import INDICE_SOAP, expressao_fts
+from ..models import AtendimentoSOAPBuscaPage, AtendimentoSOAPBuscaResult
+from . import parse_iso_date
+
+SecaoSOAP = Literal["S", "O", "A", "P"]
+
+_DEFAULT_LIMITE = 20
+_MAX_LIMITE = 100
+
+
+def buscar_atendimentos_soap(
+    ctx: Context,
+    termo: str,
+    secoes: Optional[List[SecaoSOAP]] = None,
+    paciente_id: Optional[int] = None,
+    desde: Optional[str] = None,
+    ate: Optional[str] = None,
+    limite: int = _DEFAULT_LIMITE,
+) -> AtendimentoSOAPBuscaPage:
+    """
+    Busca atendimentos cujo SOAP contém todas as palavras do termo, com trechos destacados.
+
+    Ignora acentos e maiúsculas ("dispneia" encontra "Dispnéia"). Use aspas
+    para frases exatas e * no fim da palavra para prefixo (ex.: cefal*).
+    secoes restringe a S, O, A e/ou P; desde/ate (AAAA-MM-DD, inclusivas)
+    limitam a data do atendimento. Mais recentes primeiro. O índice é
+    sincronizado em segundo plano; indice_defasagem_segundos diz quão atrás
+    do banco ele pode estar.
+    """
+
+    if not INDICE_SOAP.habilitado:
+        raise ValueError("Busca SOAP indisponível: índice local desativado (PEC_SOAP_INDEX_PATH).")
+    expressao = expressao_fts(termo, secoes)
+    data_desde = parse_iso_date(desde, "desde")
+    data_ate = parse_iso_date(ate, "ate")
+    if data_desde and data_ate and data_desde > data_ate:
+        raise ValueError("desde não pode ser posterior a ate.")
+    safe_limit = max(1, min(int(limite), _MAX_LIMITE))
+
+    rows = INDICE_SOAP.buscar(
+        expressao,
+        paciente_id=int(paciente_id) if paciente_id is not None else None,
+        desde=data_desde.isoformat() if data_desde else None,
+        ate_exclusivo=(data_ate + timedelta(days=1)).isoformat() if data_ate else None,
+        limite=safe_limit,
+    )
+    estado = INDICE_SOAP.estado()
+    atualizado_em = estado["atualizado_em"]
+    return AtendimentoSOAPBuscaPage(
+        atendimentos=[AtendimentoSOAPBuscaResult(**row) for row in rows],
+        indice_atualizado_em=(
+            datetime.fromtimestamp(atualizado_em, tz=timezone.utc).isoformat() if atualizado_em else None
+        ),
+        indice_defasagem_segundos=(
+            round(max(0.0, time.time() - atualizado_em), 1) if atualizado_em else None
+        ),
+        indice_total_atendimentos=int(estado["total"]),
+    )
+
+
+__all__ = ["SecaoSOAP", "buscar_atendimentos_soap"]
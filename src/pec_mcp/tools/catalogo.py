@@ -0,0 +1,96 @@
+"""
+Catálogo CID-10/CIAP em memória para resolver padrões de código em ids.
+
+Os filtros de condição recebem padrões (ex.: "I10%"); resolvê-los aqui em
+conjuntos de co_cid10/co_seq_ciap permite filtrar tb_problema direto pelas
+chaves inteiras, sem juntar cada problema às tabelas de códigos antes.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import NamedTuple, Tuple
+
+from ..cache import RefreshingCache
+from ..config import PEC_CATALOGO_CODIGOS_REFRESH_SECONDS
+from ..db import query_all
+from .filters import ConditionFilter, _like_matches
+
+_SQL_CATALOGO_CID10 = """
+SELECT cid.co_cid10 AS id, UPPER(cid.nu_cid10) AS code
+FROM tb_cid10 cid
+WHERE cid.nu_cid10 IS NOT NULL;
+"""
+
+_SQL_CATALOGO_CIAP = """
+SELECT ciap.co_seq_ciap AS id, UPPER(ciap.co_ciap) AS code
+FROM tb_ciap ciap
+WHERE ciap.co_ciap IS NOT NULL;
+"""
+
+
+class _Tabela(NamedTuple):
+    # Listas paralelas ordenadas por código, para busca de prefixo por bisect.
+    codes: Tuple[str, ...]
+    ids: Tuple[int, ...]
+
+    def resolve(self, pattern: str) -> Tuple[int, ...]:
+        """
+        Ids cujos códigos casam com o padrão (mesma semântica de ILIKE).
+        """
+
+        prefix = pattern[:-1] if pattern.endswith("%") else None
+        if prefix is not None and "%" not in prefix and "_" not in prefix:
+            start = bisect_left(self.codes, prefix)
+            end = start
+            while end < len(self.codes) and self.codes[end].startswith(prefix):
+                end += 1
+            matched = self.ids[start:end]
+        else:
+            matched = [cid_id for code, cid_id in zip(self.codes, self.ids) if _like_matches(pattern, code)]
+        return tuple(sorted(set(matched)))
+
+
+class _Catalogo(NamedTuple):
+    cid: _Tabela
+    ciap: _Tabela
+
+
+def _load_tabela(conn, sql: str) -> _Tabela:
+    # Ordenamos em Python (após strip) para o bisect não depender da collation do banco.
+    pairs = sorted((str(row["code"]).strip(), int(row["id"])) for row in query_all(conn, sql))
+    return _Tabela(codes=tuple(code for code, _ in pairs), ids=tuple(cid_id for _, cid_id in pairs))
+
+
+def _load_catalogo(conn, _previous) -> _Catalogo:
+    return _Catalogo(
+        cid=_load_tabela(conn, _SQL_CATALOGO_CID10),
+        ciap=_load_tabela(conn, _SQL_CATALOGO_CIAP),
+    )
+
+
+CATALOGO_CODIGOS: RefreshingCache[_Catalogo] = RefreshingCache(
+    "catalogo_codigos", _load_catalogo, PEC_CATALOGO_CODIGOS_REFRESH_SECONDS
+)
+
+
+def resolver_codigos(conn, condition: ConditionFilter) -> ConditionFilter:
+    """
+    Preenche cid_ids/ciap_ids do filtro a partir do catálogo do banco da conexão.
+
+    Padrões sem correspondência viram conjuntos vazios (nenhum problema casa),
+    como aconteceria com o ILIKE.
+    """
+
+    if not condition.cid_patterns and not condition.ciap_patterns:
+        return condition
+    catalogo = CATALOGO_CODIGOS.get(conn)
+    cid_ids = tuple(catalogo.cid.resolve(pattern) for pattern in condition.cid_patterns)
+    ciap_ids = sorted({i for pattern in condition.ciap_patterns for i in catalogo.ciap.resolve(pattern)})
+    return condition._replace(
+        cid_ids=cid_ids if condition.cid_patterns else None,
+        ciap_ids=tuple(ciap_ids) if condition.ciap_patterns else None,
+    )
+
+
+__all__ = ["CATALOGO_CODIGOS", "resolver_codigos"]
@@ -0,0 +1,228 @@
+"""
+Motor colunar (NumPy) para consulta_epidemiologia.
+
+O cubo em SQL fixa idade em anos e soma pacientes por CID; agrupamentos
+sem CID (só sexo x faixa, por exemplo) contariam o mesmo paciente várias
+vezes. Aqui carregamos uma vez os pares distintos (paciente, CID) com as
+colunas mínimas do paciente em arrays NumPy e calculamos filtros, faixas
+etárias arbitrárias e agrupamentos com operações vetorizadas, contando
+pacientes distintos em qualquer combinação sem voltar ao Postgres.
+
+Ativado com PEC_EPIDEMIOLOGIA_ENGINE=colunar; requer numpy.
+"""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+from datetime import date
+from typing import Dict, Literal, NamedTuple, Optional, Sequence, Tuple
+
+from ..cache import RefreshingCache
+from ..config import PEC_EPIDEMIOLOGIA_REFRESH_SECONDS
+from ..db import query_all, query_iter
+from .filters import ConditionFilter, PatientFilter
+
+Dimensao = Literal["cid", "sexo", "faixa_etaria", "localidade"]
+
+DIMENSOES: Tuple[str, ...] = ("cid", "sexo", "faixa_etaria", "localidade")
+
+# Mesmas faixas do cubo: 0-11, 12-17, 18-39, 40-59, 60+.
+FAIXAS_PADRAO: Tuple[int, ...] = (0, 12, 18, 40, 60)
+
+_MAX_FAIXAS = 20
+_LOTE_LINHAS = 50_000
+
+# Nascimento como AAAAMMDD: (hoje - nascimento) // 10000 é a idade em anos
+# completos, com a mesma semântica de AGE() (29/02 inclusive).
+_SQL_PARES = """
+SELECT DISTINCT
+    pr.co_cidadao                                   AS paciente_id,
+    p.co_cid10                                      AS cid_id,
+    TO_CHAR(c.dt_nascimento, 'YYYYMMDD')::int       AS nascimento,
+    c.no_sexo                                       AS sexo,
+    c.co_localidade_endereco                        AS localidade_id
+FROM tb_problema p
+JOIN tb_prontuario pr ON pr.co_seq_prontuario = p.co_prontuario
+JOIN tb_cidadao c ON c.co_seq_cidadao = pr.co_cidadao;
+"""
+
+_SQL_CID10 = "SELECT co_cid10 AS cid_id, nu_cid10, no_cid10 FROM tb_cid10;"
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as exc:  # pragma: no cover - depende do ambiente
+        raise RuntimeError("PEC_EPIDEMIOLOGIA_ENGINE=colunar requer numpy (pip install numpy).") from exc
+    return numpy
+
+
+class TabelaColunar(NamedTuple):
+    # Uma posição por par distinto (paciente, CID); -1/0 marcam nulos.
+    paciente: object  # int64
+    cid: object  # int64, -1 = problema sem CID-10
+    nascimento: object  # int32 AAAAMMDD, 0 = sem data
+    sexo: object  # int8, índice em sexos, -1 = nulo
+    localidade: object  # int64, -1 = nula
+    sexos: Tuple[str, ...]
+    cids: Dict[int, Tuple[Optional[str], Optional[str]]]
+
+
+def _carregar(conn, _previous) -> TabelaColunar:
+    np = _numpy()
+    paciente, cid, localidade = array("q"), array("q"), array("q")
+    nascimento, sexo = array("i"), array("b")
+    sexos: Dict[str, int] = {}
+    # Cursor do lado do servidor: só um lote de linhas por vez no cliente.
+    for row in query_iter(conn, _SQL_PARES, itersize=_LOTE_LINHAS):
+        paciente.append(int(row["paciente_id"]))
+        cid.append(-1 if row["cid_id"] is None else int(row["cid_id"]))
+        nascimento.append(row["nascimento"] or 0)
+        valor_sexo = row["sexo"]
+        sexo.append(-1 if valor_sexo is None else sexos.setdefault(valor_sexo, len(sexos)))
+        localidade.append(-1 if row["localidade_id"] is None else int(row["localidade_id"]))
+    cids = {
+        int(row["cid_id"]): (row.get("nu_cid10"), row.get("no_cid10"))
+        for row in query_all(conn, _SQL_CID10)
+    }
+    return TabelaColunar(
+        paciente=np.frombuffer(paciente, dtype=np.int64),
+        cid=np.frombuffer(cid, dtype=np.int64),
+        nascimento=np.frombuffer(nascimento, dtype=np.int32),
+        sexo=np.frombuffer(sexo, dtype=np.int8),
+        localidade=np.frombuffer(localidade, dtype=np.int64),
+        sexos=tuple(sexos),
+        cids=cids,
+    )
+
+
+COLUNAS_COMORBIDADES: RefreshingCache[TabelaColunar] = RefreshingCache(
+    "colunas_comorbidades", _carregar, PEC_EPIDEMIOLOGIA_REFRESH_SECONDS
+)
+
+
+def validar_faixas(faixas: Optional[Sequence[int]]) -> Tuple[int, ...]:
+    """
+    Limites inferiores das faixas etárias, crescentes; o primeiro vira 0.
+    """
+
+    if faixas is None:
+        return FAIXAS_PADRAO
+    limites = tuple(int(v) for v in faixas)
+    if not limites or len(limites) > _MAX_FAIXAS:
+        raise ValueError(f"faixas_etarias deve ter de 1 a {_MAX_FAIXAS} limites.")
+    if limites[0] < 0 or any(b <= a for a, b in zip(limites, limites[1:])):
+        raise ValueError("faixas_etarias deve ser crescente e sem idades negativas.")
+    return limites if limites[0] == 0 else (0,) + limites
+
+
+def validar_agrupamento(agrupar_por: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    if agrupar_por is None:
+        return DIMENSOES
+    dimensoes = tuple(dict.fromkeys(str(v).strip().lower() for v in agrupar_por))
+    invalidas = [d for d in dimensoes if d not in DIMENSOES]
+    if invalidas:
+        raise ValueError(f"agrupar_por inválido: {', '.join(invalidas)}. Use: {', '.join(DIMENSOES)}.")
+    return dimensoes
+
+
+def rotulos_faixas(limites: Sequence[int]) -> Tuple[str, ...]:
+    rotulos = [f"{a}-{b - 1}" for a, b in zip(limites, limites[1:])]
+    rotulos.append(f"{limites[-1]}+")
+    return tuple(rotulos)
+
+
+def faixa_etaria(idade: Optional[int], limites: Sequence[int] = FAIXAS_PADRAO) -> Optional[str]:
+    if idade is None or idade < 0:
+        return None
+    return rotulos_faixas(limites)[bisect_right(limites, idade) - 1]
+
+
+def agregar(
+    tabela: TabelaColunar,
+    filtro_paciente: PatientFilter,
+    filtro_cid: ConditionFilter,
+    localidade_id: Optional[int],
+    limites: Sequence[int],
+    dimensoes: Sequence[str],
+    limite: int,
+    hoje: Optional[date] = None,
+) -> Dict[tuple, int]:
+    """
+    Pacientes distintos por grupo, já filtrados; devolve os grupos candidatos ao top-limite.
+
+    As chaves seguem o formato do cubo (codigo, descricao, sexo, faixa,
+    localidade), com None nas dimensões fora de dimensoes.
+    """
+
+    np = _numpy()
+    hoje = hoje or date.today()
+    hoje_ymd = hoje.year * 10000 + hoje.month * 100 + hoje.day
+    idade = np.where(tabela.nascimento > 0, (hoje_ymd - tabela.nascimento) // 10000, -1)
+
+    mascara = np.ones(len(tabela.paciente), dtype=bool)
+    if filtro_paciente.sex is not None:
+        if filtro_paciente.sex not in tabela.sexos:
+            return {}
+        mascara &= tabela.sexo == tabela.sexos.index(filtro_paciente.sex)
+    if filtro_paciente.age_min is not None:
+        mascara &= (idade >= 0) & (idade >= filtro_paciente.age_min)
+    if filtro_paciente.age_max is not None:
+        mascara &= (idade >= 0) & (idade <= filtro_paciente.age_max)
+    if localidade_id is not None:
+        mascara &= tabela.localidade == localidade_id
+    if filtro_cid.cid_patterns:
+        # Padrões avaliados uma vez por código do catálogo, não por linha.
+        ids = [cid_id for cid_id, (codigo, _) in tabela.cids.items() if filtro_cid.matches_cid(codigo)]
+        mascara &= np.isin(tabela.cid, np.asarray(ids, dtype=np.int64))
+
+    if not mascara.any():
+        return {}
+    colunas = {
+        "cid": tabela.cid[mascara],
+        "sexo": tabela.sexo[mascara].astype(np.int64),
+        "faixa_etaria": np.searchsorted(np.asarray(limites), idade[mascara], side="right") - 1,
+        "localidade": tabela.localidade[mascara],
+    }
+    # Coluna constante quando não há dimensão: um único grupo com o total.
+    chaves = [colunas[d] for d in DIMENSOES if d in dimensoes] or [np.zeros(int(mascara.sum()), dtype=np.int64)]
+    if "cid" in dimensoes:
+        # Os pares (paciente, CID) são distintos: cada linha é um paciente no grupo.
+        grupos, totais = np.unique(np.stack(chaves, axis=1), axis=0, return_counts=True)
+    else:
+        distintos = np.unique(np.stack(chaves + [tabela.paciente[mascara]], axis=1), axis=0)
+        grupos, totais = np.unique(distintos[:, :-1], axis=0, return_counts=True)
+
+    if len(totais) > limite:
+        corte = np.partition(totais, len(totais) - limite)[len(totais) - limite]
+        manter = totais >= corte
+        grupos, totais = grupos[manter], totais[manter]
+
+    rotulos = rotulos_faixas(limites)
+    resultado: Dict[tuple, int] = {}
+    for linha, total in zip(grupos.tolist(), totais.tolist()):
+        valores = dict(zip([d for d in DIMENSOES if d in dimensoes], linha))
+        codigo = descricao = None
+        if "cid" in valores and valores["cid"] >= 0:
+            codigo, descricao = tabela.cids.get(valores["cid"], (None, None))
+        sexo = tabela.sexos[valores["sexo"]] if valores.get("sexo", -1) >= 0 else None
+        faixa = rotulos[valores["faixa_etaria"]] if valores.get("faixa_etaria", -1) >= 0 else None
+        localidade = valores["localidade"] if valores.get("localidade", -1) >= 0 else None
+        chave = (codigo, descricao, sexo, faixa, localidade)
+        resultado[chave] = resultado.get(chave, 0) + total
+    return resultado
+
+
+__all__ = [
+    "COLUNAS_COMORBIDADES",
+    "DIMENSOES",
+    "Dimensao",
+    "FAIXAS_PADRAO",
+    "TabelaColunar",
+    "agregar",
+    "faixa_etaria",
+    "rotulos_faixas",
+    "validar_agrupamento",
+    "validar_faixas",
+]
@@ -4,7 +4,6 @@ Tool para listar condicoes de saude (CID/CIAP) registradas em pacientes.
 
 from __future__ import annotations
 
-import re
 from typing import List, Optional
 
 from mcp.server.fastmcp import Context
@@ -12,7 +11,10 @@ from mcp.server.fastmcp import Context
 from ..db import query_all
 from ..models import ConditionResult
 from . import get_db_conn, to_iso_date
-from .filters import build_condition_filters, build_patient_filters
+from .catalogo import resolver_codigos
+from .demografia import to_initials
+from .nomes import resolver_nome
+from .filters import ConditionFilter, FilterSet, PatientFilter
 
 _SQL_CONDICOES = """
 WITH ultima_evolucao AS (
@@ -51,19 +53,6 @@ LIMIT %s;
 """
 
 
-def _to_initials(full_name: Optional[str]) -> str:
-    """
-    Converte nome completo em iniciais (ex.: "Joao de Carvalho Lima" -> "JCL").
-    """
-
-    if not full_name:
-        return "N/A"
-    parts = re.split(r"\s+", str(full_name).strip())
-    skip = {"de", "da", "do", "das", "dos"}
-    initials = [p[0].upper() for p in parts if p and p.lower() not in skip]
-    return "".join(initials) if initials else "N/A"
-
-
 def listar_condicoes_pacientes(
     ctx: Context,
     paciente_id: Optional[int] = None,
@@ -92,45 +81,49 @@ def listar_condicoes_pacientes(
     Nao use para descobrir codigos; para isso, use obter_codigos_condicao_saude.
     """
 
-    patient_clauses, patient_params = build_patient_filters(
-        paciente_id,
-        name_starts_with,
-        sex,
-        age_min,
-        age_max,
-        unidade_saude_id=unidade_saude_id,
-        equipe_id=equipe_id,
-        micro_area=micro_area,
-        alias="c",
-    )
-    condition_clauses, condition_params = build_condition_filters(
-        cid_code=cid_code,
-        cid_codes=cid_codes,
-        ciap_code=ciap_code,
-        ciap_codes=ciap_codes,
-        condition_text=condition_text,
-        cid_logic=cid_logic,
-        cid_ciap_logic=cid_ciap_logic,
-        allow_cid_and=False,
-        patient_alias="c",
+    filters = FilterSet(
+        patient=PatientFilter.build(
+            paciente_id,
+            name_starts_with,
+            sex,
+            age_min,
+            age_max,
+            unidade_saude_id=unidade_saude_id,
+            equipe_id=equipe_id,
+            micro_area=micro_area,
+        ),
+        condition=ConditionFilter.build(
+            cid_code=cid_code,
+            cid_codes=cid_codes,
+            ciap_code=ciap_code,
+            ciap_codes=ciap_codes,
+            condition_text=condition_text,
+            cid_logic=cid_logic,
+            cid_ciap_logic=cid_ciap_logic,
+            allow_cid_and=False,
+        ),
     )
 
-    all_clauses = patient_clauses + condition_clauses
-    all_params = patient_params + condition_params
-
-    if not all_clauses:
+    if filters.is_empty:
         raise ValueError("Informe pelo menos um critério de paciente ou condição.")
 
+    conn = get_db_conn(ctx)
+    # Padrões CID/CIAP e prefixo de nome viram ids (catálogo e índice de nomes).
+    filters = filters._replace(
+        patient=resolver_nome(conn, filters.patient),
+        condition=resolver_codigos(conn, filters.condition),
+    )
+    all_clauses, all_params = filters.compile("c")
+
     where_clause = "WHERE " + " AND ".join(all_clauses)
     safe_limit = max(1, min(limite, 200))
     sql = _SQL_CONDICOES.format(where_clause=where_clause)
 
-    conn = get_db_conn(ctx)
     rows = query_all(conn, sql, all_params + [safe_limit])
 
     results: List[ConditionResult] = []
     for row in rows:
-        initials = _to_initials(row.get("nome_paciente"))
+        initials = to_initials(row.get("nome_paciente"))
         birth_date = to_iso_date(row.get("data_nascimento"))
         dt_inicio = to_iso_date(row.get("dt_inicio_condicao"))
         dt_fim = to_iso_date(row.get("dt_fim_condicao"))
@@ -4,14 +4,20 @@ Tool para contar pacientes únicos aplicando filtros de paciente/condição.
 
 from __future__ import annotations
 
-from typing import Optional
+from typing import Optional, Union
 
 from mcp.server.fastmcp import Context
 
-from ..db import query_one
-from ..models import CountResult
+from ..config import PEC_COST_GUARD_APPROXIMATE
+from ..db import query_all, query_one
+from ..espelho import conexao_espelho
+from ..models import ApproximateCountResult, CountResult
 from . import get_db_conn
-from .filters import build_condition_filters, build_patient_filters
+from .aproximado import SQL_BLOCO_CIDADAO, ModoContagem, estimar_por_blocos, percentual_amostra, validar_modo
+from .catalogo import resolver_codigos
+from .custo import CustoExcedido, guardar_custo
+from .filters import ConditionFilter, FilterSet, PatientFilter
+from .nomes import resolver_nome
 
 _CTE_ULTIMA_EVOLUCAO = """
 WITH ultima_evolucao AS (
@@ -41,68 +47,128 @@ def contar_pacientes(
     condition_text: Optional[str] = None,
     cid_logic: str = "OR",
     cid_ciap_logic: str = "OR",
-) -> CountResult:
+    mode: ModoContagem = "exact",
+) -> Union[CountResult, ApproximateCountResult]:
     """
     Retorna apenas a contagem de pacientes distintos de acordo com filtros.
     Aceita filtro opcional de unidade de saúde (atendimento ou vinculação por CNES),
     equipe (co_seq_equipe) e microárea (nu_micro_area atual via cadastro individual).
+    mode="approximate" estima a partir de uma amostra de blocos do cadastro
+    (rápido, com intervalo de 95% e método); exact é o padrão.
     """
 
-    patient_clauses, patient_params = build_patient_filters(
-        paciente_id,
-        name_starts_with,
-        sex,
-        age_min,
-        age_max,
-        unidade_saude_id=unidade_saude_id,
-        equipe_id=equipe_id,
-        micro_area=micro_area,
-        alias="c",
+    modo = validar_modo(mode)
+
+    filters = FilterSet(
+        patient=PatientFilter.build(
+            paciente_id,
+            name_starts_with,
+            sex,
+            age_min,
+            age_max,
+            unidade_saude_id=unidade_saude_id,
+            equipe_id=equipe_id,
+            micro_area=micro_area,
+        ),
+        condition=ConditionFilter.build(
+            cid_code=cid_code,
+            cid_codes=cid_codes,
+            ciap_code=ciap_code,
+            ciap_codes=ciap_codes,
+            condition_text=condition_text,
+            cid_logic=cid_logic,
+            cid_ciap_logic=cid_ciap_logic,
+            allow_cid_and=True,
+        ),
     )
-    condition_clauses, condition_params = build_condition_filters(
-        cid_code=cid_code,
-        cid_codes=cid_codes,
-        ciap_code=ciap_code,
-        ciap_codes=ciap_codes,
-        condition_text=condition_text,
-        cid_logic=cid_logic,
-        cid_ciap_logic=cid_ciap_logic,
-        allow_cid_and=True,
-        patient_alias="c",
-    )
-
-    clauses = patient_clauses + condition_clauses
-    params = patient_params + condition_params
 
-    if not clauses:
+    if filters.is_empty:
         raise ValueError("Informe pelo menos um critério de paciente ou condição.")
 
+    # Busca textual em descrições/observações varre muitos problemas: vai para réplica analítica.
+    workload = "analytic" if condition_text else "interactive"
+    # Contagem exata sem texto livre pode vir do espelho local (evoluções não são espelhadas).
+    espelho = None
+    if modo == "exact" and not filters.condition.condition_text:
+        espelho = conexao_espelho(ctx, "contar_pacientes")
+    conn = espelho or get_db_conn(ctx, workload=workload)
+    # Padrões CID/CIAP viram ids do catálogo (filtro direto em tb_problema) e o
+    # prefixo de nome, ids do índice de nomes sem acento.
+    filters = filters._replace(
+        patient=resolver_nome(conn, filters.patient),
+        condition=resolver_codigos(conn, filters.condition),
+    )
+    clauses, params = filters.compile("c")
+
     where_sql = "WHERE " + " AND ".join(clauses)
 
-    use_conditions = bool(condition_clauses)
-    cte_sql = _CTE_ULTIMA_EVOLUCAO if use_conditions else ""
+    # tb_cid10/tb_ciap e a última evolução só entram quando o filtro os referencia.
+    cte_sql = _CTE_ULTIMA_EVOLUCAO if filters.condition.condition_text else ""
     condition_join = ""
-    if use_conditions:
-        condition_join = """
-JOIN tb_problema p ON p.co_prontuario = pr.co_seq_prontuario
-LEFT JOIN tb_cid10 cid ON cid.co_cid10 = p.co_cid10
+    if filters.has_conditions:
+        condition_join = "JOIN tb_problema p ON p.co_prontuario = pr.co_seq_prontuario\n"
+    if filters.condition.needs_code_joins:
+        condition_join += """LEFT JOIN tb_cid10 cid ON cid.co_cid10 = p.co_cid10
 LEFT JOIN tb_ciap ciap ON ciap.co_seq_ciap = p.co_ciap
-LEFT JOIN ultima_evolucao ue ON ue.co_unico_problema = p.co_unico_problema
 """
+    if cte_sql:
+        condition_join += "LEFT JOIN ultima_evolucao ue ON ue.co_unico_problema = p.co_unico_problema\n"
 
+    from_sql = f"""
+FROM tb_cidadao c{{amostra}}
+JOIN tb_prontuario pr ON pr.co_cidadao = c.co_seq_cidadao
+{condition_join}
+{where_sql}"""
     sql = f"""
 {cte_sql}
 SELECT COUNT(DISTINCT c.co_seq_cidadao) AS total
-FROM tb_cidadao c
-JOIN tb_prontuario pr ON pr.co_cidadao = c.co_seq_cidadao
-{condition_join}
-{where_sql};
+{from_sql.replace("{amostra}", "")};
 """
 
-    conn = get_db_conn(ctx)
+    if modo == "approximate":
+        return _contar_aproximado(conn, cte_sql, from_sql, params)
+
+    if espelho is not None:
+        # Leitura local: sem guarda de custo, o Postgres não é consultado.
+        row = query_one(conn, sql, params)
+        total = int(row["total"]) if row and row.get("total") is not None else 0
+        return CountResult(count=total, fonte=espelho.fonte)
+
+    if filters.patient.paciente_id is None:
+        # Filtros amplos (ex.: só sexo) podem varrer o cadastro inteiro.
+        try:
+            conn = guardar_custo(
+                ctx,
+                conn,
+                sql,
+                params,
+                "Restrinja com unidade_saude_id, equipe_id, micro_area, faixa etária ou códigos CID/CIAP.",
+                workload=workload,
+            )
+        except CustoExcedido:
+            if not PEC_COST_GUARD_APPROXIMATE:
+                raise
+            # Cara demais para contar exatamente: responde com a estimativa.
+            return _contar_aproximado(get_db_conn(ctx, workload="analytic"), cte_sql, from_sql, params)
     row = query_one(conn, sql, params)
     total = int(row["total"]) if row and row.get("total") is not None else 0
     return CountResult(count=total)
 
 
+def _contar_aproximado(conn, cte_sql: str, from_sql: str, params: list) -> ApproximateCountResult:
+    """
+    Conta por bloco amostrado de tb_cidadao e estima o total com intervalo de 95%.
+    """
+
+    percentual = percentual_amostra()
+    sql = f"""
+{cte_sql}
+SELECT {SQL_BLOCO_CIDADAO} AS bloco, COUNT(DISTINCT c.co_seq_cidadao) AS total
+{from_sql.replace("{amostra}", " TABLESAMPLE SYSTEM (%s)")}
+GROUP BY 1;
+"""
+    rows = query_all(conn, sql, [percentual] + params)
+    return estimar_por_blocos((int(row["total"]) for row in rows), percentual)
+
+
 __all__ = ["contar_pacientes"]
@@ -0,0 +1,124 @@
+"""
+Guarda de custo: estimativa do planejador antes de executar consultas amplas.
+
+"Informe pelo menos um critério" não impede varreduras: sex="F" sozinho
+satisfaz a regra e percorre todo o cadastro de cidadãos. Antes de executar,
+rodamos EXPLAIN (sem ANALYZE: nada é executado) no SQL gerado e lemos o custo
+total e a maior estimativa de linhas do plano. Acima dos limites a consulta
+vai para a réplica analítica; muito acima, é recusada com orientação de
+quais filtros restringir.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from typing import Literal, NamedTuple, Optional, Sequence
+
+from mcp.server.fastmcp import Context
+
+from ..config import (
+    PEC_COST_GUARD_ANALYTIC_COST,
+    PEC_COST_GUARD_ANALYTIC_ROWS,
+    PEC_COST_GUARD_ENABLED,
+    PEC_COST_GUARD_MAX_COST,
+    PEC_COST_GUARD_MAX_ROWS,
+)
+from ..db import query_one
+from ..routing import Workload
+from . import get_db_conn
+
+logger = logging.getLogger(__name__)
+
+Decisao = Literal["executar", "analitico", "recusar"]
+
+
+class EstimativaCusto(NamedTuple):
+    custo_total: float
+    # Maior estimativa de linhas entre os nós do plano (volume varrido).
+    linhas: float
+
+
+class CustoExcedido(ValueError):
+    """
+    Consulta recusada pela guarda; tools de contagem podem cair no modo aproximado.
+    """
+
+    def __init__(self, mensagem: str, estimativa: EstimativaCusto) -> None:
+        super().__init__(mensagem)
+        self.estimativa = estimativa
+
+
+def _maior_estimativa(plano: dict) -> float:
+    linhas = float(plano.get("Plan Rows") or 0)
+    for filho in plano.get("Plans") or ():
+        linhas = max(linhas, _maior_estimativa(filho))
+    return linhas
+
+
+def estimar_custo(conn, sql: str, params: Optional[Sequence] = None) -> EstimativaCusto:
+    """
+    Custo total e linhas estimadas do plano (EXPLAIN sem ANALYZE).
+    """
+
+    row = query_one(conn, "EXPLAIN (FORMAT JSON) " + sql.strip().rstrip(";"), params)
+    documento = next(iter(row.values())) if row else None
+    if isinstance(documento, str):
+        documento = json.loads(documento)
+    plano = documento[0]["Plan"]
+    return EstimativaCusto(custo_total=float(plano["Total Cost"]), linhas=_maior_estimativa(plano))
+
+
+def decidir(
+    estimativa: EstimativaCusto,
+    custo_analitico: float = PEC_COST_GUARD_ANALYTIC_COST,
+    linhas_analitico: float = PEC_COST_GUARD_ANALYTIC_ROWS,
+    custo_max: float = PEC_COST_GUARD_MAX_COST,
+    linhas_max: float = PEC_COST_GUARD_MAX_ROWS,
+) -> Decisao:
+    """
+    Compara a estimativa com os limites (limite <= 0 desativa a checagem).
+    """
+
+    def _acima(valor: float, limite: float) -> bool:
+        return limite > 0 and valor > limite
+
+    if _acima(estimativa.custo_total, custo_max) or _acima(estimativa.linhas, linhas_max):
+        return "recusar"
+    if _acima(estimativa.custo_total, custo_analitico) or _acima(estimativa.linhas, linhas_analitico):
+        return "analitico"
+    return "executar"
+
+
+def guardar_custo(
+    ctx: Context,
+    conn,
+    sql: str,
+    params: Optional[Sequence],
+    orientacao: str,
+    workload: Workload = "interactive",
+):
+    """
+    Devolve a conexão em que a consulta deve rodar, ou CustoExcedido se for cara demais.
+
+    orientacao completa a mensagem de recusa com os filtros que a tool aceita.
+    """
+
+    if not PEC_COST_GUARD_ENABLED:
+        return conn
+    estimativa = estimar_custo(conn, sql, params)
+    decisao = decidir(estimativa)
+    if decisao == "recusar":
+        logger.info("Consulta recusada pela guarda de custo: %s", estimativa)
+        raise CustoExcedido(
+            "Consulta ampla demais "
+            f"(custo estimado {estimativa.custo_total:.0f}, ~{estimativa.linhas:.0f} linhas). "
+            + orientacao,
+            estimativa,
+        )
+    if decisao == "analitico" and workload != "analytic":
+        return get_db_conn(ctx, workload="analytic")
+    return conn
+
+
+__all__ = ["CustoExcedido", "Decisao", "EstimativaCusto", "decidir", "estimar_custo", "guardar_custo"]
@@ -0,0 +1,86 @@
+"""
+Demografia de pacientes a partir de listas de ids, em lote.
+
+Tools que produzem ids (coortes, contagens listadas, linha do tempo) anexam
+nome/nascimento/sexo com uma consulta por lote pela chave primária
+(co_seq_cidadao = ANY(int[])), em vez de uma chamada por paciente.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterable, List, Optional
+
+from ..db import query_all
+from .filters import PatientFilter
+
+_SQL_DEMOGRAFIA = """
+SELECT
+    c.co_seq_cidadao AS paciente_id,
+    c.no_cidadao     AS nome_paciente,
+    c.dt_nascimento  AS data_nascimento,
+    c.no_sexo        AS sexo
+FROM tb_cidadao c
+WHERE {where_clause}
+"""
+
+# Ids por consulta: mantém o array do ANY e o plano (index scan) em tamanho previsível.
+_LOTE_IDS = 1000
+
+
+def validar_ids(ids: Optional[Iterable[int]], campo: str = "paciente_ids", maximo: Optional[int] = None) -> List[int]:
+    """
+    Ids inteiros positivos, sem repetição, na ordem recebida.
+    """
+
+    vistos: Dict[int, None] = {}
+    for valor in ids or ():
+        paciente_id = int(valor)
+        if paciente_id <= 0:
+            raise ValueError(f"{campo} deve conter apenas inteiros positivos.")
+        vistos.setdefault(paciente_id, None)
+    if maximo is not None and len(vistos) > maximo:
+        raise ValueError(f"{campo} aceita no máximo {maximo} ids.")
+    return list(vistos)
+
+
+def to_initials(full_name: Optional[str]) -> str:
+    """
+    Converte nome completo em iniciais (ex.: "Joao de Carvalho Lima" -> "JCL").
+    """
+
+    if not full_name:
+        return "N/A"
+    parts = re.split(r"\s+", str(full_name).strip())
+    skip = {"de", "da", "do", "das", "dos"}
+    initials = [p[0].upper() for p in parts if p and p.lower() not in skip]
+    return "".join(initials) if initials else "N/A"
+
+
+def hidratar_pacientes(
+    conn,
+    ids: Iterable[int],
+    filtro: Optional[PatientFilter] = None,
+) -> List[dict]:
+    """
+    Linhas de tb_cidadao (paciente_id, nome_paciente, data_nascimento, sexo) na ordem dos ids.
+
+    Ids repetidos aparecem uma vez; ids inexistentes ou fora do filtro
+    opcional (sexo, idade, unidade...) ficam de fora.
+    """
+
+    ordem = validar_ids(ids, "ids")
+    if not ordem:
+        return []
+    clauses, params = (filtro or PatientFilter()).compile("c")
+    sql = _SQL_DEMOGRAFIA.format(where_clause=" AND ".join(["c.co_seq_cidadao = ANY(%s)"] + clauses))
+
+    por_id: Dict[int, dict] = {}
+    for inicio in range(0, len(ordem), _LOTE_IDS):
+        lote = ordem[inicio : inicio + _LOTE_IDS]
+        for row in query_all(conn, sql, [lote] + params):
+            por_id[int(row["paciente_id"])] = row
+    return [por_id[paciente_id] for paciente_id in ordem if paciente_id in por_id]
+
+
+__all__ = ["hidratar_pacientes", "to_initials", "validar_ids"]
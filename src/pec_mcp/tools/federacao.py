@@ -0,0 +1,177 @@
+"""
+Tools federadas: a mesma contagem/listagem em todos os bancos municipais.
+
+Contagens são somadas; listas são mescladas, reordenadas pela mesma chave da
+tool original e cortadas no limite global, com cada item marcado pela fonte.
+Membros com erro ou timeout não derrubam a resposta: ela sai parcial, com o
+status e a latência de cada membro.
+"""
+
+from __future__ import annotations
+
+import inspect
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+
+from mcp.server.fastmcp import Context
+
+from ..config import PEC_FEDERATION_TIMEOUT_SECONDS
+from ..federation import fan_out
+from ..models import FederatedCountResult, FederatedListResult, FederatedMemberStatus
+from .condicoes import listar_condicoes_pacientes
+from .contar_pacientes import contar_pacientes
+from .gestantes import listar_gestantes
+from .sem_consulta import contar_pacientes_sem_consulta, listar_pacientes_sem_consulta
+
+FerramentaContagem = Literal["contar_pacientes", "contar_pacientes_sem_consulta"]
+FerramentaLista = Literal["listar_condicoes_pacientes", "listar_pacientes_sem_consulta", "listar_gestantes"]
+
+_CONTAGENS: Dict[str, Callable[..., Any]] = {
+    "contar_pacientes": contar_pacientes,
+    "contar_pacientes_sem_consulta": contar_pacientes_sem_consulta,
+}
+
+
+def _iso_key(value: Optional[str], nulls_first: bool) -> Tuple[bool, str]:
+    # Datas ISO ordenam como texto; o booleano posiciona os nulos.
+    if value is None:
+        return (not nulls_first, "")
+    return (nulls_first, value)
+
+
+# Chaves de ordenação equivalentes às de cada tool, com desempate pela fonte.
+_LISTAS: Dict[str, Tuple[Callable[..., Any], Callable[[dict], tuple]]] = {
+    "listar_condicoes_pacientes": (
+        listar_condicoes_pacientes,
+        lambda item: (_iso_key(item.get("dt_inicio_condicao"), False), item["fonte"], item["condition_id"]),
+    ),
+    "listar_pacientes_sem_consulta": (
+        listar_pacientes_sem_consulta,
+        lambda item: (_iso_key(item.get("ultima_consulta"), True), item["fonte"], item["paciente_id"]),
+    ),
+    "listar_gestantes": (
+        listar_gestantes,
+        lambda item: (_iso_key(item.get("dpp"), False), item["fonte"], item["gestacao_id"]),
+    ),
+}
+
+
+def _validate_arguments(fn: Callable[..., Any], argumentos: Optional[dict], reserved: Tuple[str, ...]) -> dict:
+    kwargs = dict(argumentos or {})
+    for name in ("ctx",) + reserved:
+        if name in kwargs:
+            raise ValueError(f"argumentos não pode conter {name}.")
+    try:
+        inspect.signature(fn).bind(None, **kwargs)
+    except TypeError as exc:
+        raise ValueError(f"argumentos inválidos para {fn.__name__}: {exc}") from exc
+    return kwargs
+
+
+def _resolve_timeout(timeout_segundos: Optional[float]) -> float:
+    if timeout_segundos is None:
+        return PEC_FEDERATION_TIMEOUT_SECONDS
+    return max(1.0, min(float(timeout_segundos), 120.0))
+
+
+def _collect(outcomes) -> Tuple[List[Tuple[str, Any]], List[FederatedMemberStatus]]:
+    """
+    Separa resultados bem-sucedidos e monta o status por membro.
+
+    Se todos os membros falharem por validação (mesmo erro do usuário em
+    qualquer banco), propagamos o ValueError em vez de responder vazio.
+    """
+
+    errors = [result for _, status, result, _ in outcomes if status != "ok"]
+    if errors and len(errors) == len(outcomes):
+        if all(isinstance(exc, ValueError) for exc in errors):
+            raise errors[0]
+        detalhes = "; ".join(f"{member.name}: {result}" for member, _, result, _ in outcomes)
+        raise RuntimeError(f"Nenhum membro da federação respondeu ({detalhes}).")
+
+    ok: List[Tuple[str, Any]] = []
+    membros: List[FederatedMemberStatus] = []
+    for member, status, result, latency_ms in outcomes:
+        total = None
+        erro = None
+        if status == "ok":
+            ok.append((member.name, result))
+            total = int(result["count"]) if isinstance(result, dict) else len(result)
+        else:
+            erro = str(result).strip() or result.__class__.__name__
+        membros.append(
+            FederatedMemberStatus(
+                fonte=member.name,
+                status=status,
+                latencia_ms=round(latency_ms, 1),
+                total=total,
+                erro=erro,
+            )
+        )
+    return ok, membros
+
+
+def contar_pacientes_federado(
+    ctx: Context,
+    ferramenta: FerramentaContagem,
+    argumentos: Optional[dict] = None,
+    timeout_segundos: Optional[float] = None,
+) -> FederatedCountResult:
+    """
+    Executa uma tool de contagem em todos os municípios federados e soma os totais.
+    argumentos são os mesmos da tool escolhida (sem ctx). Membros com falha
+    aparecem em membros e marcam a resposta como parcial.
+    """
+
+    fn = _CONTAGENS.get(ferramenta)
+    if fn is None:
+        raise ValueError(f"ferramenta inválida. Use: {', '.join(_CONTAGENS)}.")
+    kwargs = _validate_arguments(fn, argumentos, ())
+
+    outcomes = fan_out(fn, kwargs, timeout_seconds=_resolve_timeout(timeout_segundos))
+    ok, membros = _collect(outcomes)
+    return FederatedCountResult(
+        count=sum(int(result["count"]) for _, result in ok),
+        parcial=len(ok) < len(membros),
+        membros=membros,
+    )
+
+
+def listar_federado(
+    ctx: Context,
+    ferramenta: FerramentaLista,
+    argumentos: Optional[dict] = None,
+    limite: int = 50,
+    timeout_segundos: Optional[float] = None,
+) -> FederatedListResult:
+    """
+    Executa uma tool de listagem em todos os municípios federados.
+    Os itens são mesclados na ordem da tool original, cortados em limite e
+    recebem o campo fonte com o nome do município. Paginação por offset não
+    é suportada no modo federado.
+    """
+
+    entry = _LISTAS.get(ferramenta)
+    if entry is None:
+        raise ValueError(f"ferramenta inválida. Use: {', '.join(_LISTAS)}.")
+    fn, sort_key = entry
+    kwargs = _validate_arguments(fn, argumentos, ("limite", "offset"))
+
+    # Cada membro devolve até o limite global: é o suficiente para o corte final.
+    safe_limit = max(1, min(int(limite), 200))
+    kwargs["limite"] = safe_limit
+
+    outcomes = fan_out(fn, kwargs, timeout_seconds=_resolve_timeout(timeout_segundos))
+    ok, membros = _collect(outcomes)
+
+    itens: List[dict] = []
+    for fonte, result in ok:
+        itens.extend({**item, "fonte": fonte} for item in result)
+    itens.sort(key=sort_key)
+    return FederatedListResult(
+        itens=itens[:safe_limit],
+        parcial=len(ok) < len(membros),
+        membros=membros,
+    )
+
+
+__all__ = ["contar_pacientes_federado", "listar_federado"]
@@ -1,13 +1,18 @@
 """
 Helpers de filtros compartilhados entre tools de paciente/condições.
+
+Os filtros passam por uma AST pequena (PatientFilter, ConditionFilter,
+FilterSet) que normaliza a entrada antes de gerar SQL. Requisições
+equivalentes produzem o mesmo texto SQL (reuso de plano) e a mesma chave de
+cache.
 """
 
 from __future__ import annotations
 
-from typing import List, Optional, Sequence, Tuple
-
-# Expressão de idade parametrizada pelo alias da tabela de cidadão.
-_AGE_EXPR_TEMPLATE = "DATE_PART('year', AGE(CURRENT_DATE, {alias}.dt_nascimento))"
+import json
+import re
+from datetime import date
+from typing import List, NamedTuple, Optional, Sequence, Tuple
 
 _SEX_ALIASES = {
     "M": "MASCULINO",
@@ -30,88 +35,173 @@ def normalize_sex(sex: Optional[str]) -> Optional[str]:
     return _SEX_ALIASES.get(value)
 
 
-def build_patient_filters(
-    paciente_id: Optional[int],
-    name_prefix: Optional[str],
-    sex: Optional[str],
-    age_min: Optional[int],
-    age_max: Optional[int],
-    unidade_saude_id: Optional[int] = None,
-    equipe_id: Optional[int] = None,
-    micro_area: Optional[str] = None,
-    alias: str = "c",
-) -> Tuple[List[str], List]:
+def _years_before(reference: date, years: int) -> date:
     """
-    Monta cláusulas e parâmetros de filtros de paciente (sem WHERE).
+    Mesma data `years` anos antes (29/02 vira 28/02), alinhada ao AGE do Postgres.
     """
 
-    if age_min is not None and age_max is not None and age_min > age_max:
-        raise ValueError("age_min não pode ser maior que age_max.")
-
-    clauses: List[str] = []
-    params: List = []
-
-    age_expr = _AGE_EXPR_TEMPLATE.format(alias=alias)
-
-    if paciente_id is not None:
-        clauses.append(f"{alias}.co_seq_cidadao = %s")
-        params.append(paciente_id)
-    if name_prefix:
-        clauses.append(f"{alias}.no_cidadao ILIKE %s")
-        params.append(f"{name_prefix}%")
-    if sex:
-        normalized = normalize_sex(sex)
-        if not normalized:
-            raise ValueError("Sexo inválido. Use MASCULINO, FEMININO ou INDETERMINADO (ou M/F/I).")
-        clauses.append(f"{alias}.no_sexo = %s")
-        params.append(normalized)
-    if age_min is not None:
-        clauses.append(f"{age_expr} >= %s")
-        params.append(age_min)
-    if age_max is not None:
-        clauses.append(f"{age_expr} <= %s")
-        params.append(age_max)
-    if unidade_saude_id is not None:
-        unit_id = int(unidade_saude_id)
-        if unit_id <= 0:
-            raise ValueError("unidade_saude_id deve ser um inteiro positivo.")
-        clauses.append(
-            "("
-            "EXISTS ("
-            "SELECT 1 FROM tb_prontuario pr2 "
-            "JOIN tb_atend a ON a.co_prontuario = pr2.co_seq_prontuario "
-            f"WHERE pr2.co_cidadao = {alias}.co_seq_cidadao AND a.co_unidade_saude = %s"
-            ") "
-            "OR EXISTS ("
-            "SELECT 1 FROM tb_cidadao_vinculacao_equipe ve "
-            "JOIN tb_unidade_saude us ON us.nu_cnes = ve.nu_cnes "
-            f"WHERE ve.co_cidadao = {alias}.co_seq_cidadao "
-            "AND ve.nu_cnes IS NOT NULL AND ve.nu_cnes <> '' "
-            "AND us.co_seq_unidade_saude = %s"
-            ")"
-            ")"
-        )
-        params.extend([unit_id, unit_id])
-
-    if equipe_id is not None:
-        team_id = int(equipe_id)
-        if team_id <= 0:
-            raise ValueError("equipe_id deve ser um inteiro positivo.")
-        clauses.append(
-            "("
-            "EXISTS ("
-            "SELECT 1 FROM tb_cidadao_vinculacao_equipe ve "
-            "JOIN tb_equipe e ON e.nu_ine = ve.nu_ine "
-            f"WHERE ve.co_cidadao = {alias}.co_seq_cidadao "
-            "AND e.co_seq_equipe = %s"
-            ")"
-            ")"
+    try:
+        return reference.replace(year=reference.year - years)
+    except ValueError:
+        return reference.replace(year=reference.year - years, day=28)
+
+
+def _positive_id(value: Optional[int], field: str) -> Optional[int]:
+    if value is None:
+        return None
+    parsed = int(value)
+    if parsed <= 0:
+        raise ValueError(f"{field} deve ser um inteiro positivo.")
+    return parsed
+
+
+class PatientFilter(NamedTuple):
+    """
+    Filtros de paciente já normalizados (nó da AST de filtros).
+
+    Use PatientFilter.build para validar/normalizar a entrada: requisições
+    equivalentes (ex.: sexo "f" e "FEMININO") geram o mesmo nó, portanto o
+    mesmo SQL e a mesma chave de cache.
+
+    name_ids guarda o prefixo de nome já resolvido no índice de nomes sem
+    acento (ver tools/nomes.py): com ele o filtro vira co_seq_cidadao = ANY(int[]).
+    """
+
+    paciente_id: Optional[int] = None
+    name_prefix: Optional[str] = None
+    sex: Optional[str] = None
+    age_min: Optional[int] = None
+    age_max: Optional[int] = None
+    unidade_saude_id: Optional[int] = None
+    equipe_id: Optional[int] = None
+    micro_area: Optional[str] = None
+    name_ids: Optional[Tuple[int, ...]] = None
+
+    @classmethod
+    def build(
+        cls,
+        paciente_id: Optional[int] = None,
+        name_prefix: Optional[str] = None,
+        sex: Optional[str] = None,
+        age_min: Optional[int] = None,
+        age_max: Optional[int] = None,
+        unidade_saude_id: Optional[int] = None,
+        equipe_id: Optional[int] = None,
+        micro_area: Optional[str] = None,
+    ) -> "PatientFilter":
+        if age_min is not None and age_max is not None and age_min > age_max:
+            raise ValueError("age_min não pode ser maior que age_max.")
+
+        sex_value = None
+        if sex:
+            sex_value = normalize_sex(sex)
+            if not sex_value:
+                raise ValueError("Sexo inválido. Use MASCULINO, FEMININO ou INDETERMINADO (ou M/F/I).")
+
+        # ILIKE ignora caixa: guardamos o prefixo em maiúsculas para estabilizar a chave.
+        prefix = str(name_prefix).strip().upper() if name_prefix else ""
+        micro_value = str(micro_area).strip() if micro_area else ""
+
+        return cls(
+            paciente_id=int(paciente_id) if paciente_id is not None else None,
+            name_prefix=prefix or None,
+            sex=sex_value,
+            age_min=int(age_min) if age_min is not None else None,
+            age_max=int(age_max) if age_max is not None else None,
+            unidade_saude_id=_positive_id(unidade_saude_id, "unidade_saude_id"),
+            equipe_id=_positive_id(equipe_id, "equipe_id"),
+            micro_area=micro_value or None,
         )
-        params.append(team_id)
 
-    if micro_area:
-        micro_value = str(micro_area).strip()
-        if micro_value:
+    def birth_range(self, today: Optional[date] = None) -> Tuple[Optional[date], Optional[date]]:
+        """
+        Converte a faixa etária em (nascido_ate, nascido_apos) na data de referência.
+
+        idade >= age_min equivale a dt_nascimento <= hoje - age_min anos;
+        idade <= age_max equivale a dt_nascimento > hoje - (age_max + 1) anos.
+        """
+
+        today = today or date.today()
+        born_on_or_before = _years_before(today, self.age_min) if self.age_min is not None else None
+        born_after = _years_before(today, self.age_max + 1) if self.age_max is not None else None
+        return born_on_or_before, born_after
+
+    def matches_demographics(self, sex: Optional[str], age: Optional[int]) -> bool:
+        """
+        Aplica sexo e faixa etária a dados já agregados em memória.
+        """
+
+        if self.sex is not None and sex != self.sex:
+            return False
+        if self.age_min is not None and (age is None or age < self.age_min):
+            return False
+        if self.age_max is not None and (age is None or age > self.age_max):
+            return False
+        return True
+
+    def compile(self, alias: str = "c", today: Optional[date] = None) -> Tuple[List[str], List]:
+        """
+        Gera cláusulas (sem WHERE) e parâmetros em ordem fixa.
+        """
+
+        clauses: List[str] = []
+        params: List = []
+
+        if self.paciente_id is not None:
+            clauses.append(f"{alias}.co_seq_cidadao = %s")
+            params.append(self.paciente_id)
+        if self.name_ids is not None:
+            clauses.append(f"{alias}.co_seq_cidadao = ANY(%s)")
+            params.append(list(self.name_ids))
+        elif self.name_prefix:
+            clauses.append(f"{alias}.no_cidadao ILIKE %s")
+            params.append(f"{self.name_prefix}%")
+        if self.sex:
+            clauses.append(f"{alias}.no_sexo = %s")
+            params.append(self.sex)
+
+        # Faixa etária vira intervalo de dt_nascimento (comparação direta, indexável).
+        born_on_or_before, born_after = self.birth_range(today)
+        if born_on_or_before is not None:
+            clauses.append(f"{alias}.dt_nascimento <= %s")
+            params.append(born_on_or_before)
+        if born_after is not None:
+            clauses.append(f"{alias}.dt_nascimento > %s")
+            params.append(born_after)
+
+        if self.unidade_saude_id is not None:
+            clauses.append(
+                "("
+                "EXISTS ("
+                "SELECT 1 FROM tb_prontuario pr2 "
+                "JOIN tb_atend a ON a.co_prontuario = pr2.co_seq_prontuario "
+                f"WHERE pr2.co_cidadao = {alias}.co_seq_cidadao AND a.co_unidade_saude = %s"
+                ") "
+                "OR EXISTS ("
+                "SELECT 1 FROM tb_cidadao_vinculacao_equipe ve "
+                "JOIN tb_unidade_saude us ON us.nu_cnes = ve.nu_cnes "
+                f"WHERE ve.co_cidadao = {alias}.co_seq_cidadao "
+                "AND ve.nu_cnes IS NOT NULL AND ve.nu_cnes <> '' "
+                "AND us.co_seq_unidade_saude = %s"
+                ")"
+                ")"
+            )
+            params.extend([self.unidade_saude_id, self.unidade_saude_id])
+
+        if self.equipe_id is not None:
+            clauses.append(
+                "("
+                "EXISTS ("
+                "SELECT 1 FROM tb_cidadao_vinculacao_equipe ve "
+                "JOIN tb_equipe e ON e.nu_ine = ve.nu_ine "
+                f"WHERE ve.co_cidadao = {alias}.co_seq_cidadao "
+                "AND e.co_seq_equipe = %s"
+                ")"
+                ")"
+            )
+            params.append(self.equipe_id)
+
+        if self.micro_area:
             clauses.append(
                 "("
                 "EXISTS ("
@@ -131,20 +221,275 @@ def build_patient_filters(
                 ")"
                 ")"
             )
-            params.append(micro_value)
+            params.append(self.micro_area)
+
+        return clauses, params
+
+
+def build_patient_filters(
+    paciente_id: Optional[int],
+    name_prefix: Optional[str],
+    sex: Optional[str],
+    age_min: Optional[int],
+    age_max: Optional[int],
+    unidade_saude_id: Optional[int] = None,
+    equipe_id: Optional[int] = None,
+    micro_area: Optional[str] = None,
+    alias: str = "c",
+) -> Tuple[List[str], List]:
+    """
+    Monta cláusulas e parâmetros de filtros de paciente (sem WHERE).
+    """
 
-    return clauses, params
+    return PatientFilter.build(
+        paciente_id,
+        name_prefix,
+        sex,
+        age_min,
+        age_max,
+        unidade_saude_id=unidade_saude_id,
+        equipe_id=equipe_id,
+        micro_area=micro_area,
+    ).compile(alias)
 
 
 def _normalize_code_prefix(code: Optional[str]) -> Optional[str]:
     if not code:
         return None
     normalized = str(code).strip().upper()
+    if not normalized:
+        return None
     if "%" not in normalized and "_" not in normalized:
         normalized = f"{normalized}%"
     return normalized
 
 
+def _normalize_code_patterns(code: Optional[str], codes: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    # Ordenados e sem repetição: a ordem da lista não muda o resultado do ANY/EXISTS.
+    patterns = {_normalize_code_prefix(code)}
+    patterns.update(_normalize_code_prefix(item) for item in codes or [])
+    patterns.discard(None)
+    return tuple(sorted(patterns))
+
+
+def _like_matches(pattern: str, value: Optional[str]) -> bool:
+    if value is None:
+        return False
+    regex = "".join(
+        ".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in pattern
+    )
+    return re.fullmatch(regex, value, flags=re.IGNORECASE | re.DOTALL) is not None
+
+
+class ConditionFilter(NamedTuple):
+    """
+    Filtros de condição (CID/CIAP/texto) já normalizados (nó da AST de filtros).
+
+    cid_ids/ciap_ids guardam os padrões já resolvidos no catálogo (ver
+    tools/catalogo.py): com eles o filtro vira p.co_cid10/p.co_ciap = ANY(int[]),
+    sem depender do JOIN com tb_cid10/tb_ciap. cid_ids tem um conjunto por
+    padrão (necessário para cid_logic=AND).
+    """
+
+    cid_patterns: Tuple[str, ...] = ()
+    ciap_patterns: Tuple[str, ...] = ()
+    condition_text: Optional[str] = None
+    cid_logic: str = "OR"
+    cid_ciap_logic: str = "OR"
+    cid_ids: Optional[Tuple[Tuple[int, ...], ...]] = None
+    ciap_ids: Optional[Tuple[int, ...]] = None
+
+    @classmethod
+    def build(
+        cls,
+        cid_code: Optional[str] = None,
+        cid_codes: Optional[Sequence[str]] = None,
+        ciap_code: Optional[str] = None,
+        ciap_codes: Optional[Sequence[str]] = None,
+        condition_text: Optional[str] = None,
+        cid_logic: str = "OR",
+        cid_ciap_logic: str = "OR",
+        allow_cid_and: bool = False,
+    ) -> "ConditionFilter":
+        cid_patterns = _normalize_code_patterns(cid_code, cid_codes)
+        ciap_patterns = _normalize_code_patterns(ciap_code, ciap_codes)
+
+        cid_logic_upper = cid_logic.upper() if cid_logic else "OR"
+        if cid_patterns:
+            if cid_logic_upper not in {"OR", "AND"}:
+                raise ValueError("cid_logic deve ser OR ou AND.")
+            if cid_logic_upper == "AND" and not allow_cid_and and len(cid_patterns) > 1:
+                raise ValueError("cid_logic=AND não é suportado aqui; use OR para múltiplos CID-10.")
+        else:
+            cid_logic_upper = "OR"
+
+        logic_combiner = cid_ciap_logic.upper() if cid_ciap_logic else "OR"
+        if logic_combiner not in {"OR", "AND"} or not (cid_patterns and ciap_patterns):
+            # Sem os dois lados o combinador não altera o SQL.
+            logic_combiner = "OR"
+
+        text = None
+        if condition_text:
+            text = str(condition_text).strip()
+            if len(text) > 100:
+                raise ValueError("condition_text muito longo (máx 100 caracteres).")
+            text = text.upper() or None
+
+        return cls(
+            cid_patterns=cid_patterns,
+            ciap_patterns=ciap_patterns,
+            condition_text=text,
+            cid_logic=cid_logic_upper,
+            cid_ciap_logic=logic_combiner,
+        )
+
+    @property
+    def needs_code_joins(self) -> bool:
+        """
+        Indica se o SQL compilado referencia cid/ciap/ue (texto ou padrões não resolvidos).
+        """
+
+        if self.condition_text:
+            return True
+        if self.cid_patterns and self.cid_ids is None and self.cid_logic == "OR":
+            return True
+        return bool(self.ciap_patterns) and self.ciap_ids is None
+
+    def matches_cid(self, code: Optional[str]) -> bool:
+        """
+        Aplica os padrões CID-10 (semântica de ILIKE) a códigos já em memória.
+        """
+
+        if not self.cid_patterns:
+            return True
+        hits = [_like_matches(pattern, code) for pattern in self.cid_patterns]
+        return all(hits) if self.cid_logic == "AND" else any(hits)
+
+    def compile(self, patient_alias: str = "c") -> Tuple[List[str], List]:
+        """
+        Gera cláusulas (sem WHERE) e parâmetros em ordem fixa.
+
+        Espera o alias p (tb_problema) e, se needs_code_joins, cid, ciap e ue
+        (última evolução).
+        """
+
+        clauses: List[str] = []
+        params: List = []
+
+        cid_clause_sql = ""
+        cid_clause_params: List = []
+        if self.cid_patterns:
+            if self.cid_logic == "AND":
+                # Para AND, usamos múltiplos EXISTS (mais restritivo)
+                sub_clauses = []
+                for index, pat in enumerate(self.cid_patterns):
+                    if self.cid_ids is not None:
+                        sub_clauses.append(
+                            "EXISTS (SELECT 1 FROM tb_problema p2 "
+                            "JOIN tb_prontuario pr2 ON pr2.co_seq_prontuario = p2.co_prontuario "
+                            f"WHERE pr2.co_cidadao = {patient_alias}.co_seq_cidadao AND p2.co_cid10 = ANY(%s))"
+                        )
+                        cid_clause_params.append(list(self.cid_ids[index]))
+                        continue
+                    sub_clauses.append(
+                        "EXISTS (SELECT 1 FROM tb_problema p2 "
+                        "JOIN tb_prontuario pr2 ON pr2.co_seq_prontuario = p2.co_prontuario "
+                        "LEFT JOIN tb_cid10 cid2 ON cid2.co_cid10 = p2.co_cid10 "
+                        f"WHERE pr2.co_cidadao = {patient_alias}.co_seq_cidadao AND cid2.nu_cid10 ILIKE %s)"
+                    )
+                    cid_clause_params.append(pat)
+                cid_clause_sql = " AND ".join(sub_clauses)
+            elif self.cid_ids is not None:
+                cid_clause_sql = "p.co_cid10 = ANY(%s)"
+                cid_clause_params.append(sorted({cid_id for ids in self.cid_ids for cid_id in ids}))
+            else:
+                # Lista sempre como array: um ou vários códigos geram o mesmo SQL.
+                cid_clause_sql = "cid.nu_cid10 ILIKE ANY(%s)"
+                cid_clause_params.append(list(self.cid_patterns))
+
+        ciap_clause_sql = ""
+        ciap_clause_params: List = []
+        if self.ciap_patterns:
+            # CIAP sempre trata lista como OR (IN)
+            if self.ciap_ids is not None:
+                ciap_clause_sql = "p.co_ciap = ANY(%s)"
+                ciap_clause_params.append(list(self.ciap_ids))
+            else:
+                ciap_clause_sql = "ciap.co_ciap ILIKE ANY(%s)"
+                ciap_clause_params.append(list(self.ciap_patterns))
+
+        if cid_clause_sql and ciap_clause_sql:
+            if self.cid_ciap_logic == "OR":
+                clauses.append(f"({cid_clause_sql} OR {ciap_clause_sql})")
+                params.extend(cid_clause_params)
+                params.extend(ciap_clause_params)
+            else:
+                clauses.append(cid_clause_sql)
+                params.extend(cid_clause_params)
+                clauses.append(ciap_clause_sql)
+                params.extend(ciap_clause_params)
+        elif cid_clause_sql:
+            clauses.append(cid_clause_sql)
+            params.extend(cid_clause_params)
+        elif ciap_clause_sql:
+            clauses.append(ciap_clause_sql)
+            params.extend(ciap_clause_params)
+
+        # Texto livre é refinamento global sobre descrições/observações.
+        if self.condition_text:
+            like = f"%{self.condition_text}%"
+            clauses.append(
+                "("
+                "cid.no_cid10 ILIKE %s OR "
+                "ciap.ds_ciap ILIKE %s OR "
+                "COALESCE(p.ds_outro, '') ILIKE %s OR "
+                "COALESCE(ue.ds_observacao, '') ILIKE %s"
+                ")"
+            )
+            params.extend([like, like, like, like])
+
+        return clauses, params
+
+
+class FilterSet(NamedTuple):
+    """
+    Raiz da AST de filtros: paciente + condição, com SQL e chave de cache estáveis.
+    """
+
+    patient: PatientFilter = PatientFilter()
+    condition: ConditionFilter = ConditionFilter()
+
+    @property
+    def has_conditions(self) -> bool:
+        return bool(self.condition.cid_patterns or self.condition.ciap_patterns or self.condition.condition_text)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.has_conditions and self.patient == PatientFilter()
+
+    def compile(self, alias: str = "c", today: Optional[date] = None) -> Tuple[List[str], List]:
+        patient_clauses, patient_params = self.patient.compile(alias, today)
+        condition_clauses, condition_params = self.condition.compile(alias)
+        return patient_clauses + condition_clauses, patient_params + condition_params
+
+    def cache_key(self, scope: str, today: Optional[date] = None) -> str:
+        """
+        Chave determinística para cache de resultados (escopo = tool ou consulta).
+
+        A data de referência só entra quando há faixa etária, pois ela muda o
+        intervalo de nascimento compilado a cada dia.
+        """
+
+        payload = {
+            "patient": self.patient._asdict(),
+            "condition": {key: list(value) if isinstance(value, tuple) else value
+                          for key, value in self.condition._asdict().items()},
+        }
+        if self.patient.age_min is not None or self.patient.age_max is not None:
+            payload["today"] = (today or date.today()).isoformat()
+        return f"{scope}:" + json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+
+
 def build_condition_filters(
     cid_code: Optional[str] = None,
     cid_codes: Optional[Sequence[str]] = None,
@@ -161,106 +506,23 @@ def build_condition_filters(
     Suporta lógica combinada entre CID e CIAP (OR/AND).
     """
 
-    clauses: List[str] = []
-    params: List = []
-
-    # --- 1. CID Filters ---
-    cid_patterns: List[str] = []
-    if cid_code:
-        cid_patterns.append(_normalize_code_prefix(cid_code))
-    if cid_codes:
-        cid_patterns.extend([_normalize_code_prefix(code) for code in cid_codes if code])
-    cid_patterns = [pat for pat in cid_patterns if pat]
-
-    cid_clause_sql = ""
-    cid_clause_params = []
-
-    cid_logic_upper = cid_logic.upper() if cid_logic else "OR"
-    if cid_patterns:
-        if cid_logic_upper not in {"OR", "AND"}:
-            raise ValueError("cid_logic deve ser OR ou AND.")
-
-        if cid_logic_upper == "AND":
-            if not allow_cid_and and len(cid_patterns) > 1:
-                raise ValueError("cid_logic=AND não é suportado aqui; use OR para múltiplos CID-10.")
-            
-            # Para AND, usamos múltiplos EXISTS (mais restritivo)
-            sub_clauses = []
-            for pat in cid_patterns:
-                sub_clauses.append(
-                    "EXISTS (SELECT 1 FROM tb_problema p2 "
-                    "JOIN tb_prontuario pr2 ON pr2.co_seq_prontuario = p2.co_prontuario "
-                    "LEFT JOIN tb_cid10 cid2 ON cid2.co_cid10 = p2.co_cid10 "
-                    f"WHERE pr2.co_cidadao = {patient_alias}.co_seq_cidadao AND cid2.nu_cid10 ILIKE %s)"
-                )
-                cid_clause_params.append(pat)
-            cid_clause_sql = " AND ".join(sub_clauses)
-        else:
-            # Padrão OR
-            cid_clause_sql = "cid.nu_cid10 ILIKE ANY(%s)"
-            cid_clause_params.append(cid_patterns)
-
-    # --- 2. CIAP Filters ---
-    ciap_patterns: List[str] = []
-    if ciap_code:
-        ciap_patterns.append(_normalize_code_prefix(ciap_code))
-    if ciap_codes:
-        ciap_patterns.extend([_normalize_code_prefix(code) for code in ciap_codes if code])
-    ciap_patterns = [pat for pat in ciap_patterns if pat]
-
-    ciap_clause_sql = ""
-    ciap_clause_params = []
-
-    if ciap_patterns:
-        # CIAP sempre trata lista como OR (IN)
-        ciap_clause_sql = "ciap.co_ciap ILIKE ANY(%s)"
-        ciap_clause_params.append(ciap_patterns)
-
-    # --- 3. Combine CID & CIAP Logic ---
-    logic_combiner = cid_ciap_logic.upper()
-    if logic_combiner not in {"OR", "AND"}:
-        logic_combiner = "OR"
-
-    # Se tivermos CID AND (complexo) e tentarmos combinar com CIAP via OR, 
-    # a query pode ficar ambígua sem parênteses cuidadosos. 
-    # Simplificação: se CID=AND, ele já força subqueries EXISTS.
-    # Aqui focamos no caso principal: Lista CIDs (OR) combinado com Lista CIAPs (OR) via OR global.
-
-    if cid_clause_sql and ciap_clause_sql:
-        if logic_combiner == "OR":
-             clauses.append(f"({cid_clause_sql} OR {ciap_clause_sql})")
-             params.extend(cid_clause_params)
-             params.extend(ciap_clause_params)
-        else:
-             # AND
-             clauses.append(cid_clause_sql)
-             params.extend(cid_clause_params)
-             clauses.append(ciap_clause_sql)
-             params.extend(ciap_clause_params)
-    elif cid_clause_sql:
-        clauses.append(cid_clause_sql)
-        params.extend(cid_clause_params)
-    elif ciap_clause_sql:
-        clauses.append(ciap_clause_sql)
-        params.extend(ciap_clause_params)
-
-    # --- 4. Condition Text (Refinamento Global) ---
-    if condition_text:
-        text = str(condition_text).strip()
-        if len(text) > 100:
-            raise ValueError("condition_text muito longo (máx 100 caracteres).")
-        like = f"%{text}%"
-        clauses.append(
-            "("
-            "cid.no_cid10 ILIKE %s OR "
-            "ciap.ds_ciap ILIKE %s OR "
-            "COALESCE(p.ds_outro, '') ILIKE %s OR "
-            "COALESCE(ue.ds_observacao, '') ILIKE %s"
-            ")"
-        )
-        params.extend([like, like, like, like])
-
-    return clauses, params
-
-
-__all__ = ["build_patient_filters", "normalize_sex", "build_condition_filters"]
+    return ConditionFilter.build(
+        cid_code=cid_code,
+        cid_codes=cid_codes,
+        ciap_code=ciap_code,
+        ciap_codes=ciap_codes,
+        condition_text=condition_text,
+        cid_logic=cid_logic,
+        cid_ciap_logic=cid_ciap_logic,
+        allow_cid_and=allow_cid_and,
+    ).compile(patient_alias)
+
+
+__all__ = [
+    "ConditionFilter",
+    "FilterSet",
+    "PatientFilter",
+    "build_condition_filters",
+    "build_patient_filters",
+    "normalize_sex",
+]
@@ -1,63 +1,86 @@
 """
 Tool para listar gestações em acompanhamento pré-natal.
+
+As gestações ativas são poucas e mudam devagar, então mantemos um registro
+em memória (recarregado periodicamente) com DUM, DPP, unidades, equipes e
+microárea já resolvidos. Trimestre e filtros territoriais são aplicados em
+Python e a idade gestacional é derivada da DUM no momento da chamada.
 """
 
 from __future__ import annotations
 
-from typing import List, Optional, Tuple
+from datetime import date
+from typing import FrozenSet, List, NamedTuple, Optional, Tuple
 
 from mcp.server.fastmcp import Context
 
+from ..cache import RefreshingCache
+from ..config import PEC_GESTANTES_REFRESH_SECONDS
 from ..db import query_all
 from ..models import GestanteResult
 from . import get_db_conn, to_iso_datetime
-from .filters import build_patient_filters
+from .filters import PatientFilter
 
 # Consulta baseada no enunciado. Se o schema real divergir, ajustar aqui.
-_SQL_GESTANTES = """
-WITH g AS (
-    SELECT
-        pn.co_seq_pre_natal          AS gestacao_id,
-        pr.co_cidadao                AS paciente_id,
-        c.no_cidadao                 AS nome_paciente,
-        pn.dt_ultima_menstruacao,
-        pn.dt_desfecho,
-        pn.tp_gravidez,
-        pn.st_alto_risco,
-        ex.dt_provavel_parto_eco,
-        (CURRENT_DATE - pn.dt_ultima_menstruacao::date) AS gest_days
-    FROM tb_pre_natal pn
-    JOIN tb_prontuario pr ON pr.co_seq_prontuario = pn.co_prontuario
-    JOIN tb_cidadao   c  ON c.co_seq_cidadao     = pr.co_cidadao
-    LEFT JOIN tb_exame_prenatal ex ON ex.co_exame_requisitado = pn.co_seq_pre_natal
-    WHERE pn.dt_desfecho IS NULL
-)
+# Unidade, equipe e microárea seguem a mesma semântica de PatientFilter.
+_SQL_GESTACOES_ATIVAS = """
 SELECT
-    g.gestacao_id,
-    g.paciente_id,
-    g.nome_paciente,
+    pn.co_seq_pre_natal          AS gestacao_id,
+    pr.co_cidadao                AS paciente_id,
+    c.no_cidadao                 AS nome_paciente,
+    pn.dt_ultima_menstruacao::date AS dum,
     COALESCE(
-        g.dt_provavel_parto_eco,
-        (g.dt_ultima_menstruacao::date + INTERVAL '280 days')::date
-    )                                            AS dpp,
-    (g.gest_days / 7)                            AS idade_gestacional_semanas,
-    (g.gest_days %% 7)                           AS idade_gestacional_dias,
-    (g.gest_days / 7)::text
-      || 's' ||
-    (g.gest_days %% 7)::text
-      || 'd'                                     AS idade_gestacional_str,
-    g.tp_gravidez,
-    g.st_alto_risco,
-    'ativa'                                      AS situacao
-FROM g
-WHERE
-    g.gest_days BETWEEN %s AND %s   -- 1s a 42s
-    {trimestre_clause}
-    {patient_clause}
-ORDER BY dpp
-LIMIT %s;
+        ex.dt_provavel_parto_eco,
+        (pn.dt_ultima_menstruacao::date + INTERVAL '280 days')::date
+    )                            AS dpp,
+    pn.tp_gravidez,
+    pn.st_alto_risco,
+    ARRAY(
+        SELECT a.co_unidade_saude
+        FROM tb_prontuario pr2
+        JOIN tb_atend a ON a.co_prontuario = pr2.co_seq_prontuario
+        WHERE pr2.co_cidadao = pr.co_cidadao AND a.co_unidade_saude IS NOT NULL
+        UNION
+        SELECT us.co_seq_unidade_saude
+        FROM tb_cidadao_vinculacao_equipe ve
+        JOIN tb_unidade_saude us ON us.nu_cnes = ve.nu_cnes
+        WHERE ve.co_cidadao = pr.co_cidadao
+          AND ve.nu_cnes IS NOT NULL AND ve.nu_cnes <> ''
+    )                            AS unidade_ids,
+    ARRAY(
+        SELECT DISTINCT e.co_seq_equipe
+        FROM tb_cidadao_vinculacao_equipe ve
+        JOIN tb_equipe e ON e.nu_ine = ve.nu_ine
+        WHERE ve.co_cidadao = pr.co_cidadao
+    )                            AS equipe_ids,
+    ARRAY(
+        SELECT DISTINCT f.nu_micro_area
+        FROM tb_fat_cad_individual f
+        JOIN tb_fat_cidadao_pec fp ON fp.co_seq_fat_cidadao_pec = f.co_fat_cidadao_pec
+        WHERE fp.co_cidadao = pr.co_cidadao
+          AND f.nu_micro_area IS NOT NULL AND f.nu_micro_area <> ''
+          AND (f.st_ficha_inativa IS NULL OR f.st_ficha_inativa <> 1)
+          AND f.co_dim_tempo = (
+              SELECT MAX(f2.co_dim_tempo)
+              FROM tb_fat_cad_individual f2
+              JOIN tb_fat_cidadao_pec fp2 ON fp2.co_seq_fat_cidadao_pec = f2.co_fat_cidadao_pec
+              WHERE fp2.co_cidadao = pr.co_cidadao
+                AND f2.nu_micro_area IS NOT NULL AND f2.nu_micro_area <> ''
+                AND (f2.st_ficha_inativa IS NULL OR f2.st_ficha_inativa <> 1)
+          )
+    )                            AS micro_areas
+FROM tb_pre_natal pn
+JOIN tb_prontuario pr ON pr.co_seq_prontuario = pn.co_prontuario
+JOIN tb_cidadao   c  ON c.co_seq_cidadao     = pr.co_cidadao
+LEFT JOIN tb_exame_prenatal ex ON ex.co_exame_requisitado = pn.co_seq_pre_natal
+WHERE pn.dt_desfecho IS NULL
+  AND pn.dt_ultima_menstruacao IS NOT NULL;
 """
 
+# Recorte de idade gestacional: 1 a 42 semanas.
+_GEST_DAYS_MIN = 7
+_GEST_DAYS_MAX = 294
+
 _TRIMESTRE_RANGE = {
     "primeiro": (1, 12),
     "1": (1, 12),
@@ -71,6 +94,47 @@ _TRIMESTRE_RANGE = {
 }
 
 
+class _GestacaoAtiva(NamedTuple):
+    gestacao_id: int
+    paciente_id: int
+    nome_paciente: str
+    dum: date
+    dpp: Optional[date]
+    tp_gravidez: Optional[str]
+    st_alto_risco: Optional[str]
+    unidade_ids: FrozenSet[int]
+    equipe_ids: FrozenSet[int]
+    micro_areas: FrozenSet[str]
+
+
+def _load_gestacoes_ativas(conn, _previous) -> Tuple[_GestacaoAtiva, ...]:
+    rows = query_all(conn, _SQL_GESTACOES_ATIVAS)
+    registry = []
+    for row in rows:
+        registry.append(
+            _GestacaoAtiva(
+                gestacao_id=int(row["gestacao_id"]),
+                paciente_id=int(row["paciente_id"]),
+                nome_paciente=str(row["nome_paciente"]),
+                dum=row["dum"],
+                dpp=row.get("dpp"),
+                tp_gravidez=str(row.get("tp_gravidez")) if row.get("tp_gravidez") is not None else None,
+                st_alto_risco=str(row.get("st_alto_risco")) if row.get("st_alto_risco") is not None else None,
+                unidade_ids=frozenset(int(v) for v in row.get("unidade_ids") or []),
+                equipe_ids=frozenset(int(v) for v in row.get("equipe_ids") or []),
+                micro_areas=frozenset(str(v) for v in row.get("micro_areas") or []),
+            )
+        )
+    # Ordenado por DPP uma vez na carga; as consultas apenas filtram.
+    registry.sort(key=lambda g: (g.dpp is None, g.dpp or date.max, g.gestacao_id))
+    return tuple(registry)
+
+
+GESTACOES_ATIVAS: RefreshingCache[Tuple[_GestacaoAtiva, ...]] = RefreshingCache(
+    "gestacoes_ativas", _load_gestacoes_ativas, PEC_GESTANTES_REFRESH_SECONDS
+)
+
+
 def _resolve_trimestre(trimestre: Optional[str]) -> Optional[Tuple[int, int]]:
     if trimestre is None:
         return None
@@ -98,55 +162,46 @@ def listar_gestantes(
     # Limitamos para evitar consultas excessivas em contextos de LLM.
     safe_limit = max(1, min(limite, 200))
     trimestre_range = _resolve_trimestre(trimestre)
-    trimestre_clause = ""
-    params: List = [7, 294]
-    if trimestre_range is not None:
-        trimestre_clause = "AND (g.gest_days / 7) BETWEEN %s AND %s"
-        params.extend(list(trimestre_range))
-
-    patient_clauses, patient_params = build_patient_filters(
-        paciente_id=None,
-        name_prefix=None,
-        sex=None,
-        age_min=None,
-        age_max=None,
-        unidade_saude_id=unidade_saude_id,
-        equipe_id=equipe_id,
-        micro_area=micro_area,
-        alias="c",
+    territorio = PatientFilter.build(
+        unidade_saude_id=unidade_saude_id, equipe_id=equipe_id, micro_area=micro_area
     )
-    patient_clause = ""
-    if patient_clauses:
-        patient_clause = "AND " + " AND ".join(patient_clauses)
-        params.extend(patient_params)
 
-    params.append(safe_limit)
-    sql = _SQL_GESTANTES.format(trimestre_clause=trimestre_clause, patient_clause=patient_clause)
     conn = get_db_conn(ctx)
-    rows = query_all(conn, sql, params)
+    registry = GESTACOES_ATIVAS.get(conn)
+    today = date.today()
 
     results: List[GestanteResult] = []
-    for row in rows:
-        dpp_iso = to_iso_datetime(row.get("dpp"))
-        semanas = row.get("idade_gestacional_semanas")
-        dias = row.get("idade_gestacional_dias")
+    for gestacao in registry:
+        gest_days = (today - gestacao.dum).days
+        if not _GEST_DAYS_MIN <= gest_days <= _GEST_DAYS_MAX:
+            continue
+        semanas, dias = divmod(gest_days, 7)
+        if trimestre_range is not None and not trimestre_range[0] <= semanas <= trimestre_range[1]:
+            continue
+        if territorio.unidade_saude_id is not None and territorio.unidade_saude_id not in gestacao.unidade_ids:
+            continue
+        if territorio.equipe_id is not None and territorio.equipe_id not in gestacao.equipe_ids:
+            continue
+        if territorio.micro_area and territorio.micro_area not in gestacao.micro_areas:
+            continue
+
         results.append(
             GestanteResult(
-                gestacao_id=int(row["gestacao_id"]),
-                paciente_id=int(row["paciente_id"]),
-                nome_paciente=str(row["nome_paciente"]),
-                dpp=dpp_iso,
-                idade_gestacional_semanas=int(semanas) if semanas is not None else None,
-                idade_gestacional_dias=int(dias) if dias is not None else None,
-                idade_gestacional_str=str(row.get("idade_gestacional_str"))
-                if row.get("idade_gestacional_str") is not None
-                else None,
-                tp_gravidez=str(row.get("tp_gravidez")) if row.get("tp_gravidez") is not None else None,
-                st_alto_risco=str(row.get("st_alto_risco")) if row.get("st_alto_risco") is not None else None,
-                situacao=str(row.get("situacao", "ativa")),
+                gestacao_id=gestacao.gestacao_id,
+                paciente_id=gestacao.paciente_id,
+                nome_paciente=gestacao.nome_paciente,
+                dpp=to_iso_datetime(gestacao.dpp),
+                idade_gestacional_semanas=semanas,
+                idade_gestacional_dias=dias,
+                idade_gestacional_str=f"{semanas}s{dias}d",
+                tp_gravidez=gestacao.tp_gravidez,
+                st_alto_risco=gestacao.st_alto_risco,
+                situacao="ativa",
             )
         )
+        if len(results) >= safe_limit:
+            break
     return results
 
 
-__all__ = ["listar_gestantes"]
+__all__ = ["listar_gestantes", "GESTACOES_ATIVAS"]
@@ -0,0 +1,256 @@
+"""
+Tool que monta a linha do tempo de um paciente numa única consulta.
+
+Uma visão geral do paciente exigia várias chamadas (capturar_paciente,
+listar_condicoes_pacientes, histórico SOAP, HbA1c/PA), cada uma com sua ida
+ao banco e seu planejamento. Aqui atendimentos, evoluções de problemas,
+exames e medições viram um único UNION ALL com colunas comuns, ordenado no
+banco e entregue em páginas por keyset (data, ordem, evento_id, sequencia):
+cada página custa o mesmo, e a seguinte continua de onde a anterior parou.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Literal, Optional, Sequence, Tuple
+
+from mcp.server.fastmcp import Context
+
+from ..db import query_all
+from ..models import LinhaDoTempoEvento, LinhaDoTempoPage
+from . import decode_cursor, encode_cursor, get_db_conn, parse_iso_date, to_iso_datetime
+
+TipoEvento = Literal["atendimento", "problema", "exame", "medicao"]
+
+_DEFAULT_LIMITE = 100
+_MAX_LIMITE = 500
+
+# Cada ramo devolve as mesmas colunas; "ordem" desempata eventos no mesmo
+# instante (o atendimento antes do que foi registrado nele). O filtro do
+# paciente fica dentro de cada ramo, onde os índices por prontuário servem.
+_RAMOS: Dict[str, str] = {
+    "atendimento": """
+    SELECT
+        a.dt_inicio                 AS data_hora,
+        1                           AS ordem,
+        ap.co_seq_atend_prof        AS evento_id,
+        0                           AS sequencia,
+        'atendimento'               AS tipo,
+        ap.co_seq_atend_prof        AS atendimento_id,
+        cb.co_cbo_2002              AS codigo,
+        cb.no_cbo                   AS descricao,
+        NULL::text                  AS valor,
+        NULL::text                  AS observacao
+    FROM tb_atend_prof ap
+    JOIN tb_atend       a   ON a.co_seq_atend       = ap.co_atend
+    JOIN tb_prontuario  pr  ON pr.co_seq_prontuario = a.co_prontuario
+    LEFT JOIN tb_lotacao l  ON l.co_ator_papel      = ap.co_lotacao
+    LEFT JOIN tb_cbo     cb ON cb.co_cbo            = l.co_cbo
+    WHERE pr.co_cidadao = %s
+""",
+    "problema": """
+    SELECT
+        COALESCE(a.dt_inicio, pe.dt_inicio_problema::timestamp) AS data_hora,
+        2                           AS ordem,
+        p.co_seq_problema           AS evento_id,
+        COALESCE(pe.co_sequencial_evolucao, 0) AS sequencia,
+        'problema'                  AS tipo,
+        pe.co_atend_prof            AS atendimento_id,
+        COALESCE(cid.nu_cid10, ciap.co_ciap) AS codigo,
+        COALESCE(cid.no_cid10, ciap.ds_ciap, p.ds_outro) AS descricao,
+        pe.co_situacao_problema::text AS valor,
+        pe.ds_observacao            AS observacao
+    FROM tb_problema_evolucao pe
+    JOIN tb_problema    p   ON p.co_unico_problema  = pe.co_unico_problema
+    JOIN tb_prontuario  pr  ON pr.co_seq_prontuario = p.co_prontuario
+    LEFT JOIN tb_atend_prof ap ON ap.co_seq_atend_prof = pe.co_atend_prof
+    LEFT JOIN tb_atend   a  ON a.co_seq_atend       = ap.co_atend
+    LEFT JOIN tb_cid10 cid  ON cid.co_cid10         = p.co_cid10
+    LEFT JOIN tb_ciap ciap  ON ciap.co_seq_ciap     = p.co_ciap
+    WHERE pr.co_cidadao = %s
+""",
+    "exame": """
+    SELECT
+        COALESCE(er.dt_resultado, er.dt_realizacao)::timestamp AS data_hora,
+        3                           AS ordem,
+        er.co_seq_exame_requisitado AS evento_id,
+        0                           AS sequencia,
+        'exame'                     AS tipo,
+        NULL::bigint                AS atendimento_id,
+        CASE WHEN hg.co_exame_requisitado IS NOT NULL THEN 'HbA1c' END AS codigo,
+        CASE WHEN hg.co_exame_requisitado IS NOT NULL THEN 'Hemoglobina glicada (%%)' END AS descricao,
+        hg.vl_hemoglobina_glicada::text AS valor,
+        NULL::text                  AS observacao
+    FROM tb_exame_requisitado er
+    JOIN tb_prontuario  pr  ON pr.co_seq_prontuario = er.co_prontuario
+    LEFT JOIN tb_exame_hemoglobina_glicada hg ON hg.co_exame_requisitado = er.co_seq_exame_requisitado
+    WHERE pr.co_cidadao = %s
+""",
+    "medicao": """
+    SELECT
+        m.dt_medicao                AS data_hora,
+        4                           AS ordem,
+        m.co_seq_medicao            AS evento_id,
+        0                           AS sequencia,
+        'medicao'                   AS tipo,
+        m.co_atend_prof             AS atendimento_id,
+        'PA'                        AS codigo,
+        'Pressão arterial (mmHg)'   AS descricao,
+        m.nu_medicao_pressao_arterial AS valor,
+        NULL::text                  AS observacao
+    FROM tb_medicao m
+    JOIN tb_atend_prof  ap  ON ap.co_seq_atend_prof = m.co_atend_prof
+    JOIN tb_atend       a   ON a.co_seq_atend       = ap.co_atend
+    JOIN tb_prontuario  pr  ON pr.co_seq_prontuario = a.co_prontuario
+    WHERE pr.co_cidadao = %s
+      AND m.nu_medicao_pressao_arterial IS NOT NULL
+""",
+}
+
+TIPOS_EVENTO: Tuple[str, ...] = tuple(_RAMOS)
+
+
+def _validar_tipos(tipos: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    if not tipos:
+        return TIPOS_EVENTO
+    normalizados = {str(t).strip().lower() for t in tipos}
+    invalidos = sorted(normalizados - set(TIPOS_EVENTO))
+    if invalidos:
+        raise ValueError(f"tipos inválido: {', '.join(invalidos)}. Use: {', '.join(TIPOS_EVENTO)}.")
+    # Ordem fixa: a mesma seleção gera sempre o mesmo texto SQL (reuso de plano).
+    return tuple(t for t in TIPOS_EVENTO if t in normalizados)
+
+
+def montar_sql(
+    paciente_id: int,
+    tipos: Sequence[str],
+    desde: Optional[datetime],
+    ate_exclusivo: Optional[datetime],
+    posicao: Optional[Tuple[datetime, int, int, int]],
+    crescente: bool,
+    limite: int,
+) -> Tuple[str, List]:
+    """
+    UNION ALL dos ramos escolhidos, com janela de datas, keyset e LIMIT.
+    """
+
+    ramos = " UNION ALL ".join(_RAMOS[tipo] for tipo in tipos)
+    params: List = [paciente_id] * len(tipos)
+    clauses = ["ev.data_hora IS NOT NULL"]
+    if desde is not None:
+        clauses.append("ev.data_hora >= %s")
+        params.append(desde)
+    if ate_exclusivo is not None:
+        clauses.append("ev.data_hora < %s")
+        params.append(ate_exclusivo)
+    if posicao is not None:
+        comparador = ">" if crescente else "<"
+        clauses.append(f"(ev.data_hora, ev.ordem, ev.evento_id, ev.sequencia) {comparador} (%s, %s, %s, %s)")
+        params.extend(posicao)
+    direcao = "ASC" if crescente else "DESC"
+    sql = f"""
+SELECT ev.*
+FROM ({ramos}) ev
+WHERE {" AND ".join(clauses)}
+ORDER BY ev.data_hora {direcao}, ev.ordem {direcao}, ev.evento_id {direcao}, ev.sequencia {direcao}
+LIMIT %s
+"""
+    params.append(limite)
+    return sql, params
+
+
+def _posicao(cursor: str, paciente_id: int, tipos: Sequence[str], crescente: bool) -> Tuple[datetime, int, int, int]:
+    payload = decode_cursor(cursor)
+    if payload.get("p") != paciente_id or payload.get("t") != list(tipos) or payload.get("c") != crescente:
+        raise ValueError("cursor inválido para esta consulta.")
+    try:
+        return (datetime.fromisoformat(payload["d"]), int(payload["o"]), int(payload["i"]), int(payload["s"]))
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError("cursor inválido para esta consulta.") from exc
+
+
+def _opt_int(value) -> Optional[int]:
+    return int(value) if value is not None else None
+
+
+def _opt_str(value) -> Optional[str]:
+    return str(value) if value is not None else None
+
+
+def linha_do_tempo_paciente(
+    ctx: Context,
+    paciente_id: int,
+    desde: Optional[str] = None,
+    ate: Optional[str] = None,
+    tipos: Optional[List[TipoEvento]] = None,
+    ordem: Literal["asc", "desc"] = "desc",
+    limite: int = _DEFAULT_LIMITE,
+    cursor: Optional[str] = None,
+) -> LinhaDoTempoPage:
+    """
+    Linha do tempo do paciente: atendimentos, evoluções de problemas, exames e medições em ordem cronológica.
+
+    Uma única consulta ao banco por página. desde/ate (AAAA-MM-DD, inclusivas)
+    limitam o período; tipos restringe a atendimento, problema, exame e/ou
+    medicao; ordem="desc" (padrão) traz os mais recentes primeiro. Para a
+    próxima página, repita a chamada com cursor=proximo_cursor.
+    """
+
+    if paciente_id is None or int(paciente_id) <= 0:
+        raise ValueError("paciente_id deve ser um inteiro positivo.")
+    paciente_id_int = int(paciente_id)
+    tipos_validos = _validar_tipos(tipos)
+    ordem_norm = str(ordem).strip().lower()
+    if ordem_norm not in ("asc", "desc"):
+        raise ValueError("ordem inválida. Use asc ou desc.")
+    crescente = ordem_norm == "asc"
+    data_desde = parse_iso_date(desde, "desde")
+    data_ate = parse_iso_date(ate, "ate")
+    if data_desde and data_ate and data_desde > data_ate:
+        raise ValueError("desde não pode ser posterior a ate.")
+    page_size = max(1, min(int(limite), _MAX_LIMITE))
+    posicao = _posicao(cursor, paciente_id_int, tipos_validos, crescente) if cursor else None
+
+    sql, params = montar_sql(
+        paciente_id_int,
+        tipos_validos,
+        datetime.combine(data_desde, datetime.min.time()) if data_desde else None,
+        datetime.combine(data_ate + timedelta(days=1), datetime.min.time()) if data_ate else None,
+        posicao,
+        crescente,
+        page_size + 1,
+    )
+    rows = query_all(get_db_conn(ctx), sql, params)
+
+    proximo_cursor = None
+    if len(rows) > page_size:
+        ultimo = rows[page_size - 1]
+        proximo_cursor = encode_cursor(
+            {
+                "p": paciente_id_int,
+                "t": list(tipos_validos),
+                "c": crescente,
+                "d": ultimo["data_hora"].isoformat(),
+                "o": int(ultimo["ordem"]),
+                "i": int(ultimo["evento_id"]),
+                "s": int(ultimo["sequencia"] or 0),
+            }
+        )
+
+    eventos = [
+        LinhaDoTempoEvento(
+            tipo=str(row["tipo"]),
+            data_hora=to_iso_datetime(row.get("data_hora")),
+            evento_id=int(row["evento_id"]),
+            atendimento_id=_opt_int(row.get("atendimento_id")),
+            codigo=_opt_str(row.get("codigo")),
+            descricao=_opt_str(row.get("descricao")),
+            valor=_opt_str(row.get("valor")),
+            observacao=_opt_str(row.get("observacao")),
+        )
+        for row in rows[:page_size]
+    ]
+    return LinhaDoTempoPage(eventos=eventos, proximo_cursor=proximo_cursor)
+
+
+__all__ = ["TIPOS_EVENTO", "TipoEvento", "linha_do_tempo_paciente", "montar_sql"]
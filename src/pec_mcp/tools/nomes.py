@@ -0,0 +1,135 @@
+"""
+Índice em memória de nomes normalizados para a busca por prefixo de nome.
+
+name_starts_with virava c.no_cidadao ILIKE 'X%': sem índice btree utilizável
+e sensível a acento ("JOSE" não encontra "JOSÉ"). Aqui mantemos os nomes
+sem acento, em maiúsculas e com espaços simples, ordenados junto do
+co_seq_cidadao: o prefixo é resolvido por bisect (O(log n)) em ids, e o
+banco filtra pela chave primária.
+"""
+
+from __future__ import annotations
+
+import time
+import unicodedata
+from bisect import bisect_left
+from heapq import merge
+from typing import List, Optional, Tuple
+
+from ..cache import RefreshingCache
+from ..config import PEC_NOMES_FULL_REBUILD_SECONDS, PEC_NOMES_REFRESH_SECONDS
+from ..db import query_all
+from .filters import PatientFilter
+
+_SQL_NOMES_DELTA = """
+SELECT c.co_seq_cidadao AS paciente_id, c.no_cidadao AS nome
+FROM tb_cidadao c
+WHERE c.co_seq_cidadao > %s
+  AND c.no_cidadao IS NOT NULL
+ORDER BY c.co_seq_cidadao;
+"""
+
+# Maior caractere possível: prefixo + _FIM limita o fim da faixa no bisect.
+_FIM = "\U0010ffff"
+
+# Acima disto o prefixo é pouco seletivo ("A", "MARIA"): um ANY(int[]) com
+# dezenas de milhares de ids custa caro para montar, enviar e planejar, e o
+# ILIKE mudaria a semântica (sensível a acento). O prefixo é recusado.
+_MAX_IDS_NOME = 5000
+
+
+def normalizar_nome(nome: Optional[str]) -> str:
+    """
+    Remove acentos, passa para maiúsculas e colapsa espaços ("José  da Silva" -> "JOSE DA SILVA").
+    """
+
+    if not nome:
+        return ""
+    decomposto = unicodedata.normalize("NFKD", str(nome))
+    sem_acento = "".join(ch for ch in decomposto if not unicodedata.combining(ch))
+    return " ".join(sem_acento.upper().split())
+
+
+class _IndiceNomes:
+    """
+    Listas paralelas ordenadas por (nome normalizado, id).
+
+    Cada atualização gera um novo objeto (leitores concorrentes veem sempre
+    um índice consistente). Cidadãos novos entram pelo maior co_seq_cidadao já
+    lido; nomes alterados aparecem na recarga completa periódica.
+    """
+
+    __slots__ = ("nomes", "ids", "watermark", "full_loaded_at")
+
+    def __init__(
+        self,
+        nomes: List[str],
+        ids: List[int],
+        watermark: int = 0,
+        full_loaded_at: Optional[float] = None,
+    ) -> None:
+        self.nomes = nomes
+        self.ids = ids
+        self.watermark = watermark
+        self.full_loaded_at = time.monotonic() if full_loaded_at is None else full_loaded_at
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def prefixo(self, prefixo: str, limite: Optional[int] = None) -> Optional[Tuple[int, ...]]:
+        """
+        Ids (ordenados) dos cidadãos cujo nome normalizado começa com o prefixo.
+
+        None se houver mais de limite ids (a faixa é medida antes de copiada).
+        """
+
+        chave = normalizar_nome(prefixo)
+        if not chave:
+            return ()
+        inicio = bisect_left(self.nomes, chave)
+        fim = bisect_left(self.nomes, chave + _FIM, inicio)
+        if limite is not None and fim - inicio > limite:
+            return None
+        return tuple(sorted(self.ids[inicio:fim]))
+
+
+def _load_indice_nomes(conn, previous: Optional[_IndiceNomes]) -> _IndiceNomes:
+    completo = previous is None or time.monotonic() - previous.full_loaded_at >= PEC_NOMES_FULL_REBUILD_SECONDS
+    watermark = 0 if completo else previous.watermark
+    rows = query_all(conn, _SQL_NOMES_DELTA, (watermark,))
+    novos = sorted((normalizar_nome(row["nome"]), int(row["paciente_id"])) for row in rows)
+    if rows:
+        watermark = max(watermark, max(int(row["paciente_id"]) for row in rows))
+    if completo:
+        return _IndiceNomes([n for n, _ in novos], [i for _, i in novos], watermark)
+    if not novos:
+        return previous
+    # Intercala o delta ordenado com o índice atual em O(n), sem reordenar tudo.
+    pares = list(merge(zip(previous.nomes, previous.ids), novos))
+    return _IndiceNomes([n for n, _ in pares], [i for _, i in pares], watermark, previous.full_loaded_at)
+
+
+INDICE_NOMES: RefreshingCache[_IndiceNomes] = RefreshingCache(
+    "indice_nomes", _load_indice_nomes, PEC_NOMES_REFRESH_SECONDS
+)
+
+
+def resolver_nome(conn, patient: PatientFilter) -> PatientFilter:
+    """
+    Preenche name_ids do filtro a partir do índice de nomes do banco da conexão.
+
+    Prefixo sem correspondência vira conjunto vazio (nenhum paciente casa).
+    Com mais de _MAX_IDS_NOME correspondências o prefixo é recusado.
+    """
+
+    if not patient.name_prefix:
+        return patient
+    ids = INDICE_NOMES.get(conn).prefixo(patient.name_prefix, _MAX_IDS_NOME)
+    if ids is None:
+        raise ValueError(
+            f"name_starts_with amplo demais (mais de {_MAX_IDS_NOME} cidadãos); informe mais letras do nome."
+        )
+    return patient._replace(name_ids=ids)
+
+
+__all__ = ["INDICE_NOMES", "normalizar_nome", "resolver_nome"]
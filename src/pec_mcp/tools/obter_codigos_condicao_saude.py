@@ -12,7 +12,7 @@ from mcp.server.fastmcp import Context
 
 from ..db import query_all
 from ..models import HealthConditionCaptureResult, HealthConditionCode
-from . import get_db_conn
+from .paralelo import executar_em_paralelo
 
 _SQL_CID10 = """
 SELECT
@@ -174,6 +174,18 @@ def _build_alias_index() -> dict[str, str]:
 _PRESET_ALIAS_INDEX = _build_alias_index()
 
 
+def resolver_preset(condicao: str) -> Optional[Tuple[str, List[str], List[str]]]:
+    """
+    Resolve nome/alias de preset em (nome_canonico, cid_codes, ciap_codes).
+    """
+
+    preset_key = _PRESET_ALIAS_INDEX.get(_normalize_text(condicao))
+    if not preset_key:
+        return None
+    preset = _PRESET_CONDITIONS[preset_key]
+    return preset_key, _dedupe_codes(preset.get("cid", [])), _dedupe_codes(preset.get("ciap", []))
+
+
 def _dedupe_codes(codes: List[str]) -> List[str]:
     seen = set()
     result: List[str] = []
@@ -263,11 +275,9 @@ def obter_codigos_condicao_saude(
     if not normalized:
         raise ValueError("condicao invalida.")
 
-    preset_key = _PRESET_ALIAS_INDEX.get(normalized)
-    if preset_key:
-        preset = _PRESET_CONDITIONS[preset_key]
-        cid_codes = _dedupe_codes(preset.get("cid", []))
-        ciap_codes = _dedupe_codes(preset.get("ciap", []))
+    preset = resolver_preset(raw)
+    if preset:
+        preset_key, cid_codes, ciap_codes = preset
         cid_matches = [HealthConditionCode(code=code, description=None) for code in cid_codes]
         ciap_matches = [HealthConditionCode(code=code, description=None) for code in ciap_codes]
         return HealthConditionCaptureResult(
@@ -304,9 +314,20 @@ def obter_codigos_condicao_saude(
         code_column="ciap.co_ciap",
     )
 
-    conn = get_db_conn(ctx)
-    cid_rows = query_all(conn, _SQL_CID10.format(where_clause=cid_where), cid_params + [safe_limit])
-    ciap_rows = query_all(conn, _SQL_CIAP.format(where_clause=ciap_where), ciap_params + [safe_limit])
+    # CID e CIAP são independentes: rodam em paralelo, em conexões separadas.
+    rows, _ = executar_em_paralelo(
+        ctx,
+        {
+            "cid": lambda conn: query_all(
+                conn, _SQL_CID10.format(where_clause=cid_where), cid_params + [safe_limit]
+            ),
+            "ciap": lambda conn: query_all(
+                conn, _SQL_CIAP.format(where_clause=ciap_where), ciap_params + [safe_limit]
+            ),
+        },
+    )
+    cid_rows = rows["cid"]
+    ciap_rows = rows["ciap"]
 
     cid_matches = _dedupe_matches(cid_rows)
     ciap_matches = _dedupe_matches(ciap_rows)
@@ -335,4 +356,4 @@ def obter_codigos_condicao_saude(
     )
 
 
-__all__ = ["obter_codigos_condicao_saude"]
+__all__ = ["obter_codigos_condicao_saude", "resolver_preset"]
@@ -4,7 +4,6 @@ Tool minimalista para capturar dados de pacientes de forma anonimizada.
 
 from __future__ import annotations
 
-import re
 from typing import List, Optional
 
 from mcp.server.fastmcp import Context
@@ -12,7 +11,10 @@ from mcp.server.fastmcp import Context
 from ..db import query_all
 from ..models import PatientCaptureResult
 from . import get_db_conn, to_iso_date
-from .filters import build_patient_filters
+from .custo import guardar_custo
+from .demografia import hidratar_pacientes, to_initials, validar_ids
+from .filters import PatientFilter
+from .nomes import resolver_nome
 
 _SQL_BASE = """
 SELECT
@@ -25,18 +27,17 @@ ORDER BY c.co_seq_cidadao
 LIMIT %s;
 """
 
+_MAX_IDS = 200
 
-def _to_initials(full_name: Optional[str]) -> str:
-    """
-    Converte nome completo em iniciais (ex.: "Joao de Carvalho Lima" -> "JCL").
-    """
 
-    if not full_name:
-        return "N/A"
-    parts = re.split(r"\s+", str(full_name).strip())
-    skip = {"de", "da", "do", "das", "dos"}
-    initials = [p[0].upper() for p in parts if p and p.lower() not in skip]
-    return "".join(initials) if initials else "N/A"
+def _capturado(row: dict) -> dict:
+    sexo_val = str(row.get("sexo")) if row.get("sexo") is not None else None
+    return {
+        "name": to_initials(row.get("nome_paciente")),
+        "birth_date": to_iso_date(row.get("data_nascimento")),
+        "sex": sexo_val,
+        "gender": sexo_val,  # Fallback: usar sexo enquanto não houver coluna dedicada de gênero.
+    }
 
 
 def capturar_paciente(
@@ -50,17 +51,24 @@ def capturar_paciente(
     equipe_id: Optional[int] = None,
     micro_area: Optional[str] = None,
     limite: int = 50,
+    paciente_ids: Optional[List[int]] = None,
 ) -> List[PatientCaptureResult]:
     """
     Retorna dados mínimos de pacientes sem identificadores diretos (somente leitura).
 
     Exige ao menos um critério (id, prefixo de nome, sexo ou faixa etária) para evitar varreduras amplas.
+    O prefixo de nome ignora acentos e maiúsculas ("jose" encontra "JOSÉ").
     Aceita filtro opcional de unidade de saúde (atendimento ou vinculação por CNES),
     equipe (co_seq_equipe) e microárea (nu_micro_area atual via cadastro individual).
+    paciente_ids (até 200) busca vários pacientes numa consulta, na ordem da
+    lista e com paciente_id em cada resultado; ids inexistentes ficam de fora.
     """
 
     safe_limit = max(1, min(limite, 200))
-    clauses, params = build_patient_filters(
+    ids = validar_ids(paciente_ids, maximo=_MAX_IDS)
+    if ids and paciente_id is not None:
+        raise ValueError("Use paciente_id ou paciente_ids, não ambos.")
+    patient = PatientFilter.build(
         paciente_id,
         name_starts_with,
         sex,
@@ -69,30 +77,33 @@ def capturar_paciente(
         unidade_saude_id=unidade_saude_id,
         equipe_id=equipe_id,
         micro_area=micro_area,
-        alias="c",
     )
-    if not clauses:
+    if patient == PatientFilter() and not ids:
         raise ValueError("Informe pelo menos um critério (id, prefixo de nome, sexo ou idade).")
 
+    conn = get_db_conn(ctx)
+    # Prefixo de nome resolvido no índice sem acento: o banco busca pela chave primária.
+    patient = resolver_nome(conn, patient)
+    if ids:
+        # Busca pela chave primária: sem guarda de custo, demais filtros restringem a lista.
+        return [
+            PatientCaptureResult(paciente_id=int(row["paciente_id"]), **_capturado(row))
+            for row in hidratar_pacientes(conn, ids, patient)
+        ]
+    clauses, params = patient.compile("c")
     where_clause = "WHERE " + " AND ".join(clauses)
     sql = _SQL_BASE.format(where_clause=where_clause)
-    conn = get_db_conn(ctx)
-    rows = query_all(conn, sql, params + [safe_limit])
-
-    results: List[PatientCaptureResult] = []
-    for row in rows:
-        initials = _to_initials(row.get("nome_paciente"))
-        birth_date = to_iso_date(row.get("data_nascimento"))
-        sexo_val = str(row.get("sexo")) if row.get("sexo") is not None else None
-        results.append(
-            PatientCaptureResult(
-                name=initials,
-                birth_date=birth_date,
-                sex=sexo_val,
-                gender=sexo_val,  # Fallback: usar sexo enquanto não houver coluna dedicada de gênero.
-            )
+    params = params + [safe_limit]
+    if patient.paciente_id is None:
+        conn = guardar_custo(
+            ctx,
+            conn,
+            sql,
+            params,
+            "Restrinja com name_starts_with, unidade_saude_id, equipe_id, micro_area ou faixa etária.",
         )
-    return results
+    rows = query_all(conn, sql, params)
+    return [PatientCaptureResult(**_capturado(row)) for row in rows]
 
 
 __all__ = ["capturar_paciente"]
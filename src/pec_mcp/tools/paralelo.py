@@ -0,0 +1,90 @@
+"""
+Execução concorrente de consultas independentes dentro de uma mesma tool.
+
+Cada subconsulta roda numa thread com sua própria conexão do pool, então o
+tempo total da tool passa a ser o da parte mais lenta, não a soma das partes.
+
+Numa chamada admitida, as conexões da tool (as que ela já segura mais as das
+threads) não passam do peso com que foi admitida: a soma dos pesos em
+execução é o que o controle de admissão limita ao tamanho do pool.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Mapping, Tuple, TypeVar
+
+from mcp.server.fastmcp import Context
+
+from ..admission import peso_admitido
+from ..config import PEC_DB_POOL_SIZE
+from ..routing import Workload
+from . import conexoes_emprestadas, get_db_conn, pooled_db_conn
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+def executar_em_paralelo(
+    ctx: Context,
+    subconsultas: Mapping[str, Callable[[object], T]],
+    workload: Workload = "interactive",
+) -> Tuple[Dict[str, T], Dict[str, float]]:
+    """
+    Executa fn(conn) de cada subconsulta em paralelo e junta os resultados.
+
+    Retorna (resultados, tempos_ms), ambos indexados pelo nome da
+    subconsulta. Se alguma falhar, as demais terminam e o primeiro erro (na
+    ordem informada) é propagado. Com uma única subconsulta não há thread;
+    sem vaga para outra conexão, as subconsultas rodam em sequência na
+    conexão da chamada.
+    """
+
+    def _executar(item: Tuple[str, Callable[[object], T]]) -> Tuple[T, float]:
+        nome, fn = item
+        started = time.perf_counter()
+        with pooled_db_conn(ctx, workload=workload) as conn:
+            valor = fn(conn)
+        elapsed = (time.perf_counter() - started) * 1000
+        logger.debug("Subconsulta %s em %.1f ms.", nome, elapsed)
+        return valor, elapsed
+
+    itens = list(subconsultas.items())
+    if not itens:
+        return {}, {}
+    threads = min(len(itens), max(1, PEC_DB_POOL_SIZE))
+    peso = peso_admitido()
+    if peso is not None:
+        threads = min(threads, peso - conexoes_emprestadas())
+    if threads < 1:
+        return _em_sequencia(get_db_conn(ctx, workload=workload), itens)
+    if len(itens) == 1:
+        valor, elapsed = _executar(itens[0])
+        return {itens[0][0]: valor}, {itens[0][0]: elapsed}
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(_executar, item) for item in itens]
+
+    resultados: Dict[str, T] = {}
+    tempos: Dict[str, float] = {}
+    for (nome, _), future in zip(itens, futures):
+        valor, elapsed = future.result()
+        resultados[nome] = valor
+        tempos[nome] = elapsed
+    return resultados, tempos
+
+
+def _em_sequencia(conn, itens) -> Tuple[Dict[str, T], Dict[str, float]]:
+    resultados: Dict[str, T] = {}
+    tempos: Dict[str, float] = {}
+    for nome, fn in itens:
+        started = time.perf_counter()
+        resultados[nome] = fn(conn)
+        tempos[nome] = (time.perf_counter() - started) * 1000
+    return resultados, tempos
+
+
+__all__ = ["executar_em_paralelo"]
@@ -0,0 +1,173 @@
+"""
+Tool de prevalência de várias condições (e sobreposições) numa única varredura.
+
+Cada condição vira um conjunto de ids CID/CIAP (via catálogo). Uma única
+passada em tb_problema marca, por paciente, quais condições ele tem; a
+população (filtros de paciente) é juntada a essas marcas e todas as
+contagens saem de COUNT(...) FILTER no mesmo SELECT.
+"""
+
+from __future__ import annotations
+
+from itertools import combinations
+from typing import List, Optional, Tuple
+
+from mcp.server.fastmcp import Context
+
+from ..db import query_one
+from ..models import PrevalenciaCondicaoResult, PrevalenciaResult, PrevalenciaSobreposicaoResult
+from . import get_db_conn
+from .catalogo import resolver_codigos
+from .filters import ConditionFilter, PatientFilter
+from .obter_codigos_condicao_saude import resolver_preset
+
+# Até 6 condições: 15 pares de sobreposição ainda cabem numa resposta legível.
+_MAX_CONDICOES = 6
+
+
+def _resolve_condicoes(
+    condicoes: Optional[List[str]],
+    codigos_personalizados: Optional[List[dict]],
+) -> List[Tuple[str, ConditionFilter]]:
+    resolved: List[Tuple[str, ConditionFilter]] = []
+    for condicao in condicoes or []:
+        preset = resolver_preset(condicao)
+        if preset is None:
+            raise ValueError(
+                f"condição sem preset: {condicao}. Use codigos_personalizados com cid_codes/ciap_codes."
+            )
+        nome, cid_codes, ciap_codes = preset
+        resolved.append((nome, ConditionFilter.build(cid_codes=cid_codes, ciap_codes=ciap_codes)))
+
+    for item in codigos_personalizados or []:
+        if not isinstance(item, dict) or not str(item.get("nome") or "").strip():
+            raise ValueError("Cada item de codigos_personalizados precisa de nome.")
+        filtro = ConditionFilter.build(cid_codes=item.get("cid_codes"), ciap_codes=item.get("ciap_codes"))
+        if not filtro.cid_patterns and not filtro.ciap_patterns:
+            raise ValueError(f"Informe cid_codes ou ciap_codes para {item['nome']}.")
+        resolved.append((str(item["nome"]).strip(), filtro))
+
+    if not resolved:
+        raise ValueError("Informe pelo menos uma condição.")
+    if len(resolved) > _MAX_CONDICOES:
+        raise ValueError(f"Máximo de {_MAX_CONDICOES} condições por consulta.")
+    nomes = [nome for nome, _ in resolved]
+    if len(set(nomes)) != len(nomes):
+        raise ValueError("Nomes de condição repetidos.")
+    return resolved
+
+
+def _percentual(total: int, populacao: int) -> Optional[float]:
+    if populacao <= 0:
+        return None
+    return round(100.0 * total / populacao, 2)
+
+
+def prevalencia_condicoes(
+    ctx: Context,
+    condicoes: Optional[List[str]] = None,
+    codigos_personalizados: Optional[List[dict]] = None,
+    sex: Optional[str] = None,
+    age_min: Optional[int] = None,
+    age_max: Optional[int] = None,
+    unidade_saude_id: Optional[int] = None,
+    equipe_id: Optional[int] = None,
+    micro_area: Optional[str] = None,
+) -> PrevalenciaResult:
+    """
+    Conta pacientes com cada condição, com cada par de condições e sem nenhuma.
+
+    condicoes aceita presets de obter_codigos_condicao_saude (ex.: hipertensao,
+    diabetes); codigos_personalizados aceita itens {"nome", "cid_codes",
+    "ciap_codes"}. Até 6 condições. Filtros de sexo, idade, unidade, equipe e
+    microárea definem a população (pacientes com prontuário).
+    """
+
+    resolved = _resolve_condicoes(condicoes, codigos_personalizados)
+    patient_clauses, patient_params = PatientFilter.build(
+        sex=sex,
+        age_min=age_min,
+        age_max=age_max,
+        unidade_saude_id=unidade_saude_id,
+        equipe_id=equipe_id,
+        micro_area=micro_area,
+    ).compile("c")
+
+    conn = get_db_conn(ctx, workload="analytic")
+    filtros = [resolver_codigos(conn, filtro) for _, filtro in resolved]
+
+    # Marca por paciente (bool_or) numa única passada pelos problemas de interesse.
+    marcas_sql: List[str] = []
+    marcas_params: List = []
+    todos_cid: set = set()
+    todos_ciap: set = set()
+    for index, filtro in enumerate(filtros):
+        cid_ids = sorted({i for ids in filtro.cid_ids or () for i in ids})
+        ciap_ids = list(filtro.ciap_ids or ())
+        todos_cid.update(cid_ids)
+        todos_ciap.update(ciap_ids)
+        marcas_sql.append(
+            f"COALESCE(bool_or(p.co_cid10 = ANY(%s) OR p.co_ciap = ANY(%s)), FALSE) AS c{index}"
+        )
+        marcas_params.extend([cid_ids, ciap_ids])
+
+    indices = range(len(filtros))
+    pares = list(combinations(indices, 2))
+    contagens_sql = [f"COUNT(*) FILTER (WHERE m.c{i}) AS c{i}" for i in indices]
+    contagens_sql += [f"COUNT(*) FILTER (WHERE m.c{i} AND m.c{j}) AS c{i}_{j}" for i, j in pares]
+    nenhuma = " OR ".join(f"m.c{i}" for i in indices)
+    contagens_sql.append(f"COUNT(*) FILTER (WHERE m.paciente_id IS NULL OR NOT ({nenhuma})) AS nenhuma")
+
+    where_sql = "WHERE " + " AND ".join(patient_clauses) if patient_clauses else ""
+    marcas_select = ",\n            ".join(marcas_sql)
+    contagens_select = ",\n        ".join(contagens_sql)
+    sql = f"""
+    WITH populacao AS (
+        SELECT DISTINCT c.co_seq_cidadao AS paciente_id
+        FROM tb_cidadao c
+        JOIN tb_prontuario pr ON pr.co_cidadao = c.co_seq_cidadao
+        {where_sql}
+    ),
+    marcas AS (
+        SELECT
+            pr.co_cidadao AS paciente_id,
+            {marcas_select}
+        FROM tb_problema p
+        JOIN tb_prontuario pr ON pr.co_seq_prontuario = p.co_prontuario
+        WHERE p.co_cid10 = ANY(%s) OR p.co_ciap = ANY(%s)
+        GROUP BY pr.co_cidadao
+    )
+    SELECT
+        COUNT(*) AS populacao,
+        {contagens_select}
+    FROM populacao po
+    LEFT JOIN marcas m ON m.paciente_id = po.paciente_id;
+    """
+    params = patient_params + marcas_params + [sorted(todos_cid), sorted(todos_ciap)]
+    row = query_one(conn, sql, params) or {}
+
+    populacao = int(row.get("populacao") or 0)
+    nomes = [nome for nome, _ in resolved]
+    return PrevalenciaResult(
+        populacao=populacao,
+        condicoes=[
+            PrevalenciaCondicaoResult(
+                nome=nomes[i],
+                total_pacientes=int(row.get(f"c{i}") or 0),
+                percentual=_percentual(int(row.get(f"c{i}") or 0), populacao),
+            )
+            for i in indices
+        ],
+        sobreposicoes=[
+            PrevalenciaSobreposicaoResult(
+                condicoes=[nomes[i], nomes[j]],
+                total_pacientes=int(row.get(f"c{i}_{j}") or 0),
+                percentual=_percentual(int(row.get(f"c{i}_{j}") or 0), populacao),
+            )
+            for i, j in pares
+        ],
+        nenhuma=int(row.get("nenhuma") or 0),
+    )
+
+
+__all__ = ["prevalencia_condicoes"]
@@ -1,18 +1,33 @@
 """
 Tools para contar e listar pacientes sem consulta recente.
+
+A última consulta médica/enfermagem de cada paciente vem de um índice em
+memória mantido incrementalmente; no banco consultamos apenas o grupo de
+pacientes do perfil clínico.
 """
 
 from __future__ import annotations
 
-import re
-from typing import List, Literal, Optional, Tuple
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Literal, Optional, Tuple, Union
 
 from mcp.server.fastmcp import Context
 
-from ..db import query_all, query_one
-from ..models import CountResult, PacienteSemConsultaResult
+from ..cache import RefreshingCache
+from ..config import (
+    PEC_ULTIMA_CONSULTA_FULL_REBUILD_SECONDS,
+    PEC_ULTIMA_CONSULTA_REFRESH_SECONDS,
+    PEC_ULTIMA_CONSULTA_REVISIT,
+)
+from ..db import query_all
+from ..espelho import conexao_espelho
+from ..models import ApproximateCountResult, CountResult, PacienteSemConsultaResult
 from . import get_db_conn, to_iso_date
-from .filters import build_patient_filters
+from .aproximado import SQL_BLOCO_CIDADAO, ModoContagem, estimar_por_blocos, percentual_amostra, validar_modo
+from .catalogo import resolver_codigos
+from .demografia import hidratar_pacientes, to_initials
+from .filters import ConditionFilter, PatientFilter
 
 SemConsultaTipo = Literal["hipertensao", "diabetes", "gestante"]
 
@@ -22,27 +37,21 @@ _DEFAULT_DIAS = {
     "gestante": 60,      # 60 dias
 }
 
-_HIPERTENSAO_CID = ["I10%", "I11%", "I12%", "I13%", "I15%"]
-_HIPERTENSAO_CIAP = ["K86", "K87"]
-_DIABETES_CID = ["E10%", "E11%", "E12%", "E13%", "E14%"]
-_DIABETES_CIAP = ["T89", "T90"]
+# Perfis clínicos como nós da AST de filtros (CIAP exatos, CID por prefixo).
+_PERFIS_CONDICAO = {
+    "hipertensao": ConditionFilter(
+        cid_patterns=("I10%", "I11%", "I12%", "I13%", "I15%"),
+        ciap_patterns=("K86", "K87"),
+    ),
+    "diabetes": ConditionFilter(
+        cid_patterns=("E10%", "E11%", "E12%", "E13%", "E14%"),
+        ciap_patterns=("T89", "T90"),
+    ),
+}
 
 _CBO_MED_ENF = "(cb.co_cbo_2002 LIKE '225%%' OR cb.co_cbo_2002 LIKE '2235%%')"
 
 
-def _to_initials(full_name: Optional[str]) -> str:
-    """
-    Converte nome completo em iniciais (ex.: "Joao de Carvalho Lima" -> "JCL").
-    """
-
-    if not full_name:
-        return "N/A"
-    parts = re.split(r"\s+", str(full_name).strip())
-    skip = {"de", "da", "do", "das", "dos"}
-    initials = [p[0].upper() for p in parts if p and p.lower() not in skip]
-    return "".join(initials) if initials else "N/A"
-
-
 def _normalize_tipo(tipo: SemConsultaTipo) -> str:
     if not tipo:
         raise ValueError("tipo é obrigatório.")
@@ -61,105 +70,186 @@ def _resolve_dias(tipo: str, dias_sem_consulta: Optional[int]) -> int:
     return dias
 
 
-def _build_base_sql(tipo: str) -> Tuple[str, List]:
+def _build_base_sql(conn, tipo: str) -> Tuple[str, List]:
     if tipo == "gestante":
         sql = """
         SELECT DISTINCT pr.co_cidadao AS paciente_id
         FROM tb_pre_natal pn
         JOIN tb_prontuario pr ON pr.co_seq_prontuario = pn.co_prontuario
         WHERE pn.dt_desfecho IS NULL
-          AND (CURRENT_DATE - pn.dt_ultima_menstruacao::date) BETWEEN 7 AND 294
+          AND pn.dt_ultima_menstruacao::date BETWEEN %s AND %s
         """
-        return sql, []
-
-    if tipo == "hipertensao":
-        cid_patterns = _HIPERTENSAO_CID
-        ciap_patterns = _HIPERTENSAO_CIAP
-    elif tipo == "diabetes":
-        cid_patterns = _DIABETES_CID
-        ciap_patterns = _DIABETES_CIAP
-    else:
+        # DUM entre 7 e 294 dias atrás; datas como parâmetro também rodam no espelho.
+        today = date.today()
+        return sql, [today - timedelta(days=294), today - timedelta(days=7)]
+
+    perfil = _PERFIS_CONDICAO.get(tipo)
+    if perfil is None:
         raise ValueError("tipo inválido.")
+    # Perfis resolvidos em ids do catálogo: tb_problema filtrado sem JOIN de códigos.
+    clauses, params = resolver_codigos(conn, perfil).compile()
 
-    sql = """
+    sql = f"""
     SELECT DISTINCT pr.co_cidadao AS paciente_id
     FROM tb_problema p
     JOIN tb_prontuario pr ON pr.co_seq_prontuario = p.co_prontuario
-    LEFT JOIN tb_cid10 cid ON cid.co_cid10 = p.co_cid10
-    LEFT JOIN tb_ciap ciap ON ciap.co_seq_ciap = p.co_ciap
-    WHERE (cid.nu_cid10 ILIKE ANY(%s) OR ciap.co_ciap ILIKE ANY(%s))
+    WHERE {" AND ".join(clauses)}
     """
-    return sql, [cid_patterns, ciap_patterns]
+    return sql, params
 
 
-def _build_sem_consulta_sql(
+class _UltimasConsultas:
+    """
+    Última consulta médica/enfermagem por paciente e por paciente x unidade.
+
+    Avançada incrementalmente a partir do maior co_seq_atend já lido,
+    relendo os últimos PEC_ULTIMA_CONSULTA_REVISIT ids abaixo dele (o
+    profissional do atendimento pode ser gravado depois); uma recarga
+    completa periódica corrige atendimentos editados.
+    """
+
+    __slots__ = ("watermark", "por_paciente", "por_paciente_unidade", "full_loaded_at")
+
+    def __init__(self) -> None:
+        self.watermark = 0
+        self.por_paciente: Dict[int, date] = {}
+        self.por_paciente_unidade: Dict[Tuple[int, int], date] = {}
+        self.full_loaded_at = time.monotonic()
+
+    def ultima(self, paciente_id: int, unidade_id: Optional[int]) -> Optional[date]:
+        if unidade_id is None:
+            return self.por_paciente.get(paciente_id)
+        return self.por_paciente_unidade.get((paciente_id, unidade_id))
+
+
+_SQL_ULTIMAS_CONSULTAS_DELTA = f"""
+SELECT
+    pr.co_cidadao          AS paciente_id,
+    a.co_unidade_saude     AS unidade_id,
+    MAX(a.dt_inicio)::date AS ultima_consulta,
+    MAX(a.co_seq_atend)    AS max_atend
+FROM tb_atend_prof ap
+JOIN tb_atend a ON a.co_seq_atend = ap.co_atend
+JOIN tb_prontuario pr ON pr.co_seq_prontuario = a.co_prontuario
+LEFT JOIN tb_lotacao l ON l.co_ator_papel = ap.co_lotacao
+LEFT JOIN tb_cbo cb ON cb.co_cbo = l.co_cbo
+WHERE {_CBO_MED_ENF}
+  AND a.co_seq_atend > %s
+GROUP BY pr.co_cidadao, a.co_unidade_saude
+"""
+
+
+def _load_ultimas_consultas(conn, previous: Optional[_UltimasConsultas]) -> _UltimasConsultas:
+    store = previous
+    if store is None or time.monotonic() - store.full_loaded_at >= PEC_ULTIMA_CONSULTA_FULL_REBUILD_SECONDS:
+        store = _UltimasConsultas()
+
+    # A janela relida só pode adiantar datas: o merge abaixo fica com a maior.
+    inicio = max(0, store.watermark - PEC_ULTIMA_CONSULTA_REVISIT) if store.watermark else 0
+    rows = query_all(conn, _SQL_ULTIMAS_CONSULTAS_DELTA, (inicio,))
+    watermark = store.watermark
+    for row in rows:
+        ultima = row.get("ultima_consulta")
+        if ultima is None:
+            continue
+        paciente_id = int(row["paciente_id"])
+        atual = store.por_paciente.get(paciente_id)
+        if atual is None or ultima > atual:
+            store.por_paciente[paciente_id] = ultima
+        if row.get("unidade_id") is not None:
+            key = (paciente_id, int(row["unidade_id"]))
+            atual = store.por_paciente_unidade.get(key)
+            if atual is None or ultima > atual:
+                store.por_paciente_unidade[key] = ultima
+        watermark = max(watermark, int(row["max_atend"]))
+    store.watermark = watermark
+    return store
+
+
+ULTIMAS_CONSULTAS: RefreshingCache[_UltimasConsultas] = RefreshingCache(
+    "ultimas_consultas", _load_ultimas_consultas, PEC_ULTIMA_CONSULTA_REFRESH_SECONDS
+)
+
+
+def _build_cohort_sql(
+    conn,
     tipo: str,
     unidade_saude_id: Optional[int],
     equipe_id: Optional[int],
     micro_area: Optional[str],
-    dias_sem_consulta: int,
-    select_sql: str,
-    order_sql: str = "",
-    limit_offset_sql: str = "",
-) -> Tuple[str, List]:
-    base_sql, base_params = _build_base_sql(tipo)
-
-    ult_where = _CBO_MED_ENF
-    ult_params: List = []
-    unit_id = None
-    if unidade_saude_id is not None:
-        unit_id = int(unidade_saude_id)
-        if unit_id <= 0:
-            raise ValueError("unidade_saude_id deve ser um inteiro positivo.")
-        ult_where += " AND a.co_unidade_saude = %s"
-        ult_params.append(unit_id)
-
-    patient_clauses, patient_params = build_patient_filters(
-        paciente_id=None,
-        name_prefix=None,
-        sex=None,
-        age_min=None,
-        age_max=None,
-        unidade_saude_id=unit_id,
+    amostra_percentual: Optional[float] = None,
+) -> Tuple[str, List, Optional[int]]:
+    """
+    Monta a consulta do grupo de pacientes (perfil clínico + filtros territoriais).
+
+    A última consulta não é calculada aqui: vem de ULTIMAS_CONSULTAS, então o
+    custo por chamada depende do tamanho do grupo e não do histórico. Com
+    amostra_percentual, tb_cidadao é lido por TABLESAMPLE SYSTEM e cada linha
+    traz o bloco de origem (modo aproximado).
+    """
+
+    base_sql, base_params = _build_base_sql(conn, tipo)
+
+    patient_filter = PatientFilter.build(
+        unidade_saude_id=unidade_saude_id,
         equipe_id=equipe_id,
         micro_area=micro_area,
-        alias="c",
     )
+    patient_clauses, patient_params = patient_filter.compile("c")
+    where_sql = ""
+    if patient_clauses:
+        where_sql = "WHERE " + " AND ".join(patient_clauses)
 
-    where_clauses = [
-        "(ult.ultima_consulta IS NULL OR ult.ultima_consulta < CURRENT_DATE - INTERVAL %s)"
-    ]
-    where_clauses.extend(patient_clauses)
-    where_sql = "WHERE " + " AND ".join(where_clauses)
-
-    sql = f"""
+    if amostra_percentual is None:
+        sql = f"""
     WITH base_pacientes AS (
         {base_sql}
-    ),
-    ultima_consulta AS (
-        SELECT
-            pr.co_cidadao AS paciente_id,
-            MAX(a.dt_inicio)::date AS ultima_consulta
-        FROM tb_atend_prof ap
-        JOIN tb_atend a ON a.co_seq_atend = ap.co_atend
-        JOIN tb_prontuario pr ON pr.co_seq_prontuario = a.co_prontuario
-        LEFT JOIN tb_lotacao l ON l.co_ator_papel = ap.co_lotacao
-        LEFT JOIN tb_cbo cb ON cb.co_cbo = l.co_cbo
-        WHERE {ult_where}
-        GROUP BY pr.co_cidadao
     )
-    SELECT
-        {select_sql}
+    SELECT bp.paciente_id AS paciente_id
     FROM base_pacientes bp
     JOIN tb_cidadao c ON c.co_seq_cidadao = bp.paciente_id
-    LEFT JOIN ultima_consulta ult ON ult.paciente_id = bp.paciente_id
     {where_sql}
-    {order_sql}
-    {limit_offset_sql}
     """
+        return sql, base_params + patient_params, patient_filter.unidade_saude_id
 
-    params = base_params + ult_params + [f"{dias_sem_consulta} days"] + patient_params
-    return sql, params
+    # A amostra dirige a consulta: o perfil clínico é checado só para os
+    # cidadãos dos blocos sorteados.
+    sql = f"""
+    WITH base_pacientes AS (
+        {base_sql}
+    )
+    SELECT bp.paciente_id AS paciente_id, {SQL_BLOCO_CIDADAO} AS bloco
+    FROM tb_cidadao c TABLESAMPLE SYSTEM (%s)
+    JOIN base_pacientes bp ON bp.paciente_id = c.co_seq_cidadao
+    {where_sql}
+    """
+    params = base_params + [amostra_percentual] + patient_params
+    return sql, params, patient_filter.unidade_saude_id
+
+
+def _pacientes_sem_consulta(
+    conn,
+    tipo: str,
+    unidade_saude_id: Optional[int],
+    equipe_id: Optional[int],
+    micro_area: Optional[str],
+    dias_sem_consulta: int,
+) -> List[Tuple[int, Optional[date]]]:
+    """
+    Retorna (paciente_id, ultima_consulta) do grupo sem consulta no período.
+    """
+
+    sql, params, unit_id = _build_cohort_sql(conn, tipo, unidade_saude_id, equipe_id, micro_area)
+    rows = query_all(conn, sql, params)
+    store = ULTIMAS_CONSULTAS.get(conn)
+    corte = date.today() - timedelta(days=dias_sem_consulta)
+
+    pacientes: List[Tuple[int, Optional[date]]] = []
+    for paciente_id in {int(row["paciente_id"]) for row in rows}:
+        ultima = store.ultima(paciente_id, unit_id)
+        if ultima is None or ultima < corte:
+            pacientes.append((paciente_id, ultima))
+    return pacientes
 
 
 def contar_pacientes_sem_consulta(
@@ -169,28 +259,53 @@ def contar_pacientes_sem_consulta(
     equipe_id: Optional[int] = None,
     micro_area: Optional[str] = None,
     dias_sem_consulta: Optional[int] = None,
-) -> CountResult:
+    mode: ModoContagem = "exact",
+) -> Union[CountResult, ApproximateCountResult]:
     """
     Conta pacientes sem consulta recente por perfil clínico.
     Aceita filtros opcionais de unidade, equipe e microárea.
+    mode="approximate" estima a partir de uma amostra de blocos do cadastro
+    (rápido, com intervalo de 95% e método); exact é o padrão.
     """
 
     tipo_norm = _normalize_tipo(tipo)
     dias = _resolve_dias(tipo_norm, dias_sem_consulta)
+    modo = validar_modo(mode)
 
-    sql, params = _build_sem_consulta_sql(
-        tipo=tipo_norm,
-        unidade_saude_id=unidade_saude_id,
-        equipe_id=equipe_id,
-        micro_area=micro_area,
-        dias_sem_consulta=dias,
-        select_sql="COUNT(DISTINCT bp.paciente_id) AS total",
+    if modo == "approximate":
+        conn = get_db_conn(ctx, workload="analytic")
+        return _contar_aproximado(conn, tipo_norm, unidade_saude_id, equipe_id, micro_area, dias)
+    espelho = conexao_espelho(ctx, "contar_pacientes_sem_consulta")
+    conn = espelho or get_db_conn(ctx, workload="analytic")
+    pacientes = _pacientes_sem_consulta(conn, tipo_norm, unidade_saude_id, equipe_id, micro_area, dias)
+    if espelho is not None:
+        return CountResult(count=len(pacientes), fonte=espelho.fonte)
+    return CountResult(count=len(pacientes))
+
+
+def _contar_aproximado(
+    conn,
+    tipo: str,
+    unidade_saude_id: Optional[int],
+    equipe_id: Optional[int],
+    micro_area: Optional[str],
+    dias_sem_consulta: int,
+) -> ApproximateCountResult:
+    percentual = percentual_amostra()
+    sql, params, unit_id = _build_cohort_sql(
+        conn, tipo, unidade_saude_id, equipe_id, micro_area, amostra_percentual=percentual
     )
+    rows = query_all(conn, sql, params)
+    store = ULTIMAS_CONSULTAS.get(conn)
+    corte = date.today() - timedelta(days=dias_sem_consulta)
 
-    conn = get_db_conn(ctx)
-    row = query_one(conn, sql, params)
-    total = int(row["total"]) if row and row.get("total") is not None else 0
-    return CountResult(count=total)
+    por_bloco: Dict[int, set] = {}
+    for row in rows:
+        paciente_id = int(row["paciente_id"])
+        ultima = store.ultima(paciente_id, unit_id)
+        if ultima is None or ultima < corte:
+            por_bloco.setdefault(int(row["bloco"]), set()).add(paciente_id)
+    return estimar_por_blocos((len(ids) for ids in por_bloco.values()), percentual)
 
 
 def listar_pacientes_sem_consulta(
@@ -214,50 +329,37 @@ def listar_pacientes_sem_consulta(
     safe_limit = max(1, min(int(limite), 200))
     safe_offset = max(0, int(offset))
 
-    select_sql = """
-        bp.paciente_id AS paciente_id,
-        c.no_cidadao AS nome_paciente,
-        c.dt_nascimento AS data_nascimento,
-        c.no_sexo AS sexo,
-        ult.ultima_consulta AS ultima_consulta,
-        CASE
-            WHEN ult.ultima_consulta IS NULL THEN NULL
-            ELSE (CURRENT_DATE - ult.ultima_consulta)
-        END AS dias_sem_consulta
-    """
-
-    sql, params = _build_sem_consulta_sql(
-        tipo=tipo_norm,
-        unidade_saude_id=unidade_saude_id,
-        equipe_id=equipe_id,
-        micro_area=micro_area,
-        dias_sem_consulta=dias,
-        select_sql=select_sql,
-        order_sql="ORDER BY ult.ultima_consulta NULLS FIRST, bp.paciente_id",
-        limit_offset_sql="LIMIT %s OFFSET %s",
-    )
-    params = params + [safe_limit, safe_offset]
+    espelho = conexao_espelho(ctx, "listar_pacientes_sem_consulta")
+    conn = espelho or get_db_conn(ctx, workload="analytic")
+    pacientes = _pacientes_sem_consulta(conn, tipo_norm, unidade_saude_id, equipe_id, micro_area, dias)
+    # Mesma ordem da versão SQL: sem consulta registrada primeiro, depois a mais antiga.
+    pacientes.sort(key=lambda item: (item[1] is not None, item[1] or date.min, item[0]))
+    pagina = pacientes[safe_offset : safe_offset + safe_limit]
 
-    conn = get_db_conn(ctx)
-    rows = query_all(conn, sql, params)
+    demografia = {
+        int(row["paciente_id"]): row
+        for row in hidratar_pacientes(conn, [paciente_id for paciente_id, _ in pagina])
+    }
 
+    today = date.today()
+    fonte = espelho.fonte if espelho is not None else None
     results: List[PacienteSemConsultaResult] = []
-    for row in rows:
-        initials = _to_initials(row.get("nome_paciente"))
+    for paciente_id, ultima in pagina:
+        row = demografia.get(paciente_id, {})
+        initials = to_initials(row.get("nome_paciente"))
         birth_date = to_iso_date(row.get("data_nascimento"))
         sexo_val = str(row.get("sexo")) if row.get("sexo") is not None else None
-        ultima = to_iso_date(row.get("ultima_consulta"))
-        dias_val = row.get("dias_sem_consulta")
-        results.append(
-            PacienteSemConsultaResult(
-                paciente_id=int(row["paciente_id"]),
-                paciente_initials=initials,
-                birth_date=birth_date,
-                sex=sexo_val,
-                ultima_consulta=ultima,
-                dias_sem_consulta=int(dias_val) if dias_val is not None else None,
-            )
+        result = PacienteSemConsultaResult(
+            paciente_id=paciente_id,
+            paciente_initials=initials,
+            birth_date=birth_date,
+            sex=sexo_val,
+            ultima_consulta=to_iso_date(ultima),
+            dias_sem_consulta=(today - ultima).days if ultima is not None else None,
         )
+        if fonte is not None:
+            result["fonte"] = fonte
+        results.append(result)
     return results
 
 
@@ -0,0 +1,234 @@
+"""
+Tool de série temporal de volume de atendimentos (dia/semana/mês/ano).
+
+Intervalos longos são quebrados em blocos alinhados aos períodos e os blocos
+são consultados em paralelo (executar_em_paralelo), cada um numa conexão do pool. Blocos já
+fechados (anteriores ao período corrente) ficam em cache; só o período em
+andamento é recalculado a cada chamada.
+"""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Dict, List, Literal, Optional, Tuple
+
+from mcp.server.fastmcp import Context
+
+from ..cache import KeyedCache
+from ..config import PEC_SERIE_ATENDIMENTOS_CACHE_SECONDS
+from ..db import query_all
+from ..models import SerieAtendimentosPonto, SerieAtendimentosResult
+from . import db_key, parse_iso_date
+from .filters import PatientFilter
+from .paralelo import executar_em_paralelo
+from .sem_consulta import _CBO_MED_ENF
+
+Granularidade = Literal["dia", "semana", "mes", "ano"]
+
+_DATE_TRUNC = {"dia": "day", "semana": "week", "mes": "month", "ano": "year"}
+# Períodos por bloco: cada bloco cobre um intervalo parecido (~1 mês a 1 ano).
+_PERIODOS_POR_BLOCO = {"dia": 31, "semana": 13, "mes": 12, "ano": 1}
+_MAX_PERIODOS = 1100
+
+SERIE_ATENDIMENTOS: KeyedCache[List[dict]] = KeyedCache(
+    "serie_atendimentos", PEC_SERIE_ATENDIMENTOS_CACHE_SECONDS, max_entries=4096
+)
+
+
+def _inicio_periodo(value: date, granularidade: str) -> date:
+    # Mesmo corte do date_trunc do Postgres (semana começa na segunda-feira).
+    if granularidade == "dia":
+        return value
+    if granularidade == "semana":
+        return value - timedelta(days=value.weekday())
+    if granularidade == "mes":
+        return value.replace(day=1)
+    return value.replace(month=1, day=1)
+
+
+def _proximo_periodo(value: date, granularidade: str) -> date:
+    if granularidade == "dia":
+        return value + timedelta(days=1)
+    if granularidade == "semana":
+        return value + timedelta(days=7)
+    if granularidade == "mes":
+        return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+    return date(value.year + 1, 1, 1)
+
+
+def _blocos(
+    inicio: date, fim: date, granularidade: str, periodo_corrente: date
+) -> List[Tuple[date, date, bool]]:
+    """
+    Divide [inicio, fim) em blocos (inicio, fim, fechado) alinhados aos períodos.
+
+    Períodos a partir do corrente formam blocos próprios, não cacheáveis.
+    """
+
+    blocos: List[Tuple[date, date, bool]] = []
+    bloco_inicio = inicio
+    periodos = 0
+    atual = inicio
+    while atual < fim:
+        proximo = _proximo_periodo(atual, granularidade)
+        periodos += 1
+        aberto = atual >= periodo_corrente
+        if aberto or periodos == _PERIODOS_POR_BLOCO[granularidade] or proximo >= fim or proximo >= periodo_corrente:
+            blocos.append((bloco_inicio, proximo, not aberto))
+            bloco_inicio = proximo
+            periodos = 0
+        atual = proximo
+    return blocos
+
+
+def _build_sql(
+    granularidade: str,
+    unidade_saude_id: Optional[int],
+    equipe_id: Optional[int],
+    cbo: Optional[str],
+    apenas_medico_enfermagem: bool,
+    agrupar_por_unidade: bool,
+) -> Tuple[str, List]:
+    clauses = ["a.dt_inicio >= %s", "a.dt_inicio < %s"]
+    params: List = []
+    if unidade_saude_id is not None:
+        clauses.append("a.co_unidade_saude = %s")
+        params.append(unidade_saude_id)
+
+    # Filtros do profissional via EXISTS: um atendimento com vários
+    # profissionais continua contando uma vez.
+    prof_clauses: List[str] = []
+    if equipe_id is not None:
+        prof_clauses.append("l.co_equipe = %s")
+        params.append(equipe_id)
+    if cbo:
+        prof_clauses.append("cb.co_cbo_2002 LIKE %s")
+        params.append(f"{cbo}%")
+    if apenas_medico_enfermagem:
+        prof_clauses.append(_CBO_MED_ENF)
+    if prof_clauses:
+        clauses.append(
+            "EXISTS (SELECT 1 FROM tb_atend_prof ap "
+            "LEFT JOIN tb_lotacao l ON l.co_ator_papel = ap.co_lotacao "
+            "LEFT JOIN tb_cbo cb ON cb.co_cbo = l.co_cbo "
+            "WHERE ap.co_atend = a.co_seq_atend AND " + " AND ".join(prof_clauses) + ")"
+        )
+
+    unidade_select = "a.co_unidade_saude" if agrupar_por_unidade else "NULL::bigint"
+    sql = f"""
+    SELECT
+        date_trunc('{_DATE_TRUNC[granularidade]}', a.dt_inicio)::date AS periodo,
+        {unidade_select} AS unidade_saude_id,
+        COUNT(*) AS total
+    FROM tb_atend a
+    WHERE {" AND ".join(clauses)}
+    GROUP BY 1, 2
+    """
+    return sql, params
+
+
+def serie_atendimentos(
+    ctx: Context,
+    granularidade: Granularidade = "mes",
+    desde: Optional[str] = None,
+    ate: Optional[str] = None,
+    unidade_saude_id: Optional[int] = None,
+    equipe_id: Optional[int] = None,
+    cbo: Optional[str] = None,
+    apenas_medico_enfermagem: bool = False,
+    agrupar_por_unidade: bool = False,
+) -> SerieAtendimentosResult:
+    """
+    Série temporal do número de atendimentos por dia, semana, mês ou ano.
+
+    Filtros opcionais: unidade, equipe e CBO do profissional (prefixo, ex.:
+    "225" para médicos) ou apenas_medico_enfermagem. Com agrupar_por_unidade,
+    retorna um ponto por período e unidade. Default: últimos 12 meses.
+    """
+
+    if granularidade not in _DATE_TRUNC:
+        raise ValueError("granularidade inválida. Use: dia, semana, mes ou ano.")
+    territorio = PatientFilter.build(unidade_saude_id=unidade_saude_id, equipe_id=equipe_id)
+    cbo_value = str(cbo).strip() if cbo else ""
+    if cbo_value and not cbo_value.isdigit():
+        raise ValueError("cbo deve conter apenas dígitos (prefixo do CBO 2002).")
+
+    hoje = date.today()
+    ate_date = parse_iso_date(ate, "ate") or hoje
+    desde_date = parse_iso_date(desde, "desde") or (ate_date - timedelta(days=365))
+    if desde_date > ate_date:
+        raise ValueError("desde não pode ser posterior a ate.")
+
+    inicio = _inicio_periodo(desde_date, granularidade)
+    fim = _proximo_periodo(_inicio_periodo(ate_date, granularidade), granularidade)
+    periodos: List[date] = []
+    atual = inicio
+    while atual < fim:
+        periodos.append(atual)
+        if len(periodos) > _MAX_PERIODOS:
+            raise ValueError("Intervalo longo demais para a granularidade; use uma granularidade maior.")
+        atual = _proximo_periodo(atual, granularidade)
+
+    sql, filtro_params = _build_sql(
+        granularidade,
+        territorio.unidade_saude_id,
+        territorio.equipe_id,
+        cbo_value or None,
+        apenas_medico_enfermagem,
+        agrupar_por_unidade,
+    )
+    # Só a chave do banco: a conexão de cada bloco vem do pool, em executar_em_paralelo.
+    banco = db_key(ctx, workload="analytic")
+    blocos = _blocos(inicio, fim, granularidade, _inicio_periodo(hoje, granularidade))
+
+    chave_base = (banco, sql, tuple(filtro_params))
+
+    resultados: Dict[Tuple[date, date], List[dict]] = {}
+    pendentes: List[Tuple[date, date, bool]] = []
+    for bloco_inicio, bloco_fim, fechado in blocos:
+        cached = SERIE_ATENDIMENTOS.get(chave_base + (bloco_inicio, bloco_fim)) if fechado else None
+        if cached is not None:
+            resultados[(bloco_inicio, bloco_fim)] = cached
+        else:
+            pendentes.append((bloco_inicio, bloco_fim, fechado))
+
+    def _consulta_bloco(bloco_inicio: date, bloco_fim: date):
+        return lambda conn: query_all(conn, sql, [bloco_inicio, bloco_fim] + filtro_params)
+
+    consultados, _ = executar_em_paralelo(
+        ctx,
+        {f"{b[0]}/{b[1]}": _consulta_bloco(b[0], b[1]) for b in pendentes},
+        workload="analytic",
+    )
+    for bloco_inicio, bloco_fim, fechado in pendentes:
+        rows = consultados[f"{bloco_inicio}/{bloco_fim}"]
+        resultados[(bloco_inicio, bloco_fim)] = rows
+        if fechado:
+            SERIE_ATENDIMENTOS.put(chave_base + (bloco_inicio, bloco_fim), rows)
+
+    totais: Dict[Tuple[date, Optional[int]], int] = {}
+    for rows in resultados.values():
+        for row in rows:
+            unidade = int(row["unidade_saude_id"]) if row.get("unidade_saude_id") is not None else None
+            chave = (row["periodo"], unidade)
+            totais[chave] = totais.get(chave, 0) + int(row.get("total") or 0)
+    if not agrupar_por_unidade:
+        # Série contínua: períodos sem atendimento aparecem com zero.
+        for periodo in periodos:
+            totais.setdefault((periodo, None), 0)
+
+    pontos = [
+        SerieAtendimentosPonto(periodo=periodo.isoformat(), unidade_saude_id=unidade, total_atendimentos=total)
+        for (periodo, unidade), total in sorted(totais.items(), key=lambda item: (item[0][0], item[0][1] or 0))
+    ]
+    return SerieAtendimentosResult(
+        granularidade=granularidade,
+        desde=inicio.isoformat(),
+        ate=(fim - timedelta(days=1)).isoformat(),
+        pontos=pontos,
+        blocos_consultados=len(pendentes),
+        blocos_em_cache=len(blocos) - len(pendentes),
+    )
+
+
+__all__ = ["serie_atendimentos", "SERIE_ATENDIMENTOS"]
@@ -0,0 +1,173 @@
+"""
+Aquecimento do servidor logo após subir (deploy ou reinício em rodízio).
+
+Sem isso, as primeiras chamadas de cada tool pagam abertura de conexões,
+carga dos catálogos e caches frios do Postgres. O aquecimento roda em
+segundo plano: abre as conexões principais e do pool de cada nó, faz
+EXPLAIN das formas canônicas de consulta em cada uma (o backend carrega
+metadados de tabelas e índices), carrega o catálogo CID-10/CIAP, o índice
+de nomes e as unidades de saúde e, opcionalmente, executa sondas baratas. O servidor só
+se declara pronto (/ready) quando tudo isso termina.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .config import PEC_DB_POOL_SIZE, PEC_WARMUP_PROBES
+from .db import query_all
+from .routing import DbRouter, get_router
+from .tools.atendimentos import _SQL_ATENDIMENTOS_BASE, _SQL_CONDICOES_ATENDIMENTOS
+from .tools.catalogo import CATALOGO_CODIGOS
+from .tools.linha_do_tempo import TIPOS_EVENTO, montar_sql
+from .tools.nomes import INDICE_NOMES
+from .tools.paciente import _SQL_BASE as _SQL_PACIENTE
+from .tools.unidades import _SQL_LISTAR_UNIDADES
+
+logger = logging.getLogger(__name__)
+
+# Formas canônicas das consultas mais frequentes, com parâmetros que não
+# casam com nada (ids 0): o plano é o mesmo das chamadas reais.
+FORMAS_CANONICAS: Tuple[Tuple[str, str, Sequence], ...] = (
+    (
+        "paciente_por_id",
+        _SQL_PACIENTE.format(where_clause="WHERE c.co_seq_cidadao = %s"),
+        [0, 1],
+    ),
+    (
+        "historico_soap",
+        _SQL_ATENDIMENTOS_BASE.format(where_clause="pr.co_cidadao = %s"),
+        [0, 1],
+    ),
+    ("condicoes_atendimentos", _SQL_CONDICOES_ATENDIMENTOS, [[0]]),
+    ("linha_do_tempo", *montar_sql(0, TIPOS_EVENTO, None, None, None, False, 1)),
+    ("unidades_saude", _SQL_LISTAR_UNIDADES, []),
+)
+
+
+class Aquecimento:
+    """
+    Executa o aquecimento e guarda a prontidão e o tempo de cada etapa.
+
+    Falhas numa etapa são registradas e não impedem as seguintes: o servidor
+    fica pronto mesmo assim, atendendo a frio o que não foi aquecido.
+    """
+
+    def __init__(self) -> None:
+        self.tempos_ms: Dict[str, float] = {}
+        self.erros: Dict[str, str] = {}
+        self.iniciado_em: Optional[float] = None
+        self.concluido_em: Optional[float] = None
+        self._pronto = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pronto(self) -> bool:
+        return self._pronto.is_set()
+
+    def aguardar(self, timeout: Optional[float] = None) -> bool:
+        return self._pronto.wait(timeout)
+
+    def status(self) -> dict:
+        return {
+            "pronto": self.pronto,
+            "iniciado_em": self.iniciado_em,
+            "concluido_em": self.concluido_em,
+            "tempos_ms": dict(self.tempos_ms),
+            "erros": dict(self.erros),
+        }
+
+    def iniciar(self, router: Optional[DbRouter] = None, sondas: bool = PEC_WARMUP_PROBES) -> threading.Thread:
+        """
+        Dispara o aquecimento numa thread daemon (uma única vez por processo).
+        """
+
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self.executar,
+                args=(router or get_router(), sondas),
+                name="pec-warmup",
+                daemon=True,
+            )
+            self._thread.start()
+        return self._thread
+
+    def dispensar(self) -> None:
+        """
+        Marca o servidor como pronto sem aquecer (PEC_WARMUP_ENABLED=0).
+        """
+
+        self.concluido_em = time.time()
+        self._pronto.set()
+
+    def executar(self, router: DbRouter, sondas: bool = False) -> None:
+        """
+        Roda todas as etapas na thread atual e marca o servidor como pronto.
+        """
+
+        self.iniciado_em = time.time()
+        started = time.perf_counter()
+        try:
+            nodes = self._etapa("conexoes", router.check_now) or []
+            with ExitStack() as stack:
+                # Empresta todas as conexões do pool de uma vez para abri-las:
+                # são elas que as chamadas de tool usam.
+                por_no = self._etapa("pool", lambda: _abrir_pool(stack, nodes)) or []
+                conexoes = [conn for do_no in por_no for conn in do_no]
+                primeiras = [do_no[0] for do_no in por_no]
+                self._etapa("planos", lambda: _explicar(conexoes))
+                self._etapa("catalogo_codigos", lambda: [CATALOGO_CODIGOS.get(conn) for conn in primeiras])
+                self._etapa("indice_nomes", lambda: [INDICE_NOMES.get(conn) for conn in primeiras])
+                if primeiras:
+                    self._etapa("unidades_saude", lambda: query_all(primeiras[0], _SQL_LISTAR_UNIDADES))
+                if sondas:
+                    self._etapa("sondas", lambda: _sondar(conexoes))
+        finally:
+            self.tempos_ms["total"] = round((time.perf_counter() - started) * 1000, 1)
+            self.concluido_em = time.time()
+            self._pronto.set()
+        logger.info(
+            "Aquecimento concluído em %.1f ms (%s).",
+            self.tempos_ms["total"],
+            ", ".join(f"{nome}={ms} ms" for nome, ms in self.tempos_ms.items() if nome != "total"),
+        )
+
+    def _etapa(self, nome: str, fn: Callable[[], object]):
+        started = time.perf_counter()
+        try:
+            return fn()
+        except Exception as exc:  # noqa: BLE001 - aquecimento é melhor esforço
+            self.erros[nome] = str(exc).strip() or exc.__class__.__name__
+            logger.warning("Aquecimento: etapa %s falhou: %s", nome, exc)
+            return None
+        finally:
+            self.tempos_ms[nome] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def _abrir_pool(stack: ExitStack, nodes) -> List[List[object]]:
+    return [[stack.enter_context(node.pooled()) for _ in range(max(1, PEC_DB_POOL_SIZE))] for node in nodes]
+
+
+def _explicar(conexoes) -> None:
+    # EXPLAIN sem ANALYZE: planeja sem executar, mas carrega o cache de
+    # metadados (relcache/syscache) do backend de cada conexão.
+    for conn in conexoes:
+        for _, sql, params in FORMAS_CANONICAS:
+            query_all(conn, "EXPLAIN " + sql, params)
+
+
+def _sondar(conexoes) -> None:
+    for conn in conexoes:
+        for _, sql, params in FORMAS_CANONICAS:
+            query_all(conn, sql, params)
+
+
+# Estado global do processo, consultado pela rota /ready.
+AQUECIMENTO = Aquecimento()
+
+
+__all__ = ["AQUECIMENTO", "Aquecimento", "FORMAS_CANONICAS"]
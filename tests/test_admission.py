@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from pec_mcp.admission import ControleAdmissao, ServidorOcupado
+
+
+def _tarefa(ordem, nome, duracao=0.05):
+    async def _fn():
+        ordem.append(nome)
+        await asyncio.sleep(duracao)
+        return nome
+
+    return _fn
+
+
+def test_pesos_limitam_execucoes_simultaneas():
+    controle = ControleAdmissao(capacidade=4, max_fila=10, pesos={"pesada": 4, "leve": 1})
+    em_execucao = []
+    pico = []
+
+    def _medida(nome):
+        async def _fn():
+            em_execucao.append(nome)
+            pico.append(list(em_execucao))
+            await asyncio.sleep(0.05)
+            em_execucao.remove(nome)
+
+        return _fn
+
+    async def _cenario():
+        await asyncio.gather(
+            controle.executar("pesada", "a", _medida("p1")),
+            controle.executar("leve", "b", _medida("l1")),
+            controle.executar("pesada", "c", _medida("p2")),
+        )
+
+    asyncio.run(_cenario())
+    # A pesada ocupa toda a capacidade: nunca roda junto com outra tool.
+    assert all(len(ativos) == 1 for ativos in pico if any(n.startswith("p") for n in ativos))
+    assert controle.metricas()["em_uso"] == 0
+
+
+def test_vez_gira_entre_clientes():
+    controle = ControleAdmissao(capacidade=1, max_fila=10, max_fila_por_cliente=10)
+    ordem = []
+
+    async def _cenario():
+        tarefas = [asyncio.create_task(controle.executar("t", "agente", _tarefa(ordem, "a0")))]
+        await asyncio.sleep(0)
+        tarefas += [asyncio.create_task(controle.executar("t", "agente", _tarefa(ordem, f"a{i}"))) for i in (1, 2, 3)]
+        await asyncio.sleep(0)
+        tarefas.append(asyncio.create_task(controle.executar("t", "painel", _tarefa(ordem, "p1"))))
+        await asyncio.gather(*tarefas)
+
+    asyncio.run(_cenario())
+    assert ordem[:3] == ["a0", "a1", "p1"]
+
+
+def test_fila_cheia_e_prazo_geram_ocupado():
+    controle = ControleAdmissao(capacidade=1, max_fila=1, max_fila_por_cliente=1, espera_max_segundos=0.05)
+
+    async def _cenario():
+        longa = asyncio.create_task(controle.executar("t", "a", _tarefa([], "x", duracao=0.3)))
+        await asyncio.sleep(0)
+        espera = asyncio.create_task(controle.executar("t", "b", _tarefa([], "y")))
+        await asyncio.sleep(0)
+        with pytest.raises(ServidorOcupado) as cheia:
+            await controle.executar("t", "c", _tarefa([], "z"))
+        assert cheia.value.retry_after >= 1
+        with pytest.raises(ServidorOcupado):
+            await espera
+        await longa
+
+    asyncio.run(_cenario())
+    metricas = controle.metricas()
+    assert metricas["rejeicoes"] == {"fila_cheia": 1, "cota_cliente": 0, "prazo": 1}
+    assert metricas["fila"] == 0 and metricas["em_uso"] == 0
+    assert metricas["por_tool"]["t"] == {"admitidas": 1, "rejeitadas": 2}
+
+
+def test_capacidade_nao_passa_do_pool():
+    from pec_mcp.admission import _capacidade_configurada
+
+    assert _capacidade_configurada(capacidade=4, pool=8) == 4
+    with pytest.raises(ValueError, match="PEC_DB_POOL_SIZE"):
+        _capacidade_configurada(capacidade=8, pool=4)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from pec_mcp.tools.aproximado import estimar_por_blocos, validar_modo
+from pec_mcp.tools.contar_pacientes import contar_pacientes
+
+
+def test_estimativa_escala_pela_fracao_e_intervalo_contem_o_observado():
+    resultado = estimar_por_blocos([3, 1, 0, 2], 10.0)
+    assert resultado["count"] == 60
+    assert resultado["ic_inferior"] == 6  # nunca abaixo do que a amostra já viu
+    assert resultado["ic_superior"] > 60
+    assert resultado["metodo"] == "tablesample_system"
+    assert resultado["confianca"] == 0.95
+
+
+def test_amostra_completa_e_exata():
+    resultado = estimar_por_blocos([5, 5], 100.0)
+    assert resultado["count"] == resultado["ic_inferior"] == resultado["ic_superior"] == 10
+
+
+def test_intervalo_cobre_o_total_na_maioria_das_amostras():
+    gerador = random.Random(7)
+    blocos = [gerador.randint(0, 8) for _ in range(5000)]
+    total = sum(blocos)
+    cobertos = 0
+    for _ in range(200):
+        amostra = [y for y in blocos if gerador.random() < 0.05]
+        resultado = estimar_por_blocos(amostra, 5.0)
+        cobertos += resultado["ic_inferior"] <= total <= resultado["ic_superior"]
+    assert cobertos >= 180
+
+
+def test_modo_invalido():
+    assert validar_modo("APPROXIMATE") == "approximate"
+    with pytest.raises(ValueError):
+        validar_modo("rapido")
+    with pytest.raises(ValueError):
+        contar_pacientes(None, sex="F", mode="rapido")
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+
+from pec_mcp import cache
+from pec_mcp.cache import RefreshingCache, registrar_banco
+
+
+class _Conn:
+    def __init__(self, dsn):
+        self.dsn = dsn
+
+
+def _vencer(refreshing, conn):
+    valor, _ = refreshing._entries[cache.database_key(conn)]
+    refreshing._entries[cache.database_key(conn)] = (valor, 0.0)
+
+
+def test_valor_vencido_e_servido_enquanto_recarrega_em_fundo(monkeypatch):
+    monkeypatch.setattr(cache, "_CONECTORES", {})
+    liberar = threading.Event()
+    usadas = []
+
+    def _loader(conn, previous):
+        usadas.append(conn)
+        if previous is None:
+            return 1
+        liberar.wait(5)
+        return previous + 1
+
+    propria = _Conn("dbname=a")
+
+    @contextmanager
+    def _conectar():
+        yield propria
+
+    refreshing = RefreshingCache("teste", _loader, ttl_seconds=60)
+    chamada = _Conn("dbname=a")
+    registrar_banco(chamada, _conectar)
+    assert refreshing.get(chamada) == 1
+
+    _vencer(refreshing, chamada)
+    # Não espera a recarga: devolve o valor antigo e só uma recarga roda.
+    assert refreshing.get(chamada) == 1
+    assert refreshing.get(chamada) == 1
+    liberar.set()
+    for thread in threading.enumerate():
+        if thread.name == "pec-cache-teste":
+            thread.join(timeout=5)
+    assert refreshing.get(chamada) == 2
+    # A recarga usou uma conexão própria, não a da chamada.
+    assert usadas == [chamada, propria]
+
+
+def test_sem_conexao_propria_recarrega_na_chamada(monkeypatch):
+    monkeypatch.setattr(cache, "_CONECTORES", {})
+    refreshing = RefreshingCache("teste", lambda conn, previous: (previous or 0) + 1, ttl_seconds=60)
+    conn = _Conn("dbname=b")
+    assert refreshing.get(conn) == 1
+    _vencer(refreshing, conn)
+    assert refreshing.get(conn) == 2
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import random
+from datetime import date
+
+import pytest
+
+from pec_mcp.tools import analytics, colunar
+from pec_mcp.tools.colunar import TabelaColunar, agregar, faixa_etaria, validar_agrupamento, validar_faixas
+from pec_mcp.tools.filters import ConditionFilter, PatientFilter
+
+_HOJE = date(2024, 6, 10)
+_SEXOS = ("FEMININO", "MASCULINO")
+_CIDS = {1: ("E11", "Diabetes"), 2: ("I10", "Hipertensão"), 3: ("I11", "Cardiopatia hipertensiva")}
+
+
+def _pacientes(n: int = 400):
+    gerador = random.Random(3)
+    pacientes = {}
+    for paciente_id in range(1, n + 1):
+        nascimento = 0 if paciente_id % 50 == 0 else gerador.randint(1930, 2023) * 10000 + 101 + gerador.randint(0, 11) * 100
+        pacientes[paciente_id] = (nascimento, gerador.randint(-1, 1), gerador.choice((-1, 10, 20)))
+    pares = sorted({(p, gerador.choice((-1, 1, 2, 3))) for p in pacientes for _ in range(gerador.randint(1, 3))})
+    return pacientes, pares
+
+
+def _tabela(pacientes, pares) -> TabelaColunar:
+    np = pytest.importorskip("numpy")
+    coluna = lambda i: [pacientes[p][i] for p, _ in pares]  # noqa: E731
+    return TabelaColunar(
+        paciente=np.array([p for p, _ in pares], dtype=np.int64),
+        cid=np.array([c for _, c in pares], dtype=np.int64),
+        nascimento=np.array(coluna(0), dtype=np.int32),
+        sexo=np.array(coluna(1), dtype=np.int8),
+        localidade=np.array(coluna(2), dtype=np.int64),
+        sexos=_SEXOS,
+        cids=_CIDS,
+    )
+
+
+def _esperado(pacientes, pares, limites, dimensoes, sexo=None, idade_min=None, cid_prefixo=None):
+    grupos = {}
+    for paciente_id, cid_id in pares:
+        nascimento, sexo_id, localidade = pacientes[paciente_id]
+        idade = None if not nascimento else (_HOJE.year * 10000 + _HOJE.month * 100 + _HOJE.day - nascimento) // 10000
+        sexo_val = _SEXOS[sexo_id] if sexo_id >= 0 else None
+        codigo, descricao = _CIDS.get(cid_id, (None, None))
+        if sexo is not None and sexo_val != sexo:
+            continue
+        if idade_min is not None and (idade is None or idade < idade_min):
+            continue
+        if cid_prefixo is not None and not (codigo or "").startswith(cid_prefixo):
+            continue
+        chave = (
+            codigo if "cid" in dimensoes else None,
+            descricao if "cid" in dimensoes else None,
+            sexo_val if "sexo" in dimensoes else None,
+            faixa_etaria(idade, limites) if "faixa_etaria" in dimensoes else None,
+            (localidade if localidade >= 0 else None) if "localidade" in dimensoes else None,
+        )
+        grupos.setdefault(chave, set()).add(paciente_id)
+    return {chave: len(ids) for chave, ids in grupos.items()}
+
+
+@pytest.mark.parametrize(
+    "dimensoes, filtros",
+    [
+        (("cid", "sexo", "faixa_etaria", "localidade"), {}),
+        (("sexo", "faixa_etaria"), {"idade_min": 18}),
+        (("localidade",), {"sexo": "FEMININO", "cid_prefixo": "I1"}),
+        ((), {}),
+    ],
+)
+def test_agrupamentos_contam_pacientes_distintos(dimensoes, filtros):
+    pacientes, pares = _pacientes()
+    tabela = _tabela(pacientes, pares)
+    limites = validar_faixas([20, 65])
+    resultado = agregar(
+        tabela,
+        PatientFilter.build(sex=filtros.get("sexo"), age_min=filtros.get("idade_min")),
+        ConditionFilter.build(cid_code=filtros.get("cid_prefixo")),
+        None,
+        limites,
+        dimensoes,
+        limite=500,
+        hoje=_HOJE,
+    )
+    assert resultado == _esperado(pacientes, pares, limites, dimensoes, **filtros)
+
+
+def test_limite_mantem_apenas_candidatos_ao_topo():
+    pacientes, pares = _pacientes()
+    resultado = agregar(
+        _tabela(pacientes, pares), PatientFilter.build(), ConditionFilter.build(), None,
+        validar_faixas(None), ("cid", "sexo", "faixa_etaria", "localidade"), limite=3, hoje=_HOJE,
+    )
+    completo = _esperado(pacientes, pares, validar_faixas(None), ("cid", "sexo", "faixa_etaria", "localidade"))
+    corte = sorted(completo.values(), reverse=True)[2]
+    assert resultado == {chave: total for chave, total in completo.items() if total >= corte}
+
+
+def test_faixas_e_agrupamento():
+    assert validar_faixas([18, 60]) == (0, 18, 60)
+    assert faixa_etaria(17, (0, 18, 60)) == "0-17"
+    assert faixa_etaria(60, (0, 18, 60)) == "60+"
+    assert faixa_etaria(45) == "40-59"
+    assert faixa_etaria(None) is None
+    with pytest.raises(ValueError):
+        validar_faixas([40, 18])
+    with pytest.raises(ValueError):
+        validar_agrupamento(["municipio"])
+    assert validar_agrupamento(["SEXO", "sexo"]) == ("sexo",)
+
+
+def test_cubo_recusa_agrupamento_sem_cid(monkeypatch):
+    monkeypatch.setattr(analytics, "PEC_EPIDEMIOLOGIA_ENGINE", "cubo")
+    with pytest.raises(ValueError, match="colunar"):
+        analytics.consulta_epidemiologia(None, agrupar_por=["sexo"])
+
+
+def test_cubo_indexado_equivale_a_varredura():
+    gerador = random.Random(5)
+    celulas = [
+        analytics._CelulaComorbidade(
+            codigo_cid10=codigo,
+            descricao_cid10=descricao,
+            sexo=gerador.choice(_SEXOS + (None,)),
+            idade=gerador.choice((None, 5, 30, 70)),
+            localidade_id=gerador.choice((None, 10, 20)),
+            total_pacientes=gerador.randint(1, 9),
+        )
+        for codigo, descricao in list(_CIDS.values()) + [(None, None)]
+        for _ in range(30)
+    ]
+    cubo = analytics._CuboComorbidades(celulas)
+    assert len(cubo) == len(celulas)
+    limites = validar_faixas(None)
+    dimensoes = ("cid", "sexo", "faixa_etaria", "localidade")
+    filtro_paciente = PatientFilter.build(sex="F", age_min=18)
+    filtro_cid = ConditionFilter.build(cid_code="I1")
+    esperado = {}
+    for celula in celulas:
+        if celula.localidade_id == 20 and filtro_cid.matches_cid(celula.codigo_cid10) and filtro_paciente.matches_demographics(celula.sexo, celula.idade):
+            chave = (celula.codigo_cid10, celula.descricao_cid10, celula.sexo, faixa_etaria(celula.idade, limites), 20)
+            esperado[chave] = esperado.get(chave, 0) + celula.total_pacientes
+    assert esperado
+    assert analytics._agregar_cubo(cubo, filtro_paciente, filtro_cid, 20, limites, dimensoes) == esperado
+
+
+class _CursorServidor:
+    def __init__(self, conn, name=None, withhold=False):
+        self._conn = conn
+        self.name = name
+        self.withhold = withhold
+        self.itersize = None
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self._conn.cursores.append(self)
+        self._rows = self._conn.pares if self.name else self._conn.cids
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class _ConexaoColunar:
+    def __init__(self, pares, cids):
+        self.pares = pares
+        self.cids = cids
+        self.cursores = []
+
+    def cursor(self, name=None, withhold=False):
+        return _CursorServidor(self, name=name, withhold=withhold)
+
+
+def test_carga_le_pares_por_cursor_do_servidor():
+    pytest.importorskip("numpy")
+    pares = [
+        {"paciente_id": 1, "cid_id": 2, "nascimento": 19800101, "sexo": "FEMININO", "localidade_id": 10},
+        {"paciente_id": 2, "cid_id": None, "nascimento": None, "sexo": None, "localidade_id": None},
+    ]
+    conn = _ConexaoColunar(pares, [{"cid_id": 2, "nu_cid10": "I10", "no_cid10": "Hipertensão"}])
+    tabela = colunar._carregar(conn, None)
+    assert tabela.paciente.tolist() == [1, 2]
+    assert tabela.cid.tolist() == [2, -1]
+    assert tabela.sexo.tolist() == [0, -1]
+    assert tabela.cids == {2: ("I10", "Hipertensão")}
+    # Só a consulta grande usa cursor nomeado, com WITH HOLD (autocommit) e lote.
+    nomeado = conn.cursores[0]
+    assert nomeado.name and nomeado.withhold and nomeado.itersize == colunar._LOTE_LINHAS
+    assert conn.cursores[1].name is None
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import pytest
+
+from pec_mcp.tools import custo
+from pec_mcp.tools.custo import EstimativaCusto, decidir, estimar_custo, guardar_custo
+
+_PLANO = [
+    {
+        "Plan": {
+            "Node Type": "Aggregate",
+            "Total Cost": 41250.5,
+            "Plan Rows": 1,
+            "Plans": [
+                {"Node Type": "Hash Join", "Total Cost": 40000.0, "Plan Rows": 250000, "Plans": [
+                    {"Node Type": "Seq Scan", "Total Cost": 9000.0, "Plan Rows": 480000},
+                ]},
+            ],
+        }
+    }
+]
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self._conn.sql = sql
+
+    def fetchone(self):
+        return {"QUERY PLAN": _PLANO}
+
+
+class _Conn:
+    sql = None
+
+    def cursor(self):
+        return _Cursor(self)
+
+
+class _Router:
+    def __init__(self, analitica):
+        self.analitica = analitica
+
+    def connection(self, workload):
+        assert workload == "analytic"
+        return self.analitica
+
+
+def test_estimativa_le_custo_total_e_maior_volume_de_linhas():
+    conn = _Conn()
+    estimativa = estimar_custo(conn, "SELECT COUNT(*) FROM tb_cidadao c WHERE c.no_sexo = %s;", ["FEMININO"])
+    assert conn.sql.startswith("EXPLAIN (FORMAT JSON) SELECT")
+    assert not conn.sql.endswith(";")
+    assert estimativa == EstimativaCusto(custo_total=41250.5, linhas=480000.0)
+
+
+def test_decisao_por_limites():
+    estimativa = EstimativaCusto(custo_total=5000.0, linhas=200.0)
+    assert decidir(estimativa, 10000, 0, 100000, 0) == "executar"
+    assert decidir(estimativa, 1000, 0, 100000, 0) == "analitico"
+    assert decidir(estimativa, 0, 100, 0, 0) == "analitico"
+    assert decidir(estimativa, 1000, 0, 4000, 0) == "recusar"
+    assert decidir(estimativa, 0, 0, 0, 0) == "executar"
+
+
+def test_guarda_encaminha_para_analitica_ou_recusa(monkeypatch):
+    analitica = object()
+    ctx = type("Ctx", (), {"state": {"db_router": _Router(analitica)}})()
+    conn = _Conn()
+
+    monkeypatch.setattr(custo, "decidir", lambda estimativa: "analitico")
+    assert guardar_custo(ctx, conn, "SELECT 1", None, "") is analitica
+    assert guardar_custo(ctx, conn, "SELECT 1", None, "", workload="analytic") is conn
+
+    monkeypatch.setattr(custo, "decidir", lambda estimativa: "recusar")
+    with pytest.raises(ValueError, match="Restrinja"):
+        guardar_custo(ctx, conn, "SELECT 1", None, "Restrinja com unidade_saude_id.")
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from datetime import date
+
+import pytest
+
+from pec_mcp.tools import demografia, paciente
+from pec_mcp.tools.demografia import hidratar_pacientes, validar_ids
+from pec_mcp.tools.filters import PatientFilter
+
+_CADASTRO = {
+    i: {"paciente_id": i, "nome_paciente": f"Paciente {i} da Silva", "data_nascimento": date(1980, 1, i % 28 + 1), "sexo": "FEMININO" if i % 2 else "MASCULINO"}
+    for i in range(1, 2501)
+}
+
+
+@pytest.fixture
+def consultas(monkeypatch):
+    executadas = []
+
+    def query_all(conn, sql, params):
+        executadas.append((sql, params))
+        linhas = [_CADASTRO[i] for i in params[0] if i in _CADASTRO]
+        if "no_sexo = %s" in sql:
+            linhas = [row for row in linhas if row["sexo"] == params[1]]
+        # O banco não garante a ordem do ANY: devolvemos invertido.
+        return list(reversed(linhas))
+
+    monkeypatch.setattr(demografia, "query_all", query_all)
+    return executadas
+
+
+def test_preserva_ordem_e_consulta_em_lotes(consultas):
+    ids = [2400, 7, 99999, 7, 1] + list(range(1000, 2200))
+    rows = hidratar_pacientes(None, ids)
+    assert [row["paciente_id"] for row in rows[:3]] == [2400, 7, 1]
+    assert len(rows) == 3 + 1200
+    assert len(consultas) == 2
+    assert all("c.co_seq_cidadao = ANY(%s)" in sql for sql, _ in consultas)
+    assert hidratar_pacientes(None, []) == []
+
+
+def test_filtro_opcional_e_validacao(consultas):
+    rows = hidratar_pacientes(None, [4, 3, 2, 1], PatientFilter.build(sex="F"))
+    assert [row["paciente_id"] for row in rows] == [3, 1]
+    assert validar_ids(["3", 1, 3]) == [3, 1]
+    with pytest.raises(ValueError):
+        validar_ids([1, 0])
+    with pytest.raises(ValueError):
+        validar_ids(range(1, 5), maximo=3)
+
+
+def test_capturar_paciente_por_lista(consultas, monkeypatch):
+    monkeypatch.setattr(paciente, "get_db_conn", lambda ctx, workload="interactive": None)
+    resultado = paciente.capturar_paciente(None, paciente_ids=[10, 3, 10, 99999])
+    assert [r["paciente_id"] for r in resultado] == [10, 3]
+    assert resultado[1] == {"paciente_id": 3, "name": "P3S", "birth_date": "1980-01-04", "sex": "FEMININO", "gender": "FEMININO"}
+    assert len(consultas) == 1
+    with pytest.raises(ValueError):
+        paciente.capturar_paciente(None, paciente_id=1, paciente_ids=[2])
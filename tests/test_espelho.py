@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from pec_mcp import espelho
+from pec_mcp.db import query_all
+from pec_mcp.espelho import TABELAS_ESPELHO, Espelho, conexao_espelho, traduzir
+from pec_mcp.tools import sem_consulta
+from pec_mcp.tools.contar_pacientes import contar_pacientes
+
+
+class _CursorPG:
+    def __init__(self, tabelas, consultas, name=None, withhold=False):
+        # A sincronização lê por cursor do lado do servidor (nomeado, WITH HOLD).
+        assert name and withhold
+        self._tabelas = tabelas
+        self._consultas = consultas
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        nome = re.search(r"FROM (\w+)", sql).group(1)
+        chave = next(t.chave for t in TABELAS_ESPELHO if t.nome == nome)
+        rows = self._tabelas.get(nome, [])
+        if chave is not None:
+            rows = sorted((r for r in rows if r[chave] > params[0]), key=lambda r: r[chave])
+            self._consultas.append((nome, params[0]))
+        self._rows = [dict(r) for r in rows]
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class _ConexaoPG:
+    def __init__(self, tabelas):
+        self.tabelas = tabelas
+        self.consultas = []
+
+    def cursor(self, name=None, withhold=False):
+        return _CursorPG(self.tabelas, self.consultas, name=name, withhold=withhold)
+
+
+def _base():
+    hoje = date.today()
+    return {
+        "tb_cidadao": [
+            {"co_seq_cidadao": 1, "no_cidadao": "Ana", "dt_nascimento": date(1950, 1, 1), "no_sexo": "FEMININO", "co_localidade_endereco": 7},
+            {"co_seq_cidadao": 2, "no_cidadao": "Bruno", "dt_nascimento": date(1990, 1, 1), "no_sexo": "MASCULINO", "co_localidade_endereco": 7},
+            {"co_seq_cidadao": 3, "no_cidadao": "Carla", "dt_nascimento": date(2000, 1, 1), "no_sexo": "FEMININO", "co_localidade_endereco": None},
+        ],
+        "tb_prontuario": [{"co_seq_prontuario": 10 + i, "co_cidadao": i} for i in (1, 2, 3)],
+        "tb_problema": [
+            {"co_seq_problema": 100, "co_prontuario": 11, "co_cid10": 1, "co_ciap": None, "co_unico_problema": 1, "ds_outro": None},
+            {"co_seq_problema": 101, "co_prontuario": 12, "co_cid10": 1, "co_ciap": None, "co_unico_problema": 2, "ds_outro": None},
+            {"co_seq_problema": 102, "co_prontuario": 13, "co_cid10": 2, "co_ciap": None, "co_unico_problema": 3, "ds_outro": None},
+        ],
+        "tb_atend": [
+            {"co_seq_atend": 50, "co_prontuario": 11, "co_unidade_saude": 9, "dt_inicio": datetime.combine(hoje - timedelta(days=30), datetime.min.time())},
+        ],
+        "tb_atend_prof": [{"co_seq_atend_prof": 60, "co_atend": 50, "co_lotacao": 70, "tp_atend_prof": 1, "tp_atend": 1}],
+        "tb_lotacao": [{"co_ator_papel": 70, "co_cbo": 80, "co_prof": 1}],
+        "tb_cbo": [{"co_cbo": 80, "co_cbo_2002": "225125", "no_cbo": "Médico"}],
+        "tb_cid10": [
+            {"co_cid10": 1, "nu_cid10": "I10", "no_cid10": "Hipertensão essencial"},
+            {"co_cid10": 2, "nu_cid10": "E11", "no_cid10": "Diabetes tipo 2"},
+        ],
+        "tb_ciap": [{"co_seq_ciap": 1, "co_ciap": "K86", "ds_ciap": "Hipertensão sem complicações"}],
+    }
+
+
+@pytest.fixture
+def carregado(tmp_path, monkeypatch):
+    pg = _ConexaoPG(_base())
+    local = Espelho(str(tmp_path / "espelho.sqlite3"), lote=2)
+    local.sincronizar(pg)
+    monkeypatch.setattr(espelho, "ESPELHO", local)
+    monkeypatch.setattr(espelho, "_FERRAMENTAS_HABILITADAS", espelho.FERRAMENTAS_SUPORTADAS)
+    return local, pg
+
+
+def test_traduz_sql_das_tools():
+    sql, params = traduzir(
+        "SELECT MAX(a.dt_inicio)::date FROM t WHERE p.co_cid10 = ANY(%s) AND c.no_cidadao ILIKE %s "
+        "AND cid.nu_cid10 ILIKE ANY(%s) AND cb.co_cbo_2002 LIKE '225%%' AND a.dt > %s",
+        [[1, 2], "AN%", ["I1%"], date(2024, 1, 2)],
+    )
+    assert sql == (
+        "SELECT date(MAX(a.dt_inicio)) FROM t WHERE p.co_cid10 IN (SELECT value FROM json_each(?)) "
+        "AND c.no_cidadao LIKE ? AND EXISTS (SELECT 1 FROM json_each(?) WHERE cid.nu_cid10 LIKE json_each.value) "
+        "AND cb.co_cbo_2002 LIKE '225%' AND a.dt > ?"
+    )
+    assert params == ["[1, 2]", "AN%", '["I1%"]', "2024-01-02"]
+    with pytest.raises(ValueError, match="DISTINCT ON"):
+        traduzir("SELECT DISTINCT ON (x) x FROM t")
+
+
+def test_sincroniza_por_marca_dagua(carregado):
+    local, pg = carregado
+    assert local.fonte()["origem"] == "espelho"
+    pg.tabelas["tb_cidadao"].append(
+        {"co_seq_cidadao": 4, "no_cidadao": "Davi", "dt_nascimento": None, "no_sexo": "MASCULINO", "co_localidade_endereco": 7}
+    )
+    pg.consultas.clear()
+    lidas = local.sincronizar(pg)
+    assert lidas["tb_cidadao"] == 1 and lidas["tb_problema"] == 0
+    assert ("tb_cidadao", 3) in pg.consultas
+    # Tabelas sem chave sequencial só são relidas no próprio intervalo.
+    assert lidas["tb_cid10"] == 0
+    completo = local.sincronizar(pg, completo=True)
+    assert completo["tb_cidadao"] == 4 and completo["tb_cid10"] == 2
+
+
+def test_tabelas_sem_chave_recarregam_no_proprio_intervalo(carregado, monkeypatch):
+    local, pg = carregado
+    pg.tabelas["tb_cid10"].append({"co_cid10": 3, "nu_cid10": "J45", "no_cid10": "Asma"})
+    assert local.sincronizar(pg)["tb_cid10"] == 0
+    monkeypatch.setattr(espelho, "PEC_MIRROR_KEYLESS_REFRESH_SECONDS", 0)
+    lidas = local.sincronizar(pg)
+    assert lidas["tb_cid10"] == 3 and lidas["tb_cidadao"] == 0
+    # A idade do espelho vem das tabelas incrementais.
+    assert local.fonte()["defasagem_segundos"] < 5
+
+
+def test_contagens_servidas_pelo_espelho(carregado):
+    ctx = type("Ctx", (), {"state": {}})()
+    resultado = contar_pacientes(ctx, cid_code="I10", sex="FEMININO")
+    assert resultado["count"] == 1
+    assert resultado["fonte"]["origem"] == "espelho"
+    assert contar_pacientes(ctx, age_max=40)["count"] == 2
+
+    sem_consulta.ULTIMAS_CONSULTAS.invalidate()
+    pacientes = sem_consulta.listar_pacientes_sem_consulta(ctx, "hipertensao", dias_sem_consulta=10)
+    assert [p["paciente_id"] for p in pacientes] == [2, 1]
+    assert pacientes[1]["dias_sem_consulta"] == 30
+    assert pacientes[1]["birth_date"] == "1950-01-01"
+
+
+def test_conexao_explicita_ou_espelho_defasado_usam_postgres(carregado, monkeypatch):
+    local, _ = carregado
+    ctx = type("Ctx", (), {"state": {"db_conn": object()}})()
+    assert conexao_espelho(ctx, "contar_pacientes") is None
+    sem_conexao = type("Ctx", (), {"state": {}})()
+    assert conexao_espelho(sem_conexao, "contar_pacientes", habilitadas=frozenset()) is None
+    monkeypatch.setattr(espelho, "PEC_MIRROR_MAX_AGE_SECONDS", -1)
+    assert conexao_espelho(sem_conexao, "contar_pacientes") is None
+
+
+def _envelhecer(local, tabela, segundos):
+    db = sqlite3.connect(local.caminho)
+    with db:
+        db.execute("UPDATE _espelho_estado SET atualizado_em = ? WHERE tabela = ?", (time.time() - segundos, tabela))
+    db.close()
+
+
+def test_idade_informada_cobre_as_tabelas_lidas(carregado):
+    local, _ = carregado
+    ctx = type("Ctx", (), {"state": {}})()
+    # Catálogo de CBO relido de hora em hora: mais velho que MAX_AGE, ainda aceito.
+    _envelhecer(local, "tb_cbo", espelho.PEC_MIRROR_MAX_AGE_SECONDS + 600)
+    conn = conexao_espelho(ctx, "contar_pacientes")
+    assert conn is not None
+
+    query_all(conn, "SELECT COUNT(*) AS n FROM tb_lotacao l JOIN tb_cbo cb ON cb.co_cbo = l.co_cbo", None)
+    fonte = conn.fonte
+    assert set(fonte["defasagem_por_tabela"]) == {"tb_cbo", "tb_lotacao"}
+    assert fonte["defasagem_segundos"] >= espelho.PEC_MIRROR_MAX_AGE_SECONDS + 600
+    # Consulta que não lê tb_cbo não herda a idade dele.
+    outra = conexao_espelho(ctx, "contar_pacientes")
+    query_all(outra, "SELECT COUNT(*) AS n FROM tb_cidadao c", None)
+    assert outra.fonte["defasagem_segundos"] < 60
+
+    # Além do próprio intervalo de recarga, a tabela sem chave devolve as tools ao Postgres.
+    _envelhecer(local, "tb_cbo", espelho.PEC_MIRROR_KEYLESS_REFRESH_SECONDS + espelho.PEC_MIRROR_MAX_AGE_SECONDS + 60)
+    assert conexao_espelho(ctx, "contar_pacientes") is None
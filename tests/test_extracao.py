@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from datetime import date
+
+import pytest
+
+from pec_mcp import extracao
+from pec_mcp.extracao import montar_consulta
+from pec_mcp.tools.filters import ConditionFilter, FilterSet, PatientFilter
+
+
+def test_consulta_usa_filtros_das_tools_e_janela_inclusiva(monkeypatch):
+    monkeypatch.setattr(
+        extracao, "resolver_codigos", lambda conn, condicao: condicao._replace(cid_ids=((7, 8),))
+    )
+    filters = FilterSet(PatientFilter.build(sex="f"), ConditionFilter.build(cid_codes=["E11"]))
+    dataset, sql, params = montar_consulta(None, "problemas", filters, desde="2024-01-01", ate="2024-12-31")
+    assert dataset.colunas[0] == ("problema_id", "int64")
+    assert "ue.dt_inicio_problema >= %s AND ue.dt_inicio_problema < %s" in sql
+    assert params[-2:] == [date(2024, 1, 1), date(2025, 1, 1)]
+    assert sql.count("%s") == len(params)
+
+
+def test_validacoes():
+    vazio = FilterSet(PatientFilter.build(), ConditionFilter.build())
+    with pytest.raises(ValueError, match="--todos"):
+        montar_consulta(None, "atendimentos", vazio)
+    assert "WHERE" not in montar_consulta(None, "atendimentos", vazio, todos=True)[1]
+    with pytest.raises(ValueError):
+        montar_consulta(None, "exames", vazio, todos=True)
+    with pytest.raises(ValueError):
+        montar_consulta(None, "atendimentos", FilterSet(PatientFilter.build(), ConditionFilter.build(cid_code="E11")))
+    with pytest.raises(ValueError):
+        montar_consulta(None, "atendimentos", vazio, desde="2024-02-01", ate="2024-01-01")
+
+
+def test_stream_em_lotes_preserva_nulos_e_tipos(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    dataset = extracao._DATASETS["problemas"]
+    linhas = [f'{i},{i % 7},1980-01-0{1 + i % 9},FEMININO,E11,,2020-05-01,,"{i % 3}"\n' for i in range(5000)]
+    linhas[0] = '0,1,1980-01-01,"",,,,,\n'
+
+    def produtor(saida):
+        for linha in linhas:
+            saida.write(linha.encode())
+
+    caminho = str(tmp_path / "saida.parquet")
+    assert extracao.gravar_stream(produtor, dataset, caminho, bloco_bytes=4096) == 5000
+    tabela = pq.read_table(caminho)
+    assert tabela.schema == extracao.schema_arrow(dataset)
+    primeira = tabela.slice(0, 1).to_pylist()[0]
+    assert primeira["sexo"] == "" and primeira["cid_code"] is None and primeira["dt_inicio_condicao"] is None
+    assert tabela.column("dt_inicio_condicao")[1].as_py() == date(2020, 5, 1)
+
+
+def test_erro_do_produtor_chega_ao_chamador(tmp_path):
+    pytest.importorskip("pyarrow")
+
+    def produtor(saida):
+        saida.write(b"1,2,1980-01-01,F,,,,,\n")
+        raise RuntimeError("COPY falhou")
+
+    with pytest.raises(RuntimeError, match="COPY falhou"):
+        extracao.gravar_stream(produtor, extracao._DATASETS["problemas"], str(tmp_path / "saida.arrow"))
+
+
+@pytest.mark.parametrize("extensao", [".parquet", ".arrow"])
+def test_resultado_vazio_grava_so_o_schema(tmp_path, extensao):
+    pa = pytest.importorskip("pyarrow")
+    dataset = extracao._DATASETS["atendimentos"]
+    caminho = str(tmp_path / f"saida{extensao}")
+    assert extracao.gravar_stream(lambda saida: None, dataset, caminho) == 0
+    if extensao == ".parquet":
+        tabela = pytest.importorskip("pyarrow.parquet").read_table(caminho)
+    else:
+        tabela = pa.ipc.open_file(caminho).read_all()
+    assert tabela.num_rows == 0
+    assert tabela.schema == extracao.schema_arrow(dataset)
+
+
+def test_erro_do_produtor_antes_do_primeiro_byte(tmp_path):
+    pytest.importorskip("pyarrow")
+
+    def produtor(saida):
+        raise RuntimeError("sem permissão")
+
+    caminho = tmp_path / "saida.parquet"
+    with pytest.raises(RuntimeError, match="sem permissão"):
+        extracao.gravar_stream(produtor, extracao._DATASETS["problemas"], str(caminho))
+    assert not caminho.exists()
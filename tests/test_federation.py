@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from pec_mcp import federation
+from pec_mcp.config import get_db_dsn
+from pec_mcp.federation import FederationMember, fan_out, parse_members
+from pec_mcp.tools.contar_pacientes import contar_pacientes
+from pec_mcp.tools.federacao import contar_pacientes_federado, listar_federado
+
+
+class _ConsultaOffline:
+    def __init__(self, conn):
+        self.conn = conn
+        self.canceladas = 0
+
+    def cancelar(self):
+        self.canceladas += 1
+
+
+class _OfflineMember(FederationMember):
+    """
+    Membro sem banco: a conexão é um marcador, para testar só a orquestração.
+    """
+
+    def __init__(self, name, dsn):
+        super().__init__(name, dsn)
+        self.consultas = []
+
+    @contextmanager
+    def consulta(self, timeout_seconds):
+        consulta = _ConsultaOffline(self.name)
+        self.consultas.append(consulta)
+        yield consulta
+
+
+class _CursorFalso:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self._conn.executados.append(sql % params)
+
+
+class _ConexaoFalsa:
+    def __init__(self):
+        self.closed = 0
+        self.executados = []
+        self.canceladas = 0
+
+    def set_session(self, **kwargs):
+        pass
+
+    def cursor(self):
+        return _CursorFalso(self)
+
+    def cancel(self):
+        self.canceladas += 1
+
+
+def test_parse_members_json():
+    members = parse_members('[{"name": "a", "dsn": "host=a"}, {"dsn": "host=b"}]')
+    assert [m.name for m in members] == ["a", "membro1"]
+    with pytest.raises(ValueError):
+        parse_members('[{"name": "a", "dsn": "host=a"}, {"name": "a", "dsn": "host=b"}]')
+    assert parse_members("") == []
+
+
+def test_fan_out_resultado_parcial():
+    def _tool(ctx, atraso=0.0):
+        name = ctx.state["db_conn"]
+        if name == "erro":
+            raise RuntimeError("falhou")
+        if name == "lento":
+            time.sleep(1.0)
+        return {"count": 1}
+
+    members = [_OfflineMember(n, n) for n in ("ok", "erro", "lento")]
+    started = time.perf_counter()
+    outcomes = fan_out(_tool, {}, members=members, timeout_seconds=0.2)
+    assert time.perf_counter() - started < 0.9
+    assert [(m.name, status) for m, status, _, _ in outcomes] == [
+        ("ok", "ok"),
+        ("erro", "erro"),
+        ("lento", "timeout"),
+    ]
+    assert [c.canceladas for m in members for c in m.consultas] == [0, 0, 1]
+
+
+def test_timeout_e_cancelamento_por_chamada(monkeypatch):
+    monkeypatch.setattr(federation, "get_connection", lambda dsn, **kwargs: _ConexaoFalsa())
+    member = FederationMember("a", "host=a")
+    with member.consulta(2) as primeira:
+        with member.consulta(0.5) as segunda:
+            # Chamadas simultâneas não dividem conexão.
+            assert primeira.conn is not segunda.conn
+        segunda.cancelar()
+        primeira.cancelar()
+    assert segunda.conn.canceladas == 0
+    assert primeira.conn.canceladas == 1
+    # A conexão reaproveitada recebe o timeout da nova chamada.
+    with member.consulta(7) as terceira:
+        assert terceira.conn.executados[-1] == "SET statement_timeout = 7000"
+    assert primeira.conn.executados[0] == "SET statement_timeout = 2000"
+
+
+def test_contagem_federada_soma_membros(ctx, monkeypatch):
+    monkeypatch.setattr(
+        federation,
+        "_MEMBERS",
+        [FederationMember("municipio_a", get_db_dsn()), FederationMember("municipio_b", get_db_dsn())],
+    )
+    local = contar_pacientes(ctx, age_min=0, age_max=120)
+    result = contar_pacientes_federado(
+        ctx, "contar_pacientes", {"age_min": 0, "age_max": 120}
+    )
+    assert result["count"] == 2 * local["count"]
+    assert result["parcial"] is False
+    assert [m["fonte"] for m in result["membros"]] == ["municipio_a", "municipio_b"]
+
+    lista = listar_federado(ctx, "listar_gestantes", {}, limite=5)
+    assert len(lista["itens"]) <= 5
+    assert all(item["fonte"] in {"municipio_a", "municipio_b"} for item in lista["itens"])
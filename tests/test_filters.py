@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from datetime import date
+
+import pytest
+
+from pec_mcp.tools.filters import ConditionFilter, FilterSet, PatientFilter
+
+
+def test_requisicoes_equivalentes_geram_mesmo_sql_e_chave():
+    a = FilterSet(
+        PatientFilter.build(sex="f", age_min=18, age_max=40, name_prefix=" jo"),
+        ConditionFilter.build(cid_codes=["i10", "E11", "I10"], cid_ciap_logic="AND"),
+    )
+    b = FilterSet(
+        PatientFilter.build(sex="FEMININO", age_min=18, age_max=40, name_prefix="JO"),
+        ConditionFilter.build(cid_codes=["E11%", "I10"]),
+    )
+    hoje = date(2024, 6, 10)
+    assert a.compile(today=hoje) == b.compile(today=hoje)
+    assert a.cache_key("contar_pacientes", hoje) == b.cache_key("contar_pacientes", hoje)
+    assert a.cache_key("contar_pacientes", hoje) != a.cache_key("listar_condicoes_pacientes", hoje)
+
+
+def test_faixa_etaria_vira_intervalo_de_nascimento():
+    filtro = PatientFilter.build(age_min=10, age_max=10)
+    # Idade exatamente 10 anos em 2024-06-10: nascidos entre 2013-06-11 e 2014-06-10.
+    assert filtro.birth_range(date(2024, 6, 10)) == (date(2014, 6, 10), date(2013, 6, 10))
+    # 29/02 sem equivalente no ano de corte cai para 28/02.
+    assert PatientFilter.build(age_min=1).birth_range(date(2024, 2, 29)) == (date(2023, 2, 28), None)
+
+
+def test_validacoes():
+    with pytest.raises(ValueError):
+        PatientFilter.build(sex="X")
+    with pytest.raises(ValueError):
+        PatientFilter.build(age_min=30, age_max=20)
+    with pytest.raises(ValueError):
+        ConditionFilter.build(cid_codes=["I10", "E11"], cid_logic="AND")
+    assert ConditionFilter.build(cid_codes=["I10", "E11"], cid_logic="AND", allow_cid_and=True).cid_logic == "AND"
+
+
+def test_filtro_cid_em_memoria():
+    filtro = ConditionFilter.build(cid_code="i1")
+    assert filtro.matches_cid("I10")
+    assert not filtro.matches_cid("E11")
+    assert not filtro.matches_cid(None)
+
+
+def test_padroes_resolvidos_em_ids_filtram_tb_problema():
+    from pec_mcp.tools.catalogo import _Tabela
+
+    tabela = _Tabela(codes=("E11", "I10", "I11", "I110", "K86"), ids=(5, 1, 2, 3, 9))
+    assert tabela.resolve("I1%") == (1, 2, 3)
+    assert tabela.resolve("I11") == (2,)
+    assert tabela.resolve("I_0") == (1,)
+    assert tabela.resolve("Z%") == ()
+
+    filtro = ConditionFilter.build(cid_codes=["I11", "E11"], ciap_code="K86")
+    resolvido = filtro._replace(cid_ids=((5,), (2, 3)), ciap_ids=(9,))
+    assert not resolvido.needs_code_joins
+    assert resolvido.compile() == (["(p.co_cid10 = ANY(%s) OR p.co_ciap = ANY(%s))"], [[2, 3, 5], [9]])
+    # Texto livre continua exigindo os JOINs de descrição.
+    assert resolvido._replace(condition_text="HAS").needs_code_joins
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+from pec_mcp import indice_soap
+from pec_mcp.indice_soap import IndiceSOAP, expressao_fts
+from pec_mcp.tools import busca_soap
+
+
+def _atendimento(atendimento_id, paciente_id, dia, s=None, o=None, a=None, p=None):
+    return {
+        "atendimento_id": atendimento_id,
+        "paciente_id": paciente_id,
+        "data_hora": datetime(2024, 5, dia, 9, 30),
+        "cbo_codigo": "225142",
+        "subjetivo": s,
+        "objetivo": o,
+        "avaliacao": a,
+        "plano": p,
+    }
+
+
+@pytest.fixture
+def base(monkeypatch):
+    linhas = [
+        _atendimento(1, 10, 1, s="Tosse há 3 dias", a="Dispnéia aos esforços"),
+        _atendimento(2, 11, 2, o="Ausculta limpa"),
+        _atendimento(3, 10, 3),  # sem evolução ainda
+        _atendimento(4, 12, 4, p="Retorno se dispneia piorar"),
+    ]
+    consultas = []
+
+    def query_all(conn, sql, params):
+        inicio, fim, lote = params
+        consultas.append((inicio, fim))
+        assert "ILIKE" not in sql
+        return [dict(row) for row in linhas if inicio < row["atendimento_id"] <= fim][:lote]
+
+    monkeypatch.setattr(indice_soap, "query_all", query_all)
+    return linhas, consultas
+
+
+def test_sincroniza_em_lotes_e_busca_sem_acento(tmp_path, base):
+    _, consultas = base
+    indice = IndiceSOAP(str(tmp_path / "soap.sqlite3"), lote=2, revisitar=0)
+    assert indice.sincronizar(None) == 4
+    assert [c[0] for c in consultas] == [0, 2, 4]
+    estado = indice.estado()
+    assert estado["watermark"] == 4 and estado["total"] == 3
+
+    resultados = indice.buscar(expressao_fts("dispneia"))
+    assert [r["atendimento_id"] for r in resultados] == [4, 1]
+    assert resultados[1]["trechos"] == {"A": "**Dispnéia** aos esforços"}
+    assert resultados[0]["data_hora"] == "2024-05-04T09:30:00"
+
+    assert [r["atendimento_id"] for r in indice.buscar(expressao_fts("dispneia", ["A"]))] == [1]
+    assert [r["atendimento_id"] for r in indice.buscar(expressao_fts("dispneia"), paciente_id=12)] == [4]
+    assert indice.buscar(expressao_fts("dispneia"), desde="2024-05-02", ate_exclusivo="2024-05-04") == []
+
+
+def test_revisita_pega_evolucao_gravada_depois(tmp_path, base):
+    linhas, _ = base
+    indice = IndiceSOAP(str(tmp_path / "soap.sqlite3"), lote=10, revisitar=5)
+    indice.sincronizar(None)
+    linhas[2]["subjetivo"] = "Cefaleia intensa"
+    linhas.append(_atendimento(5, 13, 5, s="cefaléia leve"))
+    assert indice.sincronizar(None) == 5
+    assert [r["atendimento_id"] for r in indice.buscar(expressao_fts("cefal*"))] == [5, 3]
+    assert indice.estado()["watermark"] == 5
+
+
+def test_termo_nao_vira_sintaxe_fts():
+    assert expressao_fts('dor "no peito" OR NEAR(x') == '"dor" "no peito" "OR" "NEAR" "x"'
+    assert expressao_fts("cefal*", ["a", "S", "A"]) == '{avaliacao subjetivo} : ("cefal"*)'
+    with pytest.raises(ValueError):
+        expressao_fts("  ** ")
+    with pytest.raises(ValueError):
+        expressao_fts("dor", ["X"])
+
+
+def test_tool_so_le_o_indice_e_informa_idade(tmp_path, base, monkeypatch):
+    _, consultas = base
+    indice = IndiceSOAP(str(tmp_path / "soap.sqlite3"), revisitar=0)
+    monkeypatch.setattr(busca_soap, "INDICE_SOAP", indice)
+    ctx = type("Ctx", (), {"state": {"db_conn": object()}})()
+
+    # A tool não sincroniza: índice nunca carregado responde vazio e sem idade.
+    pagina = busca_soap.buscar_atendimentos_soap(ctx, "tosse")
+    assert pagina["atendimentos"] == [] and pagina["indice_defasagem_segundos"] is None
+    assert consultas == []
+
+    indice.sincronizar(None)
+    pagina = busca_soap.buscar_atendimentos_soap(ctx, "tosse", ate="2024-05-01")
+    assert [r["atendimento_id"] for r in pagina["atendimentos"]] == [1]
+    assert pagina["indice_total_atendimentos"] == 3
+    assert pagina["indice_atualizado_em"] is not None
+    assert 0 <= pagina["indice_defasagem_segundos"] < 5
+
+    with pytest.raises(ValueError):
+        busca_soap.buscar_atendimentos_soap(ctx, "tosse", desde="2024-06-01", ate="2024-05-01")
+    monkeypatch.setattr(busca_soap, "INDICE_SOAP", IndiceSOAP(""))
+    with pytest.raises(ValueError, match="PEC_SOAP_INDEX_PATH"):
+        busca_soap.buscar_atendimentos_soap(ctx, "tosse")
+
+
+class _RouterFalso:
+    def __init__(self):
+        self.emprestimos = []
+
+    @contextmanager
+    def pooled_connection(self, workload):
+        self.emprestimos.append(workload)
+        yield object()
+
+
+def test_sincronizacao_em_segundo_plano(tmp_path, base):
+    indice = IndiceSOAP(str(tmp_path / "soap.sqlite3"), revisitar=0)
+    router = _RouterFalso()
+    indice.iniciar(router, intervalo=0.01)
+    try:
+        prazo = time.monotonic() + 5
+        while indice.estado()["atualizado_em"] is None and time.monotonic() < prazo:
+            time.sleep(0.01)
+    finally:
+        indice.parar()
+        indice._thread.join(timeout=5)
+    assert indice.estado()["total"] == 3
+    assert set(router.emprestimos) == {"analytic"}
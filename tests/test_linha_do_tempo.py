@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+import pytest
+
+from pec_mcp.tools import linha_do_tempo
+from pec_mcp.tools.linha_do_tempo import linha_do_tempo_paciente, montar_sql
+
+
+def _evento(tipo, ordem, evento_id, dia, **extra):
+    row = {
+        "data_hora": datetime(2024, 5, dia, 9, 0),
+        "ordem": ordem,
+        "evento_id": evento_id,
+        "sequencia": 0,
+        "tipo": tipo,
+        "atendimento_id": extra.get("atendimento_id"),
+        "codigo": extra.get("codigo"),
+        "descricao": extra.get("descricao"),
+        "valor": extra.get("valor"),
+        "observacao": None,
+    }
+    return row
+
+
+@pytest.fixture
+def consultas(monkeypatch):
+    executadas = []
+    linhas = [
+        _evento("medicao", 4, 30, 3, codigo="PA", valor="150/95", atendimento_id=7),
+        _evento("problema", 2, 20, 2, codigo="I10", atendimento_id=7),
+        _evento("atendimento", 1, 7, 2, codigo="225142"),
+    ]
+
+    def query_all(conn, sql, params):
+        executadas.append((sql, params))
+        return linhas[: params[-1]]
+
+    monkeypatch.setattr(linha_do_tempo, "get_db_conn", lambda ctx, workload="interactive": None)
+    monkeypatch.setattr(linha_do_tempo, "query_all", query_all)
+    return executadas
+
+
+def test_uma_consulta_union_all_por_pagina(consultas):
+    pagina = linha_do_tempo_paciente(None, 5, desde="2024-05-01", ate="2024-05-31", limite=2)
+    assert len(consultas) == 1
+    sql, params = consultas[0]
+    assert sql.count("UNION ALL") == 3
+    assert params[:4] == [5, 5, 5, 5]
+    assert params[4:6] == [datetime(2024, 5, 1), datetime(2024, 6, 1)] and params[-1] == 3
+    assert [e["tipo"] for e in pagina["eventos"]] == ["medicao", "problema"]
+    assert pagina["eventos"][0]["valor"] == "150/95"
+    assert pagina["proximo_cursor"]
+
+    linha_do_tempo_paciente(None, 5, desde="2024-05-01", ate="2024-05-31", limite=2, cursor=pagina["proximo_cursor"])
+    sql, params = consultas[1]
+    assert "(ev.data_hora, ev.ordem, ev.evento_id, ev.sequencia) < (%s, %s, %s, %s)" in sql
+    assert params[6:10] == [datetime(2024, 5, 2, 9, 0), 2, 20, 0]
+
+
+def test_tipos_selecionam_ramos_em_ordem_fixa(consultas):
+    linha_do_tempo_paciente(None, 1, tipos=["exame", "ATENDIMENTO"], ordem="asc", limite=10)
+    linha_do_tempo_paciente(None, 1, tipos=["atendimento", "exame"], ordem="asc", limite=10)
+    (sql_a, params_a), (sql_b, _) = consultas
+    assert sql_a == sql_b
+    assert sql_a.count("UNION ALL") == 1 and "tb_medicao" not in sql_a
+    assert sql_a.index("tb_atend_prof") < sql_a.index("tb_exame_requisitado")
+    assert "ORDER BY ev.data_hora ASC" in sql_a and params_a == [1, 1, 11]
+    assert montar_sql(1, ("medicao",), None, None, None, False, 5)[1] == [1, 5]
+
+
+def test_validacoes(consultas):
+    with pytest.raises(ValueError):
+        linha_do_tempo_paciente(None, 0)
+    with pytest.raises(ValueError):
+        linha_do_tempo_paciente(None, 5, tipos=["vacina"])
+    with pytest.raises(ValueError):
+        linha_do_tempo_paciente(None, 5, desde="2024-06-01", ate="2024-05-01")
+    pagina = linha_do_tempo_paciente(None, 5, limite=2)
+    with pytest.raises(ValueError, match="cursor"):
+        linha_do_tempo_paciente(None, 5, tipos=["exame"], cursor=pagina["proximo_cursor"])
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import pytest
+
+from pec_mcp.tools import nomes, paciente
+from pec_mcp.tools.filters import PatientFilter
+from pec_mcp.tools.nomes import INDICE_NOMES, normalizar_nome, resolver_nome
+
+
+class _Conn:
+    def __init__(self, dsn):
+        self.dsn = dsn
+
+
+@pytest.fixture
+def cadastro(monkeypatch):
+    linhas = [
+        {"paciente_id": 1, "nome": "José da Silva"},
+        {"paciente_id": 2, "nome": "JOSEFA  Lima"},
+        {"paciente_id": 3, "nome": "Joana Souza"},
+        {"paciente_id": 4, "nome": "Ângela Prado"},
+    ]
+    consultas = []
+
+    def query_all(conn, sql, params):
+        consultas.append(params[0])
+        return [row for row in linhas if row["paciente_id"] > params[0]]
+
+    monkeypatch.setattr(nomes, "query_all", query_all)
+    INDICE_NOMES.invalidate()
+    yield linhas, consultas
+    INDICE_NOMES.invalidate()
+
+
+def test_normaliza_acento_caixa_e_espacos():
+    assert normalizar_nome("  José   da  Conceição ") == "JOSE DA CONCEICAO"
+    assert normalizar_nome(None) == ""
+
+
+def test_prefixo_sem_acento_e_avanco_incremental(cadastro, monkeypatch):
+    linhas, consultas = cadastro
+    conn = _Conn("dbname=nomes")
+    indice = INDICE_NOMES.get(conn)
+    assert indice.prefixo("jose") == (1, 2)
+    assert indice.prefixo("JOSÉ D") == (1,)
+    assert indice.prefixo("angela") == (4,)
+    assert indice.prefixo("JOAO") == ()
+
+    linhas.append({"paciente_id": 5, "nome": "José Alves"})
+    monkeypatch.setattr(INDICE_NOMES, "_ttl", -1.0)
+    assert INDICE_NOMES.get(conn).prefixo("Jose") == (1, 2, 5)
+    assert consultas == [0, 4]
+
+
+def test_filtro_de_nome_vira_busca_por_chave(cadastro, monkeypatch):
+    conn = _Conn("dbname=nomes")
+    filtro = resolver_nome(conn, PatientFilter.build(name_prefix="jose", sex="F"))
+    clauses, params = filtro.compile("c")
+    assert clauses[0] == "c.co_seq_cidadao = ANY(%s)" and params[0] == [1, 2]
+    assert not any("ILIKE" in clause for clause in clauses)
+
+    executadas = []
+    monkeypatch.setattr(paciente, "get_db_conn", lambda ctx, workload="interactive": conn)
+    monkeypatch.setattr(paciente, "guardar_custo", lambda ctx, c, sql, params, dica: c)
+    monkeypatch.setattr(paciente, "query_all", lambda c, sql, params: executadas.append(params) or [])
+    assert paciente.capturar_paciente(None, name_starts_with="Ângel") == []
+    assert executadas == [[[4], 50]]
+
+
+def test_prefixo_pouco_seletivo_e_recusado(cadastro, monkeypatch):
+    conn = _Conn("dbname=nomes")
+    monkeypatch.setattr(nomes, "_MAX_IDS_NOME", 2)
+    assert resolver_nome(conn, PatientFilter.build(name_prefix="jose")).name_ids == (1, 2)
+    with pytest.raises(ValueError, match="amplo demais"):
+        resolver_nome(conn, PatientFilter.build(name_prefix="jo"))
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from pec_mcp.admission import ControleAdmissao, admitir
+from pec_mcp.tools import com_conexoes_da_chamada, db_key, get_db_conn
+from pec_mcp.tools.paralelo import executar_em_paralelo
+
+
+class _Ctx:
+    # Conexão marcadora: as subconsultas abaixo não tocam o banco.
+    state = {"db_conn": object()}
+
+
+def _lenta(valor):
+    def _fn(conn):
+        time.sleep(0.2)
+        return valor
+
+    return _fn
+
+
+def test_tempo_total_e_o_da_parte_mais_lenta():
+    started = time.perf_counter()
+    resultados, tempos = executar_em_paralelo(_Ctx(), {"a": _lenta(1), "b": _lenta(2), "c": _lenta(3)})
+    assert time.perf_counter() - started < 0.5
+    assert resultados == {"a": 1, "b": 2, "c": 3}
+    assert set(tempos) == {"a", "b", "c"}
+    assert all(ms >= 150 for ms in tempos.values())
+
+
+def test_erro_de_subconsulta_e_propagado():
+    def _falha(conn):
+        raise ValueError("falhou")
+
+    with pytest.raises(ValueError):
+        executar_em_paralelo(_Ctx(), {"ok": _lenta(1), "erro": _falha})
+
+
+def test_cada_chamada_empresta_e_devolve_sua_conexao():
+    from concurrent.futures import ThreadPoolExecutor
+
+    class _Router:
+        name = "no"
+
+        def __init__(self):
+            self.emprestadas = []
+            self.devolvidas = []
+
+        def connection(self, workload):
+            return "compartilhada"
+
+        def node_for(self, workload):
+            return self
+
+        @contextmanager
+        def pooled(self):
+            conn = object()
+            self.emprestadas.append(conn)
+            try:
+                yield conn
+            finally:
+                self.devolvidas.append(conn)
+
+    router = _Router()
+    ctx = type("Ctx", (), {"state": {"db_router": router}})()
+
+    @com_conexoes_da_chamada
+    def _tool(ctx):
+        conn = get_db_conn(ctx)
+        assert get_db_conn(ctx) is conn
+        # Outra classe de carga no mesmo nó reaproveita a conexão da chamada.
+        assert get_db_conn(ctx, workload="analytic") is conn
+        time.sleep(0.1)
+        return conn
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        usadas = list(executor.map(_tool, [ctx, ctx]))
+    assert usadas[0] is not usadas[1]
+    assert set(map(id, router.devolvidas)) == set(map(id, usadas))
+    # Fora de uma chamada registrada, segue a conexão compartilhada do nó.
+    assert get_db_conn(ctx) == "compartilhada"
+
+
+class _RouterContado:
+    name = "no"
+
+    def __init__(self):
+        self.em_uso = 0
+        self.pico = 0
+        self.emprestimos = 0
+        self._lock = threading.Lock()
+
+    def node_for(self, workload):
+        return self
+
+    @contextmanager
+    def pooled(self):
+        with self._lock:
+            self.em_uso += 1
+            self.emprestimos += 1
+            self.pico = max(self.pico, self.em_uso)
+        try:
+            yield object()
+        finally:
+            with self._lock:
+                self.em_uso -= 1
+
+    def pooled_connection(self, workload):
+        return self.pooled()
+
+
+def _admitida(fn, peso):
+    controle = ControleAdmissao(capacidade=4, pesos={fn.__name__: peso})
+    return admitir(com_conexoes_da_chamada(fn), controle)
+
+
+@pytest.mark.parametrize("peso,segura_conexao,pico", [(2, False, 2), (2, True, 2), (1, True, 1)])
+def test_paralelismo_limitado_ao_peso_admitido(peso, segura_conexao, pico):
+    router = _RouterContado()
+    ctx = type("Ctx", (), {"state": {"db_router": router}})()
+
+    def _tool(ctx):
+        if segura_conexao:
+            get_db_conn(ctx)
+        resultados, _ = executar_em_paralelo(ctx, {str(i): _lenta(i) for i in range(4)})
+        return resultados
+
+    assert asyncio.run(_admitida(_tool, peso)(ctx)) == {str(i): i for i in range(4)}
+    assert router.pico == pico
+    if peso == 1:
+        # Sem vaga para outra conexão: tudo roda na conexão da chamada.
+        assert router.emprestimos == 1
+
+
+def test_chave_do_banco_sem_emprestar_conexao():
+    router = _RouterContado()
+    ctx = type("Ctx", (), {"state": {"db_router": router}})()
+    assert db_key(ctx, workload="analytic") == "no:no"
+    assert router.emprestimos == 0
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pec_mcp.config import get_db_dsn
+from pec_mcp import routing
+from pec_mcp.routing import DbNode, DbRouter, PoolEsgotado, parse_nodes
+from pec_mcp.tools import com_conexoes_da_chamada, get_db_conn
+
+# Segunda instância opcional (ex.: réplica local); default reaproveita a DSN principal.
+_REPLICA_DSN = os.getenv("PEC_DB_TEST_DSN_REPLICA", get_db_dsn())
+_UNREACHABLE_DSN = "host=127.0.0.1 port=1 dbname=pec user=pec"
+
+
+def test_parse_nodes_json():
+    nodes = parse_nodes(
+        '[{"name": "primario", "dsn": "host=a", "workload": "interactive"},'
+        ' {"name": "replica", "dsn": "host=b", "workload": "analytic"}]'
+    )
+    assert [(n.name, n.workload) for n in nodes] == [("primario", "interactive"), ("replica", "analytic")]
+
+
+def test_parse_nodes_invalido():
+    with pytest.raises(ValueError):
+        parse_nodes("nao-e-json")
+    with pytest.raises(ValueError):
+        parse_nodes('[{"name": "x", "dsn": "host=a", "workload": "batch"}]')
+
+
+def test_router_sem_no_disponivel():
+    router = DbRouter([DbNode("fora", _UNREACHABLE_DSN, "interactive")])
+    with pytest.raises(RuntimeError):
+        router.connection("interactive")
+    assert router.status()[0]["healthy"] is False
+
+
+def test_router_separa_cargas(db_conn):
+    router = DbRouter(
+        [
+            DbNode("interativo", get_db_dsn(), "interactive"),
+            DbNode("analitico", _REPLICA_DSN, "analytic"),
+        ]
+    )
+    try:
+        assert router.connection("analytic") is router.nodes[1].conn
+        assert router.connection("interactive") is router.nodes[0].conn
+    finally:
+        router.close()
+
+
+def test_router_drena_no_com_falha(db_conn):
+    router = DbRouter(
+        [
+            DbNode("fora", _UNREACHABLE_DSN, "analytic"),
+            DbNode("interativo", get_db_dsn(), "interactive"),
+        ]
+    )
+    try:
+        # Sem nó analítico saudável, cai para qualquer nó saudável.
+        assert router.connection("analytic") is router.nodes[1].conn
+        assert router.status()[0]["healthy"] is False
+    finally:
+        router.close()
+
+
+class _ConexaoFalsa:
+    autocommit = True
+
+    def __init__(self):
+        self.closed = 0
+
+    def set_session(self, **kwargs):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def _router_falso(monkeypatch, intervalo=3600.0):
+    saude = {"row": {"is_replica": False, "lag_seconds": 0}}
+
+    def _query_one(conn, sql):
+        if isinstance(saude["row"], Exception):
+            raise saude["row"]
+        return saude["row"]
+
+    monkeypatch.setattr(routing, "get_connection", lambda dsn, **kwargs: _ConexaoFalsa())
+    monkeypatch.setattr(routing, "query_one", _query_one)
+    return DbRouter([DbNode("a", "host=a", "interactive")], health_interval_seconds=intervalo), saude
+
+
+def test_falha_na_checagem_nao_fecha_conexao_em_uso(monkeypatch):
+    router, saude = _router_falso(monkeypatch)
+    conn = router.connection()
+    saude["row"] = RuntimeError("caiu")
+    assert router.check_now() == []
+    assert not conn.closed
+    assert router.status()[0]["error"] == "caiu"
+    with pytest.raises(RuntimeError, match="caiu"):
+        router.connection()
+
+
+def test_escolha_nao_espera_checagem_em_andamento(monkeypatch):
+    router, _ = _router_falso(monkeypatch, intervalo=0)
+    conn = router.connection()
+    node = router.nodes[0]
+    # Checagem "lenta" em andamento: a escolha usa o último resultado.
+    with node._check_lock:
+        escolhidas = []
+        thread = threading.Thread(target=lambda: escolhidas.append(router.connection()))
+        thread.start()
+        thread.join(timeout=2)
+        assert escolhidas == [conn]
+
+
+class _PoolFalso:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def getconn(self):
+        return _ConexaoFalsa()
+
+    def putconn(self, conn, close=False):
+        pass
+
+
+def test_chamadas_com_duas_cargas_no_mesmo_no_nao_travam(monkeypatch):
+    # Capacidade de admissão == pool: cada chamada segura uma conexão
+    # interativa e pede a analítica (guarda de custo, contagem aproximada).
+    router, _ = _router_falso(monkeypatch)
+    monkeypatch.setattr(routing, "ThreadedConnectionPool", _PoolFalso)
+    monkeypatch.setattr(routing, "PEC_DB_POOL_TIMEOUT_SECONDS", 2)
+    router.nodes[0]._pool_slots = threading.BoundedSemaphore(4)
+    ctx = type("Ctx", (), {"state": {"db_router": router}})()
+    todas_seguram = threading.Barrier(4, timeout=2)
+
+    @com_conexoes_da_chamada
+    def _tool(ctx):
+        interativa = get_db_conn(ctx)
+        todas_seguram.wait()
+        return get_db_conn(ctx, workload="analytic") is interativa
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(_tool, [ctx] * 4)) == [True] * 4
+
+
+def test_pool_esgotado_falha_com_prazo(monkeypatch):
+    router, _ = _router_falso(monkeypatch)
+    monkeypatch.setattr(routing, "ThreadedConnectionPool", _PoolFalso)
+    monkeypatch.setattr(routing, "PEC_DB_POOL_TIMEOUT_SECONDS", 0.1)
+    node = router.nodes[0]
+    node._pool_slots = threading.BoundedSemaphore(1)
+    with router.pooled_connection():
+        started = time.monotonic()
+        with pytest.raises(PoolEsgotado, match="pool do nó a"):
+            with router.pooled_connection():
+                pass
+        assert time.monotonic() - started < 1
+    # A vaga volta ao pool depois do erro e da devolução.
+    with router.pooled_connection():
+        pass
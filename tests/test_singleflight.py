@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pec_mcp.singleflight import SingleFlight, chave_canonica, coalescer
+
+
+class _Ctx:
+    def __init__(self, conn=None):
+        self.state = {"db_conn": conn} if conn is not None else {}
+
+
+def _contagem_lenta(execucoes):
+    lock = threading.Lock()
+
+    def contar_pacientes_sem_consulta(ctx, tipo: str, dias_sem_consulta: int = 180):
+        with lock:
+            execucoes.append(tipo)
+        time.sleep(0.2)
+        return {"count": len(execucoes)}
+
+    return contar_pacientes_sem_consulta
+
+
+def test_chamadas_identicas_simultaneas_compartilham_execucao():
+    execucoes = []
+    registro = SingleFlight()
+    tool = coalescer(_contagem_lenta(execucoes), registro)
+
+    async def _cenario():
+        # dias_sem_consulta explícito igual ao default gera a mesma chave.
+        iguais = [tool(_Ctx(), tipo="diabetes") for _ in range(4)]
+        iguais.append(tool(_Ctx(), tipo="diabetes", dias_sem_consulta=180))
+        outra = tool(_Ctx(), tipo="hipertensao")
+        return await asyncio.gather(*iguais, outra)
+
+    resultados = asyncio.run(_cenario())
+
+    assert sorted(execucoes) == ["diabetes", "hipertensao"]
+    assert len({id(r) for r in resultados[:5]}) == 1
+    assert registro.metricas() == {"contar_pacientes_sem_consulta": {"execucoes": 2, "economizadas": 4}}
+    assert registro.em_andamento() == 0
+
+
+def test_excecao_e_entregue_a_todos_e_nao_fica_em_cache():
+    registro = SingleFlight()
+    chamadas = []
+
+    def falha(ctx, tipo: str):
+        chamadas.append(tipo)
+        time.sleep(0.1)
+        raise ValueError("tipo inválido")
+
+    tool = coalescer(falha, registro)
+
+    async def _cenario():
+        return await asyncio.gather(*(tool(_Ctx(), tipo="x") for _ in range(3)), return_exceptions=True)
+
+    resultados = asyncio.run(_cenario())
+    assert all(isinstance(r, ValueError) for r in resultados)
+    assert len(chamadas) == 1
+
+    with pytest.raises(ValueError):
+        asyncio.run(tool(_Ctx(), tipo="x"))
+    assert len(chamadas) == 2
+
+
+def test_chave_separa_bancos_explicitos():
+    fn = _contagem_lenta([])
+    a = chave_canonica(fn, (_Ctx(),), {"tipo": "diabetes"})
+    b = chave_canonica(fn, (_Ctx(object()),), {"tipo": "diabetes"})
+    assert a == chave_canonica(fn, (), {"ctx": _Ctx(), "tipo": "diabetes", "dias_sem_consulta": 180})
+    assert a != b
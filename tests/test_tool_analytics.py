@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import pytest
+
+from pec_mcp.tools.analytics import consulta_epidemiologia
+
+
+def test_consulta_epidemiologia_formato(ctx):
+    results = consulta_epidemiologia(ctx, limite=10)
+    if not results:
+        pytest.skip("Base sem problemas registrados para teste")
+
+    totais = [row["total_pacientes"] for row in results]
+    assert totais == sorted(totais, reverse=True)
+    assert set(results[0].keys()) == {
+        "codigo_cid10",
+        "descricao_cid10",
+        "sexo",
+        "faixa_etaria",
+        "localidade_id",
+        "total_pacientes",
+    }
+
+
+def test_consulta_epidemiologia_filtro_sexo(ctx):
+    for row in consulta_epidemiologia(ctx, sexo="F", idade_min=18, idade_max=39, limite=20):
+        assert row["sexo"] == "FEMININO"
+        assert row["faixa_etaria"] == "18-39"
+
+
+def test_consulta_epidemiologia_faixa_invalida(ctx):
+    with pytest.raises(ValueError):
+        consulta_epidemiologia(ctx, idade_min=50, idade_max=10)
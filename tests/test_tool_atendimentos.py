@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import pytest
+
+from pec_mcp.db import query_all
+from pec_mcp.tools import decode_cursor, encode_cursor
+from pec_mcp.tools.atendimentos import (
+    listar_resumo_atendimentos_soap,
+    listar_ultimos_atendimentos_soap,
+    obter_atendimentos_soap,
+)
+
+
+def _find_paciente_com_atendimento(conn):
+    rows = query_all(
+        conn,
+        """
+        SELECT pr.co_cidadao AS paciente_id
+        FROM tb_atend_prof ap
+        JOIN tb_atend a ON a.co_seq_atend = ap.co_atend
+        JOIN tb_prontuario pr ON pr.co_seq_prontuario = a.co_prontuario
+        JOIN tb_lotacao l ON l.co_ator_papel = ap.co_lotacao
+        JOIN tb_cbo cb ON cb.co_cbo = l.co_cbo
+        WHERE cb.co_cbo_2002 LIKE '225%%'
+        LIMIT 1;
+        """,
+    )
+    if not rows:
+        return None
+    return rows[0]["paciente_id"]
+
+
+def test_resumo_e_detalhe_atendimentos(ctx):
+    paciente_id = _find_paciente_com_atendimento(ctx.state["db_conn"])
+    if not paciente_id:
+        pytest.skip("Base sem atendimentos médicos/enfermagem para teste")
+
+    pagina = listar_resumo_atendimentos_soap(ctx, paciente_id=paciente_id, limite=3, tamanho_trecho=10)
+    resumo = pagina["atendimentos"]
+    assert resumo, "Nenhum atendimento retornado no resumo"
+    for row in resumo:
+        assert row["paciente_id"] == paciente_id
+        for secao in ("soap_s_trecho", "soap_o_trecho", "soap_a_trecho", "soap_p_trecho"):
+            assert row[secao] is None or len(row[secao]) <= 10
+
+    ids = [row["atendimento_id"] for row in resumo]
+    detalhe = obter_atendimentos_soap(ctx, atendimento_ids=ids)
+    assert {row["atendimento_id"] for row in detalhe} == set(ids)
+
+
+def test_obter_atendimentos_sem_ids(ctx):
+    with pytest.raises(ValueError):
+        obter_atendimentos_soap(ctx, atendimento_ids=[])
+
+
+def test_paginacao_keyset_sem_repeticao(ctx):
+    paciente_id = _find_paciente_com_atendimento(ctx.state["db_conn"])
+    if not paciente_id:
+        pytest.skip("Base sem atendimentos médicos/enfermagem para teste")
+
+    primeira = listar_ultimos_atendimentos_soap(ctx, paciente_id=paciente_id, limite=1)
+    assert len(primeira["atendimentos"]) == 1
+    if not primeira["proximo_cursor"]:
+        pytest.skip("Paciente com apenas um atendimento")
+
+    segunda = listar_ultimos_atendimentos_soap(
+        ctx, paciente_id=paciente_id, limite=1, cursor=primeira["proximo_cursor"]
+    )
+    assert segunda["atendimentos"]
+    assert segunda["atendimentos"][0]["atendimento_id"] != primeira["atendimentos"][0]["atendimento_id"]
+
+
+def test_cursor_de_outro_paciente():
+    # Validação ocorre antes de abrir conexão; não depende de banco.
+    cursor = encode_cursor({"p": 1, "d": None, "i": 10})
+    assert decode_cursor(cursor) == {"p": 1, "d": None, "i": 10}
+    with pytest.raises(ValueError):
+        listar_ultimos_atendimentos_soap(None, paciente_id=2, cursor=cursor)
+    with pytest.raises(ValueError):
+        listar_ultimos_atendimentos_soap(None, paciente_id=2, cursor="nao-e-cursor")
+
+
+def test_limite_nulo_usa_pagina_padrao(monkeypatch):
+    from pec_mcp.tools import atendimentos
+
+    chamadas = []
+    monkeypatch.setattr(atendimentos, "get_db_conn", lambda ctx: object())
+    monkeypatch.setattr(atendimentos, "query_all", lambda conn, sql, params: chamadas.append(params) or [])
+
+    assert listar_ultimos_atendimentos_soap(None, paciente_id=1, limite=None) == {
+        "atendimentos": [],
+        "proximo_cursor": None,
+    }
+    listar_resumo_atendimentos_soap(None, paciente_id=1, limite=None)
+    # LIMIT pede uma linha a mais que a página para saber se há próxima.
+    assert chamadas[0][-1] == 21
+    assert chamadas[1][-5] == 51
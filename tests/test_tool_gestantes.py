@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import pytest
+
+from pec_mcp.tools.gestantes import listar_gestantes
+
+
+def test_listar_gestantes_formato(ctx):
+    results = listar_gestantes(ctx, limite=5)
+    if not results:
+        pytest.skip("Base sem gestações ativas para teste")
+
+    for row in results:
+        assert 1 <= row["idade_gestacional_semanas"] <= 42
+        assert row["idade_gestacional_str"] == (
+            f"{row['idade_gestacional_semanas']}s{row['idade_gestacional_dias']}d"
+        )
+    dpps = [row["dpp"] for row in results if row["dpp"]]
+    assert dpps == sorted(dpps)
+
+
+def test_listar_gestantes_por_trimestre(ctx):
+    for row in listar_gestantes(ctx, trimestre="segundo", limite=20):
+        assert 13 <= row["idade_gestacional_semanas"] <= 26
+
+
+def test_listar_gestantes_trimestre_invalido(ctx):
+    with pytest.raises(ValueError):
+        listar_gestantes(ctx, trimestre="quarto")
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import pytest
+
+from pec_mcp.tools.contar_pacientes import contar_pacientes
+from pec_mcp.tools.prevalencia import prevalencia_condicoes
+
+
+def test_prevalencia_consistente_com_contagens(ctx):
+    result = prevalencia_condicoes(ctx, condicoes=["hipertensao", "diabetes"])
+    assert [c["nome"] for c in result["condicoes"]] == ["hipertensao", "diabetes"]
+    has, dm = (c["total_pacientes"] for c in result["condicoes"])
+    ambos = result["sobreposicoes"][0]["total_pacientes"]
+    assert ambos <= min(has, dm)
+    assert result["nenhuma"] == result["populacao"] - (has + dm - ambos)
+
+    # Mesma definição de contar_pacientes para um conjunto explícito de códigos.
+    custom = prevalencia_condicoes(ctx, codigos_personalizados=[{"nome": "dm2", "cid_codes": ["E11"]}])
+    assert custom["condicoes"][0]["total_pacientes"] == contar_pacientes(ctx, cid_code="E11")["count"]
+
+
+def test_prevalencia_validacoes():
+    with pytest.raises(ValueError):
+        prevalencia_condicoes(None, condicoes=["condicao inexistente"])
+    with pytest.raises(ValueError):
+        prevalencia_condicoes(None)
+    with pytest.raises(ValueError):
+        prevalencia_condicoes(None, codigos_personalizados=[{"nome": "x"}])
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from datetime import date
+
+import pytest
+
+from pec_mcp.tools import sem_consulta
+from pec_mcp.tools.sem_consulta import contar_pacientes_sem_consulta, listar_pacientes_sem_consulta
+
+
+def test_contar_e_listar_sem_consulta_coerentes(ctx):
+    total = contar_pacientes_sem_consulta(ctx, tipo="hipertensao")["count"]
+    pagina = listar_pacientes_sem_consulta(ctx, tipo="hipertensao", limite=200)
+    assert len(pagina) == min(total, 200)
+
+    # Ordenação: sem consulta primeiro, depois a mais antiga.
+    chaves = [(row["ultima_consulta"] is not None, row["ultima_consulta"] or "") for row in pagina]
+    assert chaves == sorted(chaves)
+    for row in pagina:
+        if row["dias_sem_consulta"] is not None:
+            assert row["dias_sem_consulta"] >= 180
+
+
+def test_sem_consulta_tipo_invalido(ctx):
+    with pytest.raises(ValueError):
+        contar_pacientes_sem_consulta(ctx, tipo="asma")
+
+
+def test_indice_rele_atendimento_com_profissional_gravado_depois(monkeypatch):
+    # Atendimentos médicos/enfermagem já com profissional/CBO gravado (co_seq_atend, paciente, unidade, data).
+    atendimentos = [(10, 1, 5, date(2024, 1, 10)), (20, 2, 5, date(2024, 2, 1))]
+    inicios = []
+
+    def query_all(conn, sql, params):
+        inicios.append(params[0])
+        return [
+            {"paciente_id": p, "unidade_id": u, "ultima_consulta": d, "max_atend": a}
+            for a, p, u, d in atendimentos
+            if a > params[0]
+        ]
+
+    monkeypatch.setattr(sem_consulta, "query_all", query_all)
+    monkeypatch.setattr(sem_consulta, "PEC_ULTIMA_CONSULTA_REVISIT", 10)
+    indice = sem_consulta._load_ultimas_consultas(None, None)
+    assert indice.watermark == 20 and indice.ultima(3, None) is None
+
+    # O profissional do atendimento 15 (id abaixo da marca d'água) chega depois.
+    atendimentos.append((15, 3, 5, date(2024, 1, 20)))
+    indice = sem_consulta._load_ultimas_consultas(None, indice)
+    assert indice.ultima(3, None) == date(2024, 1, 20)
+    assert indice.ultima(3, 5) == date(2024, 1, 20)
+    assert indice.watermark == 20 and inicios == [0, 10]
+    # A releitura não recua datas mais novas já conhecidas.
+    assert indice.ultima(2, None) == date(2024, 2, 1)
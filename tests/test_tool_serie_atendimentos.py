@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from datetime import date
+
+import pytest
+
+from pec_mcp.tools.serie_atendimentos import SERIE_ATENDIMENTOS, _blocos, serie_atendimentos
+
+
+def test_blocos_separam_periodo_corrente():
+    blocos = _blocos(date(2024, 1, 1), date(2026, 11, 1), "mes", date(2026, 10, 1))
+    assert blocos == [
+        (date(2024, 1, 1), date(2025, 1, 1), True),
+        (date(2025, 1, 1), date(2026, 1, 1), True),
+        (date(2026, 1, 1), date(2026, 10, 1), True),
+        (date(2026, 10, 1), date(2026, 11, 1), False),
+    ]
+
+
+def test_serie_mensal_e_cache(ctx):
+    SERIE_ATENDIMENTOS.invalidate()
+    primeira = serie_atendimentos(ctx, granularidade="mes", desde="2023-01-01")
+    periodos = [p["periodo"] for p in primeira["pontos"]]
+    assert periodos == sorted(periodos)
+    assert all(p["total_atendimentos"] >= 0 for p in primeira["pontos"])
+
+    segunda = serie_atendimentos(ctx, granularidade="mes", desde="2023-01-01")
+    assert segunda["pontos"] == primeira["pontos"]
+    assert segunda["blocos_consultados"] == 1
+    assert segunda["blocos_em_cache"] == primeira["blocos_consultados"] - 1
+
+
+def test_serie_validacoes():
+    with pytest.raises(ValueError):
+        serie_atendimentos(None, granularidade="hora")
+    with pytest.raises(ValueError):
+        serie_atendimentos(None, granularidade="dia", desde="2010-01-01")
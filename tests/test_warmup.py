@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+
+from pec_mcp.warmup import FORMAS_CANONICAS, Aquecimento
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self._conn.executados.append(sql.strip())
+
+    def fetchall(self):
+        return []
+
+
+class _Conn:
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.executados = []
+
+    def cursor(self):
+        return _Cursor(self)
+
+
+class _Node:
+    def __init__(self, name):
+        self.name = name
+        self.emprestadas = []
+
+    @contextmanager
+    def pooled(self):
+        conn = _Conn(f"dbname={self.name}")
+        self.emprestadas.append(conn)
+        yield conn
+
+
+class _Router:
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def check_now(self):
+        return self.nodes
+
+
+def test_aquecimento_explica_formas_em_todas_as_conexoes():
+    node = _Node("a")
+    aquecimento = Aquecimento()
+    assert not aquecimento.pronto
+
+    aquecimento.executar(_Router([node]))
+
+    assert aquecimento.pronto
+    assert aquecimento.erros == {}
+    assert {"conexoes", "pool", "planos", "catalogo_codigos", "unidades_saude", "total"} <= set(
+        aquecimento.tempos_ms
+    )
+    assert node.emprestadas
+    for conn in node.emprestadas:
+        explains = [sql for sql in conn.executados if sql.startswith("EXPLAIN")]
+        assert len(explains) == len(FORMAS_CANONICAS)
+
+
+def test_falha_de_etapa_nao_impede_prontidao():
+    class _RouterFora:
+        def check_now(self):
+            raise RuntimeError("sem banco")
+
+    aquecimento = Aquecimento()
+    aquecimento.executar(_RouterFora())
+    assert aquecimento.pronto
+    assert aquecimento.erros == {"conexoes": "sem banco"}
+    assert "sondas" not in aquecimento.tempos_ms